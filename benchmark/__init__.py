@@ -1 +1 @@
-# i am a package
+"""Benchmarks for hypatia; run ``python -m benchmark --help`` for usage."""
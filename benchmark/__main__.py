@@ -0,0 +1,95 @@
+"""Run the hypatia benchmarks, or compare two sets of results.
+
+usage: python -m benchmark run [options]
+       python -m benchmark compare OLD.json NEW.json [--threshold T]
+
+``run`` generates a synthetic corpus (see ``benchmark.corpus``), runs the
+requested suites against it and prints each timing; ``--output`` also
+writes them as JSON.  ``compare`` lines up the timings in two such files,
+e.g. from two releases, and flags those which got slower or faster.
+"""
+import argparse
+import random
+import sys
+
+from .corpus import make_corpus
+from .harness import Bench
+from .harness import compare
+from .harness import format_params
+from .harness import read_report
+from .harness import write_report
+from .suites import SUITES
+
+def run(args, out=sys.stdout):
+    suites = args.suite or list(SUITES)
+    out.write('generating %d documents (seed %d)\n' % (args.docs, args.seed))
+    corpus = make_corpus(args.docs, seed=args.seed,
+                         vocabulary=args.vocabulary)
+    bench = Bench(repeat=args.repeat, out=out)
+    for name in suites:
+        out.write('\n[%s]\n' % name)
+        SUITES[name](bench, corpus, random.Random(args.seed))
+    report = bench.report(docs=args.docs, seed=args.seed,
+                          vocabulary=args.vocabulary, repeat=args.repeat,
+                          suites=suites)
+    if args.output:
+        write_report(report, args.output)
+        out.write('\nwrote %s\n' % args.output)
+    return report
+
+def run_compare(args, out=sys.stdout):
+    old = read_report(args.old)
+    new = read_report(args.new)
+    changed = 0
+    for name, params, old_best, new_best, ratio, flag in compare(
+            old, new, args.threshold):
+        if flag:
+            changed += 1
+        out.write('%-24s %-40s %10s %10s %6s %s\n' % (
+            name,
+            format_params(params),
+            '-' if old_best is None else '%.6f' % old_best,
+            '-' if new_best is None else '%.6f' % new_best,
+            '-' if ratio is None else '%.2f' % ratio,
+            flag,
+            ))
+    return changed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmark',
+                                     description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run_parser = commands.add_parser('run', help='run benchmarks')
+    run_parser.add_argument('--docs', type=int, default=10000,
+                            help='number of documents (default 10000)')
+    run_parser.add_argument('--seed', type=int, default=0,
+                            help='random seed (default 0)')
+    run_parser.add_argument('--vocabulary', type=int, default=5000,
+                            help='distinct words in the corpus '
+                                 '(default 5000)')
+    run_parser.add_argument('--repeat', type=int, default=3,
+                            help='runs per timing; the best is reported '
+                                 '(default 3)')
+    run_parser.add_argument('--suite', action='append', choices=list(SUITES),
+                            help='suite to run (repeatable; default all)')
+    run_parser.add_argument('--output', '-o',
+                            help='write the results to this JSON file')
+
+    compare_parser = commands.add_parser(
+        'compare', help='compare two JSON result files')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=0.1,
+                                help='relative change worth flagging '
+                                     '(default 0.1)')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        run(args)
+    else:
+        run_compare(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Synthetic, reproducible document corpora for the benchmarks.
+
+Every corpus is generated locally from a seed, so two runs with the same
+arguments index exactly the same documents.  Words are drawn from a
+Zipf-like distribution over a made-up vocabulary, which gives text and
+keyword indexes the long-tailed term frequencies of real text.
+"""
+import itertools
+import random
+
+SYLLABLES = (
+    'ba', 'be', 'bi', 'bo', 'da', 'de', 'di', 'do', 'ka', 'ke', 'ki', 'ko',
+    'la', 'le', 'li', 'lo', 'ma', 'me', 'mi', 'mo', 'na', 'ne', 'ni', 'no',
+    'ra', 're', 'ri', 'ro', 'sa', 'se', 'si', 'so', 'ta', 'te', 'ti', 'to',
+    )
+
+COLORS = ('red', 'green', 'blue', 'black', 'white')
+SIZES = ('small', 'medium', 'large')
+STYLES = ('plain', 'striped', 'dotted', 'checked')
+
+def facets():
+    """ Return every facet used by ``Document.topics``. """
+    result = set()
+    for name, values in (('color', COLORS), ('size', SIZES),
+                         ('style', STYLES)):
+        result.add(name)
+        result.update('%s:%s' % (name, value) for value in values)
+    return result
+
+def make_vocabulary(size):
+    """ Return ``size`` distinct pseudo-words, shortest first.  Words have
+    at least two syllables, which keeps them clear of stop words. """
+    words = []
+    for length in itertools.count(2):
+        for syllables in itertools.product(SYLLABLES, repeat=length):
+            words.append(''.join(syllables))
+            if len(words) == size:
+                return words
+
+def zipf_weights(size, exponent=1.0):
+    """ Return cumulative weights for choosing the n'th of ``size`` items
+    with probability proportional to ``1 / n ** exponent``. """
+    return list(itertools.accumulate(
+        1.0 / rank ** exponent for rank in range(1, size + 1)))
+
+class Document(object):
+    """ A synthetic document.  Attribute names double as the
+    discriminators of the benchmark catalog's indexes. """
+
+    def __init__(self, docid, title, author, date, price, tags, topics,
+                 text):
+        self.docid = docid
+        self.title = title
+        self.author = author
+        self.date = date
+        self.price = price
+        self.tags = tags
+        self.topics = topics
+        self.text = text
+
+def make_corpus(numdocs, seed=0, vocabulary=5000, text_length=50,
+                authors=1000, tags=200):
+    """ Return a list of ``numdocs`` documents with docids ``0`` to
+    ``numdocs - 1``, generated from ``seed``.
+
+    - ``title``: three words, so many documents share a title
+
+    - ``author``: one of ``authors`` names, Zipf-distributed
+
+    - ``date``: an integer day number spread uniformly over ten years
+
+    - ``price``: a float with two decimal places
+
+    - ``tags``: one to five of ``tags`` keywords, Zipf-distributed
+
+    - ``topics``: a color, size and style facet
+
+    - ``text``: ``text_length`` words from a ``vocabulary`` word
+      vocabulary, Zipf-distributed
+    """
+    rng = random.Random(seed)
+    words = make_vocabulary(vocabulary)
+    word_weights = zipf_weights(vocabulary)
+    author_names = ['author%d' % n for n in range(authors)]
+    author_weights = zipf_weights(authors)
+    tag_names = ['tag%d' % n for n in range(tags)]
+    tag_weights = zipf_weights(tags)
+    documents = []
+    for docid in range(numdocs):
+        text = rng.choices(words, cum_weights=word_weights, k=text_length)
+        documents.append(Document(
+            docid,
+            title=' '.join(text[:3]),
+            author=rng.choices(author_names, cum_weights=author_weights)[0],
+            date=rng.randrange(3650),
+            price=round(rng.uniform(1, 1000), 2),
+            tags=sorted(set(rng.choices(tag_names, cum_weights=tag_weights,
+                                        k=rng.randint(1, 5)))),
+            topics=['color:%s' % rng.choice(COLORS),
+                    'size:%s' % rng.choice(SIZES),
+                    'style:%s' % rng.choice(STYLES)],
+            text=' '.join(text),
+            ))
+    return documents
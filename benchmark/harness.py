@@ -0,0 +1,121 @@
+"""Timing and reporting for the benchmarks."""
+import json
+import platform
+import sys
+import time
+
+def hypatia_version():
+    try:
+        from importlib.metadata import version
+        return version('hypatia')
+    except Exception: # not installed
+        return None
+
+class Bench(object):
+    """ Times callables and collects the results.
+
+    Each result is a dictionary with the benchmark's ``name``, its
+    ``params`` (a dictionary of whatever distinguishes it from other runs of
+    the same benchmark), the number of operations ``ops`` performed per run,
+    and the ``best`` and ``mean`` wall-clock seconds per run over
+    ``repeat`` runs.  ``name`` plus ``params`` identify a result when
+    comparing two reports.
+    """
+
+    def __init__(self, repeat=3, timer=time.perf_counter, out=None):
+        self.repeat = repeat
+        self.timer = timer
+        self.out = out
+        self.results = []
+
+    def time(self, name, func, ops=1, setup=None, **params):
+        """ Call ``func`` ``repeat`` times (calling ``setup`` untimed
+        before each run, when given), record and return the result. """
+        timer = self.timer
+        times = []
+        for i in range(self.repeat):
+            if setup is not None:
+                setup()
+            start = timer()
+            func()
+            times.append(timer() - start)
+        result = {
+            'name': name,
+            'params': params,
+            'ops': ops,
+            'best': min(times),
+            'mean': sum(times) / len(times),
+            }
+        self.results.append(result)
+        if self.out is not None:
+            self.out.write('%s\n' % format_result(result))
+            self.out.flush()
+        return result
+
+    def report(self, **metadata):
+        """ Return the results, with ``metadata`` about the run and the
+        environment, as a JSON-serializable dictionary. """
+        metadata.update(
+            python=sys.version.split()[0],
+            implementation=platform.python_implementation(),
+            platform=platform.platform(),
+            hypatia=hypatia_version(),
+            time=time.strftime('%Y-%m-%dT%H:%M:%S'),
+            )
+        return {'metadata': metadata, 'results': self.results}
+
+def result_key(result):
+    return (result['name'],
+            tuple(sorted((k, repr(v)) for k, v in result['params'].items())))
+
+def format_params(params):
+    return ' '.join('%s=%s' % item for item in sorted(params.items()))
+
+def format_result(result):
+    best = result['best']
+    rate = ''
+    if best:
+        rate = ' (%.0f ops/s)' % (result['ops'] / best)
+    return '%-24s %-40s %10.6fs%s' % (
+        result['name'], format_params(result['params']), best, rate)
+
+def write_report(report, path):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def read_report(path):
+    with open(path) as f:
+        return json.load(f)
+
+def compare(old, new, threshold=0.1):
+    """ Compare the ``best`` timings of two reports.
+
+    Yield ``(name, params, old_best, new_best, ratio, flag)`` for every
+    benchmark in either report; ``ratio`` is ``new_best / old_best`` and
+    ``flag`` is ``'slower'`` or ``'faster'`` when it differs from 1 by more
+    than ``threshold``, ``'new'`` or ``'gone'`` for a benchmark in only one
+    of the reports, and ``''`` otherwise. """
+    old_results = dict((result_key(r), r) for r in old['results'])
+    new_results = dict((result_key(r), r) for r in new['results'])
+    for key in sorted(set(old_results) | set(new_results)):
+        old_result = old_results.get(key)
+        new_result = new_results.get(key)
+        result = new_result or old_result
+        old_best = old_result and old_result['best']
+        new_best = new_result and new_result['best']
+        ratio = None
+        if old_result is None:
+            flag = 'new'
+        elif new_result is None:
+            flag = 'gone'
+        else:
+            flag = ''
+            if old_best:
+                ratio = new_best / old_best
+                if ratio > 1 + threshold:
+                    flag = 'slower'
+                elif ratio < 1 - threshold:
+                    flag = 'faster'
+        yield (result['name'], result['params'], old_best, new_best, ratio,
+               flag)
@@ -0,0 +1,370 @@
+"""The benchmark suites.
+
+Each suite is a function accepting a ``Bench``, a corpus (see
+``benchmark.corpus``) and a ``random.Random``; it records its timings
+with ``bench.time``.  ``SUITES`` maps suite names to these functions.
+"""
+import collections
+
+from hypatia.catalog import Catalog
+from hypatia.facet import FacetIndex
+from hypatia.field import FieldIndex
+from hypatia.interfaces import FWSCAN
+from hypatia.interfaces import NBEST
+from hypatia.interfaces import TIMSORT
+from hypatia.keyword import KeywordIndex
+from hypatia.text import TextIndex
+from hypatia import query
+from hypatia.query import arrays
+
+from .corpus import facets
+
+# the number of queries timed together by the query suites
+QUERIES = 100
+
+def make_indexes():
+    """ Return a dictionary of freshly made indexes, one per
+    ``Document`` attribute. """
+    return {
+        'title': FieldIndex('title'),
+        'author': FieldIndex('author'),
+        'date': FieldIndex('date'),
+        'price': FieldIndex('price'),
+        'tags': KeywordIndex('tags'),
+        'topics': FacetIndex('topics', facets()),
+        'text': TextIndex('text'),
+        }
+
+def make_catalog(corpus):
+    catalog = Catalog()
+    catalog.update(make_indexes())
+    catalog.index_docs((doc.docid, doc) for doc in corpus)
+    return catalog
+
+_catalogs = {}
+
+def get_catalog(corpus):
+    """ Return a catalog indexing ``corpus``, shared between suites. """
+    catalog = _catalogs.get(id(corpus))
+    if catalog is None:
+        catalog = _catalogs[id(corpus)] = make_catalog(corpus)
+    return catalog
+
+def indexing(bench, corpus, rng):
+    """ Documents per second indexed by each index type, one at a time
+    and in bulk, and by a catalog holding all of them. """
+    pairs = [(doc.docid, doc) for doc in corpus]
+    numdocs = len(pairs)
+    for name in sorted(make_indexes()):
+        holder = {}
+
+        def setup():
+            holder['index'] = make_indexes()[name]
+
+        def one_at_a_time():
+            index_doc = holder['index'].index_doc
+            for docid, doc in pairs:
+                index_doc(docid, doc)
+
+        def bulk():
+            holder['index'].index_docs(pairs)
+
+        bench.time('index_doc', one_at_a_time, ops=numdocs, setup=setup,
+                   index=name)
+        bench.time('index_docs', bulk, ops=numdocs, setup=setup, index=name)
+
+    holder = {}
+
+    def setup():
+        catalog = holder['catalog'] = Catalog()
+        catalog.update(make_indexes())
+
+    def one_at_a_time():
+        index_doc = holder['catalog'].index_doc
+        for docid, doc in pairs:
+            index_doc(docid, doc)
+
+    def bulk():
+        holder['catalog'].index_docs(pairs)
+
+    bench.time('index_doc', one_at_a_time, ops=numdocs, setup=setup,
+               index='catalog')
+    bench.time('index_docs', bulk, ops=numdocs, setup=setup,
+               index='catalog')
+
+    catalog = get_catalog(corpus)
+    reindexed = rng.sample(pairs, min(numdocs, 1000))
+    bench.time('reindex_doc',
+               lambda: [catalog.reindex_doc(docid, doc)
+                        for docid, doc in reindexed],
+               ops=len(reindexed), index='catalog')
+
+def _run_queries(queries):
+    def run():
+        for q in queries:
+            len(q.execute())
+    return run
+
+def comparators(bench, corpus, rng):
+    """ Queries per second for every comparator, against the index types
+    which support it. """
+    catalog = get_catalog(corpus)
+    author = catalog['author']
+    date = catalog['date']
+    tags = catalog['tags']
+    topics = catalog['topics']
+    text = catalog['text']
+
+    def sample(attr, k=1):
+        return [getattr(doc, attr) for doc in rng.sample(corpus, k)]
+
+    def dates():
+        return sorted(rng.randrange(3650) for i in range(2))
+
+    def some_tags():
+        return sorted(set(t for ts in sample('tags', 2) for t in ts))
+
+    def word():
+        return rng.choice(sample('text')[0].split())
+
+    makers = [
+        (query.Eq, author, lambda: sample('author')[0]),
+        (query.NotEq, author, lambda: sample('author')[0]),
+        (query.Gt, date, lambda: rng.randrange(3650)),
+        (query.Ge, date, lambda: rng.randrange(3650)),
+        (query.Lt, date, lambda: rng.randrange(3650)),
+        (query.Le, date, lambda: rng.randrange(3650)),
+        (query.Any, author, lambda: sample('author', 5)),
+        (query.NotAny, author, lambda: sample('author', 5)),
+        (query.Eq, tags, lambda: sample('tags')[0][0]),
+        (query.Any, tags, some_tags),
+        (query.All, tags, some_tags),
+        (query.NotAll, tags, some_tags),
+        (query.NotAny, tags, some_tags),
+        (query.All, topics, lambda: sample('topics')[0][:2]),
+        (query.Contains, text, word),
+        (query.NotContains, text, word),
+        ]
+    for factory, index, value in makers:
+        queries = [factory(index, value()) for i in range(QUERIES)]
+        bench.time(factory.__name__, _run_queries(queries), ops=QUERIES,
+                   index=index.discriminator)
+    for factory in (query.InRange, query.NotInRange):
+        queries = [factory(date, *dates()) for i in range(QUERIES)]
+        bench.time(factory.__name__, _run_queries(queries), ops=QUERIES,
+                   index='date')
+
+def boolean(bench, corpus, rng):
+    """ Queries per second for ``And``, ``Or`` and ``Not`` combinations of
+    more and less selective comparators, also combined as NumPy arrays
+    when NumPy is installed. """
+    catalog = get_catalog(corpus)
+    author = catalog['author']
+    date = catalog['date']
+    tags = catalog['tags']
+    topics = catalog['topics']
+
+    def doc():
+        return rng.choice(corpus)
+
+    makers = {
+        'eq_and_range': lambda d: query.And(
+            query.Eq(author, d.author),
+            query.InRange(date, d.date - 365, d.date + 365)),
+        'facet_and_tag': lambda d: query.And(
+            query.All(topics, d.topics[:1]),
+            query.Any(tags, d.tags)),
+        'three_way_and': lambda d: query.And(
+            query.All(topics, d.topics[:2]),
+            query.Ge(date, d.date),
+            query.Any(tags, d.tags[:1])),
+        'and_not': lambda d: query.And(
+            query.All(topics, d.topics[:1]),
+            query.Not(query.Eq(author, d.author))),
+        'or': lambda d: query.Or(
+            query.Eq(author, d.author),
+            query.Any(tags, d.tags)),
+        'wide_or': lambda d: query.Or(*[
+            query.InRange(date, start, start + 30)
+            for start in range(d.date % 100, 3650, 120)]),
+        }
+    vectorized = [False]
+    if arrays.numpy is not None:
+        vectorized.append(True)
+    for name in sorted(makers):
+        queries = [makers[name](doc()) for i in range(QUERIES)]
+        for flag in vectorized:
+            params = {'vectorized': True} if flag else {}
+            query.BoolOp.vectorized = flag
+            try:
+                bench.time('boolean', _run_queries(queries), ops=QUERIES,
+                           query=name, **params)
+            finally:
+                query.BoolOp.vectorized = False
+
+def _fractions(numdocs):
+    fraction = 1
+    while numdocs * fraction >= 1:
+        yield fraction
+        fraction /= 16.0
+
+def sorting(bench, corpus, rng):
+    """ Seconds per sort of result sets of different sizes by a field
+    index, with each sort strategy, with and without limits, forwards and
+    backwards, and with and without sort ranks. """
+    index = get_catalog(corpus)['date']
+    numdocs = len(corpus)
+    docids = [doc.docid for doc in corpus]
+    strategies = [
+        (None, None, False),
+        (None, None, True),
+        (FWSCAN, None, False),
+        (TIMSORT, None, False),
+        (TIMSORT, None, True),
+        ]
+    for limit in (10, 1000):
+        if limit < numdocs:
+            strategies.extend([
+                (None, limit, False),
+                (None, limit, True),
+                (FWSCAN, limit, False),
+                (NBEST, limit, False),
+                (NBEST, limit, True),
+                (TIMSORT, limit, False),
+                ])
+    for ranks in (False, True):
+        if ranks:
+            index.enable_sort_ranks()
+        for fraction in _fractions(numdocs):
+            rlen = int(numdocs * fraction)
+            result = index.family.IF.Set(rng.sample(docids, rlen))
+            for sort_type, limit, reverse in strategies:
+
+                def run():
+                    for docid in index.sort(result, reverse=reverse,
+                                            limit=limit,
+                                            sort_type=sort_type):
+                        pass
+
+                bench.time('sort', run, rlen=rlen, limit=limit,
+                           reverse=reverse, sort_type=sort_type or 'default',
+                           ranks=ranks)
+    index.disable_sort_ranks()
+
+def text(bench, corpus, rng):
+    """ Queries per second for text index searches: common, rare and
+    combined words, phrases and globs, plus sorting by relevance and
+    fetching only the best results, with and without impact order,
+    phrases with and without positions, and globs starting with a
+    wildcard, which need n-grams. """
+    index = get_catalog(corpus)['text']
+    counts = collections.Counter()
+    for doc in corpus:
+        counts.update(set(doc.text.split()))
+    ranked = [word for word, count in counts.most_common()]
+    common = ranked[:len(ranked) // 100 + 1]
+    rare = ranked[-(len(ranked) // 2 + 1):]
+
+    def phrase():
+        words = rng.choice(corpus).text.split()
+        start = rng.randrange(len(words) - 1)
+        return '"%s"' % ' '.join(words[start:start + 2])
+
+    makers = {
+        'common': lambda: rng.choice(common),
+        'rare': lambda: rng.choice(rare),
+        'common_and_rare': lambda: '%s %s' % (rng.choice(common),
+                                              rng.choice(rare)),
+        'common_or_common': lambda: '%s or %s' % (rng.choice(common),
+                                                  rng.choice(common)),
+        'common_or_rare': lambda: '%s or %s' % (rng.choice(common),
+                                                rng.choice(rare)),
+        'common_not_common': lambda: '%s not %s' % (rng.choice(common),
+                                                    rng.choice(common)),
+        'phrase': phrase,
+        'glob': lambda: '%s*' % rng.choice(common)[:3],
+        }
+    for name in sorted(makers):
+        terms = [makers[name]() for i in range(QUERIES)]
+
+        def run():
+            for term in terms:
+                index.apply(term)
+
+        bench.time('text', run, ops=QUERIES, query=name)
+        if name == 'phrase':
+            index.index.enable_positions()
+            try:
+                bench.time('text', run, ops=QUERIES, query=name,
+                           positions=True)
+            finally:
+                index.index.disable_positions()
+
+    suffixes = ['*%s' % rng.choice(common)[-3:] for i in range(QUERIES)]
+
+    def run_suffixes():
+        for term in suffixes:
+            index.apply(term)
+
+    index.lexicon.enable_ngrams()
+    try:
+        bench.time('text', run_suffixes, ops=QUERIES, query='suffix_glob',
+                   ngrams=True)
+    finally:
+        index.lexicon.disable_ngrams()
+
+    results = [index.apply(rng.choice(common)) for i in range(QUERIES)]
+    for limit in (None, 10):
+
+        def run():
+            for result in results:
+                index.sort(result, limit=limit)
+
+        bench.time('text_sort', run, ops=QUERIES, limit=limit)
+
+    for name in ('common', 'common_or_common', 'common_or_rare', 'glob'):
+        terms = [makers[name]() for i in range(QUERIES)]
+
+        def run():
+            for term in terms:
+                index.sort(index.apply(term), limit=10)
+
+        def run_top():
+            for term in terms:
+                index.sort(index.apply_top(term, 10))
+
+        bench.time('text_top', run, ops=QUERIES, query=name, top=False)
+        bench.time('text_top', run_top, ops=QUERIES, query=name, top=True)
+        index.index.enable_impact_order()
+        try:
+            bench.time('text_top', run_top, ops=QUERIES, query=name,
+                       top=True, impact_order=True)
+        finally:
+            index.index.disable_impact_order()
+
+def facets_(bench, corpus, rng):
+    """ Seconds per facet count of result sets of different sizes, by
+    lookup, by intersection and with the strategy chosen by the index. """
+    index = get_catalog(corpus)['topics']
+    numdocs = len(corpus)
+    docids = [doc.docid for doc in corpus]
+    for fraction in _fractions(numdocs):
+        rlen = int(numdocs * fraction)
+        result = index.family.IF.Set(rng.sample(docids, rlen))
+        for intersect in (None, False, True):
+            bench.time('facet_counts',
+                       lambda: index.counts(result, intersect=intersect),
+                       rlen=rlen, intersect=intersect)
+            bench.time('facet_counts',
+                       lambda: index.counts(result, ['color'],
+                                            intersect=intersect),
+                       rlen=rlen, intersect=intersect, omit='color')
+
+SUITES = collections.OrderedDict([
+    ('indexing', indexing),
+    ('comparators', comparators),
+    ('boolean', boolean),
+    ('sorting', sorting),
+    ('text', text),
+    ('facets', facets_),
+    ])
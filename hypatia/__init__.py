@@ -1,9 +1,20 @@
 class RangeValue:
     """ Use in fieldindex query to indicate a range search for a term """
-    def __init__(self, start, end):
+    def __init__(self, start, end, excludemin=False, excludemax=False):
         self.start = start
         self.end = end
+        self.excludemin = excludemin
+        self.excludemax = excludemax
 
     def as_tuple(self):
         return (self.start, self.end)
 
+    def __contains__(self, value):
+        start, end = self.start, self.end
+        if start is not None:
+            if value < start or (self.excludemin and value == start):
+                return False
+        if end is not None:
+            if value > end or (self.excludemax and value == end):
+                return False
+        return True
@@ -0,0 +1,234 @@
+"""Compressed bitmap sets of docids
+
+A ``Bitmap`` splits its docids into chunks by their high bits, in the
+manner of a roaring bitmap, and keeps the low bits of each chunk's docids
+as the bits of a Python integer.  Intersection, union, difference and
+counting are then bitwise operations on integers, done in C a machine word
+at a time.  Each chunk is a persistent object of its own, so adding a
+docid rewrites one chunk rather than the whole set; chunks holding few
+docids are stored as arrays of 16-bit offsets, and full ones as the bits
+themselves.
+"""
+from array import array
+from itertools import compress
+from itertools import groupby
+import sys
+
+import BTrees
+from persistent import Persistent
+
+# Docids with the same high bits share a chunk of CHUNK_SIZE bits.
+CHUNK_SHIFT = 16
+CHUNK_SIZE = 1 << CHUNK_SHIFT
+LOW_MASK = CHUNK_SIZE - 1
+
+# Chunks holding at most this many docids are stored as an array of their
+# offsets (two bytes each) rather than as a bitmap (CHUNK_SIZE / 8 bytes).
+ARRAY_MAX = CHUNK_SIZE // 16
+
+_TO_FLAGS = bytes.maketrans(b'01', b'\x00\x01')
+_TO_DIGITS = bytes.maketrans(b'\x00\x01', b'01')
+
+try:
+    _popcount = int.bit_count
+except AttributeError: # pragma: no cover (Python < 3.10)
+    def _popcount(bits):
+        return bin(bits).count('1')
+
+def _flags(bits):
+    # A bytes object holding a 0 or 1 for each bit of bits, least
+    # significant first
+    return bin(bits)[:1:-1].encode('ascii').translate(_TO_FLAGS)
+
+def _offsets(bits, base=0):
+    # The positions of the set bits of bits, plus base, in ascending order
+    flags = _flags(bits)
+    return compress(range(base, base + len(flags)), flags)
+
+def _bits(offsets):
+    # The inverse of _offsets
+    flags = bytearray(CHUNK_SIZE)
+    for offset in offsets:
+        flags[offset] = 1
+    return int(bytes(flags[::-1]).translate(_TO_DIGITS), 2)
+
+def _split(docid):
+    return docid >> CHUNK_SHIFT, docid & LOW_MASK
+
+class Chunk(Persistent):
+    """ The docids of a ``Bitmap`` which share their high bits, as the set
+    bits of the integer ``bits`` """
+
+    def __init__(self, bits=0):
+        self.bits = bits
+
+    def __len__(self):
+        return _popcount(self.bits)
+
+    def __getstate__(self):
+        bits = self.bits
+        if _popcount(bits) > ARRAY_MAX:
+            return bits
+        offsets = array('H', _offsets(bits))
+        if sys.byteorder != 'little': # pragma: no cover
+            offsets.byteswap()
+        return offsets.tobytes()
+
+    def __setstate__(self, state):
+        if isinstance(state, bytes):
+            offsets = array('H')
+            offsets.frombytes(state)
+            if sys.byteorder != 'little': # pragma: no cover
+                offsets.byteswap()
+            state = _bits(offsets)
+        Persistent.__setstate__(self, {'bits': state})
+
+class Bitmap(Persistent):
+    """ A set of docids (integers within the range of ``family``) stored
+    as a compressed bitmap.
+
+    Supports the parts of the ``IF.Set`` API used by indexes (``insert``,
+    ``remove``, ``update``, ``len``, ``in`` and iteration in ascending
+    order) plus ``intersection``, ``union`` and ``difference`` (also
+    spelled ``&``, ``|`` and ``-``), which accept another ``Bitmap`` or
+    any iterable of docids and return a new ``Bitmap``.  ``to_set``
+    converts a ``Bitmap`` to an ``IF.Set`` for use with the rest of
+    ``BTrees``.
+    """
+
+    family = BTrees.family64
+
+    def __init__(self, docids=(), family=None):
+        if family is not None:
+            self.family = family
+        self._chunks = self.family.IO.BTree()
+        self.update(docids)
+
+    @classmethod
+    def _from_bits(cls, items, family):
+        # Make a bitmap from (high, bits) pairs, skipping empty chunks
+        bitmap = cls(family=family)
+        bitmap._chunks.update([(high, Chunk(bits))
+                               for high, bits in items if bits])
+        return bitmap
+
+    def _bits(self):
+        # (high, bits) pairs in ascending order
+        return [(high, chunk.bits) for high, chunk in self._chunks.items()]
+
+    def __len__(self):
+        return sum([_popcount(chunk.bits) for chunk in self._chunks.values()])
+
+    def __bool__(self):
+        return bool(self._chunks)
+
+    def __contains__(self, docid):
+        high, low = _split(docid)
+        chunk = self._chunks.get(high)
+        return chunk is not None and bool(chunk.bits >> low & 1)
+
+    def __iter__(self):
+        for high, chunk in self._chunks.items():
+            for docid in _offsets(chunk.bits, high << CHUNK_SHIFT):
+                yield docid
+
+    keys = __iter__
+
+    def __repr__(self):
+        return '<%s of %d docids>' % (self.__class__.__name__, len(self))
+
+    def insert(self, docid):
+        """ Add ``docid``; return 1 if it was added, 0 if it was already
+        present. """
+        high, low = _split(docid)
+        chunk = self._chunks.get(high)
+        if chunk is None:
+            self._chunks[high] = Chunk(1 << low)
+            return 1
+        bits = chunk.bits
+        if bits >> low & 1:
+            return 0
+        chunk.bits = bits | 1 << low
+        return 1
+
+    add = insert
+
+    def remove(self, docid):
+        """ Remove ``docid``, raising ``KeyError`` if it isn't present. """
+        high, low = _split(docid)
+        chunk = self._chunks.get(high)
+        if chunk is None or not chunk.bits >> low & 1:
+            raise KeyError(docid)
+        bits = chunk.bits & ~(1 << low)
+        if bits:
+            chunk.bits = bits
+        else:
+            del self._chunks[high]
+
+    def update(self, docids):
+        """ Add each of ``docids``; return the number which were added. """
+        if isinstance(docids, Bitmap):
+            items = docids._bits()
+        else:
+            items = [
+                (high, _bits([docid & LOW_MASK for docid in group]))
+                for high, group in groupby(
+                    sorted(docids), lambda docid: docid >> CHUNK_SHIFT)
+                ]
+        chunks = self._chunks
+        added = 0
+        for high, bits in items:
+            chunk = chunks.get(high)
+            if chunk is None:
+                chunks[high] = Chunk(bits)
+                added += _popcount(bits)
+            else:
+                new = chunk.bits | bits
+                if new != chunk.bits:
+                    added += _popcount(new) - _popcount(chunk.bits)
+                    chunk.bits = new
+        return added
+
+    def _coerce(self, other):
+        if isinstance(other, Bitmap):
+            return other
+        return Bitmap(other, self.family)
+
+    def intersection(self, other):
+        other = self._coerce(other)._chunks
+        return self._from_bits(
+            [(high, bits & other[high].bits)
+             for high, bits in self._bits() if high in other],
+            self.family)
+
+    __and__ = intersection
+
+    def intersection_len(self, other):
+        """ Return ``len(self.intersection(other))`` without making the
+        intersection. """
+        other = self._coerce(other)._chunks
+        return sum([_popcount(bits & other[high].bits)
+                    for high, bits in self._bits() if high in other])
+
+    def union(self, other):
+        result = self._from_bits(self._bits(), self.family)
+        result.update(self._coerce(other))
+        return result
+
+    __or__ = union
+
+    def difference(self, other):
+        other = self._coerce(other)._chunks
+        return self._from_bits(
+            [(high, bits & ~other[high].bits if high in other else bits)
+             for high, bits in self._bits()],
+            self.family)
+
+    __sub__ = difference
+
+    def to_set(self):
+        """ Return the docids as an ``IF.Set`` """
+        result = self.family.IF.Set()
+        for high, bits in self._bits():
+            result.update(_offsets(bits, high << CHUNK_SHIFT))
+        return result
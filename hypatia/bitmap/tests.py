@@ -0,0 +1,160 @@
+import unittest
+
+class Test_helpers(unittest.TestCase):
+
+    def test_offsets_and_bits(self):
+        from . import _bits
+        from . import _offsets
+        self.assertEqual(list(_offsets(0)), [])
+        self.assertEqual(list(_offsets(0b1011)), [0, 1, 3])
+        self.assertEqual(list(_offsets(0b1011, 8)), [8, 9, 11])
+        self.assertEqual(_bits([0, 1, 3]), 0b1011)
+        self.assertEqual(_bits([]), 0)
+        self.assertEqual(list(_offsets(_bits([65535]))), [65535])
+
+class TestChunk(unittest.TestCase):
+
+    def _makeOne(self, bits=0):
+        from . import Chunk
+        return Chunk(bits)
+
+    def test_len(self):
+        self.assertEqual(len(self._makeOne()), 0)
+        self.assertEqual(len(self._makeOne(0b1011)), 3)
+
+    def test_state_sparse(self):
+        chunk = self._makeOne(1 << 65535 | 0b101)
+        state = chunk.__getstate__()
+        self.assertEqual(len(state), 6)
+        other = self._makeOne()
+        other.__setstate__(state)
+        self.assertEqual(other.bits, chunk.bits)
+
+    def test_state_dense(self):
+        from . import ARRAY_MAX
+        bits = (1 << (ARRAY_MAX + 1)) - 1
+        chunk = self._makeOne(bits)
+        self.assertEqual(chunk.__getstate__(), bits)
+        other = self._makeOne()
+        other.__setstate__(bits)
+        self.assertEqual(other.bits, bits)
+
+class TestBitmap(unittest.TestCase):
+
+    def _makeOne(self, docids=(), family=None):
+        from . import Bitmap
+        return Bitmap(docids, family)
+
+    def test_empty(self):
+        bitmap = self._makeOne()
+        self.assertEqual(len(bitmap), 0)
+        self.assertFalse(bitmap)
+        self.assertEqual(list(bitmap), [])
+        self.assertFalse(1 in bitmap)
+
+    def test_ctor(self):
+        docids = [70000, 3, -5, 1 << 40, 3, 65536]
+        bitmap = self._makeOne(docids)
+        self.assertEqual(list(bitmap), sorted(set(docids)))
+        self.assertEqual(list(bitmap.keys()), sorted(set(docids)))
+        self.assertEqual(len(bitmap), 5)
+        self.assertTrue(bitmap)
+        for docid in docids:
+            self.assertTrue(docid in bitmap)
+        for docid in (4, -4, 65537, 131072):
+            self.assertFalse(docid in bitmap)
+
+    def test_ctor_w_family(self):
+        import BTrees
+        bitmap = self._makeOne([1], family=BTrees.family32)
+        self.assertEqual(bitmap.family, BTrees.family32)
+        self.assertTrue(isinstance(bitmap.to_set(), BTrees.family32.IF.Set))
+
+    def test_repr(self):
+        self.assertEqual(repr(self._makeOne([1, 2])), '<Bitmap of 2 docids>')
+
+    def test_insert(self):
+        bitmap = self._makeOne()
+        self.assertEqual(bitmap.insert(5), 1)
+        self.assertEqual(bitmap.insert(5), 0)
+        self.assertEqual(bitmap.add(6), 1)
+        self.assertEqual(bitmap.insert(1 << 20), 1)
+        self.assertEqual(list(bitmap), [5, 6, 1 << 20])
+
+    def test_remove(self):
+        bitmap = self._makeOne([1, 2, 70000])
+        bitmap.remove(1)
+        self.assertEqual(list(bitmap), [2, 70000])
+        bitmap.remove(70000)
+        self.assertEqual(len(bitmap._chunks), 1)
+        self.assertRaises(KeyError, bitmap.remove, 70000)
+        self.assertRaises(KeyError, bitmap.remove, 3)
+
+    def test_update(self):
+        bitmap = self._makeOne([1, 2])
+        self.assertEqual(bitmap.update([2, 3, 70000]), 2)
+        self.assertEqual(bitmap.update([2, 3]), 0)
+        self.assertEqual(bitmap.update(self._makeOne([4, 1 << 30])), 2)
+        self.assertEqual(list(bitmap), [1, 2, 3, 4, 70000, 1 << 30])
+
+    def test_update_w_IF_set(self):
+        import BTrees
+        docids = BTrees.family64.IF.TreeSet(range(0, 300000, 7))
+        bitmap = self._makeOne(docids)
+        self.assertEqual(list(bitmap), list(docids))
+
+    def test_intersection(self):
+        bitmap = self._makeOne([1, 2, 3, 70000, 140000])
+        other = self._makeOne([2, 3, 4, 140000, 200000])
+        result = bitmap.intersection(other)
+        self.assertEqual(list(result), [2, 3, 140000])
+        self.assertEqual(list(bitmap & [3, 70000]), [3, 70000])
+        self.assertEqual(bitmap.intersection_len(other), 3)
+        self.assertEqual(bitmap.intersection_len([1, 5]), 1)
+        self.assertEqual(list(bitmap & [200000]), [])
+        self.assertEqual(len((bitmap & [4])._chunks), 0)
+
+    def test_union(self):
+        bitmap = self._makeOne([1, 70000])
+        result = bitmap.union(self._makeOne([2, 140000]))
+        self.assertEqual(list(result), [1, 2, 70000, 140000])
+        self.assertEqual(list(bitmap | [0]), [0, 1, 70000])
+        self.assertEqual(list(bitmap), [1, 70000])
+
+    def test_difference(self):
+        bitmap = self._makeOne([1, 2, 70000])
+        result = bitmap.difference(self._makeOne([2, 70000, 5]))
+        self.assertEqual(list(result), [1])
+        self.assertEqual(len(result._chunks), 1)
+        self.assertEqual(list(bitmap - [1]), [2, 70000])
+
+    def test_to_set(self):
+        import BTrees
+        docids = list(range(-10, 200000, 3))
+        result = self._makeOne(docids).to_set()
+        self.assertTrue(isinstance(result, BTrees.family64.IF.Set))
+        self.assertEqual(list(result), docids)
+
+    def test_persistence(self):
+        import transaction
+        from ZODB import DB
+        from ZODB.MappingStorage import MappingStorage
+        db = DB(MappingStorage())
+        try:
+            conn = db.open()
+            conn.root()['bitmap'] = self._makeOne(range(0, 140000, 2))
+            transaction.commit()
+            conn2 = db.open()
+            bitmap = conn2.root()['bitmap']
+            self.assertEqual(list(bitmap), list(range(0, 140000, 2)))
+            bitmap.insert(1)
+            bitmap.remove(4)
+            transaction.commit()
+            conn.sync()
+            bitmap = conn.root()['bitmap']
+            self.assertTrue(1 in bitmap)
+            self.assertFalse(4 in bitmap)
+            self.assertEqual(len(bitmap), 70000)
+        finally:
+            transaction.abort()
+            db.close()
@@ -1,4 +1,8 @@
+from concurrent.futures import ProcessPoolExecutor
+import itertools
 import operator
+import os
+import pickle
 
 import BTrees
 from persistent.mapping import PersistentMapping
@@ -7,11 +11,16 @@ from zope.interface import implementer
 from ..interfaces import ICatalog
 from ..interfaces import ICatalogQuery
 from ..query import parse_query
+from ..util import LRUCache
+
+_marker = object()
 
 @implementer(ICatalog)
 class Catalog(PersistentMapping):
 
     family = BTrees.family64
+    query_cache_size = 0
+    parse_cache_size = 1000
 
     def __init__(self, family=None):
         PersistentMapping.__init__(self)
@@ -38,6 +47,85 @@ class Catalog(PersistentMapping):
         for index in self.values():
             index.index_doc(docid, obj)
 
+    def index_docs(self, pairs):
+        """Register many documents in indexes of this catalog.
+
+        ``pairs`` is an iterable of ``(docid, obj)`` tuples.  The result is
+        the same as calling ``index_doc`` for each of them, but indexes which
+        support it add new documents in bulk, so this is the faster way to
+        populate an empty catalog.
+        """
+        pairs = list(pairs)
+        for docid, obj in pairs:
+            assertint(docid)
+        for index in self.values():
+            index_docs = getattr(index, 'index_docs', None)
+            if index_docs is None:
+                for docid, obj in pairs:
+                    index.index_doc(docid, obj)
+            else:
+                index_docs(pairs)
+
+    def merge(self, other):
+        """Add the documents indexed by ``other`` to this catalog.
+
+        ``other`` is a mapping with the same index names as this catalog,
+        whose indexes are configured like this catalog's and hold none of
+        its document ids.  Each index's ``merge`` method is used.
+        """
+        for name, index in self.items():
+            index.merge(other[name])
+
+    def rebuild(self, docids, loader, max_workers=None, shards=None,
+                executor=None):
+        """Reset this catalog, then index the documents ``docids`` using a
+        pool of worker processes.
+
+        ``loader`` is called in the workers with a sorted list of docids and
+        must return an iterable of ``(docid, obj)`` pairs for them.  It, and
+        the catalog's (reset) indexes, are pickled to be sent to the
+        workers, so ``loader`` should be a module-level function.
+
+        The docids are split into ``shards`` contiguous ranges (by default,
+        four per worker).  Each worker builds partial indexes for a range
+        with ``index_docs``, and the partial indexes are merged into this
+        catalog in docid order.  ``max_workers`` is passed to the
+        ``concurrent.futures.ProcessPoolExecutor`` which is used unless an
+        ``executor`` is passed.
+
+        A ``ValueError`` is raised before any document is indexed if a
+        docid isn't an integer, or if an index (e.g. one with a lambda as
+        its discriminator) or, without an ``executor``, ``loader`` can't be
+        pickled.
+        """
+        docids = list(docids)
+        for docid in docids:
+            assertint(docid)
+        docids.sort()
+        if executor is None:
+            _assert_picklable('loader', loader)
+        self.reset()
+        if shards is None:
+            shards = 4 * (max_workers or os.cpu_count() or 1)
+        size = -(-len(docids) // shards) or 1
+        ranges = [docids[i:i + size] for i in range(0, len(docids), size)]
+        for name, index in self.items():
+            _assert_picklable('index %r' % name, index)
+        template = pickle.dumps(dict(self))
+        if executor is None:
+            with ProcessPoolExecutor(max_workers) as executor:
+                self._merge_partials(executor, template, loader, ranges)
+        else:
+            self._merge_partials(executor, template, loader, ranges)
+
+    def _merge_partials(self, executor, template, loader, ranges):
+        # ranges are ascending, so merging in order appends to the BTrees
+        for partial in executor.map(_build_partial,
+                                    itertools.repeat(template),
+                                    itertools.repeat(loader),
+                                    ranges):
+            self.merge(partial)
+
     def unindex_doc(self, docid):
         """Unregister the document id from indexes of this catalog.
         """
@@ -58,6 +146,85 @@ class Catalog(PersistentMapping):
         for index in self.values():
             index.reindex_doc(docid, obj)
 
+    def apply_query(self, query, names=None):
+        """ Return the set of docids matched by ``query``.
+
+        If ``query_cache_size`` is nonzero, the result is remembered and
+        reused for an equivalent query until one of the indexes it consults
+        changes.  The cache is volatile, so each database connection keeps
+        its own.
+        """
+        if not self.query_cache_size:
+            return query._apply(names)
+        key = query._cache_key(names)
+        if key is None:
+            return query._apply(names)
+        cache = getattr(self, '_v_query_cache', None)
+        if cache is None or cache.maxsize != self.query_cache_size:
+            cache = self._v_query_cache = LRUCache(self.query_cache_size)
+        result = cache.get(key, _marker)
+        if result is _marker:
+            result = query._apply(names)
+            cache[key] = result
+        return result
+
+    def parse_query(self, expr, optimize_query=True):
+        """ Return the query object for the query expression ``expr`` (see
+        ``hypatia.query.parse_query``).
+
+        The last ``parse_cache_size`` queries parsed are remembered, and
+        returned again for the same expression as long as the indexes they
+        use are still in the catalog under the same names.  The cache is
+        volatile, so each database connection keeps its own.  A query
+        returned by this method may be shared, so it mustn't be modified.
+        """
+        if not self.parse_cache_size:
+            return parse_query(expr, self, optimize_query)
+        cache = getattr(self, '_v_parse_cache', None)
+        if cache is None or cache.maxsize != self.parse_cache_size:
+            cache = self._v_parse_cache = LRUCache(self.parse_cache_size)
+        key = (expr, optimize_query)
+        cached = cache.get(key)
+        if cached is not None:
+            query, used = cached
+            if all([self.get(name) is index for name, index in used]):
+                return query
+        recorder = _IndexRecorder(self)
+        query = parse_query(expr, recorder, optimize_query)
+        cache[key] = (query, tuple(recorder.used.items()))
+        return query
+
+class _IndexRecorder(object):
+    # Looks up indexes in a catalog for hypatia.query.parse_query, noting
+    # which were used
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.used = {}
+
+    def __getitem__(self, name):
+        index = self.used[name] = self.catalog[name]
+        return index
+
+def _build_partial(template, loader, docids):
+    # Runs in a worker process: index docids into fresh copies of the
+    # catalog's indexes, which are returned to be merged by the parent.
+    indexes = pickle.loads(template)
+    pairs = list(loader(docids))
+    for docid, obj in pairs:
+        assertint(docid)
+    for index in indexes.values():
+        index.index_docs(pairs)
+    return indexes
+
+def _assert_picklable(what, obj):
+    # Catalog.rebuild sends obj to worker processes
+    try:
+        pickle.dumps(obj)
+    except (pickle.PicklingError, AttributeError, TypeError) as e:
+        raise ValueError('%s must be picklable to be sent to worker '
+                         'processes: %s' % (what, e))
+
 def assertint(docid):
     if not isinstance(docid, int):
         raise ValueError('%r is not an integer value; document ids must be '
@@ -177,8 +344,16 @@ class CatalogQuery(object):
         Return a tuple of ``(num, resultseq)``.
         """
         if isinstance(queryobject, str):
-            queryobject = parse_query(queryobject, self.catalog)
-        results = queryobject._apply(names)
+            catalog_parse_query = getattr(self.catalog, 'parse_query', None)
+            if catalog_parse_query is None:
+                queryobject = parse_query(queryobject, self.catalog)
+            else:
+                queryobject = catalog_parse_query(queryobject)
+        apply_query = getattr(self.catalog, 'apply_query', None)
+        if apply_query is None:
+            results = queryobject._apply(names)
+        else:
+            results = apply_query(queryobject, names)
         return self.sort(results, sort_index, limit, sort_type, reverse)
 
     __call__ = query
@@ -56,6 +56,122 @@ class TestCatalog(unittest.TestCase):
         catalog['name'] = idx
         self.assertRaises(ValueError, catalog.index_doc, 'abc', 'value')
 
+    def test_index_docs(self):
+        catalog = self._makeOne()
+        idx = DummyIndex()
+        bulk = DummyIndex()
+        bulk.index_docs = lambda pairs: setattr(bulk, 'pairs', pairs)
+        catalog['name'] = idx
+        catalog['bulk'] = bulk
+        catalog.index_docs(iter([(1, 'one'), (2, 'two')]))
+        self.assertEqual(idx.docid, 2)
+        self.assertEqual(idx.value, 'two')
+        self.assertEqual(bulk.pairs, [(1, 'one'), (2, 'two')])
+
+    def test_index_docs_nonint_docid(self):
+        catalog = self._makeOne()
+        idx = DummyIndex()
+        catalog['name'] = idx
+        self.assertRaises(ValueError, catalog.index_docs,
+                          [(1, 'value'), ('abc', 'value')])
+        self.assertEqual(idx.docid, None)
+
+    def test_merge(self):
+        catalog = self._makeOne()
+        idx = DummyIndex()
+        catalog['name'] = idx
+        other = {'name': DummyIndex()}
+        catalog.merge(other)
+        self.assertTrue(idx.merged is other['name'])
+
+    def _makeFieldCatalog(self):
+        from ..field import FieldIndex
+        catalog = self._makeOne()
+        catalog['value'] = FieldIndex(_discriminate_value)
+        return catalog
+
+    def test_rebuild(self):
+        from concurrent.futures import ThreadPoolExecutor
+        catalog = self._makeFieldCatalog()
+        catalog.index_doc(100, 'stale')
+        with ThreadPoolExecutor(2) as executor:
+            catalog.rebuild(range(10, 0, -1), _load_docs, max_workers=2,
+                            executor=executor)
+        index = catalog['value']
+        self.assertEqual(list(index._rev_index.items()),
+                         [(docid, docid % 3) for docid in range(1, 11)])
+        self.assertEqual(list(index._not_indexed), [])
+        self.assertEqual(index.indexed_count(), 10)
+
+    def test_rebuild_text_scores(self):
+        from ..text import TextIndex
+        catalog = self._makeOne()
+        catalog['text'] = TextIndex(_discriminate_value)
+        for docid, text in _load_texts(range(1, 21)):
+            catalog.index_doc(docid, text)
+        catalog.rebuild(range(1, 21), _load_texts, shards=4,
+                        executor=DummyExecutor())
+        fresh = self._makeOne()
+        fresh['text'] = TextIndex(_discriminate_value)
+        fresh.index_docs(_load_texts(range(1, 21)))
+        self.assertEqual(catalog['text'].index._totaldoclen(),
+                         fresh['text'].index._totaldoclen())
+        self.assertEqual(list(catalog['text'].applyContains('alpha').items()),
+                         list(fresh['text'].applyContains('alpha').items()))
+
+    def test_rebuild_shards(self):
+        catalog = self._makeFieldCatalog()
+        executor = DummyExecutor()
+        catalog.rebuild([1, 2, 3, 4, 5], _load_docs, shards=2,
+                        executor=executor)
+        self.assertEqual(executor.ranges, [[1, 2, 3], [4, 5]])
+        self.assertEqual(catalog['value'].indexed_count(), 5)
+
+    def test_rebuild_nonint_docid(self):
+        catalog = self._makeFieldCatalog()
+        catalog.index_doc(1, 'value')
+        executor = DummyExecutor()
+        self.assertRaises(ValueError, catalog.rebuild, [1, 'abc'],
+                          _load_docs, executor=executor)
+        self.assertFalse(hasattr(executor, 'ranges'))
+        self.assertEqual(catalog['value'].indexed_count(), 1)
+
+    def test_rebuild_nonint_docid_from_loader(self):
+        catalog = self._makeFieldCatalog()
+        self.assertRaises(ValueError, catalog.rebuild, [1, 2],
+                          _load_str_docids, executor=DummyExecutor())
+
+    def test_rebuild_unpicklable_index(self):
+        from ..field import FieldIndex
+        catalog = self._makeOne()
+        catalog['value'] = FieldIndex(lambda obj, default: obj)
+        executor = DummyExecutor()
+        with self.assertRaises(ValueError) as context:
+            catalog.rebuild([1, 2], _load_docs, executor=executor)
+        self.assertTrue("index 'value'" in str(context.exception))
+        self.assertFalse(hasattr(executor, 'ranges'))
+
+    def test_rebuild_unpicklable_loader(self):
+        catalog = self._makeFieldCatalog()
+        catalog.index_doc(1, 'value')
+        with self.assertRaises(ValueError) as context:
+            catalog.rebuild([1, 2], lambda docids: [])
+        self.assertTrue('loader' in str(context.exception))
+        self.assertEqual(catalog['value'].indexed_count(), 1)
+
+    def test_rebuild_no_docids(self):
+        catalog = self._makeFieldCatalog()
+        executor = DummyExecutor()
+        catalog.rebuild([], _load_docs, executor=executor)
+        self.assertEqual(executor.ranges, [])
+
+    def test_rebuild_process_pool(self):
+        catalog = self._makeFieldCatalog()
+        catalog.rebuild(range(1, 21), _load_docs, max_workers=2)
+        index = catalog['value']
+        self.assertEqual(index.indexed_count(), 20)
+        self.assertEqual(list(index._fwd_index[0]), [3, 6, 9, 12, 15, 18])
+
     def test_reindex_doc(self):
         catalog = self._makeOne()
         idx = DummyIndex()
@@ -71,6 +187,92 @@ class TestCatalog(unittest.TestCase):
         catalog.unindex_doc(1)
         self.assertEqual(idx.unindexed, 1)
 
+    def test_apply_query_cache_disabled(self):
+        catalog = self._makeOne()
+        query = DummyQuery([1], cache_key='key')
+        self.assertEqual(catalog.apply_query(query, {'a': 1}), [1])
+        self.assertEqual(query.applied, [{'a': 1}])
+        self.assertFalse(hasattr(catalog, '_v_query_cache'))
+
+    def test_apply_query_uncacheable(self):
+        catalog = self._makeOne()
+        catalog.query_cache_size = 10
+        query = DummyQuery([1])
+        self.assertEqual(catalog.apply_query(query), [1])
+        self.assertEqual(catalog.apply_query(query), [1])
+        self.assertEqual(query.applied, [None, None])
+
+    def test_apply_query_cached(self):
+        catalog = self._makeOne()
+        catalog.query_cache_size = 10
+        query = DummyQuery([1], cache_key='key')
+        result = catalog.apply_query(query)
+        self.assertTrue(catalog.apply_query(query) is result)
+        self.assertTrue(
+            catalog.apply_query(DummyQuery([2], cache_key='key')) is result)
+        self.assertEqual(query.applied, [None])
+        self.assertEqual(
+            catalog.apply_query(DummyQuery([2], cache_key='other')), [2])
+
+    def test_apply_query_cache_resized(self):
+        catalog = self._makeOne()
+        catalog.query_cache_size = 10
+        catalog.apply_query(DummyQuery([1], cache_key='key'))
+        catalog.query_cache_size = 5
+        query = DummyQuery([1], cache_key='key')
+        catalog.apply_query(query)
+        self.assertEqual(query.applied, [None])
+        self.assertEqual(catalog._v_query_cache.maxsize, 5)
+
+    def _makeParseCatalog(self):
+        from ..field import FieldIndex
+        catalog = self._makeOne()
+        catalog['a'] = FieldIndex('a')
+        catalog['b'] = FieldIndex('b')
+        return catalog
+
+    def test_parse_query_cache_disabled(self):
+        catalog = self._makeParseCatalog()
+        catalog.parse_cache_size = 0
+        query = catalog.parse_query('a == 1')
+        self.assertTrue(query.index is catalog['a'])
+        self.assertFalse(catalog.parse_query('a == 1') is query)
+        self.assertFalse(hasattr(catalog, '_v_parse_cache'))
+
+    def test_parse_query_cached(self):
+        from ..query import And
+        catalog = self._makeParseCatalog()
+        query = catalog.parse_query('a == 1 and b == 2')
+        self.assertTrue(isinstance(query, And))
+        self.assertTrue(catalog.parse_query('a == 1 and b == 2') is query)
+        self.assertFalse(catalog.parse_query('a == 1 and b == 2',
+                                             optimize_query=False) is query)
+        self.assertFalse(catalog.parse_query('a == 1') is query)
+
+    def test_parse_query_index_replaced(self):
+        from ..field import FieldIndex
+        catalog = self._makeParseCatalog()
+        query = catalog.parse_query('a == 1 and b == 2')
+        catalog['c'] = FieldIndex('c')
+        self.assertTrue(catalog.parse_query('a == 1 and b == 2') is query)
+        catalog['b'] = FieldIndex('b')
+        other = catalog.parse_query('a == 1 and b == 2')
+        self.assertFalse(other is query)
+        self.assertTrue(other.queries[1].index is catalog['b'])
+
+    def test_parse_query_index_removed(self):
+        catalog = self._makeParseCatalog()
+        catalog.parse_query('a == 1')
+        catalog.data.pop('a')
+        self.assertRaises(KeyError, catalog.parse_query, 'a == 1')
+
+    def test_parse_query_cache_resized(self):
+        catalog = self._makeParseCatalog()
+        query = catalog.parse_query('a == 1')
+        catalog.parse_cache_size = 5
+        self.assertFalse(catalog.parse_query('a == 1') is query)
+        self.assertEqual(catalog._v_parse_cache.maxsize, 5)
+
 class TestCatalogQuery(unittest.TestCase):
     def _makeOne(self, catalog, family=None):
         from . import CatalogQuery
@@ -235,6 +437,42 @@ class TestCatalogQuery(unittest.TestCase):
         self.assertEqual(idx1.limit, 1)
         
 
+    def test_query_uses_apply_query(self):
+        catalog = self._makeCatalog()
+        catalog.query_cache_size = 10
+        q = self._makeOne(catalog)
+        query = DummyQuery([1, 2], cache_key='key')
+        self.assertEqual(q.query(query), (2, [1, 2]))
+        self.assertEqual(q.query(query), (2, [1, 2]))
+        self.assertEqual(query.applied, [None])
+
+    def test_query_str_uses_parse_query(self):
+        from ..field import FieldIndex
+        catalog = self._makeCatalog()
+        catalog['a'] = FieldIndex('a')
+        catalog['a'].index_doc(1, Dummy(a=5))
+        parsed = []
+        def parse_query(expr):
+            parsed.append(expr)
+            return catalog.__class__.parse_query(catalog, expr)
+        catalog.parse_query = parse_query
+        q = self._makeOne(catalog)
+        self.assertEqual(list(q.query('a == 5')[1]), [1])
+        self.assertEqual(parsed, ['a == 5'])
+
+    def test_query_str_catalog_without_parse_query(self):
+        from ..field import FieldIndex
+        index = FieldIndex('a')
+        index.index_doc(1, Dummy(a=5))
+        q = self._makeOne({'a': index})
+        self.assertEqual(list(q.query('a == 5')[1]), [1])
+
+    def test_query_catalog_without_apply_query(self):
+        q = self._makeOne({})
+        query = DummyQuery([1, 2])
+        self.assertEqual(q.query(query, names={'a': 1}), (2, [1, 2]))
+        self.assertEqual(query.applied, [{'a': 1}])
+
     def _test_functional_merge(self, **extra):
         from ..field import FieldIndex
         from ..keyword import KeywordIndex
@@ -333,6 +571,9 @@ class DummyIndex(object):
     def apply(self, query):
         return self.arg[0]
 
+    def merge(self, other):
+        self.merged = other
+
     def apply_intersect(self, query, docids): # pragma: no cover
         if docids is None:
             return self.arg[0]
@@ -348,3 +589,41 @@ class DummyIndex(object):
         if reverse:
             return ['sorted3', 'sorted2', 'sorted1']
         return ['sorted1', 'sorted2', 'sorted3']
+
+class Dummy(object):
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+class DummyQuery(object):
+    def __init__(self, result, cache_key=None):
+        self.result = result
+        self.cache_key = cache_key
+        self.applied = []
+
+    def _apply(self, names):
+        self.applied.append(names)
+        return self.result
+
+    def _cache_key(self, names):
+        return self.cache_key
+
+class DummyExecutor(object):
+    def map(self, func, *iterables):
+        self.ranges = []
+        for args in zip(*iterables):
+            self.ranges.append(args[-1])
+            yield func(*args)
+
+def _discriminate_value(obj, default):
+    return obj
+
+def _load_docs(docids):
+    # a rebuild() loader; module scope so that it can be pickled
+    return [(docid, docid % 3) for docid in docids]
+
+def _load_str_docids(docids):
+    return [(str(docid), docid) for docid in docids]
+
+def _load_texts(docids):
+    return [(docid, 'alpha ' * (docid % 3 + 1) + 'beta ' * (docid % 5))
+            for docid in docids]
@@ -1,6 +1,7 @@
 from hashlib import md5
 from zope.interface import implementer
 
+from ..bitmap import Bitmap
 from ..keyword import KeywordIndex
 from ..interfaces import IIndex
 
@@ -57,10 +58,13 @@ class FacetIndex(KeywordIndex):
             # unindex the previous value
             self.unindex_doc(docid)
             self._not_indexed.add(docid)
+            self._add_docids((docid,))
+            self._bump_generation()
             return None
 
         if docid in self._not_indexed:
             self._not_indexed.remove(docid)
+            self._bump_generation()
 
         old = self._rev_index.get(docid)
         if old is not None:
@@ -82,6 +86,7 @@ class FacetIndex(KeywordIndex):
                             fwset = self.family.IF.Set()
                             self._fwd_index[fac] = fwset
                         fwset.insert(docid)
+                        self._grow_container(fac, fwset)
                         revset = self._rev_index.get(docid)
                         if revset is None:
                             revset = self.family.OO.Set()
@@ -90,14 +95,36 @@ class FacetIndex(KeywordIndex):
 
         if changed:
             self._num_docs.change(1)
+            self._add_docids((docid,))
+            self._bump_generation()
+        else:
+            # no facet matched, so it's neither indexed nor not indexed
+            self._discard_docid(docid)
 
         return value
 
-    def counts(self, docids, omit_facets=()):
+    def _words(self, value):
+        # The set of facets index_docs() stores for a discriminated value
+        words = self.family.OO.Set()
+        for facet in value:
+            L = []
+            for category in facet.split(':'):
+                L.append(category)
+                facet_candidate = ':'.join(L)
+                if facet_candidate in self.facets:
+                    words.insert(facet_candidate)
+        return words
+
+    def counts(self, docids, omit_facets=(), intersect=None):
         """ Given a set of docids (usually returned from query),
         provide count information for further facet narrowing.
         Optionally omit count information for facets and their
-        ancestors that are in 'omit_facets' (a sequence of facets)"""
+        ancestors that are in 'omit_facets' (a sequence of facets)
+
+        Small results are counted by looking up the facets of each docid;
+        large ones by intersecting the result with each facet's set of
+        docids (see ``counts_intersect_wins``).  Pass a true or false
+        ``intersect`` to force either strategy."""
 
         effective_omits = self.family.OO.Set()
 
@@ -111,6 +138,14 @@ class FacetIndex(KeywordIndex):
         include_facets = self.family.OO.difference(self.facets,
                                                    effective_omits)
 
+        if intersect is None:
+            if not hasattr(docids, '__len__'):
+                docids = self.family.IF.Set(docids)
+            intersect = counts_intersect_wins(len(docids),
+                                              self._num_docs.value)
+        if intersect:
+            return self._intersect_counts(docids, include_facets)
+
         counts = {}
         isect_cache = {}
 
@@ -129,6 +164,50 @@ class FacetIndex(KeywordIndex):
 
         return counts
 
+    def _intersect_counts(self, docids, include_facets):
+        IF = self.family.IF
+        if not isinstance(docids, (IF.Set, IF.TreeSet)):
+            docids = IF.Set(docids)
+        intersection = IF.intersection
+        fwd_index = self._fwd_index
+        docids_bitmap = None
+        counts = {}
+        for facet in include_facets:
+            facet_docids = fwd_index.get(facet)
+            if facet_docids is None:
+                continue
+            if isinstance(facet_docids, Bitmap):
+                if docids_bitmap is None:
+                    docids_bitmap = Bitmap(docids, self.family)
+                count = facet_docids.intersection_len(docids_bitmap)
+            else:
+                count = len(intersection(docids, facet_docids))
+            if count:
+                counts[facet] = count
+        return counts
+
+# Per docid, counting by lookup does work in Python for each of the
+# document's facets, while counting by intersection does roughly the same
+# work in C for each of the facet's docids; the lookup's cost per facet is
+# about this many times the intersection's per docid.
+COUNTS_LOOKUP_COST = 64
+
+def counts_intersect_wins(numdocids, numdocs):
+    """ Return true if counting the facets of a result of ``numdocids``
+    docids from an index of ``numdocs`` documents is predicted to be
+    faster by intersecting the result with every facet's docids than by
+    looking up each docid's facets.
+
+    Counting by lookup costs about ``COUNTS_LOOKUP_COST`` for each facet
+    of each docid in the result, i.e. ``numdocids * postings / numdocs``
+    times that, where ``postings`` is the total size of the facets' sets
+    of docids.  Counting by intersection costs about ``postings`` plus
+    ``numdocids`` for each facet, and as long as most documents in the
+    result don't share the same combination of facets, lookup pays a
+    similar cost per facet to intersect each docid's facets with the ones
+    being counted.  That leaves intersection winning once the result is
+    more than ``1 / COUNTS_LOOKUP_COST`` of the index."""
+    return numdocids * COUNTS_LOOKUP_COST > numdocs
 
 def make_binary(value):
     if isinstance(value, bytes):
@@ -232,6 +232,62 @@ class TestCatalogFacetIndex(unittest.TestCase):
         counts = index.counts(result, search)
         self.assertEqual(counts, {'size:large':1})
 
+    def test_counts_strategies_agree(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        for search in (['price:0-100'], ['price:0-100', 'color:red'],
+                       ['size:large'], ['size'], ['color']):
+            result = index.search(search)
+            for omit in ((), search):
+                self.assertEqual(
+                    index.counts(result, omit, intersect=True),
+                    index.counts(result, omit, intersect=False))
+
+    def test_counts_chooses_lookup_for_small_result(self):
+        index = self._makeOne()
+        index.index_docs([(docid, ['color:blue']) for docid in range(100)])
+        index._intersect_counts = None
+        self.assertEqual(index.counts(index.family.IF.Set([1])),
+                         {'color': 1, 'color:blue': 1})
+
+    def test_counts_chooses_intersection_for_large_result(self):
+        index = self._makeOne()
+        index.index_docs([(docid, ['color:blue']) for docid in range(100)])
+        with mock.patch('hypatia.facet.cachekey') as cachekey:
+            counts = index.counts(index.family.IF.Set([1, 2]))
+        self.assertEqual(counts, {'color': 2, 'color:blue': 2})
+        self.assertFalse(cachekey.called)
+
+    def test_counts_w_iterator(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        counts = index.counts(iter([1, 2]))
+        self.assertEqual(counts['color:blue'], 2)
+
+    def test_counts_intersect_w_list(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        counts = index.counts([1, 2], intersect=True)
+        self.assertEqual(counts['color:blue'], 2)
+
+    def test_counts_w_bitmaps(self):
+        from ..bitmap import Bitmap
+        index = self._makeOne()
+        index.tree_threshold = 2
+        index.bitmap_density = 0.5
+        index.bitmap_min_docs = 0
+        self._populateIndex(index)
+        self.assertTrue(isinstance(index._fwd_index['color:blue'], Bitmap))
+        self.assertFalse(isinstance(index._fwd_index['color:red'], Bitmap))
+        expected = self._makeOne()
+        self._populateIndex(expected)
+        result = index.family.IF.Set([1, 2, 3, 4])
+        for intersect in (True, False):
+            self.assertEqual(index.counts(result, intersect=intersect),
+                             expected.counts(result))
+        self.assertEqual(list(index.search(['color:blue', 'price'])),
+                         [1, 2, 3])
+
     def test_indexed(self):
         index = self._makeOne()
         self._populateIndex(index)
@@ -250,6 +306,84 @@ class TestCatalogFacetIndex(unittest.TestCase):
         self.assertEqual(index.index_doc(20, 'foo'), 'foo')
         self.assertFalse(20 in index._not_indexed)
 
+    def test_docids_maintained(self):
+        def discriminator(obj, default):
+            if obj is None:
+                return default
+            return obj
+        index = self._makeOne(discriminator)
+        self._populateIndex(index)
+        index.index_doc(5, None)
+        index.index_doc(6, None)
+        index.index_doc(6, ['color:blue'])
+        index.index_doc(5, ['unknown'])
+        index.index_doc(1, ['unknown'])
+        docids = index.docids()
+        self.assertTrue(docids is index._all_docids)
+        self.assertEqual(list(docids), [2, 3, 4, 6])
+        self.assertEqual(
+            list(docids),
+            sorted(set(index.indexed()) | set(index.not_indexed())))
+
+    def test_index_docs(self):
+        def discriminator(obj, default):
+            if obj is None:
+                return default
+            return obj
+        pairs = [(1, ['price:0-100', 'color:blue', 'style:gucci:handbag']),
+                 (2, ['price:0-100', 'color:blue', 'style:gucci:dress']),
+                 (3, None),
+                 (4, ['unknown']),
+                 (2, ['color:red'])]
+        index = self._makeOne(discriminator)
+        index.index_docs(pairs)
+        expected = self._makeOne(discriminator)
+        for docid, value in pairs:
+            expected.index_doc(docid, value)
+        self.assertEqual(
+            [(facet, list(docids))
+             for facet, docids in index._fwd_index.items()],
+            [(facet, list(docids))
+             for facet, docids in expected._fwd_index.items()])
+        self.assertEqual(
+            [(docid, list(facets))
+             for docid, facets in index._rev_index.items()],
+            [(docid, list(facets))
+             for docid, facets in expected._rev_index.items()])
+        self.assertEqual(list(index._not_indexed), [3])
+        self.assertEqual(index.indexed_count(), 2)
+        self.assertEqual(index.counts(index.family.IF.Set([1, 2]))['color'],
+                         2)
+
+    def test_merge(self):
+        index = self._makeOne()
+        other = self._makeOne()
+        index.index_doc(1, ['price:0-100', 'color:blue'])
+        other.index_doc(2, ['color:red', 'style:gucci:dress'])
+        index.merge(other)
+        self.assertEqual(index.indexed_count(), 2)
+        counts = index.counts(index.family.IF.Set([1, 2]))
+        self.assertEqual(counts['color'], 2)
+        self.assertEqual(counts['style:gucci:dress'], 1)
+
+    def test_generation(self):
+        def discriminator(obj, default):
+            if obj is None:
+                return default
+            return obj
+        index = self._makeOne(discriminator)
+        self.assertEqual(index.generation(), 1)
+        index.index_doc(1, ['color:blue'])
+        self.assertEqual(index.generation(), 2)
+        index.index_doc(1, ['unknown'])
+        self.assertEqual(index.generation(), 3)
+        index.index_doc(1, None)
+        self.assertEqual(index.generation(), 4)
+        index.index_doc(1, ['color:red'])
+        self.assertEqual(index.generation(), 6)
+        index.reset()
+        self.assertEqual(index.generation(), 7)
+
 
 @pytest.mark.parametrize(
     "value, expected", [
@@ -286,3 +420,20 @@ def test_cachekey(facets):
             assert mock_call == mock.call(facet.encode("ascii"))
         else:
             assert mock_call == mock.call(facet)
+
+class Test_counts_intersect_wins(unittest.TestCase):
+
+    def _callFUT(self, numdocids, numdocs):
+        from . import counts_intersect_wins
+        return counts_intersect_wins(numdocids, numdocs)
+
+    def test_small_result(self):
+        self.assertFalse(self._callFUT(10, 100000))
+
+    def test_large_result(self):
+        self.assertTrue(self._callFUT(10000, 100000))
+
+    def test_threshold(self):
+        from . import COUNTS_LOOKUP_COST
+        self.assertFalse(self._callFUT(1000, 1000 * COUNTS_LOOKUP_COST))
+        self.assertTrue(self._callFUT(1001, 1000 * COUNTS_LOOKUP_COST))
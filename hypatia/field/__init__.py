@@ -17,6 +17,10 @@ import bisect
 from functools import total_ordering
 import heapq
 from itertools import islice
+from itertools import repeat
+from operator import itemgetter
+import random
+import time
 
 import persistent
 from BTrees.Length import Length
@@ -34,6 +38,10 @@ _marker = []
 @implementer(
         interfaces.IIndex,
         interfaces.IIndexStatistics,
+        interfaces.IIndexEstimate,
+        interfaces.IIndexFilter,
+        interfaces.IIndexGeneration,
+        interfaces.IIndexMerge,
         )
 class FieldIndex(BaseIndexMixin, persistent.Persistent):
     """ Field indexing.
@@ -63,9 +71,24 @@ class FieldIndex(BaseIndexMixin, persistent.Persistent):
     - InRange
 
     - NotInRange
+
+    If ``sort_ranks`` is true, the index also keeps a table of each docid's
+    integer rank in value order, which lets ``sort`` compare integers
+    instead of indexed values.  See ``enable_sort_ranks``.
     """
 
-    def __init__(self, discriminator, family=None):
+    # docid -> rank and value -> rank tables; None unless sort ranks are
+    # enabled.  Ranks are spaced ``rank_step`` apart so that new values can
+    # usually be given a rank without renumbering the others.
+    _doc_rank = None
+    _value_rank = None
+    rank_step = 1 << 16
+
+    # A SortTable built by ``calibrate_sort``; None to use the built-in
+    # heuristics (``fwscan_wins`` and friends).
+    sort_table = None
+
+    def __init__(self, discriminator, family=None, sort_ranks=False):
         if family is not None:
             self.family = family
         if not callable(discriminator):
@@ -74,6 +97,8 @@ class FieldIndex(BaseIndexMixin, persistent.Persistent):
                                  'string')
         self.discriminator = discriminator
         self.reset()
+        if sort_ranks:
+            self.enable_sort_ranks()
 
     def reset(self):
         """Initialize forward and reverse mappings."""
@@ -83,6 +108,69 @@ class FieldIndex(BaseIndexMixin, persistent.Persistent):
         self._rev_index = self.family.IO.BTree()
         self._num_docs = Length(0)
         self._not_indexed = self.family.IF.TreeSet()
+        self._all_docids = self.family.IF.TreeSet()
+        if self._doc_rank is not None:
+            self._value_rank = self.family.OI.BTree()
+            self._doc_rank = self.family.II.BTree()
+        self._bump_generation()
+
+    def enable_sort_ranks(self):
+        """ Build the table of sort ranks from the current contents of the
+        index, and keep it up to date from now on.  Sorting by an index
+        with sort ranks compares integers rather than indexed values, at
+        the cost of an integer per indexed document. """
+        self._renumber_ranks()
+
+    def disable_sort_ranks(self):
+        """ Discard the table of sort ranks. """
+        self._value_rank = self._doc_rank = None
+
+    def _renumber_ranks(self):
+        fwd_index = self._fwd_index
+        step = min(self.rank_step,
+                   self.family.maxint // (2 * len(fwd_index) + 2)) or 1
+        value_rank = self.family.OI.BTree()
+        doc_rank = self.family.II.BTree()
+        rank = 0
+        for value, docids in fwd_index.items():
+            value_rank[value] = rank
+            doc_rank.update(dict.fromkeys(docids, rank))
+            rank += step
+        self._value_rank = value_rank
+        self._doc_rank = doc_rank
+
+    def _rank_docs(self, value, docids):
+        # Record the rank of value for docids, giving value a rank between
+        # those of its neighbours if it's new.  Return False if there's no
+        # room for one, in which case the caller must renumber.
+        value_rank = self._value_rank
+        rank = value_rank.get(value)
+        if rank is None:
+            try:
+                below = value_rank[value_rank.maxKey(value)]
+            except ValueError:
+                below = None
+            try:
+                above = value_rank[value_rank.minKey(value)]
+            except ValueError:
+                above = None
+            if below is None and above is None:
+                rank = 0
+            elif above is None:
+                rank = below + self.rank_step
+                if rank > self.family.maxint:
+                    return False
+            elif below is None:
+                rank = above - self.rank_step
+                if rank < self.family.minint:
+                    return False
+            elif above - below > 1:
+                rank = (below + above) // 2
+            else:
+                return False
+            value_rank[value] = rank
+        self._doc_rank.update(dict.fromkeys(docids, rank))
+        return True
 
     def unique_values(self):
         """ Return the unique values in the index for all docids as an iterable
@@ -121,11 +209,14 @@ class FieldIndex(BaseIndexMixin, persistent.Persistent):
                 self.unindex_doc(docid)
                 # Store docid in set of unindexed docids
                 self._not_indexed.add(docid)
+                self._add_docids((docid,))
+                self._bump_generation()
             return None
 
         if docid in self._not_indexed:
             # Remove from set of unindexed docs if it was in there.
             self._not_indexed.remove(docid)
+            self._bump_generation()
         
         rev_index = self._rev_index
         if docid in rev_index:
@@ -148,13 +239,81 @@ class FieldIndex(BaseIndexMixin, persistent.Persistent):
 
         # Insert into reverse index.
         rev_index[docid] = value
+        self._add_docids((docid,))
+
+        if self._doc_rank is not None:
+            if not self._rank_docs(value, (docid,)):
+                self._renumber_ranks()
+
+        self._bump_generation()
+
+    def index_docs(self, pairs):
+        """See interface IIndexInjection"""
+        rev_index = self._rev_index
+        not_indexed = self._not_indexed
+        new = {}
+        for docid, obj in pairs:
+            if docid in rev_index or docid in not_indexed or docid in new:
+                # reindexing takes the one-document-at-a-time path
+                self._add_docs(new)
+                new = {}
+                self.index_doc(docid, obj)
+            else:
+                new[docid] = self.discriminate(obj, _marker)
+        self._add_docs(new)
+
+    def _add_docs(self, new):
+        # Bulk insert a mapping of docid -> value (or _marker) for documents
+        # which are not yet in the index.
+        if not new:
+            return
+        self._add_docids(new)
+        missing = [docid for docid, value in new.items() if value is _marker]
+        for docid in missing:
+            del new[docid]
+        self._not_indexed.update(sorted(missing))
+
+        pairs = [(value, docid) for docid, value in new.items()]
+        self._update_forward(self._group_docids(pairs))
+        self._rev_index.update(new)
+        self._num_docs.change(len(new))
+        self._bump_generation()
+
+    def _update_forward(self, items):
+        # Add each of the (value, docids) pairs in items to the forward index
+        fwd_index = self._fwd_index
+        TreeSet = self.family.IF.TreeSet
+        ranked = self._doc_rank is not None
+        renumber = False
+        for value, docids in items:
+            set = fwd_index.get(value)
+            if set is None:
+                fwd_index[value] = TreeSet(docids)
+            else:
+                set.update(docids)
+            if ranked and not renumber:
+                renumber = not self._rank_docs(value, docids)
+        if renumber:
+            # one renumbering covers the rest of the batch
+            self._renumber_ranks()
+
+    def merge(self, other):
+        """See interface IIndexMerge"""
+        self._update_forward(other._fwd_index.items())
+        self._rev_index.update(other._rev_index)
+        self._not_indexed.update(other._not_indexed)
+        self._add_docids(other.docids())
+        self._num_docs.change(other._num_docs())
+        self._bump_generation()
 
     def unindex_doc(self, docid):
         """See interface IIndexInjection.
         """
+        self._discard_docid(docid)
         _not_indexed = self._not_indexed
         if docid in _not_indexed:
             _not_indexed.remove(docid)
+            self._bump_generation()
 
         rev_index = self._rev_index
         value = rev_index.get(docid, _marker)
@@ -175,7 +334,13 @@ class FieldIndex(BaseIndexMixin, persistent.Persistent):
         if not set:
             del self._fwd_index[value]
 
+        if self._doc_rank is not None:
+            del self._doc_rank[docid]
+            if not set:
+                del self._value_rank[value]
+
         self._num_docs.change(-1)
+        self._bump_generation()
 
     def reindex_doc(self, docid, value):
         """ See interface IIndexInjection """
@@ -210,6 +375,22 @@ class FieldIndex(BaseIndexMixin, persistent.Persistent):
         elif sort_type == interfaces.OPTIMAL:
             sort_type = None
 
+        if self._doc_rank is not None:
+            if sort_type is None and self.sort_table is not None:
+                sort_type = self.sort_table.lookup(
+                    reverse, limit, len(docids), numdocs)
+            if sort_type is None and not reverse:
+                if fwscan_wins(limit, len(docids), numdocs):
+                    sort_type = interfaces.FWSCAN
+            if sort_type != interfaces.FWSCAN:
+                return self.sort_ranked(
+                    docids,
+                    reverse,
+                    limit,
+                    sort_type,
+                    raise_unsortable,
+                    )
+
         if reverse:
             return self.sort_reverse(
                 docids,
@@ -242,6 +423,9 @@ class FieldIndex(BaseIndexMixin, persistent.Persistent):
         # for an overview of why we bother doing all this work to
         # choose the right sort algorithm.
         
+        if sort_type is None and self.sort_table is not None:
+            sort_type = self.sort_table.lookup(False, limit, rlen, numdocs)
+
         if sort_type is None:
             if fwscan_wins(limit, rlen, numdocs):
                 # forward scan beats both n-best and timsort reliably
@@ -274,6 +458,10 @@ class FieldIndex(BaseIndexMixin, persistent.Persistent):
         sort_type=None,
         raise_unsortable=True,
         ):
+        if sort_type is None and self.sort_table is not None:
+            sort_type = self.sort_table.lookup(
+                True, limit, len(docids), numdocs)
+
         if sort_type is None:
             rlen = len(docids)
             if limit:
@@ -293,6 +481,62 @@ class FieldIndex(BaseIndexMixin, persistent.Persistent):
         else:
             raise ValueError('Unknown sort type %s' % sort_type)
 
+    def sort_ranked(
+        self,
+        docids,
+        reverse=False,
+        limit=None,
+        sort_type=None,
+        raise_unsortable=True,
+        ):
+        """ Sort docids by their integer sort ranks; requires sort ranks to
+        be enabled.  ``sort_type`` may be ``NBEST`` (the default when a
+        limit is given) or ``TIMSORT`` (stable; the default otherwise). """
+        if sort_type is None:
+            if limit:
+                sort_type = interfaces.NBEST
+            else:
+                sort_type = interfaces.TIMSORT
+        if sort_type == interfaces.NBEST:
+            if limit is None:
+                raise ValueError('nbest requires a limit')
+        elif sort_type != interfaces.TIMSORT:
+            raise ValueError('Unknown sort type %s' % sort_type)
+        return self._sort_ranked(
+            docids, reverse, limit, sort_type, raise_unsortable)
+
+    def _sort_ranked(self, docids, reverse, limit, sort_type,
+                     raise_unsortable):
+        # Look up every rank up front (in C, via map) so that the sort
+        # itself only ever compares integers.
+        ranks = list(map(self._doc_rank.get, docids, repeat(None)))
+        missing_docids = ()
+        if None in ranks:
+            missing_docids = [docid for rank, docid in zip(ranks, docids)
+                              if rank is None]
+            pairs = [(rank, docid) for rank, docid in zip(ranks, docids)
+                     if rank is not None]
+        else:
+            pairs = zip(ranks, docids)
+
+        if sort_type == interfaces.NBEST:
+            # ties are broken by docid, as in nbest_ascending/descending
+            if reverse:
+                result = heapq.nlargest(limit, pairs)
+            else:
+                result = heapq.nsmallest(limit, pairs)
+        else:
+            # ties keep their input order, as in a stable timsort
+            result = sorted(pairs, key=itemgetter(0), reverse=reverse)
+            if limit:
+                result = result[:limit]
+
+        for rank, docid in result:
+            yield docid
+
+        if raise_unsortable and missing_docids:
+            raise Unsortable(missing_docids)
+
     def scan_forward(self, docids, limit=None, raise_unsortable=True):
         fwd_index = self._fwd_index
 
@@ -312,6 +556,109 @@ class FieldIndex(BaseIndexMixin, persistent.Persistent):
         if raise_unsortable and docids:
             raise Unsortable(docids)
 
+    # Docids are handed to the narrowing callable passed to ``scan`` in
+    # batches of at least this many.
+    scan_batch_size = 256
+
+    def scan(self, narrow, reverse=False, limit=None):
+        """ Yield indexed docids in sort order, omitting those which
+        ``narrow`` (a callable accepting and returning a set of docids)
+        rejects.  Used to sort lazy result sets without evaluating their
+        query in full. """
+        values = self._fwd_index.values()
+        if reverse:
+            values = reversed(values)
+        n = 0
+        batch = []
+        batchlen = 0
+        for set in values:
+            batch.append(set)
+            batchlen += len(set)
+            if batchlen < self.scan_batch_size:
+                continue
+            for docid in self._scan_batch(batch, narrow):
+                n += 1
+                yield docid
+                if limit and n >= limit:
+                    return
+            batch = []
+            batchlen = 0
+        for docid in self._scan_batch(batch, narrow):
+            n += 1
+            yield docid
+            if limit and n >= limit:
+                return
+
+    def _scan_batch(self, batch, narrow):
+        if not batch:
+            return
+        matched = narrow(self.family.IF.multiunion(batch))
+        for set in batch:
+            for docid in set:
+                if docid in matched:
+                    yield docid
+
+    def scan_wins(self, limit, rlen):
+        """ Return true if ``scan`` is predicted to find the first ``limit``
+        of ``rlen`` matching docids faster than sorting all of them. """
+        numdocs = self._num_docs.value
+        if not numdocs:
+            return False
+        if self.sort_table is not None:
+            sort_type = self.sort_table.lookup(False, limit, rlen, numdocs)
+            if sort_type is not None:
+                return sort_type == interfaces.FWSCAN
+        return fwscan_wins(limit, rlen, numdocs)
+
+    def calibrate_sort(self, limits=(1, 10, 100, 1000), step=1, repeat=3,
+                       timer=time.perf_counter, seed=None):
+        """ Time the sort strategies against random samples of the docids
+        in this index and remember the fastest for each combination of
+        direction, result size and limit.
+
+        Result sizes are sampled at ``numdocs``, ``numdocs / 2**step``,
+        ``numdocs / 2**(2*step)`` and so on down to a single docid; each is
+        sorted with no limit and with each of ``limits`` no greater than
+        it, taking the best of ``repeat`` runs.  The resulting
+        ``SortTable`` is stored as ``sort_table`` (and returned); ``sort``
+        consults it whenever no ``sort_type`` is passed.  Set
+        ``sort_table`` to None to go back to the built-in heuristics.
+
+        Calibrate once the index holds a representative number of
+        documents, and again when it has grown by an order of magnitude
+        or so: the table describes result sizes relative to the size of
+        the index, but the costs of the strategies don't scale alike. """
+        numdocs = self._num_docs.value
+        if not numdocs:
+            raise ValueError('cannot calibrate an empty index')
+        all_docids = list(self._rev_index.keys())
+        rng = random.Random(seed)
+        TreeSet = self.family.IF.TreeSet
+        winners = {}
+        for shift in range(0, numdocs.bit_length(), step):
+            rlen = numdocs >> shift
+            docids = TreeSet(rng.sample(all_docids, rlen))
+            for limit in (None,) + tuple(l for l in limits if l <= rlen):
+                for reverse in (False, True):
+                    best = None
+                    for sort_type in _sort_candidates(reverse, limit):
+                        elapsed = min(
+                            self._time_sort(docids, reverse, limit,
+                                            sort_type, timer)
+                            for i in range(repeat))
+                        if best is None or elapsed < best[0]:
+                            best = (elapsed, sort_type)
+                    winners[(reverse, rlen, limit)] = best[1]
+        self.sort_table = SortTable(numdocs, winners)
+        return self.sort_table
+
+    def _time_sort(self, docids, reverse, limit, sort_type, timer):
+        start = timer()
+        for docid in self.sort(docids, reverse=reverse, limit=limit,
+                               sort_type=sort_type):
+            pass
+        return timer() - start
+
     def nbest_ascending(self, docids, limit, raise_unsortable=False):
         if limit is None: #pragma NO COVERAGE
             raise RuntimeError('n-best used without limit')
@@ -406,10 +753,12 @@ class FieldIndex(BaseIndexMixin, persistent.Persistent):
         sets = []
         for q in queries:
             if isinstance(q, RangeValue):
-                q = q.as_tuple()
+                values = self._fwd_index.values(
+                    q.start, q.end,
+                    excludemin=q.excludemin, excludemax=q.excludemax)
             else:
-                q = (q, q)
-            set = self.family.IF.multiunion(self._fwd_index.values(*q))
+                values = self._fwd_index.values(q, q)
+            set = self.family.IF.multiunion(values)
             sets.append(set)
 
         result = None
@@ -417,14 +766,15 @@ class FieldIndex(BaseIndexMixin, persistent.Persistent):
         if len(sets) == 1:
             result = sets[0]
         elif operator == 'and':
-            for _, set in sorted([(len(x), x) for x in sets]):
+            for set in sorted(sets, key=len):
                 result = self.family.IF.intersection(set, result)
         else:
             result = self.family.IF.multiunion(sets)
 
         return result
 
-    def apply(self, q):
+    def _parse_query(self, q):
+        # Return a (queries, operator) tuple suitable for passing to search
         if isinstance(q, dict):
             val = q['query']
             if isinstance(val, RangeValue):
@@ -432,17 +782,68 @@ class FieldIndex(BaseIndexMixin, persistent.Persistent):
             elif not isinstance(val, (list, tuple)):
                 val = [val]
             operator = q.get('operator', 'or')
-            result = self.search(val, operator)
+            return val, operator
+        if isinstance(q, tuple) and len(q) == 2:
+            # b/w compat stupidity; this needs to die
+            q = RangeValue(*q)
+            q = [q]
+        elif not isinstance(q, (list, tuple)):
+            q = [q]
+        return q, 'or'
+
+    def apply(self, q):
+        queries, operator = self._parse_query(q)
+        return self.search(queries, operator)
+
+    def estimate(self, q):
+        """ See interface IIndexEstimate """
+        queries, operator = self._parse_query(q)
+        fwd_index = self._fwd_index
+        estimates = []
+        for q in queries:
+            if isinstance(q, RangeValue):
+                estimates.append(self._estimate_range(*q.as_tuple()))
+            else:
+                estimates.append(len(fwd_index.get(q, ())))
+        if not estimates:
+            return 0
+        if operator == 'and':
+            return min(estimates)
+        return min(sum(estimates), self._num_docs())
+
+    # When estimating the size of a range, the document sets of at most this
+    # many keys (spread evenly across the range) are measured, and the result
+    # is extrapolated to the number of keys in the range.
+    estimate_sample_size = 32
+
+    def _estimate_range(self, start, end):
+        values = self._fwd_index.values(start, end)
+        numkeys = len(values)
+        sample_size = self.estimate_sample_size
+        if numkeys <= sample_size:
+            return sum([len(set) for set in values])
+        step = numkeys / float(sample_size)
+        sampled = 0
+        for i in range(sample_size):
+            sampled += len(values[int(i * step)])
+        return int(sampled * step)
+
+    def filter(self, docids, q):
+        """ See interface IIndexFilter """
+        queries, operator = self._parse_query(q)
+        rev_index = self._rev_index
+        if operator == 'and':
+            combine = all
         else:
-            if isinstance(q, tuple) and len(q) == 2:
-                # b/w compat stupidity; this needs to die
-                q = RangeValue(*q)
-                q = [q]
-            elif not isinstance(q, (list, tuple)):
-                q = [q]
-            result = self.search(q, 'or')
+            combine = any
 
-        return result
+        def predicate(docid):
+            value = rev_index.get(docid, _marker)
+            if value is _marker or not queries:
+                return False
+            return combine([_matches(value, q) for q in queries])
+
+        return self._filter_docids(docids, predicate)
 
     def applyEq(self, value):
         return self.apply(value)
@@ -509,6 +910,12 @@ class FieldIndex(BaseIndexMixin, persistent.Persistent):
     def notinrange(self, start, end, excludemin=False, excludemax=False):
         return query.NotInRange(self, start, end, excludemin, excludemax)
 
+def _matches(value, q):
+    # does an indexed value satisfy a single (parsed) query term?
+    if isinstance(q, RangeValue):
+        return value in q
+    return value == q
+
 def nsort(docids, rev_index, missing):
     for docid in docids:
         try:
@@ -536,6 +943,69 @@ class _MissingValue(object):
 ASC = _MissingValue(True)
 DESC = _MissingValue(False)
 
+def _sort_candidates(reverse, limit):
+    candidates = []
+    if not reverse:
+        candidates.append(interfaces.FWSCAN)
+    if limit:
+        candidates.append(interfaces.NBEST)
+    candidates.append(interfaces.TIMSORT)
+    return candidates
+
+def _log2_ratio(n, numdocs):
+    # floor(log2(numdocs / n)), for 1 <= n
+    return max((numdocs // n).bit_length() - 1, 0)
+
+class SortTable(object):
+    """ The fastest sort strategy for each combination of direction,
+    result size and limit, as timed by ``FieldIndex.calibrate_sort``.
+
+    Result sizes and limits are stored as ``log2(numdocs / n)`` buckets so
+    that the table still applies as the index grows or shrinks.  Each
+    bucket that wasn't timed takes the strategy of the nearest one that
+    was. """
+
+    def __init__(self, numdocs, winners):
+        # winners maps (reverse, rlen, limit) to the fastest sort type
+        self.numdocs = numdocs
+        self.winners = winners
+        self.depth = depth = numdocs.bit_length()
+        measured = {}
+        for (reverse, rlen, limit), sort_type in winners.items():
+            lbucket = None
+            if limit:
+                lbucket = _log2_ratio(limit, numdocs)
+            measured[(reverse, _log2_ratio(rlen, numdocs), lbucket)] = \
+                sort_type
+        self.cells = cells = {}
+        for reverse in (False, True):
+            for lbucket in (None,) + tuple(range(depth)):
+                candidates = [
+                    key for key in measured
+                    if key[0] == reverse and
+                    (key[2] is None) == (lbucket is None)
+                    ]
+                if not candidates:
+                    continue
+                for rbucket in range(depth):
+                    nearest = min(
+                        candidates,
+                        key=lambda key: (abs(key[1] - rbucket) +
+                                         abs((key[2] or 0) - (lbucket or 0)),
+                                         key[1], key[2]),
+                        )
+                    cells[(reverse, rbucket, lbucket)] = measured[nearest]
+
+    def lookup(self, reverse, limit, rlen, numdocs):
+        """ Return the sort type to use, or None if the table has no
+        opinion. """
+        depth = self.depth
+        rbucket = min(_log2_ratio(max(rlen, 1), numdocs), depth - 1)
+        lbucket = None
+        if limit:
+            lbucket = min(_log2_ratio(limit, numdocs), depth - 1)
+        return self.cells.get((reverse, rbucket, lbucket))
+
 def fwscan_wins(limit, rlen, numdocs):
     """
     Primitive curve-fitting to see if forward scan will beat both
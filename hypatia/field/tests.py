@@ -1050,6 +1050,290 @@ class FieldIndexTests(unittest.TestCase):
         result = sorted(list(result))
         self.assertEqual(result, [2, 5, 6, 7, 10, 11])
 
+    def test_class_conforms_to_IIndexEstimate(self):
+        from zope.interface.verify import verifyClass
+        from ..interfaces import IIndexEstimate
+        verifyClass(IIndexEstimate, self._getTargetClass())
+
+    def test_estimate_single_value(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        index.index_doc(12, 3)
+        self.assertEqual(index.estimate(3), 2)
+        self.assertEqual(index.estimate(100), 0)
+
+    def test_estimate_list_or(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        self.assertEqual(index.estimate([1, 2, 100]), 2)
+
+    def test_estimate_or_capped_at_num_docs(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        from .. import RangeValue
+        query = [RangeValue(1, 11), RangeValue(1, 11)]
+        self.assertEqual(index.estimate(query), 11)
+
+    def test_estimate_dict_and(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        index.index_doc(12, 3)
+        query = {'query': [3, 4], 'operator': 'and'}
+        self.assertEqual(index.estimate(query), 1)
+
+    def test_estimate_empty_query(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        self.assertEqual(index.estimate([]), 0)
+
+    def test_estimate_range(self):
+        from .. import RangeValue
+        index = self._makeOne()
+        self._populateIndex(index)
+        self.assertEqual(index.estimate(RangeValue(3, 7)), 5)
+        self.assertEqual(index.estimate((3, 7)), 5)
+        self.assertEqual(index.estimate(RangeValue(None, 7)), 7)
+        self.assertEqual(index.estimate(RangeValue(100, None)), 0)
+
+    def test_estimate_range_sampled(self):
+        from .. import RangeValue
+        index = self._makeOne()
+        for docid in range(100):
+            index.index_doc(docid, docid // 2)
+        index.estimate_sample_size = 4
+        self.assertEqual(index.estimate(RangeValue(0, 9)), 20)
+        index.estimate_sample_size = 32
+        self.assertEqual(index.estimate(RangeValue(0, 49)), 100)
+
+    def test_estimate_range_sampled_skewed(self):
+        from .. import RangeValue
+        index = self._makeOne()
+        for docid in range(10):
+            index.index_doc(docid, docid)
+        for docid in range(10, 50):
+            index.index_doc(docid, 0)
+        index.estimate_sample_size = 5
+        # the extrapolation overshoots, but is capped at the document count
+        self.assertEqual(index._estimate_range(0, 9), 90)
+        self.assertEqual(index.estimate(RangeValue(0, 9)), 50)
+
+    def test_class_conforms_to_IIndexFilter(self):
+        from zope.interface.verify import verifyClass
+        from ..interfaces import IIndexFilter
+        verifyClass(IIndexFilter, self._getTargetClass())
+
+    def _assertSameState(self, index, other):
+        def fwd(index):
+            return [(value, list(docids))
+                    for value, docids in index._fwd_index.items()]
+        self.assertEqual(fwd(index), fwd(other))
+        self.assertEqual(list(index._rev_index.items()),
+                         list(other._rev_index.items()))
+        self.assertEqual(list(index._not_indexed), list(other._not_indexed))
+        self.assertEqual(index.indexed_count(), other.indexed_count())
+
+    def test_index_docs(self):
+        pairs = [(5, 1), (2, 2), (1, 1), (3, _marker), (4, 2)]
+        index = self._makeOne()
+        index.index_docs(iter(pairs))
+        expected = self._makeOne()
+        for docid, value in pairs:
+            expected.index_doc(docid, value)
+        self._assertSameState(index, expected)
+        self.assertEqual(list(index._fwd_index[1]), [1, 5])
+        self.assertEqual(index.generation(), 2)
+
+    def test_index_docs_existing(self):
+        index = self._makeOne()
+        expected = self._makeOne()
+        for each in (index, expected):
+            each.index_doc(1, 1)
+            each.index_doc(2, _marker)
+        pairs = [(3, 1), (1, 2), (4, 3), (2, 3), (5, 1), (5, 4), (6, _marker),
+                 (6, 1), (7, _marker)]
+        index.index_docs(pairs)
+        for docid, value in pairs:
+            expected.index_doc(docid, value)
+        self._assertSameState(index, expected)
+
+    def test_class_conforms_to_IIndexMerge(self):
+        from zope.interface.verify import verifyClass
+        from ..interfaces import IIndexMerge
+        verifyClass(IIndexMerge, self._getTargetClass())
+
+    def test_merge(self):
+        pairs = [(1, 1), (2, 2), (3, _marker), (4, 1), (5, 3), (6, 2)]
+        index = self._makeOne()
+        other = self._makeOne()
+        expected = self._makeOne()
+        index.index_docs(pairs[:3])
+        other.index_docs(pairs[3:])
+        expected.index_docs(pairs)
+        generation = index.generation()
+        index.merge(other)
+        self._assertSameState(index, expected)
+        self.assertEqual(index.generation(), generation + 1)
+        self.assertFalse(index._fwd_index[1] is other._fwd_index[1])
+        self.assertEqual(list(other._fwd_index[1]), [4])
+
+    def test_index_docs_empty(self):
+        index = self._makeOne()
+        index.index_docs([])
+        self.assertEqual(index.indexed_count(), 0)
+        self.assertEqual(index.generation(), 1)
+
+    def test_class_conforms_to_IIndexGeneration(self):
+        from zope.interface.verify import verifyClass
+        from ..interfaces import IIndexGeneration
+        verifyClass(IIndexGeneration, self._getTargetClass())
+
+    def _assertBumps(self, index, bumps, func, *args):
+        generation = index.generation()
+        func(*args)
+        self.assertEqual(index.generation(), generation + bumps)
+
+    def test_generation(self):
+        index = self._makeOne()
+        self.assertEqual(index.generation(), 1)
+        self._assertBumps(index, 1, index.index_doc, 1, 'a')
+        self._assertBumps(index, 0, index.index_doc, 1, 'a')
+        self._assertBumps(index, 0, index.reindex_doc, 1, 'a')
+        self._assertBumps(index, 2, index.reindex_doc, 1, 'b')
+        self._assertBumps(index, 2, index.index_doc, 1, _marker)
+        self._assertBumps(index, 0, index.index_doc, 1, _marker)
+        self._assertBumps(index, 2, index.index_doc, 1, 'b')
+        self._assertBumps(index, 1, index.unindex_doc, 1)
+        self._assertBumps(index, 0, index.unindex_doc, 1)
+        index.index_doc(2, _marker)
+        self._assertBumps(index, 1, index.unindex_doc, 2)
+        self._assertBumps(index, 1, index.reset)
+
+    def test_apply_range_exclusive(self):
+        from .. import RangeValue
+        index = self._makeOne()
+        self._populateIndex(index)
+        result = index.apply(RangeValue(3, 5, excludemin=True))
+        self.assertEqual(list(result), [3, 4])
+        result = index.apply(RangeValue(3, 5, excludemax=True))
+        self.assertEqual(list(result), [1, 3])
+
+    def _filter(self, index, query, docids=None):
+        if docids is None:
+            docids = index.family.IF.Set(range(1, 13))
+        return list(index.filter(docids, query))
+
+    def test_filter_single_value(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        self.assertEqual(self._filter(index, 4), [3])
+        self.assertEqual(self._filter(index, 42), [])
+
+    def test_filter_list_or(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        self.assertEqual(self._filter(index, [1, 4]), [3, 5])
+
+    def test_filter_range(self):
+        from .. import RangeValue
+        index = self._makeOne()
+        self._populateIndex(index)
+        self.assertEqual(self._filter(index, RangeValue(3, 5)), [1, 3, 4])
+        self.assertEqual(self._filter(index, (3, 5)), [1, 3, 4])
+        self.assertEqual(self._filter(index, RangeValue(None, 2)), [2, 5])
+        self.assertEqual(self._filter(index, RangeValue(10, None)), [10, 11])
+
+    def test_filter_range_exclusive(self):
+        from .. import RangeValue
+        index = self._makeOne()
+        self._populateIndex(index)
+        query = RangeValue(3, 5, excludemin=True, excludemax=True)
+        self.assertEqual(self._filter(index, query), [3])
+
+    def test_filter_dict_and(self):
+        from .. import RangeValue
+        index = self._makeOne()
+        self._populateIndex(index)
+        query = {'query': [4, RangeValue(3, 5)], 'operator': 'and'}
+        self.assertEqual(self._filter(index, query), [3])
+
+    def test_filter_empty_query(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        self.assertEqual(self._filter(index, []), [])
+
+    def test_filter_unindexed_docids(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        docids = index.family.IF.Set([3, 99])
+        self.assertEqual(self._filter(index, 4, docids), [3])
+
+    def test_filter_weighted(self):
+        from .. import RangeValue
+        index = self._makeOne()
+        self._populateIndex(index)
+        docids = index.family.IF.Bucket({1: 0.5, 2: 1.0, 3: 1.5})
+        result = index.filter(docids, RangeValue(3, 4))
+        self.assertEqual(list(result.items()), [(1, 0.5), (3, 1.5)])
+
+    def test_filter_agrees_with_apply(self):
+        from .. import RangeValue
+        index = self._makeOne()
+        self._populateIndex(index)
+        queries = [1, [2, 9], RangeValue(2, 8), RangeValue(2, 8, True, True),
+                   {'query': [RangeValue(1, 6), RangeValue(4, 9)],
+                    'operator': 'and'}]
+        for query in queries:
+            self.assertEqual(self._filter(index, query),
+                             list(index.apply(query)))
+
+    def _narrower(self, *docids):
+        return lambda candidates: [x for x in candidates if x in docids]
+
+    def test_scan(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        narrow = self._narrower(1, 2, 3, 10, 99)
+        self.assertEqual(list(index.scan(narrow)), [2, 1, 3, 10])
+
+    def test_scan_reverse(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        narrow = self._narrower(1, 2, 3, 10, 99)
+        self.assertEqual(list(index.scan(narrow, reverse=True)),
+                         [10, 3, 1, 2])
+
+    def test_scan_limit(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        narrow = self._narrower(1, 2, 3, 10)
+        self.assertEqual(list(index.scan(narrow, limit=2)), [2, 1])
+
+    def test_scan_batched(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        index.index_doc(12, 3)
+        index.scan_batch_size = 2
+        batches = []
+        def narrow(candidates):
+            batches.append(list(candidates))
+            return candidates
+        self.assertEqual(list(index.scan(narrow, limit=4)), [5, 2, 1, 12])
+        self.assertEqual(batches, [[2, 5], [1, 12]])
+        batches[:] = []
+        self.assertEqual(len(list(index.scan(narrow))), 12)
+        self.assertEqual(len(batches), 6)
+
+    def test_scan_empty(self):
+        index = self._makeOne()
+        self.assertEqual(list(index.scan(self._narrower(1))), [])
+
+    def test_scan_wins(self):
+        index = self._makeOne()
+        self.assertFalse(index.scan_wins(10, 10))
+        self._populateIndex(index)
+        self.assertTrue(index.scan_wins(10, 10))
+        self.assertFalse(index.scan_wins(1, 0))
+
     def test_docids(self):
         index = self._makeOne()
         self._populateIndex(index)
@@ -1107,6 +1391,36 @@ class FieldIndexTests(unittest.TestCase):
         index.index_doc(2, _marker)
         self.assertEqual(set([1, 2]), set(index.docids()))
 
+    def test_docids_maintained(self):
+        index = self._makeOne()
+        other = self._makeOne()
+        self._populateIndex(index)
+        index.index_doc(3, _marker)
+        index.index_doc(4, 42)
+        index.unindex_doc(5)
+        index.index_docs([(12, 1), (13, _marker), (2, _marker)])
+        other.index_docs([(14, 1), (15, _marker)])
+        index.merge(other)
+        docids = index.docids()
+        self.assertTrue(docids is index._all_docids)
+        self.assertEqual(
+            list(docids),
+            sorted(set(index.indexed()) | set(index.not_indexed())))
+        self.assertEqual(list(docids), [1, 2, 3, 4] + list(range(6, 16)))
+        self.assertEqual(list(index.applyNotEq(1)),
+                         [1, 2, 3, 4, 6, 7, 8, 9, 10, 11, 13, 15])
+
+    def test_docids_built_on_first_change(self):
+        # as for an index pickled before docids were kept
+        index = self._makeOne()
+        self._populateIndex(index)
+        index.index_doc(12, _marker)
+        del index._all_docids
+        self.assertEqual(list(index.docids()), list(range(1, 13)))
+        self.assertTrue(index._all_docids is None)
+        index.unindex_doc(1)
+        self.assertEqual(list(index._all_docids), list(range(2, 13)))
+
     def test_not_indexed_count(self):
         index = self._makeOne()
         index.index_doc(1, 1)
@@ -1185,6 +1499,442 @@ class FieldIndexTests(unittest.TestCase):
         self.assertEqual(result._start, 1)
         self.assertEqual(result._end, 2)
 
+class FieldIndexSortRankTests(unittest.TestCase):
+
+    def _makeOne(self, sort_ranks=True, family=None):
+        from . import FieldIndex
+        def _discriminator(obj, default):
+            if obj is _marker:
+                return default
+            return obj
+        return FieldIndex(_discriminator, family=family,
+                          sort_ranks=sort_ranks)
+
+    def _populateIndex(self, index):
+        for docid, value in [(1, 5), (2, 2), (3, 1), (4, 3), (5, 4), (6, 8),
+                             (7, 9), (8, 7), (9, 6), (10, 11), (11, 10),
+                             (12, 5), (13, 2), (14, _marker)]:
+            index.index_doc(docid, value)
+
+    def _assertRanksConsistent(self, index):
+        self.assertEqual(list(index._doc_rank.keys()),
+                         list(index._rev_index.keys()))
+        self.assertEqual(list(index._value_rank.keys()),
+                         list(index._fwd_index.keys()))
+        ranks = list(index._value_rank.values())
+        self.assertEqual(ranks, sorted(set(ranks)))
+        for docid, value in index._rev_index.items():
+            self.assertEqual(index._doc_rank[docid], index._value_rank[value])
+
+    def test_disabled_by_default(self):
+        index = self._makeOne(sort_ranks=False)
+        self._populateIndex(index)
+        self.assertEqual(index._doc_rank, None)
+        self.assertEqual(index._value_rank, None)
+
+    def test_ctor_sort_ranks(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        self._assertRanksConsistent(index)
+
+    def test_enable_sort_ranks(self):
+        index = self._makeOne(sort_ranks=False)
+        self._populateIndex(index)
+        index.enable_sort_ranks()
+        self._assertRanksConsistent(index)
+        self.assertEqual(index._value_rank[1], 0)
+        self.assertEqual(index._value_rank[2], index.rank_step)
+
+    def test_disable_sort_ranks(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        index.disable_sort_ranks()
+        self.assertEqual(index._doc_rank, None)
+        self.assertEqual(index._value_rank, None)
+        index.index_doc(20, 20)
+        self.assertEqual(index._doc_rank, None)
+
+    def test_reset_keeps_sort_ranks(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        index.reset()
+        self.assertEqual(len(index._doc_rank), 0)
+        self.assertEqual(len(index._value_rank), 0)
+        index.index_doc(1, 1)
+        self._assertRanksConsistent(index)
+
+    def test_index_doc_new_values(self):
+        index = self._makeOne()
+        index.index_doc(1, 5)
+        self.assertEqual(index._doc_rank[1], 0)
+        index.index_doc(2, 7)
+        self.assertEqual(index._doc_rank[2], index.rank_step)
+        index.index_doc(3, 3)
+        self.assertEqual(index._doc_rank[3], -index.rank_step)
+        index.index_doc(4, 6)
+        self.assertEqual(index._doc_rank[4], index.rank_step // 2)
+        index.index_doc(5, 6)
+        self.assertEqual(index._doc_rank[5], index.rank_step // 2)
+        self._assertRanksConsistent(index)
+
+    def test_index_doc_renumbers_when_out_of_room(self):
+        index = self._makeOne()
+        index.rank_step = 2
+        index.index_doc(1, 1)
+        index.index_doc(2, 3)
+        index.index_doc(3, 2)
+        self.assertEqual(index._doc_rank[3], 1)
+        index.index_doc(4, 4)
+        index.index_doc(5, 2.5)
+        self._assertRanksConsistent(index)
+        self.assertEqual(list(index._value_rank.values()), [0, 2, 4, 6, 8])
+
+    def test_index_doc_renumbers_at_maxint(self):
+        index = self._makeOne()
+        index.rank_step = index.family.maxint + 1
+        index.index_doc(1, 1)
+        index.index_doc(2, 2)
+        self._assertRanksConsistent(index)
+
+    def test_index_doc_renumbers_at_minint(self):
+        index = self._makeOne()
+        index.rank_step = index.family.maxint + 2
+        index.index_doc(1, 2)
+        index.index_doc(2, 1)
+        self._assertRanksConsistent(index)
+
+    def test_reindex_doc(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        index.reindex_doc(1, 12)
+        index.reindex_doc(2, _marker)
+        index.reindex_doc(3, 5)
+        self._assertRanksConsistent(index)
+        self.assertFalse(1 in index._value_rank)
+
+    def test_unindex_doc(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        index.unindex_doc(1)
+        self.assertFalse(1 in index._doc_rank)
+        self.assertTrue(5 in index._value_rank)
+        index.unindex_doc(12)
+        self.assertFalse(5 in index._value_rank)
+        index.unindex_doc(14)
+        self._assertRanksConsistent(index)
+
+    def test_index_docs(self):
+        index = self._makeOne()
+        index.index_doc(1, 1)
+        index.index_docs([(2, 3), (3, 2), (4, 2), (5, _marker), (1, 4)])
+        self._assertRanksConsistent(index)
+
+    def test_index_docs_renumbers_once(self):
+        index = self._makeOne()
+        index.rank_step = 2
+        index.index_doc(1, 1)
+        index.index_doc(2, 3)
+        calls = []
+        renumber = index._renumber_ranks
+        def _renumber_ranks():
+            calls.append(True)
+            renumber()
+        index._renumber_ranks = _renumber_ranks
+        index.index_docs([(3, 1.5), (4, 2), (5, 2.5), (6, 4)])
+        self.assertEqual(len(calls), 1)
+        self._assertRanksConsistent(index)
+
+    def test_merge(self):
+        index = self._makeOne()
+        other = self._makeOne(sort_ranks=False)
+        index.index_docs([(1, 1), (2, 3)])
+        other.index_docs([(3, 2), (4, 3), (5, 0)])
+        index.merge(other)
+        self._assertRanksConsistent(index)
+
+    def _assertSortsAgree(self, docids, **kw):
+        ranked = self._makeOne()
+        unranked = self._makeOne(sort_ranks=False)
+        for index in (ranked, unranked):
+            self._populateIndex(index)
+        self.assertEqual(list(ranked.sort(docids, **kw)),
+                         list(unranked.sort(docids, **kw)))
+
+    def test_sort_timsort(self):
+        from ..interfaces import TIMSORT
+        docids = [13, 12, 11, 10, 9, 8, 7, 6, 5, 4, 3, 2, 1]
+        self._assertSortsAgree(docids, sort_type=TIMSORT)
+        self._assertSortsAgree(docids, sort_type=TIMSORT, reverse=True)
+        self._assertSortsAgree(docids, sort_type=TIMSORT, limit=4)
+        self._assertSortsAgree(docids, sort_type=TIMSORT, limit=4,
+                               reverse=True)
+
+    def test_sort_stable(self):
+        from ..interfaces import STABLE
+        docids = [1, 13, 2, 12]
+        self._assertSortsAgree(docids, sort_type=STABLE)
+        self._assertSortsAgree(docids, sort_type=STABLE, reverse=True)
+
+    def test_sort_nbest(self):
+        from ..interfaces import NBEST
+        docids = [13, 12, 11, 10, 9, 8, 7, 6, 5, 4, 3, 2, 1]
+        self._assertSortsAgree(docids, sort_type=NBEST, limit=5)
+        self._assertSortsAgree(docids, sort_type=NBEST, limit=5,
+                               reverse=True)
+
+    def test_sort_default(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        docids = [13, 12, 1, 2]
+        self.assertEqual(list(index.sort(docids, reverse=True)),
+                         [12, 1, 13, 2])
+        self.assertEqual(list(index.sort(docids, reverse=True, limit=3)),
+                         [12, 1, 13])
+
+    def test_sort_default_uses_fwscan_when_it_wins(self):
+        index = self._makeOne()
+        self._populateIndex(index)
+        index.sort_ranked = None
+        self.assertEqual(list(index.sort([1, 2, 3, 4])), [3, 2, 4, 1])
+
+    def test_sort_default_ranked_when_fwscan_loses(self):
+        index = self._makeOne()
+        for docid in range(1000):
+            index.index_doc(docid, -docid)
+        self.assertEqual(list(index.sort([1, 2, 3], limit=2)), [3, 2])
+
+    def test_sort_force_fwscan(self):
+        from ..interfaces import FWSCAN
+        index = self._makeOne()
+        self._populateIndex(index)
+        index.sort_ranked = None
+        self.assertEqual(list(index.sort([1, 2, 3], sort_type=FWSCAN)),
+                         [3, 2, 1])
+
+    def test_sort_missing_docids(self):
+        from hypatia.exc import Unsortable
+        from ..interfaces import NBEST
+        from ..interfaces import TIMSORT
+        index = self._makeOne()
+        self._populateIndex(index)
+        for kw in ({'sort_type': TIMSORT}, {'sort_type': NBEST, 'limit': 2}):
+            result = index.sort([1, 99, 2, 14, 3], **kw)
+            dids = []
+            try:
+                for did in result:
+                    dids.append(did)
+            except Unsortable as e:
+                self.assertEqual(list(e.docids), [99, 14])
+            else: # pragma: no cover
+                raise AssertionError('Unsortable not raised')
+            self.assertEqual(dids, [3, 2, 1][:kw.get('limit')])
+
+    def test_sort_missing_docids_raise_unsortable_False(self):
+        from ..interfaces import TIMSORT
+        index = self._makeOne()
+        self._populateIndex(index)
+        result = index.sort([1, 99, 2], sort_type=TIMSORT,
+                            raise_unsortable=False)
+        self.assertEqual(list(result), [2, 1])
+
+    def test_sort_ranked_nbest_without_limit(self):
+        from ..interfaces import NBEST
+        index = self._makeOne()
+        self._populateIndex(index)
+        self.assertRaises(ValueError, index.sort_ranked, [1, 2],
+                          sort_type=NBEST)
+
+    def test_sort_ranked_bad_sort_type(self):
+        from ..interfaces import FWSCAN
+        index = self._makeOne()
+        self._populateIndex(index)
+        self.assertRaises(ValueError, index.sort, [1, 2], reverse=True,
+                          sort_type=FWSCAN)
+        self.assertRaises(ValueError, index.sort_ranked, [1, 2],
+                          sort_type='nonesuch')
+
+class FieldIndexCalibrationTests(unittest.TestCase):
+
+    def _makeOne(self, numdocs=64, sort_ranks=False):
+        from . import FieldIndex
+        index = FieldIndex(lambda obj, default: obj, sort_ranks=sort_ranks)
+        index.index_docs([(docid, docid % 7) for docid in range(numdocs)])
+        return index
+
+    def _makeTable(self, numdocs, winners):
+        from . import SortTable
+        return SortTable(numdocs, winners)
+
+    def test_calibrate_empty_index(self):
+        index = self._makeOne(numdocs=0)
+        self.assertRaises(ValueError, index.calibrate_sort)
+
+    def test_calibrate_sort(self):
+        from ..interfaces import FWSCAN
+        from ..interfaces import NBEST
+        from ..interfaces import TIMSORT
+        index = self._makeOne()
+        table = index.calibrate_sort(repeat=1, seed=0)
+        self.assertTrue(index.sort_table is table)
+        self.assertEqual(table.numdocs, 64)
+        self.assertEqual(
+            set(table.winners),
+            set([(reverse, rlen, limit)
+                    for reverse in (False, True)
+                    for rlen in (64, 32, 16, 8, 4, 2, 1)
+                    for limit in (None, 1, 10, 100)
+                    if limit is None or limit <= rlen]))
+        for (reverse, rlen, limit), sort_type in table.winners.items():
+            if reverse:
+                self.assertNotEqual(sort_type, FWSCAN)
+            if not limit:
+                self.assertNotEqual(sort_type, NBEST)
+            self.assertTrue(sort_type in (FWSCAN, NBEST, TIMSORT))
+
+    def test_calibrate_sort_picks_fastest(self):
+        from ..interfaces import FWSCAN
+        from ..interfaces import NBEST
+        from ..interfaces import TIMSORT
+        index = self._makeOne(numdocs=4)
+        costs = {FWSCAN: 3, NBEST: 1, TIMSORT: 2}
+        clock = [0]
+        sort = index.sort
+        def _sort(docids, reverse, limit, sort_type):
+            clock[0] += costs[sort_type]
+            return sort(docids, reverse, limit, sort_type)
+        index.sort = _sort
+        table = index.calibrate_sort(limits=(1,), step=2,
+                                     timer=lambda: clock[0])
+        self.assertEqual(table.winners, {
+            (False, 4, None): TIMSORT,
+            (True, 4, None): TIMSORT,
+            (False, 4, 1): NBEST,
+            (True, 4, 1): NBEST,
+            (False, 1, None): TIMSORT,
+            (True, 1, None): TIMSORT,
+            (False, 1, 1): NBEST,
+            (True, 1, 1): NBEST,
+            })
+
+    def test_calibrate_sort_w_sort_ranks(self):
+        index = self._makeOne(sort_ranks=True)
+        index.calibrate_sort(repeat=1, seed=0)
+        docids = [3, 1, 4, 15, 9, 2, 6]
+        self.assertEqual(list(index.sort(docids)),
+                         sorted(docids, key=lambda docid: docid % 7))
+
+    def test_sort_consults_table(self):
+        from ..interfaces import FWSCAN
+        from ..interfaces import NBEST
+        from ..interfaces import TIMSORT
+        index = self._makeOne()
+        index.sort_table = self._makeTable(64, {
+            (False, 64, None): TIMSORT,
+            (False, 64, 1): FWSCAN,
+            (True, 64, None): TIMSORT,
+            (True, 64, 1): NBEST,
+            })
+        calls = []
+        def _wrap(name):
+            method = getattr(index, name)
+            def wrapper(*arg):
+                calls.append(name)
+                return method(*arg)
+            setattr(index, name, wrapper)
+        for name in ('scan_forward', 'nbest_descending', 'timsort_ascending',
+                     'timsort_descending'):
+            _wrap(name)
+        docids = list(range(64))
+        list(index.sort(docids))
+        list(index.sort(docids, limit=1))
+        list(index.sort(docids, reverse=True))
+        list(index.sort(docids, reverse=True, limit=1))
+        self.assertEqual(calls, ['timsort_ascending', 'scan_forward',
+                                 'timsort_descending', 'nbest_descending'])
+        self.assertTrue(index.scan_wins(1, 64))
+        self.assertFalse(index.scan_wins(None, 64))
+
+    def test_sort_consults_table_w_sort_ranks(self):
+        from ..interfaces import FWSCAN
+        from ..interfaces import TIMSORT
+        index = self._makeOne(sort_ranks=True)
+        index.sort_table = self._makeTable(64, {
+            (False, 64, None): FWSCAN,
+            (True, 64, None): TIMSORT,
+            })
+        index.sort_ranked = None
+        self.assertEqual(list(index.sort([8, 7])), [7, 8])
+
+    def test_sort_w_table_without_opinion(self):
+        from ..interfaces import TIMSORT
+        index = self._makeOne()
+        index.sort_table = self._makeTable(64, {(False, 64, None): TIMSORT})
+        self.assertEqual(list(index.sort([8, 7], reverse=True, limit=1)),
+                         [8])
+        self.assertTrue(index.scan_wins(1, 64))
+
+class TestSortTable(unittest.TestCase):
+
+    def _makeOne(self, numdocs, winners):
+        from . import SortTable
+        return SortTable(numdocs, winners)
+
+    def test_lookup_measured(self):
+        table = self._makeOne(1024, {(False, 1024, None): 'a',
+                                     (False, 1, None): 'b',
+                                     (False, 32, 4): 'c',
+                                     (True, 32, None): 'd'})
+        self.assertEqual(table.lookup(False, None, 1024, 1024), 'a')
+        self.assertEqual(table.lookup(False, None, 1, 1024), 'b')
+        self.assertEqual(table.lookup(False, 4, 32, 1024), 'c')
+        self.assertEqual(table.lookup(True, None, 32, 1024), 'd')
+
+    def test_lookup_nearest(self):
+        table = self._makeOne(1024, {(False, 1024, None): 'a',
+                                     (False, 1, None): 'b',
+                                     (False, 32, 4): 'c'})
+        self.assertEqual(table.lookup(False, None, 600, 1024), 'a')
+        self.assertEqual(table.lookup(False, None, 3, 1024), 'b')
+        self.assertEqual(table.lookup(False, 1000, 1000, 1024), 'c')
+        self.assertEqual(table.lookup(True, None, 32, 1024), None)
+        self.assertEqual(table.lookup(True, 4, 32, 1024), None)
+
+    def test_lookup_relative_to_numdocs(self):
+        table = self._makeOne(1024, {(False, 1024, None): 'a',
+                                     (False, 1, None): 'b'})
+        self.assertEqual(table.lookup(False, None, 4096, 4096), 'a')
+        self.assertEqual(table.lookup(False, None, 0, 4096), 'b')
+        self.assertEqual(table.lookup(False, None, 1, 1 << 30), 'b')
+
+    def test_lookup_limit_greater_than_numdocs(self):
+        table = self._makeOne(16, {(True, 16, 100): 'a'})
+        self.assertEqual(table.lookup(True, 100, 16, 16), 'a')
+        self.assertEqual(table.lookup(True, 1, 1, 16), 'a')
+
+class TestRangeValue(unittest.TestCase):
+
+    def _makeOne(self, *arg, **kw):
+        from .. import RangeValue
+        return RangeValue(*arg, **kw)
+
+    def test_as_tuple(self):
+        self.assertEqual(self._makeOne(1, 2).as_tuple(), (1, 2))
+
+    def test___contains___inclusive(self):
+        rv = self._makeOne(1, 3)
+        self.assertEqual([x in rv for x in range(5)],
+                         [False, True, True, True, False])
+
+    def test___contains___exclusive(self):
+        rv = self._makeOne(1, 3, excludemin=True, excludemax=True)
+        self.assertEqual([x in rv for x in range(5)],
+                         [False, False, True, False, False])
+
+    def test___contains___open(self):
+        self.assertTrue(100 in self._makeOne(1, None))
+        self.assertTrue(-100 in self._makeOne(None, 1))
+        self.assertTrue(0 in self._makeOne(None, None))
+
 class Test_fwscan_wins(unittest.TestCase):
 
     def _callFUT(self, limit, rlen, numdocs):
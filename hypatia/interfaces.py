@@ -18,6 +18,19 @@ class IIndexInjection(Interface):
         This can also be used to reindex documents.
         """
 
+    def index_docs(pairs):
+        """Add many documents to the index.
+
+        pairs: an iterable of ``(docid, value)`` tuples, each as would be
+        passed to ``index_doc``
+
+        return: None
+
+        The result is the same as calling ``index_doc`` for each pair in
+        turn, but documents which are new to the index are added in bulk,
+        which is much faster when (re)building an index from scratch.
+        """
+
     def unindex_doc(docid):
         """Remove a document from the index.
 
@@ -61,7 +74,10 @@ class IIndexEnumeration(Interface):
         """ Return the set of document ids which have been reported to this
         index via its ``index_doc`` or ``reindex_doc`` method (including
         document ids which had values which were not indexed).  This is the
-        logical union of sets returned by indexed() and not_indexed()."""
+        logical union of sets returned by indexed() and not_indexed().
+
+        The set may be one the index keeps up to date itself, so it must
+        be treated as read-only: copy it before changing it."""
 
     def docids_count():
         """Return the number of document ids currently in the set of both
@@ -85,6 +101,61 @@ class IIndexStatistics(Interface):
     def word_count():
         """Return the number of words currently indexed."""
 
+class IIndexEstimate(Interface):
+    """An index that can cheaply approximate the size of a query result."""
+
+    def estimate(query):
+        """Return an approximation of the number of document ids that
+        ``apply(query)`` would return, without computing the result.
+
+        ``query`` takes the same form as the argument to the index's
+        ``apply`` method.  The estimate is not guaranteed to be exact, but
+        implementations should be much cheaper than ``len(apply(query))``.
+        """
+
+class IIndexFilter(Interface):
+    """An index that can narrow an existing result by probing its reverse
+    index one document at a time."""
+
+    def filter(docids, query):
+        """Return the members of ``docids`` which ``apply(query)`` would
+        also return.
+
+        ``query`` takes the same form as the argument to the index's
+        ``apply`` method.  If ``docids`` is a weighted result (a mapping of
+        docid to score) the scores of the surviving docids are preserved in
+        the returned mapping, otherwise a set is returned.
+
+        The cost is proportional to ``len(docids)`` rather than to the
+        size of ``apply(query)``, so this is the cheaper way of
+        intersecting a small result with a large one.
+        """
+
+class IIndexGeneration(Interface):
+    """An index which counts the changes made to it."""
+
+    def generation():
+        """Return an integer which changes whenever a document is indexed,
+        reindexed or unindexed, or the index is reset.
+
+        Results computed by the index while the generation stays the same
+        may be reused.  Return ``None`` if the index has changes which are
+        not yet committed, or if it does not keep a generation counter, in
+        which case results should not be reused.
+        """
+
+class IIndexMerge(Interface):
+    """An index which can absorb another index built separately."""
+
+    def merge(other):
+        """Add the documents indexed by ``other`` to this index.
+
+        ``other`` must be an index of the same kind and configuration which
+        holds none of this index's document ids, for example one built over
+        a different range of docids in another process.  ``other`` is not
+        modified.
+        """
+
 class IIndexSort(Interface):
 
     def sort(docids, reverse=False, limit=None, sort_type=None,
@@ -114,6 +185,21 @@ class ICatalog(IIndexInjection):
     """ Dictionary-like object which maps index names to index instances.
     Also supports the IIndexInjection interface."""
 
+    query_cache_size = Attribute(
+        'The number of query results remembered by ``apply_query``.  Zero '
+        'disables the cache.'
+        )
+
+    def apply_query(query, names=None):
+        """Return the set of docids matched by ``query`` (an object from
+        :mod:`hypatia.query`), using ``names`` to resolve any
+        :class:`hypatia.query.Name` values in it.
+
+        While ``query_cache_size`` is nonzero, results are remembered per
+        connection and reused until one of the indexes the query consults
+        changes (see :class:`IIndexGeneration`).
+        """
+
 class ICatalogQuery(Interface):
     def __call__(queryobject, sort_index=None, limit=None, sort_type=None,
                  reverse=False, names=None):
@@ -2,8 +2,13 @@ from zope.interface import implementer
 
 from ..interfaces import (
     IIndex,
+    IIndexEstimate,
+    IIndexFilter,
+    IIndexGeneration,
+    IIndexMerge,
     IIndexStatistics,
     )
+from ..bitmap import Bitmap
 from ..util import BaseIndexMixin
 
 from persistent import Persistent
@@ -18,6 +23,10 @@ _marker = object()
 @implementer(
     IIndex,
     IIndexStatistics,
+    IIndexEstimate,
+    IIndexFilter,
+    IIndexGeneration,
+    IIndexMerge,
     IKeywordQuerying,
     )
 class KeywordIndex(BaseIndexMixin, Persistent):
@@ -48,6 +57,16 @@ class KeywordIndex(BaseIndexMixin, Persistent):
     # use a TreeSet for that word instead of a Set.
     tree_threshold = 64
 
+    # If a word is referenced by at least tree_threshold docids and by at
+    # least this fraction of the indexed documents, store its docids in a
+    # compressed Bitmap instead.  None (the default) disables bitmaps.
+    bitmap_density = None
+
+    # Words aren't turned into Bitmaps as they grow until the index holds
+    # at least this many documents, as the density of a word means little
+    # early in a build; optimize() converts them regardless.
+    bitmap_min_docs = 1000
+
     def __init__(self, discriminator, family=None):
         if family is not None:
             self.family = family
@@ -70,6 +89,8 @@ class KeywordIndex(BaseIndexMixin, Persistent):
         self._rev_index = self.family.IO.BTree()
         self._num_docs = Length(0)
         self._not_indexed = self.family.IF.TreeSet()
+        self._all_docids = self.family.IF.TreeSet()
+        self._bump_generation()
 
     def unique_values(self):
         """ Return the unique values in the index for all docids as an iterable
@@ -89,6 +110,9 @@ class KeywordIndex(BaseIndexMixin, Persistent):
     def not_indexed(self):
         return self._not_indexed
 
+    def indexed_count(self):
+        return self._num_docs()
+
     def word_count(self):
         """Return the number of indexed words"""
         return len(self._fwd_index)
@@ -153,11 +177,14 @@ class KeywordIndex(BaseIndexMixin, Persistent):
                 self.unindex_doc(docid)
                 # Store docid in set of unindexed docids
                 self._not_indexed.add(docid)
+                self._add_docids((docid,))
+                self._bump_generation()
             return None
 
         if docid in self._not_indexed:
             # Remove from set of unindexed docs if it was in there.
             self._not_indexed.remove(docid)
+            self._bump_generation()
 
         if isinstance(seq, str):
             raise TypeError('seq argument must be a list/tuple of strings')
@@ -166,6 +193,8 @@ class KeywordIndex(BaseIndexMixin, Persistent):
         if not seq:
             if old_kw:
                 self.unindex_doc(docid)
+            # neither indexed nor not indexed
+            self._discard_docid(docid)
             return
 
         seq = self.normalize(seq)
@@ -173,9 +202,11 @@ class KeywordIndex(BaseIndexMixin, Persistent):
         new_kw = self.family.OO.Set(seq)
 
         if old_kw is None:
+            self._num_docs.change(1)
             self._insert_forward(docid, new_kw)
             self._insert_reverse(docid, new_kw)
-            self._num_docs.change(1)
+            self._add_docids((docid,))
+            self._bump_generation()
         else:
             # determine added and removed keywords
             kw_added = self.family.OO.difference(new_kw, old_kw)
@@ -190,23 +221,122 @@ class KeywordIndex(BaseIndexMixin, Persistent):
                 fwd.remove(docid)
                 if not fwd:
                     del self._fwd_index[word]
+                elif isinstance(fwd, Bitmap):
+                    self._grow_container(word, fwd)
 
             # now update reverse and forward indexes
             self._insert_forward(docid, kw_added)
             self._insert_reverse(docid, new_kw)
+            self._bump_generation()
+
+    def index_docs(self, pairs):
+        """ See interface IIndexInjection """
+        rev_index = self._rev_index
+        not_indexed = self._not_indexed
+        new = {}
+        for docid, obj in pairs:
+            if docid in rev_index or docid in not_indexed or docid in new:
+                # reindexing takes the one-document-at-a-time path
+                self._add_docs(new)
+                new = {}
+                self.index_doc(docid, obj)
+            else:
+                value = self.discriminate(obj, _marker)
+                if value is not _marker:
+                    value = self._words(value)
+                new[docid] = value
+        self._add_docs(new)
+
+    def _words(self, seq):
+        # The set of words index_docs() stores for a discriminated value
+        if isinstance(seq, str):
+            raise TypeError('seq argument must be a list/tuple of strings')
+        if not seq:
+            return self.family.OO.Set()
+        return self.family.OO.Set(self.normalize(seq))
+
+    def _add_docs(self, new):
+        # Bulk insert a mapping of docid -> words (or _marker) for documents
+        # which are not yet in the index.
+        if not new:
+            return
+        missing = []
+        indexed = {}
+        pairs = []
+        for docid, words in new.items():
+            if words is _marker:
+                missing.append(docid)
+            elif words:
+                indexed[docid] = words
+                pairs.extend((word, docid) for word in words)
+        self._not_indexed.update(sorted(missing))
+        self._add_docids(missing)
+        self._add_docids(indexed)
+        self._num_docs.change(len(indexed))
+        self._update_forward(self._group_docids(pairs))
+        self._rev_index.update(indexed)
+        if indexed or missing:
+            self._bump_generation()
+
+    def _update_forward(self, items):
+        # Add each of the (word, docids) pairs in items to the forward index
+        idx = self._fwd_index
+        Set = self.family.IF.Set
+        for word, docids in items:
+            word_idx = idx.get(word)
+            if word_idx is None:
+                idx[word] = word_idx = Set(docids)
+            else:
+                word_idx.update(docids)
+            self._grow_container(word, word_idx)
+
+    def _grow_container(self, word, word_idx):
+        # Replace a word's Set of docids with a TreeSet or Bitmap once it
+        # has grown big (and dense) enough, and a Bitmap with a TreeSet
+        # once it's no longer dense enough.
+        n = len(word_idx)
+        density = self.bitmap_density
+        numdocs = self._num_docs()
+        if isinstance(word_idx, Bitmap):
+            if density is None or n < density * numdocs:
+                self._fwd_index[word] = self.family.IF.TreeSet(word_idx)
+            return
+        if n < self.tree_threshold:
+            return
+        if (density is not None and numdocs >= self.bitmap_min_docs and
+                n >= density * numdocs):
+            self._fwd_index[word] = Bitmap(word_idx, self.family)
+        elif not isinstance(word_idx, self.family.IF.TreeSet):
+            self._fwd_index[word] = self.family.IF.TreeSet(word_idx)
+
+    def merge(self, other):
+        """ See interface IIndexMerge """
+        self._num_docs.change(other._num_docs())
+        self._update_forward(other._fwd_index.items())
+        OOSet = self.family.OO.Set
+        self._rev_index.update([(docid, OOSet(words))
+                                for docid, words in other._rev_index.items()])
+        self._not_indexed.update(other._not_indexed)
+        self._add_docids(other.docids())
+        self._bump_generation()
 
     def unindex_doc(self, docid):
+        self._discard_docid(docid)
         _not_indexed = self._not_indexed
         if docid in _not_indexed:
             _not_indexed.remove(docid)
+            self._bump_generation()
         
         idx  = self._fwd_index
 
         try:
             for word in self._rev_index[docid]:
-                idx[word].remove(docid)
-                if not idx[word]:
+                word_idx = idx[word]
+                word_idx.remove(docid)
+                if not word_idx:
                     del idx[word]
+                elif isinstance(word_idx, Bitmap):
+                    self._grow_container(word, word_idx)
         except KeyError:
             msg = 'WAAA!  Inconsistent'
             return
@@ -217,24 +347,20 @@ class KeywordIndex(BaseIndexMixin, Persistent):
             msg = 'WAAA!  Inconsistent'
 
         self._num_docs.change(-1)
+        self._bump_generation()
 
     def _insert_forward(self, docid, words):
         """insert a sequence of words into the forward index """
 
         idx = self._fwd_index
         get_word_idx = idx.get
-        IF = self.family.IF
-        Set = IF.Set
-        TreeSet = IF.TreeSet
+        Set = self.family.IF.Set
         for word in words:
             word_idx = get_word_idx(word)
             if word_idx is None:
                 idx[word] = word_idx = Set()
             word_idx.insert(docid)
-            if (not isinstance(word_idx, TreeSet) and
-                    len(word_idx) >= self.tree_threshold):
-                # Convert to a TreeSet.
-                idx[word] = TreeSet(word_idx)
+            self._grow_container(word, word_idx)
 
     def _insert_reverse(self, docid, words):
         """ add words to forward index """
@@ -250,12 +376,21 @@ class KeywordIndex(BaseIndexMixin, Persistent):
         query = self.normalize(query)
 
         sets = []
+        bitmaps = []
         for word in query:
             docids = self._fwd_index.get(word, self.family.IF.Set())
-            sets.append(docids)
+            if isinstance(docids, Bitmap):
+                bitmaps.append(docids)
+            else:
+                sets.append(docids)
 
         if operator == 'or':
             rs = self.family.IF.multiunion(sets)
+            if bitmaps:
+                union = bitmaps[0]
+                for bitmap in bitmaps[1:]:
+                    union = union | bitmap
+                rs = self.family.IF.union(rs, union.to_set())
         elif operator == 'and':
             # sort smallest to largest set so we intersect the smallest
             # number of document identifiers possible
@@ -265,6 +400,18 @@ class KeywordIndex(BaseIndexMixin, Persistent):
                 rs = self.family.IF.intersection(rs, set)
                 if not rs:
                     break
+            if bitmaps and (rs is None or rs):
+                # intersect the bitmaps with each other (and with the
+                # intersection of any sets) as bitmaps
+                bitmaps.sort(key=len)
+                if rs is None:
+                    intersection = bitmaps[0]
+                    bitmaps = bitmaps[1:]
+                else:
+                    intersection = Bitmap(rs, self.family)
+                for bitmap in bitmaps:
+                    intersection = intersection & bitmap
+                rs = intersection.to_set()
         else:
             raise TypeError('Keyword index only supports `and` and `or` '
                             'operators, not `%s`.' % operator)
@@ -282,24 +429,80 @@ class KeywordIndex(BaseIndexMixin, Persistent):
             query = query['query']
         return self.search(query, operator=operator)
 
+    def _parse_query(self, query):
+        # Return a (words, operator) tuple for the query forms accepted by
+        # estimate and filter: those accepted by apply, plus a single
+        # keyword which isn't a string, as applyEq allows.
+        operator = 'and'
+        if isinstance(query, dict):
+            operator = query.get('operator', operator)
+            query = query['query']
+        if operator not in ('and', 'or'):
+            raise TypeError('Keyword index only supports `and` and `or` '
+                            'operators, not `%s`.' % operator)
+        if isinstance(query, str) or not hasattr(query, '__iter__'):
+            query = [query]
+        return self.normalize(query), operator
+
+    def estimate(self, query):
+        """ See interface IIndexEstimate.
+
+        In addition to the forms accepted by ``apply``, a single keyword
+        which isn't a string may be passed, as ``applyEq`` allows."""
+        words, operator = self._parse_query(query)
+        fwd_index = self._fwd_index
+        lengths = [len(fwd_index.get(word, ())) for word in words]
+        if operator == 'or':
+            return min(sum(lengths), self._num_docs())
+        if not lengths:
+            return 0
+        return min(lengths)
+
+    def filter(self, docids, query):
+        """ See interface IIndexFilter.
+
+        Accepts the same query forms as ``estimate``."""
+        words, operator = self._parse_query(query)
+        rev_index = self._rev_index
+        if operator == 'or':
+            combine = any
+        else:
+            combine = all
+
+        def predicate(docid):
+            keywords = rev_index.get(docid)
+            if keywords is None or not words:
+                return False
+            return combine([word in keywords for word in words])
+
+        return self._filter_docids(docids, predicate)
+
     def optimize(self):
-        """Optimize the index. Call this after changing tree_threshold.
+        """Optimize the index. Call this after changing tree_threshold
+        or bitmap_density.
 
         This converts internal data structures between
-        Sets and TreeSets based on tree_threshold.
+        Sets, TreeSets and Bitmaps based on tree_threshold and
+        bitmap_density.
         """
         idx = self._fwd_index
         IF = self.family.IF
         Set = IF.Set
         TreeSet = IF.TreeSet
+        density = self.bitmap_density
+        numdocs = self._num_docs()
         items = list(self._fwd_index.items())
         for word, word_idx in items:
-            if len(word_idx) >= self.tree_threshold:
-                if not isinstance(word_idx, TreeSet):
-                    # Convert to a TreeSet.
-                    idx[word] = TreeSet(word_idx)
+            n = len(word_idx)
+            if n < self.tree_threshold:
+                cls = Set
+            elif density is not None and n >= density * numdocs:
+                cls = Bitmap
             else:
-                if isinstance(word_idx, TreeSet):
-                    # Convert to a Set.
-                    idx[word] = Set(word_idx)
+                cls = TreeSet
+            if not isinstance(word_idx, cls):
+                if cls is Bitmap:
+                    idx[word] = Bitmap(word_idx, self.family)
+                else:
+                    idx[word] = cls(word_idx)
 
@@ -110,6 +110,95 @@ class _KeywordIndexTestsBase:
         self.assertEqual(list(result), [2, 3])
         self.assertEqual(query, {'operator': 'or', 'query': [5]})
 
+    def test_estimate(self):
+        index = self._makeOne()
+        self._populate(index)
+        self.assertEqual(index.estimate('cmf'), 1)
+        self.assertEqual(index.estimate(['foo']), 0)
+
+    def test_estimate_or(self):
+        index = self._makeOne()
+        self._populate(index)
+        query = {'query': ['cmf', 'Zope'], 'operator': 'or'}
+        self.assertEqual(index.estimate(query), 2)
+
+    def test_estimate_or_capped_at_doc_count(self):
+        index = self._makeOne()
+        for docid in range(1, 4):
+            index.index_doc(docid, ('a', 'b'))
+        query = {'query': ['a', 'b'], 'operator': 'or'}
+        self.assertEqual(index.estimate(query), 3)
+
+    def test_estimate_and(self):
+        index = self._makeOne()
+        index.index_doc(1, ('a', 'b'))
+        index.index_doc(2, ('a',))
+        self.assertEqual(index.estimate(['a', 'b']), 1)
+        self.assertEqual(index.estimate([]), 0)
+
+    def test_estimate_non_string_keyword(self):
+        index = self._makeOne()
+        index.index_doc(1, (1, 2))
+        self.assertEqual(index.estimate(1), 1)
+
+    def test_estimate_bad_operator(self):
+        index = self._makeOne()
+        query = {'query': ['a'], 'operator': 'xor'}
+        self.assertRaises(TypeError, index.estimate, query)
+
+    def test_indexed_count(self):
+        index = self._makeOne()
+        self._populate(index)
+        self.assertEqual(index.indexed_count(), self._populated_doc_count)
+        index.unindex_doc(5)
+        self.assertEqual(index.indexed_count(),
+                         self._populated_doc_count - 1)
+
+    def _filter(self, index, query, docids=None):
+        if docids is None:
+            docids = index.family.IF.Set(range(1, 7))
+        return list(index.filter(docids, query))
+
+    def test_filter(self):
+        index = self._makeOne()
+        self._populate(index)
+        self.assertEqual(self._filter(index, 'cmf'), [5])
+        self.assertEqual(self._filter(index, ['foo']), [])
+
+    def test_filter_and(self):
+        index = self._makeOne()
+        self._populate(index)
+        self.assertEqual(self._filter(index, ['CMF', 'Zope3']), [1])
+        self.assertEqual(self._filter(index, ['cmf', 'zope4']), [])
+        self.assertEqual(self._filter(index, []), [])
+
+    def test_filter_or(self):
+        index = self._makeOne()
+        self._populate(index)
+        query = {'query': ['cmf', 'Zope', 'FOX'], 'operator': 'or'}
+        self.assertEqual(self._filter(index, query), [2, 3, 5])
+        docids = index.family.IF.Set([1, 2, 3])
+        self.assertEqual(self._filter(index, query, docids), [2, 3])
+
+    def test_filter_non_string_keyword(self):
+        index = self._makeOne()
+        index.index_doc(1, (1, 2))
+        index.index_doc(2, (3,))
+        self.assertEqual(self._filter(index, 1), [1])
+
+    def test_filter_weighted(self):
+        index = self._makeOne()
+        self._populate(index)
+        docids = index.family.IF.Bucket({1: 0.5, 2: 1.0, 4: 1.5})
+        result = index.filter(docids, ['quick'])
+        self.assertEqual(list(result.items()), [(2, 1.0)])
+
+    def test_filter_bad_operator(self):
+        index = self._makeOne()
+        query = {'query': ['a'], 'operator': 'xor'}
+        self.assertRaises(TypeError, index.filter, index.family.IF.Set(),
+                          query)
+
     def test_applyAny(self):
         index = self._makeOne()
         index.index_doc(1, [1, 2, 3])
@@ -228,6 +317,28 @@ class _KeywordIndexTestsBase:
         index.index_doc(2, _marker)
         self.assertEqual(set([1, 2]), set(index.docids()))
 
+    def test_docids_maintained(self):
+        index = self._makeOne()
+        other = self._makeOne()
+        index.index_doc(1, [1])
+        index.index_doc(2, _marker)
+        index.index_doc(3, [2])
+        index.index_doc(4, _marker)
+        index.index_doc(3, [3])
+        index.index_doc(2, [])
+        index.index_doc(4, [4])
+        index.index_docs([(5, [1]), (6, []), (7, _marker)])
+        index.unindex_doc(1)
+        other.index_docs([(8, [2]), (9, _marker)])
+        index.merge(other)
+        docids = index.docids()
+        self.assertTrue(docids is index._all_docids)
+        self.assertEqual(list(docids), [3, 4, 5, 7, 8, 9])
+        self.assertEqual(
+            list(docids),
+            sorted(set(index.indexed()) | set(index.not_indexed())))
+        self.assertEqual(list(index.applyNotEq(3)), [4, 5, 7, 8, 9])
+
     def test_optimize_converts_to_simple_set(self):
         index = self._makeOne()
         index.tree_threshold = 0
@@ -249,6 +360,150 @@ class _KeywordIndexTestsBase:
         self.assertEqual(type(index._fwd_index['zope']),
             type(self.IFSet()))
 
+    def _makeBitmapIndex(self):
+        index = self._makeOne()
+        index.tree_threshold = 2
+        index.bitmap_density = 0.5
+        index.bitmap_min_docs = 0
+        index.index_doc(1, ('common', 'rare', 'half'))
+        index.index_doc(2, ('common', 'half'))
+        index.index_doc(3, ('common', 'other'))
+        index.index_doc(4, ('common', 'other'))
+        return index
+
+    def test_bitmap_density(self):
+        from ..bitmap import Bitmap
+        index = self._makeBitmapIndex()
+        self.assertTrue(isinstance(index._fwd_index['common'], Bitmap))
+        self.assertTrue(isinstance(index._fwd_index['half'], Bitmap))
+        self.assertTrue(isinstance(index._fwd_index['other'], Bitmap))
+        self.assertEqual(type(index._fwd_index['rare']), type(self.IFSet()))
+        self.assertEqual(index._fwd_index['common'].family,
+                         self._get_family())
+        index.index_doc(5, ('other',))
+        index.index_doc(6, ('other',))
+        self.assertEqual(type(index._fwd_index['rare']), type(self.IFSet()))
+        self.assertEqual(list(index._fwd_index['other']), [3, 4, 5, 6])
+
+    def test_bitmap_density_tree_set_below_density(self):
+        index = self._makeBitmapIndex()
+        index.bitmap_density = 0.9
+        index.index_doc(5, ('half',))
+        index.index_doc(6, ('new', 'unrelated'))
+        index.index_doc(7, ('new',))
+        self.assertEqual(type(index._fwd_index['new']),
+                         type(self.IFTreeSet()))
+
+    def _sparseDocs(self, docids):
+        # 'dense' in every document, 'sparse' in one in ten
+        return [(docid, ('dense', 'sparse') if docid % 10 == 0 else
+                 ('dense',)) for docid in docids]
+
+    def test_bitmap_density_sparse_word_stays_tree_set(self):
+        from ..bitmap import Bitmap
+        incremental = self._makeOne()
+        bulk = self._makeOne()
+        merged = self._makeOne()
+        other = self._makeOne()
+        for index in (incremental, bulk, merged, other):
+            index.bitmap_density = 0.5
+        for docid, words in self._sparseDocs(range(2000)):
+            incremental.index_doc(docid, words)
+        for start in range(0, 2000, 100):
+            bulk.index_docs(self._sparseDocs(range(start, start + 100)))
+        merged.index_docs(self._sparseDocs(range(500)))
+        other.index_docs(self._sparseDocs(range(500, 2000)))
+        merged.merge(other)
+        for index in (incremental, bulk, merged):
+            self.assertEqual(type(index._fwd_index['sparse']),
+                             type(self.IFTreeSet()))
+            self.assertTrue(isinstance(index._fwd_index['dense'], Bitmap))
+            self.assertEqual(len(index.search(['sparse'])), 200)
+            self.assertEqual(len(index.search(['dense'])), 2000)
+
+    def test_bitmap_demoted_below_density(self):
+        from ..bitmap import Bitmap
+        index = self._makeBitmapIndex()
+        self.assertTrue(isinstance(index._fwd_index['half'], Bitmap))
+        index.index_doc(5, ('common',))
+        index.index_doc(2, ('common',))
+        self.assertEqual(type(index._fwd_index['half']),
+                         type(self.IFTreeSet()))
+        self.assertTrue(isinstance(index._fwd_index['other'], Bitmap))
+        index.index_doc(6, ('common',))
+        index.unindex_doc(3)
+        self.assertEqual(type(index._fwd_index['other']),
+                         type(self.IFTreeSet()))
+        self.assertEqual(list(index.search(['other'])), [4])
+        index.bitmap_density = None
+        index.unindex_doc(4)
+        self.assertEqual(type(index._fwd_index['common']),
+                         type(self.IFTreeSet()))
+
+    def test_search_w_bitmaps(self):
+        index = self._makeBitmapIndex()
+        IFSet = self.IFSet
+        for words, operator, expected in [
+                (['common'], 'and', [1, 2, 3, 4]),
+                (['common', 'half'], 'and', [1, 2]),
+                (['common', 'half', 'rare'], 'and', [1]),
+                (['common', 'other', 'rare'], 'and', []),
+                (['common', 'missing'], 'and', []),
+                (['half', 'other'], 'and', []),
+                (['half', 'other'], 'or', [1, 2, 3, 4]),
+                (['rare', 'other'], 'or', [1, 3, 4]),
+                (['half'], 'or', [1, 2]),
+                ]:
+            result = index.search(words, operator)
+            self.assertEqual(type(result), type(IFSet()))
+            self.assertEqual(list(result), expected)
+
+    def test_negate_w_bitmaps(self):
+        index = self._makeBitmapIndex()
+        self.assertEqual(list(index.applyNotAny(['half'])), [3, 4])
+        self.assertEqual(list(index.applyNotAll(['common', 'half'])), [3, 4])
+
+    def test_unindex_and_reindex_w_bitmaps(self):
+        index = self._makeBitmapIndex()
+        index.index_doc(1, ('common',))
+        self.assertEqual(list(index.search(['half'])), [2])
+        index.unindex_doc(2)
+        self.assertFalse('half' in index._fwd_index)
+        self.assertEqual(list(index.search(['common'])), [1, 3, 4])
+
+    def test_merge_w_bitmaps(self):
+        from ..bitmap import Bitmap
+        index = self._makeBitmapIndex()
+        other = self._makeOne()
+        other.bitmap_density = 0.1
+        other.bitmap_min_docs = 0
+        other.tree_threshold = 1
+        other.index_doc(5, ('common', 'rare'))
+        other.index_doc(6, ('new',))
+        self.assertTrue(isinstance(other._fwd_index['rare'], Bitmap))
+        index.merge(other)
+        self.assertEqual(list(index.search(['common'])), [1, 2, 3, 4, 5])
+        self.assertEqual(list(index.search(['rare'])), [1, 5])
+        self.assertEqual(list(index.search(['new'])), [6])
+
+    def test_optimize_converts_to_and_from_bitmap(self):
+        from ..bitmap import Bitmap
+        index = self._makeBitmapIndex()
+        index.bitmap_density = None
+        index.optimize()
+        self.assertEqual(type(index._fwd_index['common']),
+            type(self.IFTreeSet()))
+        self.assertEqual(type(index._fwd_index['half']),
+            type(self.IFTreeSet()))
+        self.assertEqual(list(index.search(['common', 'half'])), [1, 2])
+        index.bitmap_density = 0.9
+        index.optimize()
+        self.assertTrue(isinstance(index._fwd_index['common'], Bitmap))
+        self.assertEqual(type(index._fwd_index['half']),
+            type(self.IFTreeSet()))
+        self.assertEqual(type(index._fwd_index['rare']), type(self.IFSet()))
+        self.assertEqual(list(index.search(['common', 'half'])), [1, 2])
+
     def test_index_with_empty_sequence_unindexes(self):
         index = self._makeOne()
         self._populate(index)
@@ -355,6 +610,115 @@ class _TestCaseBase:
         from .interfaces import IKeywordQuerying
         verifyObject(IKeywordQuerying, self._makeOne())
 
+    def test_class_conforms_to_IIndexEstimate(self):
+        from zope.interface.verify import verifyClass
+        from hypatia.interfaces import IIndexEstimate
+        verifyClass(IIndexEstimate, self._getTargetClass())
+
+    def test_class_conforms_to_IIndexFilter(self):
+        from zope.interface.verify import verifyClass
+        from hypatia.interfaces import IIndexFilter
+        verifyClass(IIndexFilter, self._getTargetClass())
+
+    def test_class_conforms_to_IIndexGeneration(self):
+        from zope.interface.verify import verifyClass
+        from hypatia.interfaces import IIndexGeneration
+        verifyClass(IIndexGeneration, self._getTargetClass())
+
+    def _assertSameState(self, index, other):
+        def fwd(index):
+            return [(word, type(docids), list(docids))
+                    for word, docids in index._fwd_index.items()]
+        def rev(index):
+            return [(docid, list(words))
+                    for docid, words in index._rev_index.items()]
+        self.assertEqual(fwd(index), fwd(other))
+        self.assertEqual(rev(index), rev(other))
+        self.assertEqual(list(index._not_indexed), list(other._not_indexed))
+        self.assertEqual(index.indexed_count(), other.indexed_count())
+
+    def test_index_docs(self):
+        pairs = [(5, ['a', 'b']), (2, ['b']), (1, ['a', 'c']), (3, _marker),
+                 (4, []), (6, ['b'])]
+        index = self._makeOne()
+        index.tree_threshold = 3
+        index.index_docs(iter(pairs))
+        expected = self._makeOne()
+        expected.tree_threshold = 3
+        for docid, value in pairs:
+            expected.index_doc(docid, value)
+        self._assertSameState(index, expected)
+        self.assertEqual(list(index._fwd_index['b']), [2, 5, 6])
+        self.assertEqual(index.generation(), 2)
+
+    def test_index_docs_existing(self):
+        index = self._makeOne()
+        expected = self._makeOne()
+        for each in (index, expected):
+            each.tree_threshold = 3
+            each.index_doc(1, ['a'])
+            each.index_doc(2, _marker)
+        pairs = [(3, ['a']), (1, ['b']), (4, ['a']), (2, ['a']),
+                 (5, ['a']), (5, ['c']), (6, _marker), (6, ['a'])]
+        index.index_docs(pairs)
+        for docid, value in pairs:
+            expected.index_doc(docid, value)
+        self._assertSameState(index, expected)
+
+    def test_class_conforms_to_IIndexMerge(self):
+        from zope.interface.verify import verifyClass
+        from hypatia.interfaces import IIndexMerge
+        verifyClass(IIndexMerge, self._getTargetClass())
+
+    def test_merge(self):
+        pairs = [(1, ['a', 'b']), (2, ['b']), (3, _marker), (4, ['b', 'c']),
+                 (5, ['a']), (6, ['b'])]
+        index = self._makeOne()
+        other = self._makeOne()
+        expected = self._makeOne()
+        for each in (index, other, expected):
+            each.tree_threshold = 3
+        index.index_docs(pairs[:3])
+        other.index_docs(pairs[3:])
+        expected.index_docs(pairs)
+        index.merge(other)
+        self._assertSameState(index, expected)
+        self.assertFalse(index._rev_index[4] is other._rev_index[4])
+        self.assertEqual(index.generation(), 3)
+
+    def test_index_docs_nothing_indexed(self):
+        index = self._makeOne()
+        index.index_docs([(1, [])])
+        self.assertEqual(index.indexed_count(), 0)
+        self.assertEqual(index.generation(), 1)
+
+    def test_index_docs_str(self):
+        index = self._makeOne()
+        self.assertRaises(TypeError, index.index_docs, [(1, 'abc')])
+
+    def _assertBumps(self, index, bumps, func, *args):
+        generation = index.generation()
+        func(*args)
+        self.assertEqual(index.generation(), generation + bumps)
+
+    def test_generation(self):
+        index = self._makeOne()
+        self.assertEqual(index.generation(), 1)
+        self._assertBumps(index, 1, index.index_doc, 1, ['a'])
+        self._assertBumps(index, 0, index.index_doc, 1, ['a'])
+        self._assertBumps(index, 0, index.reindex_doc, 1, ['a'])
+        self._assertBumps(index, 1, index.reindex_doc, 1, ['a', 'b'])
+        self._assertBumps(index, 1, index.index_doc, 1, [])
+        self._assertBumps(index, 0, index.index_doc, 1, [])
+        self._assertBumps(index, 1, index.index_doc, 1, _marker)
+        self._assertBumps(index, 0, index.index_doc, 1, _marker)
+        self._assertBumps(index, 2, index.index_doc, 1, ['b'])
+        self._assertBumps(index, 1, index.unindex_doc, 1)
+        self._assertBumps(index, 0, index.unindex_doc, 1)
+        index.index_doc(2, _marker)
+        self._assertBumps(index, 1, index.unindex_doc, 2)
+        self._assertBumps(index, 1, index.reset)
+
     def test_class_conforms_to_IIndex(self):
         from zope.interface.verify import verifyClass
         from hypatia.interfaces import IIndex
@@ -1,10 +1,17 @@
 import ast
+from collections import Counter
+import copy
+import heapq
+from itertools import islice
 import operator
 import sys
 
 import BTrees
 
+from .. import RangeValue
 from ..util import RichComparisonMixin
+from ..util import filter_wins
+from . import arrays
 
 
 _marker = object()
@@ -35,6 +42,16 @@ class Query(object):
     def iter_children(self):
         return ()
 
+    def prepare(self, names=None):
+        """
+        Return a ``Plan`` for this query, which can be executed many times,
+        with different ``names``, without optimizing the query or planning
+        its evaluation order each time.  ``names``, if given, are sample
+        values used to estimate the size of subqueries which depend on
+        them.
+        """
+        return Plan(self, names)
+
     def print_tree(self, out=sys.stdout, level=0):
         out.write('%s%s\n' % ('  ' * level, str(self)))
         for child in self.iter_children():
@@ -47,6 +64,58 @@ class Query(object):
         """
         return self
 
+    def _estimate(self, names):
+        """
+        Return an approximation of the number of documents this query will
+        match, or ``None`` if no cheap estimate is available.  Used by the
+        query planner to choose an evaluation order.
+        """
+        return None
+
+    def _cache_key(self, names):
+        """
+        Return a hashable key which equals the key of any other query
+        producing the same result from the same index contents, or ``None``
+        if the result of this query must not be cached.
+        """
+        return None
+
+    def _filter_wins(self, numdocids, estimate):
+        """
+        Return True if narrowing a result of ``numdocids`` documents with
+        ``filter`` is predicted to be cheaper than ``intersect``, given this
+        query's own estimate.
+        """
+        return False
+
+    def _stream(self, names):
+        """
+        Return an iterator over the docids matched by this query.  Used by
+        lazy result sets; subclasses may avoid computing the whole result.
+        """
+        return iter(self._apply(names))
+
+    def _apply_array(self, names):
+        """
+        Return the result of this query in the form used by
+        ``hypatia.query.arrays``.  Used by vectorized boolean operators.
+        """
+        return arrays.from_result(self._apply(names))
+
+    def _narrower(self, names):
+        """
+        Return a callable which accepts a set of docids and returns those of
+        them which this query matches.  Used by lazy result sets to test
+        candidates in batches; the query's own result is computed at most
+        once, on first use.
+        """
+        cache = []
+        def narrow(docids):
+            if not cache:
+                cache.append(self._apply(names))
+            return self.family.IF.weightedIntersection(docids, cache[0])[1]
+        return narrow
+
     def intersect(self, left, names):
         right = self._apply(names)
         if not len(left) or not len(right):
@@ -65,6 +134,12 @@ class Query(object):
         _, result = self.family.IF.weightedUnion(left, right)
         return result
 
+    def difference(self, left, names):
+        right = self._apply(names)
+        if not len(left) or not len(right):
+            return left
+        return self.family.IF.difference(left, right)
+
 class Comparator(Query):
     """
     Base class for all comparators used in queries.
@@ -88,6 +163,54 @@ class Comparator(Query):
             return names[name]
         return value
 
+    def _index_query(self, names):
+        """
+        Return the constraint expressed by this comparator in the form
+        accepted by the ``apply`` method of its index, or ``None`` if it
+        cannot be expressed that way.
+        """
+        return None
+
+    def _estimate(self, names):
+        estimate = getattr(self.index, 'estimate', None)
+        if estimate is None:
+            return None
+        query = self._index_query(names)
+        if query is None:
+            return None
+        return estimate(query)
+
+    def _cache_key(self, names):
+        generation = getattr(self.index, 'generation', None)
+        if generation is None:
+            return None
+        generation = generation()
+        if generation is None:
+            return None
+        try:
+            value = _frozen(self._cache_value(names))
+        except TypeError:
+            return None
+        return (type(self), self.index, generation, value)
+
+    def _cache_value(self, names):
+        return self._get_value(names)
+
+    def _filter_wins(self, numdocids, estimate):
+        if estimate is None or getattr(self.index, 'filter', None) is None:
+            return False
+        return filter_wins(numdocids, self.index.indexed_count(), estimate)
+
+    def filter(self, left, names):
+        return self.index.filter(left, self._index_query(names))
+
+    def _narrower(self, names):
+        if getattr(self.index, 'filter', None) is not None:
+            query = self._index_query(names)
+            if query is not None:
+                return lambda docids: self.index.filter(docids, query)
+        return Query._narrower(self, names)
+
     def __str__(self):
         return ' '.join((self.index.qname(), self.operator, repr(self._value)))
 
@@ -98,7 +221,7 @@ class Comparator(Query):
     def flush(self, *arg, **kw):
         self.index.flush(*arg, **kw)
 
-    def execute(self, optimize=True, names=None, resolver=None):
+    def execute(self, optimize=True, names=None, resolver=None, lazy=False):
         if optimize:
             query = self._optimize()
         else:
@@ -107,7 +230,8 @@ class Comparator(Query):
         return self.index.resultset_from_query(
             query,
             names=names,
-            resolver=resolver
+            resolver=resolver,
+            **_lazy_kw(lazy)
             )
 
 class Contains(Comparator):
@@ -119,6 +243,9 @@ class Contains(Comparator):
     def _apply(self, names):
         return self.index.applyContains(self._get_value(names))
 
+    def _index_query(self, names):
+        return self._get_value(names)
+
     def __str__(self):
         return '%r in %s' % (self._value, self.index)
 
@@ -150,6 +277,9 @@ class Eq(Comparator):
     def _apply(self, names):
         return self.index.applyEq(self._get_value(names))
 
+    def _index_query(self, names):
+        return self._get_value(names)
+
     def negate(self):
         return NotEq(self.index, self._value)
 
@@ -178,6 +308,9 @@ class Gt(Comparator):
     def _apply(self, names):
         return self.index.applyGt(self._get_value(names))
 
+    def _index_query(self, names):
+        return RangeValue(self._get_value(names), None, excludemin=True)
+
     def negate(self):
         return Le(self.index, self._value)
 
@@ -192,6 +325,9 @@ class Lt(Comparator):
     def _apply(self, names):
         return self.index.applyLt(self._get_value(names))
 
+    def _index_query(self, names):
+        return RangeValue(None, self._get_value(names), excludemax=True)
+
     def negate(self):
         return Ge(self.index, self._value)
 
@@ -206,6 +342,9 @@ class Ge(Comparator):
     def _apply(self, names):
         return self.index.applyGe(self._get_value(names))
 
+    def _index_query(self, names):
+        return RangeValue(self._get_value(names), None)
+
     def negate(self):
         return Lt(self.index, self._value)
 
@@ -220,6 +359,9 @@ class Le(Comparator):
     def _apply(self, names):
         return self.index.applyLe(self._get_value(names))
 
+    def _index_query(self, names):
+        return RangeValue(None, self._get_value(names))
+
     def negate(self):
         return Gt(self.index, self._value)
 
@@ -233,6 +375,9 @@ class Any(Comparator):
     def _apply(self, names):
         return self.index.applyAny(self._get_value(names))
 
+    def _index_query(self, names):
+        return {'query': self._get_value(names), 'operator': 'or'}
+
     def negate(self):
         return NotAny(self.index, self._value)
 
@@ -267,6 +412,9 @@ class All(Comparator):
     def _apply(self, names):
         return self.index.applyAll(self._get_value(names))
 
+    def _index_query(self, names):
+        return {'query': self._get_value(names), 'operator': 'and'}
+
     def negate(self):
         return NotAll(self.index, self._value)
 
@@ -337,6 +485,10 @@ class _Range(Comparator, RichComparisonMixin):
             return names[name]
         return value
 
+    def _cache_value(self, names):
+        return (self._get_start(names), self._get_end(names),
+                self.start_exclusive, self.end_exclusive)
+
     def __str__(self):
         s = [repr(self._start)]
         if self.start_exclusive:
@@ -372,6 +524,10 @@ class InRange(_Range):
             self._get_start(names), self._get_end(names),
             self.start_exclusive, self.end_exclusive)
 
+    def _index_query(self, names):
+        return RangeValue(self._get_start(names), self._get_end(names),
+                          self.start_exclusive, self.end_exclusive)
+
     def negate(self):
         return NotInRange(self.index, self._start, self._end,
                           self.start_exclusive, self.end_exclusive)
@@ -401,6 +557,11 @@ class BoolOp(Query):
     """
     Base class for Or and And operators.
     """
+    # Set to True to combine the results of subqueries as NumPy arrays
+    # (see hypatia.query.arrays), converting back to BTrees only once the
+    # outermost operator is done.  Ignored if NumPy isn't installed.
+    vectorized = False
+
     def __init__(self, *queries):
         arguments = []
         for query in queries:
@@ -418,11 +579,22 @@ class BoolOp(Query):
     def __eq__(self, other):
         return type(self) == type(other) and self.queries == other.queries
 
+    def _cache_key(self, names):
+        keys = []
+        for query in self.queries:
+            key = query._cache_key(names)
+            if key is None:
+                return None
+            keys.append(key)
+        # a multiset: the order of subqueries doesn't change the result,
+        # but a repeated one adds its weights again
+        return (type(self), frozenset(Counter(keys).items()))
+
     def flush(self, *arg, **kw):
         for query in self.queries:
             query.flush(*arg, **kw)
 
-    def execute(self, optimize=True, names=None, resolver=None):
+    def execute(self, optimize=True, names=None, resolver=None, lazy=False):
         if not self.queries:
             raise ValueError('No subqueries')
 
@@ -441,20 +613,24 @@ class BoolOp(Query):
             raise ValueError('No query has a reference to an index')
 
         if optimize:
-            query = self._optimize()
+            query = _share(self._optimize())
         else:
             query = self
 
         return index.resultset_from_query(
             query,
             names=names,
-            resolver=resolver
+            resolver=resolver,
+            **_lazy_kw(lazy)
             )
 
     def iter_children(self):
         for query in self.queries:
             yield query
 
+    def _vectorize(self):
+        return self.vectorized and arrays.numpy is not None
+
     def _optimize_eq(self):
         # If all queries are Eq operators for the same index, we can replace
         # this And or Or with an All or Any node.
@@ -495,16 +671,54 @@ class BoolOp(Query):
             return NotAll(index, values)
         return NotAny(index, values)
 
+    def _simplify(self, queries):
+        # Drop repeated subqueries (A & A is A, and A | A is A) and
+        # subqueries absorbed by another (A & (A | B) is A, and A | (A & B)
+        # is A).  Dropping a subquery changes the weights of a weighted
+        # result, so leave the subqueries alone if any of them may be
+        # weighted.
+        for query in queries:
+            if _may_be_weighted(query):
+                return queries
+        unique = []
+        for query in queries:
+            if query not in unique:
+                unique.append(query)
+        dual = Or if isinstance(self, And) else And
+        return [query for query in unique
+                if not (isinstance(query, dual) and
+                        _any_in(query.queries, unique, query))]
+
 
 class Or(BoolOp):
     """Boolean Or of multiple queries."""
 
     def _apply(self, names):
-        queries = self.queries
-        result = queries[0]._apply(names)
-        for query in queries[1:]:
-            result = query.union(result, names)
-        return result
+        if self._vectorize():
+            return arrays.to_result(self._apply_array(names), self.family)
+        return _mass_union([query._apply(names) for query in self.queries],
+                           self.family)
+
+    def _apply_array(self, names):
+        return arrays.union(
+            [query._apply_array(names) for query in self.queries])
+
+    def _estimate(self, names):
+        # the union can't be larger than the sum of its parts
+        total = 0
+        for query in self.queries:
+            estimate = query._estimate(names)
+            if estimate is None:
+                return None
+            total += estimate
+        return total
+
+    def _narrower(self, names):
+        narrowers = [query._narrower(names) for query in self.queries]
+        def narrow(docids):
+            return _mass_union([narrower(docids) for narrower in narrowers],
+                               self.family)
+        return narrow
 
     def negate(self):
         neg_queries = [query.negate() for query in self.queries]
@@ -519,7 +733,8 @@ class Or(BoolOp):
         if new_me is not None:
             return new_me
 
-        queries = [query._optimize() for query in self.queries]
+        queries = self._simplify(
+            [query._optimize() for query in self.queries])
         # There might be a combination of Gt/Ge and Lt/Le operators for the
         # same index that could be used to compose a NotInRange.
         uppers = {}
@@ -555,19 +770,207 @@ class Or(BoolOp):
         return self.__class__(*queries)
 
 
+def _any_in(queries, others, exclude):
+    # True if any of queries equals one of others other than exclude
+    for other in others:
+        if other is not exclude and other in queries:
+            return True
+    return False
+
+def _may_be_weighted(query):
+    # True if query may produce a weighted result, such as a query against
+    # a text index
+    if isinstance(query, BoolOp):
+        for subq in query.queries:
+            if _may_be_weighted(subq):
+                return True
+        return False
+    if isinstance(query, Comparator):
+        return getattr(query.index, 'weighted', False)
+    return True
+
+def _is_weighted(result):
+    # IF buckets and BTrees map docids to weights (e.g. text relevance
+    # scores); sets and plain iterables of docids are unweighted
+    return hasattr(result, 'values')
+
+def _mass_union(results, family):
+    """
+    Return the union of ``results`` with the docids and weights that
+    folding ``Query.union`` over them from left to right would produce, but
+    merged n ways rather than pairwise.
+
+    Unweighted results are merged by one ``multiunion``.  Once a weighted
+    result appears the union is weighted: unweighted results ahead of it
+    count as a single set, each later one adds a weight of 1 to its
+    docids, and the weighted union is built smallest first, as by
+    ``hypatia.text.setops.mass_weightedUnion``.
+    """
+    IF = family.IF
+    nonempty = [result for result in results if len(result)]
+    if len(nonempty) < 2:
+        return nonempty[0] if nonempty else results[0]
+    weighted = [_is_weighted(result) for result in nonempty]
+    if True not in weighted:
+        return IF.multiunion(nonempty)
+    first = weighted.index(True)
+    mappings = nonempty[first:]
+    if first:
+        mappings.append(IF.multiunion(nonempty[:first]))
+    heap = []
+    for i, mapping in enumerate(mappings):
+        if not _is_weighted(mapping):
+            mapping = IF.weightedUnion(IF.Bucket(), mapping)[1]
+        heap.append((len(mapping), i, mapping))
+    heapq.heapify(heap)
+    while len(heap) > 1:
+        xlen, i, x = heapq.heappop(heap)
+        ylen, j, y = heapq.heappop(heap)
+        merged = IF.weightedUnion(x, y)[1]
+        heapq.heappush(heap, (len(merged), i, merged))
+    return heap[0][2]
+
 class And(BoolOp):
     """Boolean And of multiple queries."""
 
     def _apply(self, names):
+        if self._vectorize():
+            return arrays.to_result(self._apply_array(names), self.family)
         IF = self.family.IF
-        queries = self.queries
-        result = queries[0]._apply(names)
-        for query in queries[1:]:
+        positive, negative = self._plan(names)
+        if positive:
+            result = positive[0][0]._apply(names)
+            for query, estimate in positive[1:]:
+                if len(result) == 0:
+                    return IF.Set()
+                if query._filter_wins(len(result), estimate):
+                    # probe the remaining candidates one by one rather
+                    # than computing the subquery's whole result
+                    result = _filter(query, result, names, self.family)
+                else:
+                    result = query.intersect(result, names)
+        else:
+            # Nothing to subtract from but the complement of the first
+            # negation, which must be computed against its index's universe.
+            result = negative.pop(0)._apply(names)
+        for query in negative:
             if len(result) == 0:
                 return IF.Set()
-            result = query.intersect(result, names)
+            result = _restrict(result, _negation_index(query), self.family)
+            result = query.negate().difference(result, names)
         return result
 
+    def _apply_array(self, names):
+        positive, negative = self._plan(names)
+        if positive:
+            result = positive[0][0]._apply_array(names)
+            for query, estimate in positive[1:]:
+                if len(result[0]) == 0:
+                    return arrays.empty()
+                if query._filter_wins(len(result[0]), estimate):
+                    result = arrays.from_result(_filter(
+                        query, arrays.to_result(result, self.family), names,
+                        self.family))
+                else:
+                    result = arrays.intersection(
+                        result, query._apply_array(names))
+        else:
+            result = negative.pop(0)._apply_array(names)
+        for query in negative:
+            if len(result[0]) == 0:
+                return arrays.empty()
+            universe = _negation_index(query).docids()
+            result = arrays.intersection(result, arrays.from_result(universe))
+            result = arrays.difference(
+                result, query.negate()._apply_array(names))
+        return result
+
+    # lazily streamed results are produced this many candidates at a time
+    stream_batch_size = 256
+
+    def _stream(self, names):
+        positive, negative = self._plan(names)
+        if not positive:
+            for docid in self._apply(names):
+                yield docid
+            return
+        # Only the most selective subquery is computed in full; its docids
+        # are tested against the rest in batches as the stream is consumed.
+        driver = iter(positive[0][0]._apply(names))
+        narrow = self._plan_narrower(positive[1:], negative, names)
+        while True:
+            batch = list(islice(driver, self.stream_batch_size))
+            if not batch:
+                return
+            for docid in narrow(self.family.IF.Set(batch)):
+                yield docid
+
+    def _narrower(self, names):
+        positive, negative = self._plan(names)
+        return self._plan_narrower(positive, negative, names)
+
+    def _plan_narrower(self, positive, negative, names):
+        narrowers = [query._narrower(names) for query, estimate in positive]
+        negators = [(_negation_index(query), query.negate()._narrower(names))
+                    for query in negative]
+        def narrow(docids):
+            for narrower in narrowers:
+                if not docids:
+                    return docids
+                docids = narrower(docids)
+            for index, negator in negators:
+                if not docids:
+                    return docids
+                docids = _restrict(docids, index, self.family)
+                docids = self.family.IF.difference(docids, negator(docids))
+            return docids
+        return narrow
+
+    def _plan(self, names):
+        """
+        Return a tuple ``(positive, negative)`` describing the order in which
+        subqueries should be evaluated.
+
+        ``positive`` holds ``(query, estimate)`` pairs for the subqueries
+        that are intersected with each other, ordered smallest estimated
+        result first so that the running result shrinks as quickly as
+        possible.  Subqueries which can't provide an estimate (``None``) keep
+        their relative order and are evaluated after the ones that can.
+
+        ``negative`` holds the negations: negated comparators (``NotEq``,
+        ``NotAny``, ``NotInRange`` and ``NotContains``), ``Not`` queries
+        whose negation is one, and ``Or`` queries of such negations against
+        one index (e.g. the negation of an ``And``).  These are applied
+        last: the running result is narrowed to the documents of the negated
+        index and the documents matched by the positive counterpart are
+        subtracted from it, which avoids computing the complement of the
+        positive result against the whole index.
+        """
+        positive = []
+        negative = []
+        for query in self.queries:
+            if _is_negation(query):
+                negative.append(query)
+            else:
+                estimate = query._estimate(names)
+                if estimate is None:
+                    key = (1, 0, len(positive))
+                else:
+                    key = (0, estimate, len(positive))
+                positive.append((key, query, estimate))
+        positive = [(query, estimate)
+                    for key, query, estimate in sorted(positive)]
+        return positive, negative
+
+    def _estimate(self, names):
+        # the intersection can't be larger than its smallest part
+        estimates = [query._estimate(names) for query in self.queries
+                     if not _is_negation(query)]
+        estimates = [x for x in estimates if x is not None]
+        if not estimates:
+            return None
+        return min(estimates)
+
     def negate(self):
         neg_queries = [query.negate() for query in self.queries]
         return Or(*neg_queries)
@@ -581,7 +984,8 @@ class And(BoolOp):
         if new_me is not None:
             return new_me
 
-        queries = [query._optimize() for query in self.queries]
+        queries = self._simplify(
+            [query._optimize() for query in self.queries])
         # There might be a combination of Gt/Ge and Lt/Le operators for the
         # same index that could be used to compose an InRange.
         uppers = {}
@@ -616,6 +1020,12 @@ class And(BoolOp):
         return self.__class__(*queries)
 
 
+# Negated comparators which And applies as a set difference against its
+# running result rather than by intersecting with their complement.
+# NotAll isn't one: its result is that of All.
+_DIFFERENCE_TYPES = (NotEq, NotAny, NotInRange, NotContains)
+
+
 class Not(Query):
     """Negation of a query."""
 
@@ -634,24 +1044,434 @@ class Not(Query):
     def _apply(self, names):
         return self.query.negate()._apply(names)
 
+    def _apply_array(self, names):
+        return self.query.negate()._apply_array(names)
+
     def _optimize(self):
         return self.query.negate()._optimize()
 
+    def _cache_key(self, names):
+        key = self.query._cache_key(names)
+        if key is None:
+            return None
+        return (type(self), key)
+
     def flush(self, *arg, **kw):
         self.query.flush(*arg, **kw)
 
-    def execute(self, optimize=True, names=None, resolver=None):
+    def execute(self, optimize=True, names=None, resolver=None, lazy=False):
         if optimize:
-            query = self._optimize()
+            query = _share(self._optimize())
         else:
             query = self
 
         return self.query.index.resultset_from_query(
             query,
             names=names,
-            resolver=resolver
+            resolver=resolver,
+            **_lazy_kw(lazy)
+            )
+
+    def _narrower(self, names):
+        return self.query.negate()._narrower(names)
+
+
+def _negation_index(query):
+    # The index whose documents bound the result of query, if And should
+    # apply query as a difference between its running result, narrowed to
+    # those documents, and the result of query.negate(): a negated
+    # comparator, a Not whose negation is one, or an Or of such negations
+    # against a single index (e.g. the negation of an And of comparators).
+    # None for other queries.
+    if isinstance(query, _DIFFERENCE_TYPES):
+        return query.index
+    if isinstance(query, Not):
+        return _negation_index(query.query.negate())
+    if isinstance(query, Or):
+        index = None
+        for subq in query.queries:
+            subindex = _negation_index(subq)
+            if subindex is None:
+                return None
+            if index is not None and subindex is not index:
+                return None
+            index = subindex
+        return index
+    return None
+
+def _is_negation(query):
+    return _negation_index(query) is not None
+
+def _filter(query, result, names, family):
+    # query.filter(result, names), with the weights intersecting result with
+    # the (unweighted) result of query would give: 1 more than in result
+    result = query.filter(result, names)
+    if _is_weighted(result):
+        result = family.IF.weightedIntersection(
+            result, family.IF.Set(result.keys()))[1]
+    return result
+
+def _restrict(result, index, family):
+    # The docids of result which index has been told about.  A negation's
+    # complement never holds any others, and weights gain 1 as they would
+    # intersecting with it.
+    return family.IF.weightedIntersection(result, index.docids())[1]
+
+
+class Plan(Query):
+    """
+    A query prepared for repeated execution by ``Query.prepare``.
+
+    The query is optimized once, and each ``And`` in it has its subqueries
+    sorted once by their estimated size, its negated comparators paired
+    with their positive counterparts and its nested operators compiled
+    likewise.  Only subqueries whose estimates depend on ``Name`` values
+    that weren't given to ``prepare`` are estimated again by ``execute``.
+    The order is fixed when the plan is made, so prepare the query again
+    if the sizes of its results change a lot.
+
+    A plan is itself a query:  it can be passed to ``CatalogQuery.query``
+    or combined with other queries.
+    """
+
+    def __init__(self, query, names=None):
+        self.query = optimize(query)
+        self.index = _find_index(self.query)
+        self._run = _compile(self.query, names)
+
+    def __str__(self):
+        return 'Plan'
+
+    def iter_children(self):
+        yield self.query
+
+    def flush(self, *arg, **kw):
+        self.query.flush(*arg, **kw)
+
+    def _apply(self, names):
+        query = self.query
+        if isinstance(query, _Memoized):
+            query = query.query
+        if isinstance(query, BoolOp) and query._vectorize():
+            return self.query._apply(names)
+        return self._run(names)
+
+    def _apply_array(self, names):
+        return self.query._apply_array(names)
+
+    def _estimate(self, names):
+        return self.query._estimate(names)
+
+    def _cache_key(self, names):
+        return self.query._cache_key(names)
+
+    def _stream(self, names):
+        return self.query._stream(names)
+
+    def _narrower(self, names):
+        return self.query._narrower(names)
+
+    def execute(self, optimize=True, names=None, resolver=None, lazy=False):
+        # optimize is accepted as by Query.execute; the plan's query was
+        # optimized when it was prepared
+        return self.index.resultset_from_query(
+            self,
+            names=names,
+            resolver=resolver,
+            **_lazy_kw(lazy)
             )
 
+def _find_index(query):
+    # The index of the first query found, breadth first, which has one
+    queries = [query]
+    while queries:
+        subq = queries.pop(0)
+        index = getattr(subq, 'index', None)
+        if index is not None:
+            return index
+        queries.extend(list(subq.iter_children()))
+    raise ValueError('No query has a reference to an index')
+
+def _compile(query, names):
+    # A callable which computes the result of query for names
+    if isinstance(query, And):
+        return _compile_and(query, names)
+    if isinstance(query, Or):
+        family = query.family
+        runs = [_compile(subq, names) for subq in query.queries]
+        def run_or(names):
+            return _mass_union([run(names) for run in runs], family)
+        return run_or
+    if isinstance(query, _Memoized):
+        run_memoized = _compile(query.query, names)
+        return lambda names: run_memoized(_Names(names))
+    if isinstance(query, _Shared):
+        run_shared = _compile(query.query, names)
+        return lambda names: query._memoize(names, 'set', run_shared)
+    return query._apply
+
+def _compile_and(query, names):
+    # Compiles what And._apply does for each execution
+    IF = query.family.IF
+    positive = []
+    negative = []
+    for subq in query.queries:
+        index = _negation_index(subq)
+        if index is not None:
+            negative.append((index, _compile(subq.negate(), names)))
+            continue
+        try:
+            estimate = subq._estimate(names or {})
+        except NameError:
+            # depends on a name only known at execution time
+            estimate = _marker
+        if isinstance(subq, BoolOp):
+            step = (subq, _compile(subq, names), None)
+        else:
+            step = (subq, None, subq.intersect)
+        positive.append((estimate, step))
+    if not positive:
+        first = _compile(query.queries[0], names)
+        negative.pop(0)
+    dynamic = [i for i, (estimate, step) in enumerate(positive)
+               if estimate is _marker]
+    if not dynamic:
+        positive = _order(positive)
+
+    def run_and(names):
+        if not positive:
+            result = first(names)
+        else:
+            steps = positive
+            if dynamic:
+                steps = list(steps)
+                for i in dynamic:
+                    steps[i] = (steps[i][1][0]._estimate(names), steps[i][1])
+                steps = _order(steps)
+            estimate, (subq, run, intersect) = steps[0]
+            result = run(names) if run is not None else subq._apply(names)
+            for estimate, (subq, run, intersect) in steps[1:]:
+                if len(result) == 0:
+                    return IF.Set()
+                if subq._filter_wins(len(result), estimate):
+                    result = _filter(subq, result, names, query.family)
+                elif intersect is not None:
+                    result = intersect(result, names)
+                else:
+                    right = run(names)
+                    if not len(right):
+                        return IF.Set()
+                    _, result = IF.weightedIntersection(result, right)
+        for index, run in negative:
+            if len(result) == 0:
+                return IF.Set()
+            result = _restrict(result, index, query.family)
+            right = run(names)
+            if len(right):
+                result = IF.difference(result, right)
+        return result
+
+    return run_and
+
+def _order(steps):
+    # (estimate, step) pairs ordered as by And._plan
+    keyed = []
+    for i, (estimate, step) in enumerate(steps):
+        if estimate is None:
+            key = (1, 0, i)
+        else:
+            key = (0, estimate, i)
+        keyed.append((key, estimate, step))
+    keyed.sort(key=lambda item: item[0])
+    return [(estimate, step) for key, estimate, step in keyed]
+
+class _Names(dict):
+    # The names passed to one execution of a query, plus the results of
+    # its shared subqueries computed so far
+    def __init__(self, names):
+        dict.__init__(self, names or {})
+        self.memo = {}
+
+class _Shared(Query):
+    """
+    A subquery which appears more than once in an optimized query.  Every
+    occurrence is the same ``_Shared`` object, which computes its result
+    once per execution of the ``_Memoized`` query containing it.
+    """
+
+    def __init__(self, query, uses=2):
+        self.query = query
+        self.uses = uses
+
+    def __str__(self):
+        return 'Shared'
+
+    def __eq__(self, other):
+        return type(self) == type(other) and self.query == other.query
+
+    __hash__ = Query.__hash__
+
+    def iter_children(self):
+        yield self.query
+
+    def flush(self, *arg, **kw):
+        self.query.flush(*arg, **kw)
+
+    def negate(self):
+        return self.query.negate()
+
+    def _memoize(self, names, kind, apply):
+        memo = getattr(names, 'memo', None)
+        if memo is None:
+            return apply(names)
+        key = (id(self), kind)
+        result = memo.get(key)
+        if result is None:
+            result = memo[key] = apply(names)
+        return result
+
+    def _apply(self, names):
+        return self._memoize(names, 'set', self.query._apply)
+
+    def _apply_array(self, names):
+        return self._memoize(names, 'array', self.query._apply_array)
+
+    def _estimate(self, names):
+        return self.query._estimate(names)
+
+    def _cache_key(self, names):
+        return self.query._cache_key(names)
+
+    def _filter_wins(self, numdocids, estimate):
+        # each use filters its own candidates, but the result is computed
+        # only once
+        return self.query._filter_wins(numdocids * self.uses, estimate)
+
+    def filter(self, left, names):
+        return self.query.filter(left, names)
+
+    def _narrower(self, names):
+        return self.query._narrower(names)
+
+class _Memoized(Query):
+    """
+    An optimized query containing ``_Shared`` subqueries, which gives each
+    execution of the query somewhere to keep their results.
+    """
+
+    def __init__(self, query):
+        self.query = query
+
+    def __str__(self):
+        return 'Memoized'
+
+    def __eq__(self, other):
+        return type(self) == type(other) and self.query == other.query
+
+    __hash__ = Query.__hash__
+
+    def iter_children(self):
+        yield self.query
+
+    def flush(self, *arg, **kw):
+        self.query.flush(*arg, **kw)
+
+    def negate(self):
+        return self.query.negate()
+
+    def _apply(self, names):
+        return self.query._apply(_Names(names))
+
+    def _apply_array(self, names):
+        return self.query._apply_array(_Names(names))
+
+    def _stream(self, names):
+        return self.query._stream(_Names(names))
+
+    def _narrower(self, names):
+        return self.query._narrower(_Names(names))
+
+    def _estimate(self, names):
+        return self.query._estimate(names)
+
+    def _cache_key(self, names):
+        return self.query._cache_key(names)
+
+    def execute(self, optimize=True, names=None, resolver=None, lazy=False):
+        return _find_index(self.query).resultset_from_query(
+            self,
+            names=names,
+            resolver=resolver,
+            **_lazy_kw(lazy)
+            )
+
+def _share(query):
+    # Replace the subqueries which appear more than once in query by one
+    # _Shared query each (common subexpression elimination).  Negated
+    # comparators are left alone, as And treats them specially.
+    seen = [] # [query, occurrences, shared]
+
+    def find(subq):
+        for entry in seen:
+            if entry[0] == subq:
+                return entry
+        return None
+
+    def count(subq):
+        entry = find(subq)
+        if entry is not None:
+            # its subqueries were counted at its first occurrence
+            entry[1] += 1
+            return
+        seen.append([subq, 1, None])
+        if isinstance(subq, BoolOp):
+            for child in subq.queries:
+                count(child)
+
+    def shared(entry):
+        return entry[1] > 1 and not _is_negation(entry[0])
+
+    def rewrite(subq):
+        entry = find(subq)
+        if shared(entry):
+            if entry[2] is None:
+                entry[2] = _Shared(rewrite_children(subq), entry[1])
+            return entry[2]
+        return rewrite_children(subq)
+
+    def rewrite_children(subq):
+        if not isinstance(subq, BoolOp):
+            return subq
+        queries = [rewrite(child) for child in subq.queries]
+        if all(new is old for new, old in zip(queries, subq.queries)):
+            return subq
+        new = copy.copy(subq)
+        new.queries = queries
+        return new
+
+    if not isinstance(query, BoolOp):
+        return query
+    count(query)
+    if not any(shared(entry) for entry in seen):
+        return query
+    return _Memoized(rewrite_children(query))
+
+def _frozen(value):
+    # A hashable equivalent of a (resolved) comparator value; raises
+    # TypeError if the value can't be hashed.  Lists and tuples mean
+    # different things to some indexes, so their type is part of the key.
+    if isinstance(value, (list, tuple)):
+        return (type(value),) + tuple(_frozen(item) for item in value)
+    hash(value)
+    return value
+
+def _lazy_kw(lazy):
+    # Only pass ``lazy`` along when it's asked for, so that overrides of
+    # ``resultset_from_query`` which predate it keep working.
+    if lazy:
+        return {'lazy': True}
+    return {}
+
 class Name(object):
     """
     A variable name in an expression, evaluated at query time.  Can be used
@@ -973,7 +1793,7 @@ class _AstParser(object):
 
 def optimize(query):
     if isinstance(query, Query):
-        return query._optimize()
+        return _share(query._optimize())
     return query
 
 
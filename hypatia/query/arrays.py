@@ -0,0 +1,103 @@
+"""Set algebra on sorted NumPy arrays of docids.
+
+Used by ``And`` and ``Or`` when ``BoolOp.vectorized`` is true and NumPy is
+installed.  A result is a ``(docids, weights)`` pair: ``docids`` is a
+sorted array of distinct docids, and ``weights`` is either ``None``, for
+an unweighted result (an ``IF.Set``), or a parallel array of weights, for
+a weighted one (an ``IF.Bucket``, e.g. from a text index).
+
+Results are combined as ``weightedUnion``, ``weightedIntersection`` and
+``difference`` would combine them from left to right: unweighted operands
+ahead of the first weighted one merge as plain sets, and from then on an
+unweighted operand adds a weight of 1 to each of its docids.
+"""
+
+try:
+    import numpy
+except ImportError: # pragma: no cover
+    numpy = None
+    DOCID = WEIGHT = None
+else:
+    DOCID = numpy.int64
+    WEIGHT = numpy.float32 # as stored by IF buckets
+
+def empty(weighted=False):
+    """ Return an empty result """
+    weights = numpy.empty(0, WEIGHT) if weighted else None
+    return numpy.empty(0, DOCID), weights
+
+def from_result(result):
+    """ Convert an ``IF`` set or mapping to a result """
+    count = len(result)
+    if hasattr(result, 'values'):
+        return (numpy.fromiter(result.keys(), DOCID, count),
+                numpy.fromiter(result.values(), WEIGHT, count))
+    return numpy.fromiter(result, DOCID, count), None
+
+def to_result(result, family):
+    """ Convert a result to an ``IF.Set`` or, if weighted, an
+    ``IF.Bucket`` of ``family`` """
+    docids, weights = result
+    if weights is None:
+        return family.IF.Set(docids.tolist())
+    return family.IF.Bucket(list(zip(docids.tolist(), weights.tolist())))
+
+def _weights(result):
+    docids, weights = result
+    if weights is None:
+        return numpy.ones(len(docids), WEIGHT)
+    return weights
+
+def _starts(docids):
+    # A mask of the first occurrence of each docid in sorted docids; cheaper
+    # than numpy.unique, which can't assume its input is sorted
+    starts = numpy.empty(len(docids), bool)
+    starts[:1] = True
+    numpy.not_equal(docids[1:], docids[:-1], out=starts[1:])
+    return starts
+
+def union(results):
+    """ Return the union of a sequence of results, merged in one pass
+    rather than pairwise """
+    weighted = [weights is not None for docids, weights in results]
+    results = [result for result in results if len(result[0])]
+    if not results:
+        return empty(any(weighted))
+    first = len(results)
+    for i, (docids, weights) in enumerate(results):
+        if weights is not None:
+            first = i
+            break
+    prefix = [docids for docids, weights in results[:first]]
+    if len(prefix) > 1:
+        docids = numpy.sort(numpy.concatenate(prefix), kind='stable')
+        prefix = [docids[_starts(docids)]]
+    if first == len(results):
+        return prefix[0], None
+    results = [(docids, None) for docids in prefix] + results[first:]
+    docids = numpy.concatenate([docids for docids, weights in results])
+    weights = numpy.concatenate([_weights(result) for result in results])
+    order = numpy.argsort(docids, kind='stable')
+    docids = docids[order]
+    starts = _starts(docids)
+    return (docids[starts],
+            numpy.add.reduceat(weights[order], numpy.flatnonzero(starts)))
+
+def intersection(left, right):
+    """ Return the intersection of two results """
+    if not len(left[0]) or not len(right[0]):
+        return empty()
+    if left[1] is None and right[1] is None:
+        return numpy.intersect1d(left[0], right[0], assume_unique=True), None
+    docids, lindex, rindex = numpy.intersect1d(
+        left[0], right[0], assume_unique=True, return_indices=True)
+    return docids, _weights(left)[lindex] + _weights(right)[rindex]
+
+def difference(left, right):
+    """ Return the docids of ``left`` which aren't in ``right``, with their
+    weights """
+    if not len(left[0]) or not len(right[0]):
+        return left
+    keep = numpy.isin(left[0], right[0], assume_unique=True, invert=True)
+    docids, weights = left
+    return docids[keep], None if weights is None else weights[keep]
@@ -1,5 +1,9 @@
 import unittest
 
+try:
+    import numpy
+except ImportError: # pragma: no cover
+    numpy = None
 
 class ComparatorTestBase(unittest.TestCase):
 
@@ -82,6 +86,61 @@ class TestQuery(unittest.TestCase):
         a = self._makeOne()
         self.assertEqual(a.iter_children(), ())
 
+    def test_estimate(self):
+        a = self._makeOne()
+        self.assertEqual(a._estimate(None), None)
+
+    def test_filter_wins(self):
+        a = self._makeOne()
+        self.assertFalse(a._filter_wins(1, 1000))
+
+    def test_stream(self):
+        a = self._makeOne()
+        a._apply = lambda names: [1, 2]
+        self.assertEqual(list(a._stream(None)), [1, 2])
+
+    def test_narrower(self):
+        from BTrees import family64
+        a = self._makeOne()
+        applied = []
+        def _apply(names):
+            applied.append(names)
+            return family64.IF.Set([2, 3, 4])
+        a._apply = _apply
+        narrow = a._narrower('names')
+        self.assertEqual(applied, [])
+        self.assertEqual(list(narrow(family64.IF.Set([1, 2, 3]))), [2, 3])
+        self.assertEqual(list(narrow(family64.IF.Set([4, 5]))), [4])
+        self.assertEqual(applied, ['names'])
+
+    def test_difference(self):
+        a = self._makeOne()
+        a._apply = lambda names: set([2])
+        a.family = DummyFamily()
+        self.assertEqual(a.difference(set([1, 2]), None), set([1]))
+
+    def test_difference_left_empty(self):
+        a = self._makeOne()
+        a._apply = lambda names: set([2])
+        left = set()
+        self.assertTrue(a.difference(left, None) is left)
+
+    def test_difference_right_empty(self):
+        a = self._makeOne()
+        a._apply = lambda names: set()
+        left = set([1])
+        self.assertTrue(a.difference(left, None) is left)
+
+    def test_intersect_left_empty(self):
+        a = self._makeOne()
+        a._apply = lambda names: set([2])
+        a.family = DummyFamily()
+        self.assertEqual(a.intersect(set(), None), set())
+
+    def test_cache_key(self):
+        a = self._makeOne()
+        self.assertEqual(a._cache_key(None), None)
+
     def test_print_tree(self):
         from . import Query
 
@@ -136,6 +195,111 @@ class TestComparator(ComparatorTestBase):
         self.assertEqual(rs['names'], None)
         self.assertEqual(rs['resolver'], None)
 
+    def test_estimate_no_index_query(self):
+        index = DummyIndex()
+        inst = self._makeOne(index, 'val')
+        self.assertEqual(inst._estimate(None), None)
+        self.assertFalse(hasattr(index, 'estimated'))
+
+    def test_estimate_index_without_estimate(self):
+        inst = self._makeOne(object(), 'val')
+        inst._index_query = lambda names: 'val'
+        self.assertEqual(inst._estimate(None), None)
+
+    def test_estimate(self):
+        index = DummyIndex()
+        inst = self._makeOne(index, 'val')
+        inst._index_query = lambda names: 'val'
+        self.assertEqual(inst._estimate(None), 42)
+        self.assertEqual(index.estimated, 'val')
+
+    def test_filter_wins_no_estimate(self):
+        inst = self._makeOne(DummyFilterIndex(), 'val')
+        self.assertFalse(inst._filter_wins(1, None))
+
+    def test_filter_wins_index_without_filter(self):
+        inst = self._makeOne(DummyIndex(), 'val')
+        self.assertFalse(inst._filter_wins(1, 100000))
+
+    def test_filter_wins(self):
+        inst = self._makeOne(DummyFilterIndex(), 'val')
+        self.assertTrue(inst._filter_wins(1, 100000))
+        self.assertFalse(inst._filter_wins(100000, 100000))
+
+    def test_narrower_w_filter(self):
+        index = DummyFilterIndex()
+        inst = self._makeOne(index, 'val')
+        inst._index_query = lambda names: 'val'
+        narrow = inst._narrower(None)
+        self.assertEqual(narrow(set([1])), set([1]))
+        self.assertEqual(index.filtered, (set([1]), 'val'))
+
+    def test_narrower_no_index_query(self):
+        from BTrees import family64
+        index = DummyFilterIndex()
+        inst = self._makeOne(index, 'val')
+        inst._apply = lambda names: family64.IF.Set([1])
+        narrow = inst._narrower(None)
+        self.assertEqual(list(narrow(family64.IF.Set([1, 2]))), [1])
+        self.assertFalse(hasattr(index, 'filtered'))
+
+    def test_narrower_index_without_filter(self):
+        from BTrees import family64
+        inst = self._makeOne(DummyIndex(), 'val')
+        inst._index_query = lambda names: 'val'
+        inst._apply = lambda names: family64.IF.Set([2])
+        narrow = inst._narrower(None)
+        self.assertEqual(list(narrow(family64.IF.Set([1, 2]))), [2])
+
+    def test_filter(self):
+        index = DummyFilterIndex()
+        inst = self._makeOne(index, 'val')
+        inst._index_query = lambda names: 'val'
+        self.assertEqual(inst.filter(set([1, 2]), None), set([1, 2]))
+        self.assertEqual(index.filtered, (set([1, 2]), 'val'))
+
+    def test_cache_key_index_without_generation(self):
+        inst = self._makeOne(DummyIndex(), 'val')
+        self.assertEqual(inst._cache_key(None), None)
+
+    def test_cache_key_index_changed(self):
+        inst = self._makeOne(DummyGenerationIndex(None), 'val')
+        self.assertEqual(inst._cache_key(None), None)
+
+    def test_cache_key_unhashable_value(self):
+        inst = self._makeOne(DummyGenerationIndex(), ['a', {}])
+        self.assertEqual(inst._cache_key(None), None)
+
+    def test_cache_key(self):
+        from . import Comparator
+        index = DummyGenerationIndex()
+        inst = self._makeOne(index, 'val')
+        self.assertEqual(inst._cache_key(None), (Comparator, index, 1, 'val'))
+        self.assertEqual(inst._cache_key(None),
+                         self._makeOne(index, 'val')._cache_key(None))
+        index.gen = 2
+        self.assertEqual(inst._cache_key(None), (Comparator, index, 2, 'val'))
+
+    def test_cache_key_differs_by_index(self):
+        inst = self._makeOne(DummyGenerationIndex(), 'val')
+        other = self._makeOne(DummyGenerationIndex(), 'val')
+        self.assertNotEqual(inst._cache_key(None), other._cache_key(None))
+
+    def test_cache_key_resolves_names(self):
+        from . import Name
+        index = DummyGenerationIndex()
+        inst = self._makeOne(index, ['a', Name('foo')])
+        self.assertEqual(inst._cache_key({'foo': 'b'}),
+                         self._makeOne(index, ['a', 'b'])._cache_key(None))
+        self.assertNotEqual(inst._cache_key({'foo': 'b'}),
+                            inst._cache_key({'foo': 'c'}))
+
+    def test_cache_key_list_and_tuple_differ(self):
+        index = DummyGenerationIndex()
+        inst = self._makeOne(index, ['a', 'b'])
+        self.assertNotEqual(inst._cache_key(None),
+                            self._makeOne(index, ('a', 'b'))._cache_key(None))
+
     def test_flush(self):
         index = DummyIndex()
         inst = self._makeOne(index, 'val')
@@ -149,6 +313,14 @@ class TestComparator(ComparatorTestBase):
         self.assertEqual(rs['query'], inst)
         self.assertEqual(rs['names'], {'a':1})
         self.assertEqual(rs['resolver'], True)
+        self.assertEqual(rs['lazy'], False)
+
+    def test_execute_lazy(self):
+        index = DummyIndex()
+        inst = self._makeOne(index, 'val')
+        rs = inst.execute(lazy=True)
+        self.assertEqual(rs['query'], inst)
+        self.assertEqual(rs['lazy'], True)
 
 class TestContains(ComparatorTestBase):
 
@@ -156,6 +328,10 @@ class TestContains(ComparatorTestBase):
         from . import Contains
         return Contains
 
+    def test_index_query(self):
+        inst = self._makeOne('index', 'val')
+        self.assertEqual(inst._index_query(None), 'val')
+
     def test_apply(self):
         index = DummyIndex()
         inst = self._makeOne(index, 'val')
@@ -198,6 +374,10 @@ class TestNotContains(ComparatorTestBase):
         from . import NotContains
         return NotContains
 
+    def test_index_query(self):
+        inst = self._makeOne('index', 'val')
+        self.assertEqual(inst._index_query(None), None)
+
     def test_apply(self):
         index = DummyIndex()
         inst = self._makeOne(index, 'val')
@@ -221,6 +401,11 @@ class TestEq(ComparatorTestBase):
         from . import Eq
         return Eq
 
+    def test_index_query(self):
+        from . import Name
+        inst = self._makeOne('index', Name('foo'))
+        self.assertEqual(inst._index_query({'foo': 'val'}), 'val')
+
     def test_apply(self):
         index = DummyIndex()
         inst = self._makeOne(index, 'val')
@@ -275,10 +460,18 @@ class TestNotEq(ComparatorTestBase):
 
 class TestGt(ComparatorTestBase):
 
+    _exclusive = True
+
     def _getTargetClass(self):
         from . import Gt
         return Gt
 
+    def test_index_query(self):
+        inst = self._makeOne('index', 'val')
+        query = inst._index_query(None)
+        self.assertEqual(query.as_tuple(), ('val', None))
+        self.assertEqual(query.excludemin, self._exclusive)
+
     def test_apply(self):
         index = DummyIndex()
         inst = self._makeOne(index, 'val')
@@ -304,10 +497,18 @@ class TestGt(ComparatorTestBase):
 
 class TestLt(ComparatorTestBase):
 
+    _exclusive = True
+
     def _getTargetClass(self):
         from . import Lt
         return Lt
 
+    def test_index_query(self):
+        inst = self._makeOne('index', 'val')
+        query = inst._index_query(None)
+        self.assertEqual(query.as_tuple(), (None, 'val'))
+        self.assertEqual(query.excludemax, self._exclusive)
+
     def test_apply(self):
         index = DummyIndex()
         inst = self._makeOne(index, 'val')
@@ -333,10 +534,18 @@ class TestLt(ComparatorTestBase):
 
 class TestGe(ComparatorTestBase):
 
+    _exclusive = False
+
     def _getTargetClass(self):
         from . import Ge
         return Ge
 
+    def test_index_query(self):
+        inst = self._makeOne('index', 'val')
+        query = inst._index_query(None)
+        self.assertEqual(query.as_tuple(), ('val', None))
+        self.assertEqual(query.excludemin, self._exclusive)
+
     def test_apply(self):
         index = DummyIndex()
         inst = self._makeOne(index, 'val')
@@ -362,10 +571,18 @@ class TestGe(ComparatorTestBase):
 
 class TestLe(ComparatorTestBase):
 
+    _exclusive = False
+
     def _getTargetClass(self):
         from . import Le
         return Le
 
+    def test_index_query(self):
+        inst = self._makeOne('index', 'val')
+        query = inst._index_query(None)
+        self.assertEqual(query.as_tuple(), (None, 'val'))
+        self.assertEqual(query.excludemax, self._exclusive)
+
     def test_apply(self):
         index = DummyIndex()
         inst = self._makeOne(index, 'val')
@@ -395,6 +612,11 @@ class TestAll(ComparatorTestBase):
         from . import All
         return All
 
+    def test_index_query(self):
+        inst = self._makeOne('index', ['one', 'two'])
+        self.assertEqual(inst._index_query(None),
+                         {'query': ['one', 'two'], 'operator': 'and'})
+
     def test_apply(self):
         index = DummyIndex()
         inst = self._makeOne(index, 'val')
@@ -451,6 +673,11 @@ class TestAny(ComparatorTestBase):
         from . import Any
         return Any
 
+    def test_index_query(self):
+        inst = self._makeOne('index', ['one', 'two'])
+        self.assertEqual(inst._index_query(None),
+                         {'query': ['one', 'two'], 'operator': 'or'})
+
     def test_apply(self):
         index = DummyIndex()
         inst = self._makeOne(index, 'val')
@@ -574,6 +801,20 @@ class TestInRange(ComparatorTestBase):
         self.assertEqual(
             index.range, ('begin', 'end', True, True))
 
+    def test_index_query(self):
+        from . import Name
+        inst = self._makeOne('index', Name('foo'), 'end')
+        query = inst._index_query({'foo': 'begin'})
+        self.assertEqual(query.as_tuple(), ('begin', 'end'))
+        self.assertFalse(query.excludemin)
+        self.assertFalse(query.excludemax)
+
+    def test_index_query_exclusive(self):
+        inst = self._makeOne('index', 'begin', 'end', True, True)
+        query = inst._index_query(None)
+        self.assertTrue(query.excludemin)
+        self.assertTrue(query.excludemax)
+
     def test_to_str(self):
         index = DummyIndex('index')
         inst = self._makeOne(index, 0, 5)
@@ -611,6 +852,16 @@ class TestInRange(ComparatorTestBase):
         inst = self._makeOne('index', 'begin', 'end')
         self.assertNotEqual(inst, object())
 
+    def test_cache_key(self):
+        from . import InRange, Name
+        index = DummyGenerationIndex()
+        inst = self._makeOne(index, Name('begin'), 'end', True)
+        self.assertEqual(inst._cache_key({'begin': 'a'}),
+                         (InRange, index, 1, (tuple, 'a', 'end', True, False)))
+        self.assertNotEqual(
+            inst._cache_key({'begin': 'a'}),
+            self._makeOne(index, 'a', 'end')._cache_key(None))
+
 
 class TestNotInRange(ComparatorTestBase):
 
@@ -691,6 +942,29 @@ class TestBoolOp(BoolOpTestBase):
         self.assertEqual(left.flushed, True)
         self.assertEqual(right.flushed, True)
 
+    def test_cache_key(self):
+        from . import BoolOp
+        left = DummyQuery(None, cache_key='a')
+        right = DummyQuery(None, cache_key='b')
+        inst = self._makeOne(left, right)
+        self.assertEqual(inst._cache_key(None),
+                         (BoolOp, frozenset([('a', 1), ('b', 1)])))
+        self.assertEqual(inst._cache_key(None),
+                         self._makeOne(right, left)._cache_key(None))
+
+    def test_cache_key_repeated_child(self):
+        query = DummyQuery(None, cache_key='a')
+        once = self._makeOne(query, DummyQuery(None, cache_key='b'))
+        twice = self._makeOne(query, query)
+        twice.queries.append(DummyQuery(None, cache_key='b'))
+        self.assertNotEqual(twice._cache_key(None), once._cache_key(None))
+
+    def test_cache_key_uncacheable_child(self):
+        left = DummyQuery(None, cache_key='a')
+        right = DummyQuery(None)
+        inst = self._makeOne(left, right)
+        self.assertEqual(inst._cache_key(None), None)
+
 class TestOr(BoolOpTestBase):
 
     def _getTargetClass(self):
@@ -709,8 +983,60 @@ class TestOr(BoolOpTestBase):
         self.assertEqual(o._apply(None), set([1, 2, 3, 4]))
         self.assertTrue(left.applied)
         self.assertTrue(right.applied)
-        self.assertEqual(left.unioned, None)
-        self.assertEqual(right.unioned, (left.results, right.results))
+
+    def test_narrower(self):
+        from BTrees import family64
+        IF = family64.IF
+        left = DummyQuery(IF.Set([1, 2]))
+        right = DummyQuery(IF.Set([3]))
+        o = self._makeOne(left, right)
+        narrow = o._narrower(None)
+        self.assertEqual(list(narrow(IF.Set([1, 3, 5]))), [1, 3])
+
+    def test_apply_n_way(self):
+        from BTrees import family64
+        from . import Or
+        IF = family64.IF
+        queries = [DummyQuery(IF.Set([n, n + 10])) for n in range(5)]
+        o = Or(*queries)
+        result = o._apply(None)
+        self.assertEqual(list(result), [0, 1, 2, 3, 4, 10, 11, 12, 13, 14])
+        self.assertTrue(all(query.applied for query in queries))
+
+    def test_apply_all_empty(self):
+        left = DummyQuery(set())
+        right = DummyQuery(set())
+        o = self._makeOne(left, right)
+        self.assertTrue(o._apply(None) is left.results)
+
+    def test_apply_weighted(self):
+        from BTrees import family64
+        from . import Or
+        from . import Query
+        IF = family64.IF
+
+        class Fixed(Query):
+            def __init__(self, result):
+                self.result = result
+
+            def _apply(self, names):
+                return self.result
+
+        cases = [
+            [IF.Set([1, 2]), IF.Set([2, 3]), IF.Bucket({2: 0.5, 4: 1.5})],
+            [IF.Bucket({2: 0.5}), IF.Set([1, 2]), IF.Set([2]),
+             IF.Bucket({1: 2.0, 9: 1.0})],
+            [IF.Set(), IF.Set([4]), IF.Set(), IF.Bucket({4: 2.0}),
+             IF.Bucket()],
+            ]
+        for results in cases:
+            # what Or computed by folding Query.union over its children
+            expected = results[0]
+            for result in results[1:]:
+                expected = Fixed(result).union(expected, None)
+            o = Or(*[Fixed(result) for result in results])
+            self.assertEqual(list(o._apply(None).items()),
+                             list(expected.items()))
 
     def test_apply_left_empty(self):
         left = DummyQuery(set())
@@ -720,8 +1046,6 @@ class TestOr(BoolOpTestBase):
         self.assertEqual(o._apply(None), set([3, 4]))
         self.assertTrue(left.applied)
         self.assertTrue(right.applied)
-        self.assertEqual(left.unioned, None)
-        self.assertEqual(right.unioned, (left.results, right.results))
 
     def test_apply_right_empty(self):
         left = DummyQuery(set([1, 2]))
@@ -731,8 +1055,6 @@ class TestOr(BoolOpTestBase):
         self.assertEqual(o._apply(None), set([1, 2]))
         self.assertTrue(left.applied)
         self.assertTrue(right.applied)
-        self.assertEqual(left.unioned, None)
-        self.assertEqual(right.unioned, (left.results, right.results))
 
     def test_negate(self):
         from . import And
@@ -745,6 +1067,18 @@ class TestOr(BoolOpTestBase):
         self.assertTrue(left.negated)
         self.assertTrue(right.negated)
 
+    def test_estimate(self):
+        left = DummyQuery(None, estimate=3)
+        right = DummyQuery(None, estimate=2)
+        o = self._makeOne(left, right)
+        self.assertEqual(o._estimate(None), 5)
+
+    def test_estimate_unknown(self):
+        left = DummyQuery(None, estimate=3)
+        right = DummyQuery(None)
+        o = self._makeOne(left, right)
+        self.assertEqual(o._estimate(None), None)
+
 class TestAnd(BoolOpTestBase):
 
     def _getTargetClass(self):
@@ -799,6 +1133,320 @@ class TestAnd(BoolOpTestBase):
         self.assertTrue(left.negated)
         self.assertTrue(right.negated)
 
+    def test_apply_smallest_estimate_first(self):
+        left = DummyQuery(set([1, 2, 3]), estimate=3)
+        right = DummyQuery(set([3, 4]), estimate=2)
+        o = self._makeOne(left, right)
+        o.family = DummyFamily()
+        self.assertEqual(o._apply(None), set([3]))
+        self.assertEqual(right.intersected, None)
+        self.assertEqual(left.intersected, (right.results, left.results))
+
+    def _makeNotEq(self, values):
+        from BTrees import family64
+        from . import NotEq
+        return NotEq(DummyIndex(), family64.IF.Set(values))
+
+    def test_stream(self):
+        from BTrees import family64
+        IF = family64.IF
+        left = DummyQuery(IF.Set([1, 2, 3, 4, 5]), estimate=5)
+        right = DummyQuery(IF.Set([2, 4, 6]), estimate=10)
+        o = self._getTargetClass()(right, left, self._makeNotEq([4]))
+        o.stream_batch_size = 2
+        self.assertEqual(list(o._stream(None)), [2])
+        self.assertTrue(left.applied)
+        self.assertFalse(right.applied)
+
+    def test_stream_no_positive(self):
+        o = self._getTargetClass()(self._makeNotEq([4]))
+        self.assertEqual(list(o._stream(None)), [4])
+
+    def test_narrower(self):
+        from BTrees import family64
+        IF = family64.IF
+        left = DummyQuery(IF.Set([1, 2, 3, 4, 5]), estimate=5)
+        right = DummyQuery(IF.Set([2, 4, 6]), estimate=10)
+        o = self._getTargetClass()(left, right, self._makeNotEq([4]))
+        narrow = o._narrower(None)
+        self.assertEqual(list(narrow(IF.Set(range(10)))), [2])
+        self.assertFalse(left.applied)
+        self.assertFalse(right.applied)
+
+    def test_narrower_emptied_by_positive(self):
+        from BTrees import family64
+        IF = family64.IF
+        left = DummyQuery(IF.Set([1]), estimate=1)
+        right = DummyQuery(IF.Set([2]), estimate=2)
+        o = self._makeOne(left, right)
+        narrow = o._narrower(None)
+        self.assertEqual(list(narrow(IF.Set([2]))), [])
+
+    def test_narrower_emptied_by_negative(self):
+        from BTrees import family64
+        IF = family64.IF
+        query = DummyQuery(IF.Set([4]), estimate=1)
+        o = self._getTargetClass()(
+            query, self._makeNotEq([4]), self._makeNotEq([5]))
+        narrow = o._narrower(None)
+        self.assertEqual(list(narrow(IF.Set([4]))), [])
+
+    def test_apply_filter_wins(self):
+        left = DummyQuery(set([1, 2, 3]), estimate=3)
+        right = DummyQuery(set([3, 4, 5, 6]), estimate=4)
+        right.filter_wins = True
+        o = self._makeOne(left, right)
+        o.family = DummyFamily()
+        self.assertEqual(o._apply(None), set([3]))
+        self.assertEqual(right.filtered, set([1, 2, 3]))
+        self.assertEqual(right.intersected, None)
+
+    def test_apply_filter_weights(self):
+        # weighted results score the same whether a subquery filters them
+        # or is intersected with them
+        from ..field import FieldIndex
+        from ..text import TextIndex
+        from . import Contains
+        from . import Eq
+        field = FieldIndex(lambda docid, default: docid % 2)
+        text = TextIndex(
+            lambda docid, default: 'red ' * (docid % 4 + 1)
+            if docid % 5 == 0 else 'blue')
+        for docid in range(100):
+            field.index_doc(docid, docid)
+            text.index_doc(docid, docid)
+        weighted, eq = Contains(text, 'red'), Eq(field, 1)
+        expected = field.family.IF.weightedIntersection(
+            weighted._apply({}), eq._apply({}))[1]
+        for filter_wins in (False, True):
+            eq._filter_wins = lambda numdocids, estimate: filter_wins
+            query = self._makeOne(weighted, eq)
+            for result in (query._apply({}), query.prepare()._apply({})):
+                self.assertEqual(list(result.items()), list(expected.items()))
+
+    def test_apply_unknown_estimate_last(self):
+        left = DummyQuery(set([1, 2, 3]))
+        right = DummyQuery(set([3, 4]), estimate=100)
+        o = self._makeOne(left, right)
+        o.family = DummyFamily()
+        self.assertEqual(o._apply(None), set([3]))
+        self.assertEqual(right.intersected, None)
+        self.assertEqual(left.intersected, (right.results, left.results))
+
+    def test_apply_negation_as_difference(self):
+        from BTrees import family64
+        from . import NotEq
+        index = DummyIndex()
+        negated = NotEq(index, family64.IF.Set([2]))
+        positive = DummyQuery(family64.IF.Set([1, 2, 3]))
+        o = self._makeOne(negated, positive)
+        self.assertEqual(list(o._apply(None)), [1, 3])
+        self.assertEqual(list(index.eq), [2])
+        self.assertFalse(hasattr(index, 'not_eq'))
+
+    def test_apply_negation_skipped_when_result_empty(self):
+        from . import NotEq
+        index = DummyIndex()
+        negated = NotEq(index, set([2]))
+        left = DummyQuery(set([1, 2]))
+        right = DummyQuery(set([3, 4]))
+        o = self._makeOne(left, right)
+        o.queries.append(negated)
+        o.family = DummyFamily()
+        self.assertEqual(o._apply(None), set())
+        self.assertFalse(hasattr(index, 'eq'))
+
+    def test_apply_only_negations(self):
+        from BTrees import family64
+        from . import NotEq
+        index = DummyIndex()
+        first = NotEq(index, family64.IF.Set([1, 2, 3]))
+        second = NotEq(index, family64.IF.Set([2]))
+        o = self._makeOne(first, second)
+        self.assertEqual(list(o._apply(None)), [1, 3])
+        self.assertEqual(list(index.not_eq), [1, 2, 3])
+        self.assertEqual(list(index.eq), [2])
+
+    def test_apply_negation_outside_index(self):
+        # Documents the negated index was never told about match neither
+        # the negation nor its positive counterpart.
+        from ..field import FieldIndex
+        from ..keyword import KeywordIndex
+        from . import Eq
+        from . import NotAny
+        from . import NotEq
+        keywords = {1: ['a'], 2: ['b'], 3: []}
+        field = FieldIndex(lambda docid, default: 1)
+        keyword = KeywordIndex(lambda docid, default: keywords[docid])
+        for docid in (1, 2, 3, 4):
+            field.index_doc(docid, docid)
+        for docid in keywords:
+            keyword.index_doc(docid, docid)
+        negated = NotAny(keyword, ['a'])
+        self.assertEqual(list(negated._apply({})), [2])
+        query = self._makeOne(Eq(field, 1), negated)
+        self.assertEqual(list(query._apply({})), [2])
+        self.assertEqual(list(query._stream({})), [2])
+        narrow = query._narrower({})
+        self.assertEqual(list(narrow(field.family.IF.Set([1, 2, 3, 4]))),
+                         [2])
+        query = self._makeOne(NotEq(field, 2), negated)
+        self.assertEqual(list(query._apply({})), [2])
+
+    def test_apply_negations_as_intersection(self):
+        # Each kind of negation And subtracts gives what intersecting with
+        # the negation's own result gives, for documents missing from the
+        # negated index too.
+        from ..field import FieldIndex
+        from ..keyword import KeywordIndex
+        from ..text import TextIndex
+        from . import Any
+        from . import Contains
+        from . import Eq
+        from . import InRange
+        from . import Le
+        from . import Not
+        from . import NotAll
+        from . import NotAny
+        from . import NotContains
+        from . import NotEq
+        from . import NotInRange
+        from . import Or
+        driver = FieldIndex(lambda docid, default: docid)
+        field = FieldIndex(lambda docid, default: docid % 10)
+        keyword = KeywordIndex(
+            lambda docid, default: ['k%d' % (docid % 3), 'j%d' % (docid % 2)])
+        text = TextIndex(lambda docid, default: 'w%d' % (docid % 4))
+        for docid in range(50):
+            driver.index_doc(docid, docid)
+        for docid in range(35):
+            field.index_doc(docid, docid)
+        for docid in range(30):
+            keyword.index_doc(docid, docid)
+        for docid in range(10, 40):
+            text.index_doc(docid, docid)
+        IF = driver.family.IF
+        negations = [
+            NotInRange(field, 2, 5),
+            NotContains(text, 'w1'),
+            Not(Any(keyword, ['k0'])),
+            Not(self._makeOne(Eq(field, 3), InRange(field, 2, 5))),
+            Or(NotAny(keyword, ['k0']), NotEq(keyword, 'j1')),
+            ]
+        # applied by intersection
+        others = [
+            NotAll(keyword, ['k0', 'j1']),
+            Not(self._makeOne(Le(field, 5), Eq(field, 3))),
+            Or(NotEq(field, 1), NotAny(keyword, ['k0'])),
+            Or(NotAny(keyword, ['k0']), Any(keyword, ['j1'])),
+            Or(NotContains(text, 'w1'), Contains(text, 'w2')),
+            ]
+        for negation in negations + others:
+            query = self._makeOne(Le(driver, 45), negation)
+            positive, negative = query._plan({})
+            self.assertEqual(negative, [negation] if negation in negations
+                             else [])
+            expected = list(IF.intersection(
+                Le(driver, 45)._apply({}), negation._apply({})))
+            self.assertEqual(list(query._apply({})), expected)
+            self.assertEqual(list(query._stream({})), expected)
+            narrow = query._narrower({})
+            self.assertEqual(list(narrow(IF.Set(range(50)))), expected)
+        # weights are those intersecting with the negation would give
+        weighted = Contains(text, 'w1')
+        for negation in negations:
+            query = self._makeOne(weighted, negation)
+            expected = IF.weightedIntersection(
+                weighted._apply({}), negation._apply({}))[1]
+            self.assertEqual(list(query._apply({}).items()),
+                             list(expected.items()))
+
+    def test_plan(self):
+        from . import NotAny
+        from . import NotContains
+        from . import NotInRange
+        unknown = DummyQuery(None)
+        big = DummyQuery(None, estimate=10)
+        small = DummyQuery(None, estimate=1)
+        notany = NotAny('index', 'val')
+        notcontains = NotContains('index', 'val')
+        notinrange = NotInRange('index', 'begin', 'end')
+        o = self._getTargetClass()(
+            notany, unknown, big, notcontains, small, notinrange)
+        positive, negative = o._plan(None)
+        self.assertEqual(positive, [(small, 1), (big, 10), (unknown, None)])
+        self.assertEqual(negative, [notany, notcontains, notinrange])
+
+    def test_plan_negations(self):
+        from . import Eq
+        from . import Not
+        from . import NotAll
+        from . import NotAny
+        from . import NotEq
+        from . import Or
+        from . import Query
+        unknown = DummyQuery(None)
+        notall = NotAll('index', 'val')
+        not_ = Not(DummyQuery(None))
+        not_eq = Not(Eq('index', 'val'))
+        negated_and = Or(NotEq('index', 'val'), NotAny('index', 'other'))
+        mixed = Or(NotEq('index', 'val'), Eq('index', 'other'))
+        two_indexes = Or(NotEq('index', 'val'), NotEq('other', 'val'))
+        positive_or = Or(Eq('index', 'val'), Eq('index', 'other'))
+        no_negate = Or(NotEq('index', 'val'), Query())
+        o = self._getTargetClass()(
+            notall, unknown, not_, not_eq, negated_and, mixed, two_indexes,
+            positive_or, no_negate)
+        positive, negative = o._plan(None)
+        self.assertEqual(positive, [(notall, None), (unknown, None),
+                                    (not_, None), (mixed, None),
+                                    (two_indexes, None), (positive_or, None),
+                                    (no_negate, None)])
+        self.assertEqual(negative, [not_eq, negated_and])
+
+    def test_apply_not_as_difference(self):
+        from ..field import FieldIndex
+        from . import Eq
+        from . import InRange
+        from . import Le
+        from . import Not
+        from . import Or
+        index = FieldIndex(lambda docid, default: docid % 10)
+        for docid in range(30):
+            index.index_doc(docid, docid)
+        index._negate = None # the complement is never computed
+        query = self._makeOne(Le(index, 5), Not(Eq(index, 3)))
+        self.assertEqual(list(query._apply({})),
+                         [0, 1, 2, 4, 5, 10, 11, 12, 14, 15, 20, 21, 22, 24,
+                          25])
+        # the negation of an And
+        query = self._makeOne(Le(index, 5),
+                              Not(self._makeOne(InRange(index, 0, 3),
+                                                Eq(index, 3))))
+        for query in (query, query._optimize()):
+            self.assertEqual(list(query._apply({})),
+                             [0, 1, 2, 4, 5, 10, 11, 12, 14, 15, 20, 21,
+                              22, 24, 25])
+        # an Or with a positive part is intersected with
+        del index._negate
+        query = self._makeOne(Le(index, 5),
+                              Or(Not(Eq(index, 3)), Eq(index, 3)))
+        self.assertEqual(list(query._apply({})),
+                         [docid for docid in range(30) if docid % 10 <= 5])
+
+    def test_estimate(self):
+        from . import NotEq
+        left = DummyQuery(None, estimate=3)
+        right = DummyQuery(None, estimate=2)
+        unknown = DummyQuery(None)
+        o = self._getTargetClass()(
+            left, right, unknown, NotEq(DummyIndex(), 'val'))
+        self.assertEqual(o._estimate(None), 2)
+
+    def test_estimate_unknown(self):
+        o = self._makeOne(DummyQuery(None), DummyQuery(None))
+        self.assertEqual(o._estimate(None), None)
+
 class TestBoolOpExecute(unittest.TestCase):
 
     def _makeDummyQuery(self, values):
@@ -866,6 +1514,15 @@ class TestBoolOpExecute(unittest.TestCase):
         self.assertEqual(rs['names'], {'a':1})
         self.assertEqual(rs['resolver'], True)
 
+    def test_execute_lazy(self):
+        from . import Or
+        left = self._makeDummyQuery({'foo': 11})
+        right = self._makeDummyQuery({'bar': 12})
+        inst = Or(left, right)
+        rs = inst.execute(lazy=True)
+        self.assertEqual(rs['query'], inst)
+        self.assertEqual(rs['lazy'], True)
+
     def test_execute_no_queries(self):
         from . import Or
         inst = Or()
@@ -926,6 +1583,21 @@ class TestNot(BoolOpTestBase):
         self.assertEqual(rs['names'], {'a':1})
         self.assertEqual(rs['resolver'], True)
 
+    def test_execute_lazy(self):
+        index = DummyIndex()
+        query = DummyQuery('foo', index=index)
+        inst = self._makeOne(query)
+        rs = inst.execute(lazy=True)
+        self.assertEqual(rs['query'], query)
+        self.assertEqual(rs['lazy'], True)
+
+    def test_narrower(self):
+        query = DummyQuery(set([1]))
+        o = self._makeOne(query)
+        narrow = o._narrower(None)
+        self.assertEqual(narrow(set([1, 2])), set([1]))
+        self.assertTrue(query.negated)
+
     def test_flush(self):
         index = DummyIndex()
         query = DummyQuery('foo', index=index)
@@ -933,6 +1605,15 @@ class TestNot(BoolOpTestBase):
         inst.flush(True)
         self.assertEqual(query.flushed, True)
 
+    def test_cache_key(self):
+        from . import Not
+        inst = self._makeOne(DummyQuery('foo', cache_key='a'))
+        self.assertEqual(inst._cache_key(None), (Not, 'a'))
+
+    def test_cache_key_uncacheable(self):
+        inst = self._makeOne(DummyQuery('foo'))
+        self.assertEqual(inst._cache_key(None), None)
+
 class TestName(unittest.TestCase):
 
     def _makeOne(self):
@@ -1371,6 +2052,635 @@ class Test_parse_query(unittest.TestCase):
         self.assertTrue(isinstance(op.queries[1].queries[1], Lt))
 
 
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class Test_arrays(unittest.TestCase):
+
+    def _IF(self):
+        from BTrees import family64
+        return family64.IF
+
+    def _fold(self, op, results):
+        result = results[0]
+        for other in results[1:]:
+            result = op(result, other)[1]
+        return result
+
+    def _check(self, expected, result):
+        from BTrees import family64
+        from .arrays import to_result
+        result = to_result(result, family64)
+        self.assertEqual(type(result), type(expected))
+        self.assertEqual(list(result.items() if hasattr(result, 'items')
+                              else result),
+                         list(expected.items() if hasattr(expected, 'items')
+                              else expected))
+
+    def test_round_trip(self):
+        from .arrays import from_result
+        IF = self._IF()
+        for result in (IF.Set(), IF.Set([1, 5, 9]), IF.TreeSet([2, 3]),
+                       IF.Bucket({1: 0.5, 7: 2.0}), IF.BTree({3: 1.0})):
+            docids, weights = from_result(result)
+            self.assertEqual(weights is None, not hasattr(result, 'values'))
+            expected = IF.Set(result) if weights is None else IF.Bucket(result)
+            self._check(expected, (docids, weights))
+
+    def test_union(self):
+        from .arrays import from_result
+        from .arrays import union
+        IF = self._IF()
+        cases = [
+            [IF.Set([1, 2]), IF.Set([2, 3]), IF.Set([9])],
+            [IF.Set([1, 2]), IF.Set([2, 3]), IF.Bucket({2: 0.5, 4: 1.5})],
+            [IF.Bucket({2: 0.5}), IF.Set([1, 2]), IF.Set([2]),
+             IF.Bucket({1: 2.0, 9: 1.0})],
+            [IF.Set([4]), IF.Set(), IF.Bucket({4: 2.0})],
+            ]
+        for results in cases:
+            self._check(self._fold(IF.weightedUnion, results),
+                        union([from_result(r) for r in results]))
+        self._check(IF.Set(), union([from_result(IF.Set())]))
+        self._check(IF.Bucket(),
+                    union([from_result(IF.Set()), from_result(IF.Bucket())]))
+
+    def test_intersection(self):
+        from .arrays import from_result
+        from .arrays import intersection
+        IF = self._IF()
+        cases = [
+            [IF.Set([1, 2, 3]), IF.Set([2, 3, 4])],
+            [IF.Set([1, 2, 3]), IF.Bucket({2: 0.5, 3: 1.0, 4: 1.5})],
+            [IF.Bucket({2: 0.5, 3: 1.0}), IF.Bucket({3: 2.0})],
+            ]
+        for left, right in cases:
+            self._check(IF.weightedIntersection(left, right)[1],
+                        intersection(from_result(left), from_result(right)))
+        self._check(IF.Set(), intersection(from_result(IF.Bucket({1: 1.0})),
+                                           from_result(IF.Set())))
+
+    def test_difference(self):
+        from .arrays import difference
+        from .arrays import from_result
+        IF = self._IF()
+        cases = [
+            [IF.Set([1, 2, 3]), IF.Set([2, 4])],
+            [IF.Bucket({2: 0.5, 3: 1.0}), IF.Set([3])],
+            [IF.Set([1]), IF.Set()],
+            ]
+        for left, right in cases:
+            self._check(IF.difference(left, right),
+                        difference(from_result(left), from_result(right)))
+
+@unittest.skipIf(numpy is None, 'NumPy is not installed')
+class TestVectorized(unittest.TestCase):
+
+    def setUp(self):
+        from ..field import FieldIndex
+        from ..keyword import KeywordIndex
+        self.field = FieldIndex(lambda docid, default: docid % 50)
+        self.keyword = KeywordIndex(
+            lambda docid, default: ['k%d' % (docid % n) for n in (3, 7)])
+        for docid in range(300):
+            self.field.index_doc(docid, docid)
+            self.keyword.index_doc(docid, docid)
+
+    def _assertSameResult(self, query):
+        expected = query._apply(None)
+        query.vectorized = True
+        result = query._apply(None)
+        self.assertEqual(hasattr(result, 'values'),
+                         hasattr(expected, 'values'))
+        self.assertEqual(list(result), list(expected))
+        return result
+
+    def test_and_filter_weights(self):
+        from ..text import TextIndex
+        from . import And
+        from . import Contains
+        from . import Eq
+        text = TextIndex(
+            lambda docid, default: 'red ' * (docid % 4 + 1)
+            if docid % 25 == 0 else 'blue')
+        for docid in range(300):
+            text.index_doc(docid, docid)
+        eq = Eq(self.keyword, 'k0')
+        eq._filter_wins = lambda numdocids, estimate: True
+        query = And(Contains(text, 'red'), eq)
+        expected = self.field.family.IF.weightedIntersection(
+            Contains(text, 'red')._apply(None), eq._apply(None))[1]
+        result = self._assertSameResult(query)
+        self.assertEqual(list(result.items()), list(expected.items()))
+
+    def test_and_negation_outside_index(self):
+        from . import And
+        from . import Le
+        from . import NotEq
+        for docid in range(300, 310):
+            self.field.index_doc(docid, docid)
+        query = And(Le(self.field, 10), NotEq(self.keyword, 'k0'))
+        result = self._assertSameResult(query)
+        self.assertEqual(list(result),
+                         list(self.field.family.IF.intersection(
+                             self.field.applyLe(10),
+                             self.keyword.applyNotEq('k0'))))
+
+    def test_or_many_ranges(self):
+        from . import InRange
+        from . import Or
+        query = Or(*[InRange(self.field, n, n + 3) for n in range(0, 40, 4)])
+        self.assertEqual(len(self._assertSameResult(query)), 240)
+
+    def test_and_or_not(self):
+        from . import All
+        from . import And
+        from . import Eq
+        from . import Ge
+        from . import Not
+        from . import NotEq
+        from . import Or
+        query = And(
+            Or(Eq(self.keyword, 'k1'), Eq(self.keyword, 'k2'),
+               And(Ge(self.field, 40), Eq(self.keyword, 'k0'))),
+            Not(All(self.keyword, ['k0', 'k3'])),
+            NotEq(self.field, 10))
+        self._assertSameResult(query)
+        query = And(NotEq(self.field, 10), NotEq(self.field, 11))
+        self.assertEqual(len(self._assertSameResult(query)), 288)
+        query = Or(Not(Eq(self.field, 10)), Eq(self.keyword, 'k1'))
+        self._assertSameResult(query)
+
+    def test_and_empty(self):
+        from . import And
+        from . import Eq
+        from . import NotEq
+        query = And(Eq(self.field, 1), Eq(self.field, 2), Eq(self.field, 3))
+        self.assertEqual(len(self._assertSameResult(query)), 0)
+        query = And(Eq(self.field, 1), Eq(self.field, 2), NotEq(self.field, 3))
+        self.assertEqual(len(self._assertSameResult(query)), 0)
+
+    def test_and_filter_wins(self):
+        from . import And
+        from . import Eq
+        from . import Ge
+        query = And(Eq(self.field, 1), Ge(self.field, 0))
+        self.field.indexed_count = lambda: 10 ** 9
+        self.assertEqual(len(self._assertSameResult(query)), 6)
+
+    def test_weighted(self):
+        from BTrees import family64
+        from . import And
+        from . import Eq
+        from . import Or
+        from . import Query
+        IF = family64.IF
+
+        class Weighted(Query):
+            def _apply(self, names):
+                return IF.Bucket({1: 0.5, 3: 2.0, 7: 1.0})
+
+        query = Or(Eq(self.field, 1), Weighted(),
+                   And(Weighted(), Eq(self.field, 7)))
+        result = self._assertSameResult(query)
+        self.assertEqual(dict(result.items()),
+                         {1: 1.5, 3: 2.0, 7: 3.0, 51: 1.0, 101: 1.0,
+                          151: 1.0, 201: 1.0, 251: 1.0})
+
+
+class TestPlan(unittest.TestCase):
+
+    def setUp(self):
+        from ..field import FieldIndex
+        from ..keyword import KeywordIndex
+        self.field = FieldIndex(lambda docid, default: docid % 50)
+        self.keyword = KeywordIndex(
+            lambda docid, default: ['k%d' % (docid % n) for n in (3, 7)])
+        for docid in range(300):
+            self.field.index_doc(docid, docid)
+            self.keyword.index_doc(docid, docid)
+
+    def _assertSamePlan(self, query, names=None, prepare_names=None):
+        plan = query.prepare(prepare_names)
+        expected = query._optimize()._apply(names)
+        result = plan._apply(names)
+        self.assertEqual(hasattr(result, 'values'),
+                         hasattr(expected, 'values'))
+        self.assertEqual(list(result), list(expected))
+        return result
+
+    def test_prepare(self):
+        from . import Eq
+        from . import InRange
+        from . import Plan
+        from . import Ge
+        from . import Le
+        query = Ge(self.field, 10) & Le(self.field, 20) & Eq(self.keyword, 'k0')
+        plan = query.prepare()
+        self.assertTrue(isinstance(plan, Plan))
+        self.assertTrue(isinstance(plan.query.queries[0], InRange))
+        self.assertTrue(plan.index is self.field)
+        self.assertEqual(str(plan), 'Plan')
+        self.assertEqual(list(plan.iter_children()), [plan.query])
+        self.assertEqual(len(self._assertSamePlan(query)), 29)
+
+    def test_execute(self):
+        from . import Eq
+        from . import Name
+        query = Eq(self.field, Name('value')) & Eq(self.keyword, 'k1')
+        plan = query.prepare()
+        for value, lazy in ((4, False), (1, True)):
+            names = {'value': value}
+            expected = list(query.execute(names=names).all())
+            result = plan.execute(names=names, lazy=lazy)
+            self.assertEqual(list(result.all()), expected)
+            self.assertTrue(expected)
+
+    def test_execute_dummy_index(self):
+        from . import Plan
+        index = DummyIndex()
+        plan = Plan(DummyQuery(set([1]), index=index))
+        rs = plan.execute(names={'a': 1}, resolver=True, lazy=True)
+        self.assertEqual(rs, {'query': plan, 'names': {'a': 1},
+                              'resolver': True, 'lazy': True})
+        rs = plan.execute(False, {'a': 1}, True)
+        self.assertEqual(rs, {'query': plan, 'names': {'a': 1},
+                              'resolver': True, 'lazy': False})
+
+    def test_no_query_has_an_index(self):
+        from . import Or
+        class Dummy(object):
+            def iter_children(self):
+                return ()
+            def _optimize(self):
+                return self
+        self.assertRaises(ValueError, Or(Dummy(), Dummy()).prepare)
+
+    def test_names(self):
+        from . import Any
+        from . import Eq
+        from . import NotEq
+        from . import Name
+        query = (Eq(self.field, Name('value')) & Any(self.keyword, ['k1']) &
+                 NotEq(self.field, Name('other')))
+        for prepare_names in (None, {'value': 3, 'other': 1}):
+            for value in (1, 4, 7):
+                names = {'value': value, 'other': 1}
+                self._assertSamePlan(query, names, prepare_names)
+        plan = query.prepare()
+        self.assertRaises(NameError, plan._apply, {'other': 1})
+
+    def test_nested(self):
+        from . import And
+        from . import Eq
+        from . import Ge
+        from . import Lt
+        from . import Not
+        from . import NotEq
+        from . import Or
+        query = And(
+            Or(Eq(self.keyword, 'k1'), Eq(self.keyword, 'k2'),
+               And(Ge(self.field, 40), Eq(self.keyword, 'k0'))),
+            Not(Eq(self.keyword, 'k3')),
+            Or(Lt(self.field, 30), Eq(self.keyword, 'k5')),
+            NotEq(self.field, 10))
+        self.assertEqual(len(self._assertSamePlan(query)), 130)
+
+    def test_and_empty(self):
+        from BTrees import family64
+        from . import And
+        from . import Query
+        from . import Eq
+        from . import NotEq
+        from . import Or
+        IF = family64.IF
+        query = And(Eq(self.field, 1), Eq(self.keyword, 'k2'),
+                    Eq(self.field, 3))
+        self.assertEqual(len(self._assertSamePlan(query)), 0)
+        query = And(Eq(self.field, 1), Eq(self.field, 2), NotEq(self.field, 3))
+        self.assertEqual(len(self._assertSamePlan(query)), 0)
+        query = And(Eq(self.field, 1),
+                    Or(Eq(self.field, 2), Eq(self.field, 3)))
+        self.assertEqual(len(self._assertSamePlan(query)), 0)
+        query = And(Or(Eq(self.field, 2), Eq(self.field, 3)),
+                    Or(Eq(self.field, 4), Eq(self.field, 5)),
+                    Eq(self.field, 6))
+        self.assertEqual(len(self._assertSamePlan(query)), 0)
+
+        class Unestimated(Query):
+            def _apply(self, names):
+                return IF.Set()
+
+        # the Or has no estimate, so it comes last
+        query = And(Eq(self.field, 1),
+                    Or(Unestimated(), Eq(self.keyword, 'k9')))
+        self.assertEqual(len(self._assertSamePlan(query)), 0)
+
+    def test_and_only_negations(self):
+        from . import And
+        from . import NotEq
+        query = And(NotEq(self.field, 10), NotEq(self.keyword, 'k1'))
+        self.assertEqual(len(self._assertSamePlan(query)), 169)
+
+    def test_and_filter_wins(self):
+        from . import And
+        from . import Eq
+        from . import Ge
+        query = And(Eq(self.field, 1), Ge(self.field, 0))
+        self.field.indexed_count = lambda: 10 ** 9
+        self.assertEqual(len(self._assertSamePlan(query)), 6)
+
+    def test_and_negation_outside_index(self):
+        from . import And
+        from . import Any
+        from . import Le
+        from . import Not
+        from . import NotAny
+        from . import NotEq
+        from . import Or
+        for docid in range(300, 310):
+            self.field.index_doc(docid, docid)
+        IF = self.field.family.IF
+        for negation in (NotEq(self.keyword, 'k0'),
+                         Not(Any(self.keyword, ['k1'])),
+                         Or(NotEq(self.keyword, 'k0'),
+                            NotAny(self.keyword, ['k2']))):
+            query = And(Le(self.field, 10), negation)
+            expected = IF.intersection(self.field.applyLe(10),
+                                       negation._apply({}))
+            result = self._assertSamePlan(query)
+            self.assertEqual(list(result), list(expected))
+            self.assertEqual(list(query.prepare().execute().all()),
+                             list(expected))
+
+    def test_and_w_dummy_queries(self):
+        from . import And
+        left = DummyQuery(set([1, 2, 3]), index=DummyIndex())
+        right = DummyQuery(set([3, 4]), estimate=100)
+        query = And(left, right)
+        query.family = DummyFamily()
+        plan = query.prepare()
+        self.assertEqual(plan._apply(None), set([3]))
+        self.assertEqual(left.intersected, (right.results, left.results))
+
+    def test_vectorized(self):
+        from . import And
+        from . import Eq
+        from . import NotEq
+        query = And(Eq(self.keyword, 'k1'), NotEq(self.field, 10))
+        plan = query.prepare()
+        query.vectorized = True
+        plan.query.vectorized = True
+        self.assertEqual(list(plan._apply(None)), list(query._apply(None)))
+
+    def test_delegates_to_query(self):
+        from . import Eq
+        from . import Plan
+        calls = []
+        class Recorder(object):
+            index = DummyIndex()
+            def __getattr__(self, name):
+                return lambda *arg: calls.append((name, arg)) or name
+        plan = Plan(Eq(self.field, 1))
+        plan.query = Recorder()
+        self.assertEqual(plan._apply_array('names'), '_apply_array')
+        self.assertEqual(plan._estimate('names'), '_estimate')
+        self.assertEqual(plan._cache_key('names'), '_cache_key')
+        self.assertEqual(plan._stream('names'), '_stream')
+        self.assertEqual(plan._narrower('names'), '_narrower')
+        plan.flush(True)
+        self.assertEqual(calls, [('_apply_array', ('names',)),
+                                 ('_estimate', ('names',)),
+                                 ('_cache_key', ('names',)),
+                                 ('_stream', ('names',)),
+                                 ('_narrower', ('names',)),
+                                 ('flush', (True,))])
+
+class TestSharing(unittest.TestCase):
+
+    def setUp(self):
+        from ..field import FieldIndex
+        from ..keyword import KeywordIndex
+        self.field = FieldIndex(lambda docid, default: docid % 50)
+        self.keyword = KeywordIndex(
+            lambda docid, default: ['k%d' % (docid % n) for n in (3, 7)])
+        for docid in range(300):
+            self.field.index_doc(docid, docid)
+            self.keyword.index_doc(docid, docid)
+        self.applied = []
+        applyEq = self.keyword.applyEq
+        def counting(value):
+            self.applied.append(value)
+            return applyEq(value)
+        self.keyword.applyEq = counting
+
+    def test_simplify_duplicates(self):
+        from . import And
+        from . import Eq
+        from . import Or
+        a, b = Eq(self.field, 1), Eq(self.keyword, 'k0')
+        self.assertEqual(And(a, b, Eq(self.field, 1))._optimize(), And(a, b))
+        self.assertEqual(Or(a, b, Eq(self.keyword, 'k0'))._optimize(),
+                         Or(a, b))
+        self.assertEqual(Or(And(a, b), And(a, b))._optimize(), And(a, b))
+
+    def test_simplify_absorption(self):
+        from . import And
+        from . import Eq
+        from . import Or
+        a, b = Eq(self.field, 1), Eq(self.keyword, 'k0')
+        c = Eq(self.keyword, 'k1')
+        self.assertEqual(And(a, Or(b, a))._optimize(), a)
+        self.assertEqual(Or(And(a, b), a)._optimize(), a)
+        self.assertEqual(And(c, Or(a, b), a)._optimize(), And(c, a))
+        self.assertEqual(And(c, Or(a, b))._optimize(), And(c, Or(a, b)))
+
+    def test_simplify_keeps_weighted(self):
+        from ..text import TextIndex
+        from . import And
+        from . import Contains
+        from . import Eq
+        from . import Or
+        from . import optimize
+        text = TextIndex(lambda docid, default: 'red ' * (docid % 4 + 1))
+        for docid in range(300):
+            text.index_doc(docid, docid)
+        t, a = Contains(text, 'red'), Eq(self.field, 1)
+        queries = [Or(t, Contains(text, 'red')),
+                   And(t, Contains(text, 'red')),
+                   Or(t, And(Contains(text, 'red'), a)),
+                   Or(t, a, Eq(self.field, 1)),
+                   And(Eq(self.keyword, 'k0'), t, Eq(self.keyword, 'k0'))]
+        for query in queries:
+            self.assertEqual(query._optimize(), query)
+            self.assertEqual(list(optimize(query)._apply({}).items()),
+                             list(query._apply({}).items()))
+        other = DummyQuery('other')
+        query = Or(other, DummyQuery('other'))
+        self.assertEqual(query._simplify(query.queries), query.queries)
+
+    def test_share(self):
+        from . import And
+        from . import Eq
+        from . import Or
+        from . import _Memoized
+        from . import Le
+        from . import optimize
+        # the keyword subquery is the smallest, so each And applies it
+        query = Or(And(Eq(self.keyword, 'k0'), Le(self.field, 40)),
+                   And(Eq(self.keyword, 'k0'), Le(self.field, 30)),
+                   And(Eq(self.keyword, 'k0'), Le(self.field, 25)))
+        expected = list(query._optimize()._apply({}))
+        self.assertEqual(len(self.applied), 3)
+        del self.applied[:]
+        shared = optimize(query)
+        self.assertTrue(isinstance(shared, _Memoized))
+        self.assertEqual(str(shared), 'Memoized')
+        self.assertEqual(list(shared.iter_children()), [shared.query])
+        first, second, third = shared.query.queries
+        self.assertTrue(first.queries[0] is second.queries[0])
+        self.assertTrue(first.queries[0] is third.queries[0])
+        self.assertEqual(str(first.queries[0]), 'Shared')
+        self.assertEqual(first.queries[0].uses, 3)
+        self.assertEqual(list(first.queries[0].iter_children()),
+                         [Eq(self.keyword, 'k0')])
+        self.assertEqual(shared, optimize(query))
+        self.assertEqual(list(shared._apply({})), expected)
+        self.assertEqual(self.applied, ['k0'])
+        self.assertEqual(list(shared._apply(None)), expected)
+        self.assertEqual(self.applied, ['k0', 'k0'])
+
+    def test_share_nested(self):
+        from . import And
+        from . import Eq
+        from . import Or
+        from . import optimize
+        from . import Le
+        either = Or(Eq(self.keyword, 'k1'), Eq(self.field, 2))
+        query = Or(And(Le(self.field, 40), either),
+                   And(Le(self.field, 30), either),
+                   And(Le(self.field, 20), Eq(self.keyword, 'k1')))
+        expected = list(query._optimize()._apply({}))
+        del self.applied[:]
+        shared = optimize(query)
+        first, second, third = shared.query.queries
+        self.assertTrue(first.queries[1] is second.queries[1])
+        self.assertTrue(first.queries[1].query.queries[0] is
+                        third.queries[1])
+        self.assertEqual(list(shared._apply({})), expected)
+        self.assertEqual(self.applied, ['k1'])
+
+    def test_share_nothing(self):
+        from . import And
+        from . import Eq
+        from . import NotEq
+        from . import Or
+        from . import optimize
+        query = Or(And(NotEq(self.keyword, 'k0'), Eq(self.field, 1)),
+                   And(NotEq(self.keyword, 'k0'), Eq(self.field, 2)))
+        self.assertEqual(optimize(query), query)
+        query = Eq(self.field, 1)
+        self.assertTrue(optimize(query) is query)
+
+    def test_execute(self):
+        from . import And
+        from . import Eq
+        from . import Le
+        from . import Or
+        from . import _Memoized
+        query = Or(And(Eq(self.keyword, 'k0'), Le(self.field, 40)),
+                   And(Eq(self.keyword, 'k0'), Le(self.field, 30)))
+        expected = list(query._optimize()._apply({}))
+        result = query.execute()
+        self.assertEqual(list(result.all(resolve=False)), expected)
+        memoized = query.execute(lazy=True).query
+        self.assertTrue(isinstance(memoized, _Memoized))
+        result = memoized.execute(lazy=True)
+        self.assertEqual(list(result.all(resolve=False)), expected)
+        self.assertEqual(len(result), len(expected))
+        self.assertEqual(list(result.all(resolve=False)), expected)
+        self.assertEqual(memoized.negate(), query.negate())
+
+    def test_narrower(self):
+        from BTrees import family64
+        from . import And
+        from . import Eq
+        from . import Or
+        from . import optimize
+        query = Or(And(Eq(self.keyword, 'k0'), Eq(self.field, 1)),
+                   And(Eq(self.keyword, 'k0'), Eq(self.field, 2)))
+        narrow = optimize(query)._narrower({})
+        result = narrow(family64.IF.Set(range(0, 300, 2)))
+        self.assertEqual(list(result), [102, 252])
+
+    def test_prepare(self):
+        from . import And
+        from . import Eq
+        from . import Or
+        from . import Le
+        either = Or(Eq(self.field, 2), Eq(self.keyword, 'k1'))
+        query = Or(And(Eq(self.keyword, 'k0'), Le(self.field, 40)),
+                   And(Eq(self.keyword, 'k0'), either),
+                   And(either, Le(self.field, 30)),
+                   And(Or(Eq(self.keyword, 'k0'), Eq(self.field, 7)),
+                       Le(self.field, 35)))
+        expected = list(query._optimize()._apply({}))
+        del self.applied[:]
+        plan = query.prepare()
+        self.assertEqual(list(plan._apply({})), expected)
+        self.assertEqual(sorted(self.applied), ['k0', 'k1'])
+
+    def test_vectorized(self):
+        from . import And
+        from . import Eq
+        from . import Or
+        from . import arrays
+        if arrays.numpy is None: # pragma: no cover
+            return
+        from . import Le
+        query = Or(And(Eq(self.keyword, 'k0'), Le(self.field, 40)),
+                   And(Eq(self.keyword, 'k0'), Le(self.field, 30)))
+        expected = list(query._optimize()._apply({}))
+        del self.applied[:]
+        plan = query.prepare()
+        plan.query.query.vectorized = True
+        self.assertEqual(list(plan._apply({})), expected)
+        self.assertEqual(self.applied, ['k0'])
+
+    def test_delegates_to_query(self):
+        from . import Eq
+        from . import _Memoized
+        from . import _Shared
+        calls = []
+        class Recorder(object):
+            def __getattr__(self, name):
+                return lambda *arg: calls.append((name, arg)) or name
+        shared = _Shared(Eq(self.field, 1))
+        self.assertEqual(list(shared._apply({})), [1, 51, 101, 151, 201, 251])
+        shared.query = Recorder()
+        memoized = _Memoized(shared)
+        memoized.query = Recorder()
+        self.assertEqual(shared._estimate('names'), '_estimate')
+        self.assertEqual(shared._cache_key('names'), '_cache_key')
+        self.assertEqual(shared._filter_wins(1, 2), '_filter_wins')
+        self.assertEqual(shared.filter('left', 'names'), 'filter')
+        self.assertEqual(shared._narrower('names'), '_narrower')
+        self.assertEqual(shared.negate(), 'negate')
+        shared.flush(True)
+        self.assertEqual(memoized._apply_array({}), '_apply_array')
+        self.assertEqual(memoized._estimate('names'), '_estimate')
+        self.assertEqual(memoized._cache_key('names'), '_cache_key')
+        memoized.flush(False)
+        self.assertEqual(calls, [('_estimate', ('names',)),
+                                 ('_cache_key', ('names',)),
+                                 ('_filter_wins', (2, 2)),
+                                 ('filter', ('left', 'names')),
+                                 ('_narrower', ('names',)),
+                                 ('negate', ()),
+                                 ('flush', (True,)),
+                                 ('_apply_array', ({},)),
+                                 ('_estimate', ('names',)),
+                                 ('_cache_key', ('names',)),
+                                 ('flush', (False,))])
+
 class DummyIndex(object):
     def __init__(self, name=None):
         self.name = name
@@ -1430,19 +2740,52 @@ class DummyIndex(object):
         self.not_range = (start, end, start_exclusive, end_exclusive)
         return self.not_range
 
+    def docids(self):
+        from BTrees import family64
+        return family64.IF.Set(range(10))
+
+    def estimate(self, query):
+        self.estimated = query
+        return 42
+
     def qname(self):
         return str(self.name)
 
-    def resultset_from_query(self, query, names=None, resolver=None):
-        return {'query':query, 'names':names, 'resolver':resolver}
+    def resultset_from_query(self, query, names=None, resolver=None,
+                             lazy=False):
+        return {'query':query, 'names':names, 'resolver':resolver,
+                'lazy':lazy}
+
+class DummyFilterIndex(DummyIndex):
+    def indexed_count(self):
+        return 1000
+
+    def filter(self, docids, query):
+        self.filtered = (docids, query)
+        return docids
+
+
+class DummyGenerationIndex(DummyIndex):
+    def __init__(self, gen=1):
+        self.gen = gen
+
+    def generation(self):
+        return self.gen
+
 
 class DummyFamily(object):
     @property
     def IF(self):
         return self
 
-    def Set(self):
-        return set()
+    def Set(self, items=()):
+        return set(items)
+
+    def difference(self, left, right):
+        return left - right
+
+    def multiunion(self, sets):
+        return set().union(*sets)
 
 
 class DummyQuery(object):
@@ -1450,16 +2793,36 @@ class DummyQuery(object):
     negated = False
     flushed = False
     intersected = None
-    unioned = None
+    filtered = None
+    filter_wins = False
 
-    def __init__(self, results, index=None):
+    def __init__(self, results, index=None, estimate=None, cache_key=None):
         self.results = results
         self.index = index
+        self.estimate = estimate
+        self.cache_key = cache_key
 
     def _apply(self, names):
         self.applied = True
         return self.results
 
+    def _estimate(self, names):
+        return self.estimate
+
+    def _cache_key(self, names):
+        return self.cache_key
+
+    def _filter_wins(self, numdocids, estimate):
+        return self.filter_wins
+
+    def _narrower(self, names):
+        return lambda docids: type(docids)(
+            [x for x in docids if x in self.results])
+
+    def filter(self, theset, names):
+        self.filtered = theset
+        return theset & self._apply(names)
+
     def negate(self):
         self.negated = True
         return self
@@ -1476,8 +2839,3 @@ class DummyQuery(object):
             return result
         self.intersected = (theset, result)
         return theset & result
-
-    def union(self, theset, names):
-        result = self._apply(names)
-        self.unioned = (theset, result)
-        return theset | result
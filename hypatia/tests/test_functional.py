@@ -163,6 +163,117 @@ class TestQueryExecution(unittest.TestCase, _CatalogMaker):
         self.assertEqual(len(resultset), 2)
         self.assertEqual(list(resultset.ids), [4, 5])
 
+class TestLazyQueryExecution(unittest.TestCase, _CatalogMaker):
+    def _get_query(self):
+        return (
+            self.allowed.any(['a', 'b']) &
+            self.name.any(['name1', 'name2', 'name3', 'name4', 'name5']) &
+            self.title.noteq('title3') &
+            self.text.contains('body')
+            )
+
+    def test_it(self):
+        self._makeCatalog()
+        resultset = self._get_query().execute(lazy=True)
+        self.assertEqual(resultset.first(), 1)
+        self.assertEqual(list(resultset.ids), [1, 2, 4, 5])
+        self.assertEqual(len(resultset), 4)
+
+    def test_sort(self):
+        self._makeCatalog()
+        query = self._get_query()
+        expected = list(query.execute().sort(self.name, reverse=True).ids)
+        for limit in (1, 2, 10):
+            resultset = query.execute(lazy=True).sort(
+                self.name, reverse=True, limit=limit)
+            self.assertEqual(list(resultset.ids), expected[:limit])
+
+class TestCachedCatalogQuery(unittest.TestCase, _CatalogMaker):
+    def _get_query(self):
+        return (
+            self.allowed.any(['a', 'b']) &
+            self.name.noteq(query.Name('name')) &
+            self.text.contains('body')
+            )
+
+    def test_it(self):
+        from ..catalog import CatalogQuery
+        catalog = self._makeCatalog()
+        catalog.query_cache_size = 10
+        q = CatalogQuery(catalog)
+        names = {'name': 'name1'}
+        numdocs, first = q.query(self._get_query(), names=names)
+        self.assertEqual(list(first), [2, 4, 5])
+        numdocs, second = q.query(self._get_query(), names=names)
+        self.assertTrue(second is first)
+        numdocs, result = q.query(self._get_query(), names={'name': 'name2'})
+        self.assertEqual(list(result), [1, 4, 5])
+        catalog.index_doc(7, Content('name7', 'title7', 'body', ['a']))
+        numdocs, result = q.query(self._get_query(), names=names)
+        self.assertEqual(list(result), [2, 4, 5, 7])
+
+    def test_uncommitted_changes_not_cached(self):
+        import transaction
+        from ZODB.DB import DB
+        from ZODB.MappingStorage import MappingStorage
+        from ..catalog import CatalogQuery
+        db = DB(MappingStorage())
+        try:
+            conn = db.open()
+            catalog = conn.root()['catalog'] = self._makeCatalog()
+            catalog.query_cache_size = 10
+            transaction.commit()
+            q = CatalogQuery(catalog)
+            q.query(self._get_query(), names={'name': 'name1'})
+            self.assertEqual(len(catalog._v_query_cache), 1)
+            catalog.index_doc(7, Content('name7', 'title7', 'body', ['a']))
+            numdocs, result = q.query(self._get_query(),
+                                      names={'name': 'name1'})
+            self.assertEqual(list(result), [2, 4, 5, 7])
+            self.assertEqual(len(catalog._v_query_cache), 1)
+            transaction.abort()
+            numdocs, result = q.query(self._get_query(),
+                                      names={'name': 'name1'})
+            self.assertEqual(list(result), [2, 4, 5])
+        finally:
+            transaction.abort()
+            db.close()
+
+class TestBulkIndexing(unittest.TestCase, _CatalogMaker):
+    def test_it(self):
+        from ..catalog import CatalogQuery
+        expected = self._makeCatalog()
+        catalog = self._makeCatalog()
+        catalog.reset()
+        catalog.index_docs(
+            (docid, Content(name, 'title', text, allowed))
+            for docid, name, text, allowed in [
+                (1, 'name1', 'body one', ['a']),
+                (2, 'name2', 'body two', ['b']),
+                (3, 'name3', 'body three', ['c']),
+                (4, 'name4', 'body four', ['a', 'b']),
+                (5, 'name5', 'body five', ['a', 'b', 'c']),
+                (6, 'name6', 'body six', ['d']),
+                ])
+        catalog.index_docs([
+            (3, Content('name3', 'title3', 'body three', ['c'])),
+            (4, Content('name4', None, 'body four', ['a', 'b'])),
+            (1, Content('name1', 'title1', 'body one', ['a'])),
+            (2, Content('name2', 'title2', 'body two', ['b'])),
+            (5, Content('name5', 'title5', 'body five', ['a', 'b', 'c'])),
+            (6, Content('name6', 'title6', 'body six', ['d'])),
+            ])
+        query = (
+            "allowed in any(['a', 'b']) and not(title == 'title2') "
+            "and 'body' in text"
+            )
+        self.assertEqual(list(CatalogQuery(catalog)(query)[1]),
+                         list(CatalogQuery(expected)(query)[1]))
+        for name in ('name', 'title', 'text', 'allowed'):
+            for docid in range(1, 7):
+                self.assertEqual(catalog[name].document_repr(docid),
+                                 expected[name].document_repr(docid))
+
 class TestFieldIndexResultSetSortStabilityGuarantee(unittest.TestCase):
     def _makeCatalog(self):
         from ..catalog import Catalog
@@ -13,6 +13,7 @@
 ##############################################################################
 """Text index.
 """
+import heapq
 import sys
 
 from persistent import Persistent
@@ -20,6 +21,9 @@ from zope.interface import implementer
 
 from hypatia.interfaces import (
     IIndex,
+    IIndexEstimate,
+    IIndexGeneration,
+    IIndexMerge,
     IIndexStatistics,
     IIndexSort,
     )
@@ -35,16 +39,25 @@ from .queryparser import QueryParser
 from .parsetree import ParseError
 
 from ..util import BaseIndexMixin 
+from ..util import LRUCache
 from .. import query
 
 _marker = object()
 
 @implementer(
     IIndex,
+    IIndexEstimate,
+    IIndexGeneration,
+    IIndexMerge,
     IIndexSort,
     IIndexStatistics
     )
 class TextIndex(BaseIndexMixin, Persistent):
+
+    parse_cache_size = 1000
+    # queries against this index produce weighted results
+    weighted = True
+
     def __init__(self, discriminator, lexicon=None, index=None,
                  family=None):
         if family is not None:
@@ -66,7 +79,9 @@ class TextIndex(BaseIndexMixin, Persistent):
 
     def reset(self):
         self._not_indexed = self.family.IF.TreeSet()
+        self._all_docids = self.family.IF.TreeSet()
         self.index.reset()
+        self._bump_generation()
 
     def document_repr(self, docid, default=None):
         return self.index.document_repr(docid, default)
@@ -79,6 +94,8 @@ class TextIndex(BaseIndexMixin, Persistent):
             self.unindex_doc(docid)
             # Store docid in set of unindexed docids
             self._not_indexed.add(docid)
+            self._add_docids((docid,))
+            self._bump_generation()
             return None
 
         if docid in self._not_indexed:
@@ -86,12 +103,42 @@ class TextIndex(BaseIndexMixin, Persistent):
             self._not_indexed.remove(docid)
 
         self.index.index_doc(docid, text)
+        self._add_docids((docid,))
+        self._bump_generation()
+
+    def index_docs(self, pairs):
+        _not_indexed = self._not_indexed
+        texts = []
+        for docid, obj in pairs:
+            text = self.discriminate(obj, _marker)
+            if text is _marker or docid in _not_indexed:
+                # one document at a time, in order, for the rare cases
+                self._index_texts(texts)
+                texts = []
+                self.index_doc(docid, obj)
+            else:
+                texts.append((docid, text))
+        self._index_texts(texts)
+        self._bump_generation()
+
+    def _index_texts(self, texts):
+        self.index.index_docs(texts)
+        self._add_docids([docid for docid, text in texts])
+
+    def merge(self, other):
+        """ See interface IIndexMerge """
+        self._not_indexed.update(other._not_indexed)
+        self._add_docids(other.docids())
+        self.index.merge(other.index)
+        self._bump_generation()
 
     def unindex_doc(self, docid):
+        self._discard_docid(docid)
         _not_indexed = self._not_indexed
         if docid in _not_indexed:
             _not_indexed.remove(docid)
         self.index.unindex_doc(docid)
+        self._bump_generation()
 
     def reindex_doc(self, docid, object):
         # index_doc knows enough about reindexing to do the right thing
@@ -111,8 +158,23 @@ class TextIndex(BaseIndexMixin, Persistent):
         return self.index.word_count()
 
     def parse_query(self, querytext):
-        parser = QueryParser(self.lexicon)
-        tree = parser.parseQuery(querytext)
+        """ Return the parse tree of ``querytext``.
+
+        The last ``parse_cache_size`` trees are remembered for their query
+        text and lexicon.  The cache is volatile, so each database
+        connection keeps its own.
+        """
+        if not self.parse_cache_size:
+            return QueryParser(self.lexicon).parseQuery(querytext)
+        cache = getattr(self, '_v_parse_cache', None)
+        if cache is None or cache.maxsize != self.parse_cache_size:
+            cache = self._v_parse_cache = LRUCache(self.parse_cache_size)
+        # A Lexicon parses leading glob characters only with n-grams
+        key = (querytext, self.lexicon,
+               getattr(self.lexicon, '_ngrams', None) is None)
+        tree = cache.get(key)
+        if tree is None:
+            tree = cache[key] = QueryParser(self.lexicon).parseQuery(querytext)
         return tree
 
     def check_query(self, querytext):
@@ -128,24 +190,80 @@ class TextIndex(BaseIndexMixin, Persistent):
         tree = self.parse_query(querytext)
         results = tree.executeQuery(self.index)
         if results:
-            qw = self.index.query_weight(tree.terms())
-            
-            # Hack to avoid ZeroDivisionError
-            if qw == 0:
-                qw = 1.0
-
-            qw *= 1.0
-
-            for docid, score in results.items():
-                try:
-                    results[docid] = score/qw
-                except TypeError:
-                    # We overflowed the score, perhaps wildly unlikely.
-                    # Who knows.
-                    results[docid] = sys.maxsize / 10.0
+            self._normalize(tree, results, results.items())
+        return results
+
+    def apply_top(self, querytext, limit):
+        """ Return the ``limit`` best scoring documents matching
+        ``querytext``, as a mapping of docid to the score ``apply`` would
+        give them.  ``sort`` orders them.
 
+        Queries made only of words, globs and ``OR`` are answered by the
+        index's ``search_top``, if it has one (``OkapiIndex`` does), which
+        avoids scoring documents that can't make the cut.  Others are
+        scored in full but only the best ``limit`` scores are normalized.
+        """
+        tree = self.parse_query(querytext)
+        search_top = getattr(self.index, 'search_top', None)
+        wids = self._disjunction_wids(tree)
+        if search_top is not None and wids:
+            best = search_top(wids, limit)
+        else:
+            results = tree.executeQuery(self.index)
+            if not results:
+                return results
+            best = heapq.nlargest(
+                limit, [(score, docid) for docid, score in results.items()])
+        return self._normalize(tree, self.family.IF.Bucket(),
+                               [(docid, score) for score, docid in best])
+
+    def _disjunction_wids(self, tree):
+        # The wids whose scores add up to the score of each document matched
+        # by tree, or None if tree is more than an OR of words and globs
+        node_type = tree.nodeType()
+        if node_type == 'ATOM':
+            return self.lexicon.termToWordIds(tree.getValue())
+        if node_type == 'GLOB':
+            return self.lexicon.globToWordIds(tree.getValue())
+        if node_type == 'OR':
+            wids = []
+            for node in tree.getValue():
+                node_wids = self._disjunction_wids(node)
+                if node_wids is None:
+                    return None
+                wids.extend(node_wids)
+            return wids
+        return None
+
+    def _normalize(self, tree, results, items):
+        # Store each (docid, score) of items in results, as a fraction of
+        # the query's maximum score
+        qw = self.index.query_weight(tree.terms())
+
+        # Hack to avoid ZeroDivisionError
+        if qw == 0:
+            qw = 1.0
+
+        qw *= 1.0
+
+        for docid, score in items:
+            try:
+                results[docid] = score/qw
+            except TypeError:
+                # We overflowed the score, perhaps wildly unlikely.
+                # Who knows.
+                results[docid] = sys.maxsize / 10.0
         return results
  
+    def estimate(self, querytext):
+        """ See interface IIndexEstimate """
+        tree = self.parse_query(querytext)
+        estimate = tree.estimateQuery(self.index)
+        if estimate is None:
+            # nothing constrains the result, so assume the worst
+            return self.indexed_count()
+        return min(estimate, self.indexed_count())
+
     def applyContains(self, value):
         return self.apply(value)
 
@@ -189,9 +307,12 @@ class TextIndex(BaseIndexMixin, Persistent):
         items = [(weight, docid) for (docid, weight) in result.items()]
         # when reverse is false, output largest weight first.
         # when reverse is true, output smallest weight first.
-        items.sort(reverse=not reverse)
-        result = [docid for (weight, docid) in items]
         if limit:
-            result = result[:limit]
-        return result
+            if reverse:
+                items = heapq.nsmallest(limit, items)
+            else:
+                items = heapq.nlargest(limit, items)
+        else:
+            items.sort(reverse=not reverse)
+        return [docid for (weight, docid) in items]
     
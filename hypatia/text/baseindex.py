@@ -13,7 +13,11 @@
 ##############################################################################
 """Abstract base class for full text index with relevance ranking.
 """
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
 import math
+import sys
 
 from persistent import Persistent
 from zope.interface import implementer
@@ -48,6 +52,11 @@ class BaseIndex(Persistent):
 
     lexicon = property(lambda self: self._lexicon,)
 
+    # wid -> {docid -> deltas of the word's positions in the document's
+    # list of wids, as packed by _encode_positions}; None unless positions
+    # are enabled.  See ``enable_positions``.
+    _positions = None
+
     def __init__(self, lexicon, family=None):
         if family is not None:
             self.family = family
@@ -86,6 +95,67 @@ class BaseIndex(Persistent):
         self.word_count = Length.Length()
         self.indexed_count = Length.Length()
 
+        if self._positions is not None:
+            self._positions = IOBTree()
+
+    def enable_positions(self):
+        """ Build a positional posting store from the current contents of
+        the index, and keep it up to date from now on.  Phrase searches
+        then check where the phrase's words occur in each candidate
+        document from their postings, rather than by searching the whole
+        document's list of words. """
+        self._positions = IOBTree()
+        self._add_positions(self._docwords.keys())
+
+    def disable_positions(self):
+        """ Discard the positional posting store. """
+        self._positions = None
+
+    def _add_positions(self, docids):
+        # Add the positions of each word of newly indexed documents
+        positions = self._positions
+        if positions is None:
+            return
+        for docid in docids:
+            for wid, at in _word_positions(self.get_words(docid)).items():
+                doc2positions = positions.get(wid)
+                if doc2positions is None:
+                    doc2positions = positions[wid] = self.family.IO.BTree()
+                doc2positions[docid] = _encode_positions(at)
+
+    def _remove_positions(self, docid):
+        # Remove the positions of a document about to be unindexed or
+        # reindexed
+        positions = self._positions
+        if positions is None:
+            return
+        for wid in set(self.get_words(docid)):
+            doc2positions = positions[wid]
+            del doc2positions[docid]
+            if not doc2positions:
+                del positions[wid]
+
+    def get_positions(self, docid, wids):
+        """Return a mapping of each of ``wids`` which occurs in document
+        ``docid`` to the ascending list of its positions in the document's
+        list of wids (see ``get_words``).
+
+        Uses the positional posting store if positions are enabled, and
+        decodes the document's words otherwise.
+        """
+        positions = self._positions
+        if positions is None:
+            at = _word_positions(self.get_words(docid))
+            return dict([(wid, at[wid]) for wid in wids if wid in at])
+        result = {}
+        for wid in wids:
+            doc2positions = positions.get(wid)
+            if doc2positions is not None:
+                code = doc2positions.get(docid)
+                if code is not None:
+                    result[wid] = list(_decode_positions(code))
+        return result
+
     def word_count(self):
         """Return the number of words in the index."""
         # This must be overridden by subclasses which do not set the
@@ -121,6 +191,7 @@ class BaseIndex(Persistent):
         self._mass_add_wordinfo(wid2weight, docid)
         self._docweight[docid] = docweight
         self._docwords[docid] = widcode.encode(wids)
+        self._add_positions((docid,))
         try:
             self.indexed_count.change(1)
         except AttributeError:
@@ -128,6 +199,108 @@ class BaseIndex(Persistent):
             self.indexed_count = Length.Length(len(self._docweight))
         return len(wids)
 
+    def index_docs(self, pairs):
+        new = {}
+        for docid, text in pairs:
+            if docid in self._docwords or docid in new:
+                # reindexing takes the one-document-at-a-time path
+                self._add_docs(new)
+                new = {}
+                self.index_doc(docid, text)
+            else:
+                new[docid] = self._lexicon.sourceToWordIds(text)
+        self._add_docs(new)
+
+    # A subclass may wish to extend or override this.  This is the bulk
+    # version of index_doc for a mapping of docid -> wids of documents which
+    # are not yet indexed; each word's docid->weight map is written once.
+    def _add_docs(self, docid2wids):
+        if not docid2wids:
+            return 0
+        count = 0
+        wid2docs = {}
+        docweights = {}
+        docwords = {}
+        for docid, wids in docid2wids.items():
+            wid2weight, docweight = self._get_frequencies(wids)
+            for wid, weight in wid2weight.items():
+                docs = wid2docs.get(wid)
+                if docs is None:
+                    wid2docs[wid] = docs = {}
+                docs[docid] = weight
+            docweights[docid] = docweight
+            docwords[docid] = widcode.encode(wids)
+            count += len(wids)
+
+        dicttype = type({})
+        get_doc2score = self._wordinfo.get
+        new_word_count = 0
+        for wid, docs in wid2docs.items():
+            doc2score = get_doc2score(wid)
+            if doc2score is None:
+                doc2score = docs
+                new_word_count += 1
+            else:
+                doc2score.update(docs)
+            if (isinstance(doc2score, dicttype) and
+                len(doc2score) > self.DICT_CUTOFF):
+                doc2score = self.family.IF.BTree(doc2score)
+            self._wordinfo[wid] = doc2score # not redundant:  Persistency!
+
+        self._docweight.update(docweights)
+        self._docwords.update(docwords)
+        self._add_positions(docid2wids)
+        try:
+            self.word_count.change(new_word_count)
+        except AttributeError:
+            # upgrade word_count to Length object
+            self.word_count = Length.Length(len(self._wordinfo))
+        try:
+            self.indexed_count.change(len(docid2wids))
+        except AttributeError:
+            # upgrade indexed_count to Length object
+            self.indexed_count = Length.Length(len(self._docweight))
+        return count
+
+    # A subclass may wish to extend this.  Add the documents of another index
+    # of the same kind (usually built in another process); word ids are
+    # translated through this index's lexicon.
+    def merge(self, other):
+        wids = self._lexicon.merge(other._lexicon)
+        dicttype = type({})
+        get_doc2score = self._wordinfo.get
+        new_word_count = 0
+        for wid, docs in other._wordinfo.items():
+            wid = wids[wid]
+            doc2score = get_doc2score(wid)
+            if doc2score is None:
+                doc2score = dict(docs)
+                new_word_count += 1
+            else:
+                doc2score.update(docs)
+            if (isinstance(doc2score, dicttype) and
+                len(doc2score) > self.DICT_CUTOFF):
+                doc2score = self.family.IF.BTree(doc2score)
+            self._wordinfo[wid] = doc2score # not redundant:  Persistency!
+
+        self._docweight.update(other._docweight)
+        decode = widcode.decode
+        encode = widcode.encode
+        self._docwords.update(
+            [(docid, encode([wids[wid] for wid in decode(code)]))
+             for docid, code in other._docwords.items()])
+        self._add_positions(other._docwords.keys())
+        try:
+            self.word_count.change(new_word_count)
+        except AttributeError:
+            # upgrade word_count to Length object
+            self.word_count = Length.Length(len(self._wordinfo))
+        try:
+            self.indexed_count.change(len(other._docwords))
+        except AttributeError:
+            # upgrade indexed_count to Length object
+            self.indexed_count = Length.Length(len(self._docweight))
+
     # A subclass may wish to extend or override this.  This is for adjusting
     # to a new version of a doc that already exists.  The goal is to be
     # faster than simply unindexing the old version in its entirety and then
@@ -164,8 +337,10 @@ class BaseIndex(Persistent):
             if old_wid2w[wid] != newscore:
                 self._add_wordinfo(wid, newscore, docid)
 
+        self._remove_positions(docid)
         self._docweight[docid] = new_docw
         self._docwords[docid] = widcode.encode(new_wids)
+        self._add_positions((docid,))
         return len(new_wids)
 
     # Subclass must override.
@@ -188,6 +363,7 @@ class BaseIndex(Persistent):
             return
         for wid in self.family.IF.TreeSet(self.get_words(docid)).keys():
             self._del_wordinfo(wid, docid)
+        self._remove_positions(docid)
         del self._docwords[docid]
         del self._docweight[docid]
         try:
@@ -218,14 +394,76 @@ class BaseIndex(Persistent):
         hits = mass_weightedIntersection(scores, self.family)
         if not hits:
             return hits
+        result = self.family.IF.BTree()
+        if self._positions is not None:
+            first = self._positions[wids[0]]
+            rest = [(offset, self._positions[wid])
+                    for offset, wid in enumerate(wids) if offset]
+            for docid, weight in hits.items():
+                # where the phrase may start, narrowed by each later word
+                starts = list(_decode_positions(first.get(docid)))
+                for offset, doc2positions in rest:
+                    if not starts:
+                        break
+                    at = set(_decode_positions(doc2positions.get(docid)))
+                    starts = [start for start in starts
+                              if start + offset in at]
+                if starts:
+                    result[docid] = weight
+            return result
         code = widcode.encode(wids)
+        for docid, weight in hits.items():
+            if _contains_code(self._docwords[docid], code):
+                result[docid] = weight
+        return result
+
+    def search_near(self, terms, distance, ordered=False):
+        wids = self._lexicon.termToWordIds(terms)
+        cleaned_wids = self._remove_oov_wids(wids)
+        if len(wids) != len(cleaned_wids):
+            # At least one wid was OOV:  can't possibly find it.
+            return self.family.IF.BTree()
+        if not ordered:
+            # A word occurring twice in any order is the same as once.
+            wids = list(dict.fromkeys(wids))
+        hits = mass_weightedIntersection(self._search_wids(wids), self.family)
+        if not hits:
+            return hits
+        span = _ordered_span if ordered else _span
+        # The first and last words may be this far apart.
+        window = distance + len(wids) - 1
         result = self.family.IF.BTree()
         for docid, weight in hits.items():
-            docwords = self._docwords[docid]
-            if docwords.find(code) >= 0:
+            positions = self.get_positions(docid, wids)
+            found = span([positions.get(wid, ()) for wid in wids])
+            if found is not None and found <= window:
                 result[docid] = weight
         return result
 
+    def estimate(self, term):
+        wids = self._lexicon.termToWordIds(term)
+        if not wids:
+            return None # All docs match
+        return self._estimate_wids_union(self._remove_oov_wids(wids))
+
+    def estimate_glob(self, pattern):
+        wids = self._lexicon.globToWordIds(pattern)
+        return self._estimate_wids_union(self._remove_oov_wids(wids))
+
+    def estimate_phrase(self, phrase):
+        wids = self._lexicon.termToWordIds(phrase)
+        cleaned_wids = self._remove_oov_wids(wids)
+        if not cleaned_wids or len(wids) != len(cleaned_wids):
+            # At least one wid was OOV:  can't possibly find it.
+            return 0
+        # A phrase can't match more documents than its rarest word does.
+        return min([len(self._wordinfo[wid]) for wid in cleaned_wids])
+
+    def _estimate_wids_union(self, wids):
+        # Sum of the document frequencies, capped at the number of documents.
+        total = sum([len(self._wordinfo[wid]) for wid in wids])
+        return min(total, len(self._docweight))
+
     def _remove_oov_wids(self, wids):
         return [wid for wid in wids if wid in self._wordinfo]
 
@@ -334,6 +572,91 @@ class BaseIndex(Persistent):
                 # upgrade word_count to Length object
                 self.word_count = Length.Length(len(self._wordinfo))
 
+def _word_positions(wids):
+    # Map each wid in a list of wids to the ascending list of its positions
+    positions = {}
+    for i, wid in enumerate(wids):
+        at = positions.get(wid)
+        if at is None:
+            positions[wid] = [i]
+        else:
+            at.append(i)
+    return positions
+
+def _span(positions):
+    # The least distance between the first and last of one position chosen
+    # from each of a sequence of ascending lists of positions, found by
+    # sliding a window over all of them in order
+    merged = sorted([(at, i) for i, ats in enumerate(positions) for at in ats])
+    counts = [0] * len(positions)
+    missing = len(positions)
+    best = None
+    first = 0
+    for at, i in merged:
+        if not counts[i]:
+            missing -= 1
+        counts[i] += 1
+        while not missing:
+            start, j = merged[first]
+            if best is None or at - start < best:
+                best = at - start
+            counts[j] -= 1
+            if not counts[j]:
+                missing += 1
+            first += 1
+    return best
+
+def _ordered_span(positions):
+    # Like _span, but the chosen positions must ascend in sequence order;
+    # each start is best followed by the first position of each next list
+    # after the last one chosen
+    best = None
+    for start in positions[0]:
+        end = start
+        for ats in positions[1:]:
+            i = bisect_right(ats, end)
+            if i == len(ats):
+                # No later start can be followed either.
+                return best
+            end = ats[i]
+        if best is None or end - start < best:
+            best = end - start
+    return best
+
+def _contains_code(docwords, code):
+    # Does the WidCode'd docwords contain the WidCode'd code?  A match must
+    # end where an encoding does: the code of a wid is a prefix of the
+    # codes of larger wids.
+    end = len(code)
+    i = docwords.find(code)
+    while i >= 0:
+        if i + end == len(docwords) or docwords[i + end] >= '\x80':
+            return True
+        i = docwords.find(code, i + 1)
+    return False
+
+def _encode_positions(positions):
+    # Pack an ascending list of positions as the deltas between them, two
+    # bytes each if they fit, preceded by the array typecode
+    deltas = array('I', [positions[0]])
+    deltas.extend([b - a for a, b in zip(positions, positions[1:])])
+    if max(deltas) < 0x10000:
+        deltas = array('H', deltas)
+    if sys.byteorder != 'little': # pragma: no cover
+        deltas.byteswap()
+    return deltas.typecode.encode('ascii') + deltas.tobytes()
+
+def _decode_positions(code):
+    # The inverse of _encode_positions, as an iterator; None or an empty
+    # string decodes to no positions
+    if not code:
+        return iter(())
+    deltas = array(chr(code[0]))
+    deltas.frombytes(code[1:])
+    if sys.byteorder != 'little': # pragma: no cover
+        deltas.byteswap()
+    return accumulate(deltas)
+
 def inverse_doc_frequency(term_count, num_items):
     """Return the inverse doc frequency for a term,
 
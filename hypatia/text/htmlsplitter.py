@@ -23,7 +23,7 @@ from .interfaces import ISplitter
 MARKUP = re.compile(r"(<[^<>]*>|&[A-Za-z]+;)")
 
 WORDS = re.compile(r"\w+")
-GLOBS = re.compile(r"\w+[\w*?]*")
+GLOBS = re.compile(r"[*?]*\w+[\w*?]*")
 
 @implementer(ISplitter)
 class HTMLWordSplitter(object):
@@ -38,14 +38,14 @@ class ILexicon(Interface):
         lexicon.
         """
 
-    def globToWordIds(pattern):
+    def globToWordIds(pattern, limit=None):
         """Return a sequence of ids of words matching the pattern.
 
         The argument should be a single word using globbing syntax,
         e.g. 'foo*' meaning anything starting with 'foo'.
 
         Return the wids for all words in the lexicon that match the
-        pattern.
+        pattern, or for at most 'limit' of them if 'limit' isn't None.
         """
 
     def word_count():
@@ -76,6 +76,13 @@ class ILexicon(Interface):
         The word should be one of the words returned by parseTerms().
         """
 
+    def merge(other):
+        """Add the words of the lexicon ``other`` to this lexicon.
+
+        Return a mapping of each of ``other``'s word ids to the id of the
+        same word in this lexicon.
+        """
+
 class ILexiconBasedIndex(Interface):
     """ Interface for indexes which hold a lexicon."""
     lexicon = Attribute('Lexicon used by the index.')
@@ -122,7 +129,8 @@ class IQueryParseTree(Interface):
     def nodeType():
         """Return the node type.
 
-        This is one of 'AND', 'OR', 'NOT', 'ATOM', 'PHRASE' or 'GLOB'.
+        This is one of 'AND', 'OR', 'NOT', 'ATOM', 'PHRASE', 'GLOB',
+        'NEAR' or 'SLOPPY_PHRASE'.
         """
 
     def getValue():
@@ -135,6 +143,10 @@ class IQueryParseTree(Interface):
         'ATOM'            a string (representing a single search term)
         'PHRASE'          a string (representing a search phrase)
         'GLOB'            a string (representing a pattern, e.g. "foo*")
+        'NEAR'            a list of words (which must occur near each
+                          other, see getDistance())
+        'SLOPPY_PHRASE'   a list of words (a phrase whose words may be
+                          apart, see getDistance())
         """
 
     def terms():
@@ -151,6 +163,17 @@ class IQueryParseTree(Interface):
         May raise ParseTree.QueryError.
         """
 
+    def estimateQuery(index):
+        """Approximate the number of documents matched by this node.
+
+        The index argument must implement the IExtendedQuerying interface.
+
+        Return an integer, or None if all documents match due to the
+        lexicon returning no wids for the node's terms.
+
+        May raise ParseTree.QueryError.
+        """
+
 class ISearchableText(Interface):
     """Interface that text-indexable objects should implement."""
 
@@ -198,6 +221,14 @@ class IExtendedQuerying(Interface):
         Return an IFBtree mapping docid to score.
         """
 
+    def search_near(terms, distance, ordered=False):
+        """Execute a proximity search on a sequence of words.
+
+        Return an IFBTree mapping docid to score for the documents in
+        which the words occur with at most 'distance' other words between
+        them, in the order given if 'ordered' is true.
+        """
+
     def search_glob(pattern):
         """Execute a pattern search.
 
@@ -208,6 +239,20 @@ class IExtendedQuerying(Interface):
         Return an IFBTree mapping docid to score.
         """
 
+    def estimate(term):
+        """Approximate the number of documents search(term) would return.
+
+        Return None under the same circumstances search(term) would.
+        """
+
+    def estimate_phrase(phrase):
+        """Approximate the number of documents search_phrase(phrase)
+        would return."""
+
+    def estimate_glob(pattern):
+        """Approximate the number of documents search_glob(pattern)
+        would return."""
+
     def query_weight(terms):
         """Return the weight for a set of query terms.
 
@@ -17,8 +17,11 @@ import re
 
 from zope.interface import implementer
 
+from BTrees.IIBTree import IITreeSet
+from BTrees.IIBTree import intersection
 from BTrees.IOBTree import IOBTree
 from BTrees.OIBTree import OIBTree
+from BTrees.OOBTree import OOBTree
 from BTrees.Length import Length
 
 from persistent import Persistent
@@ -30,9 +33,18 @@ from .stopdict import get_stopdict
 from .parsetree import QueryError
 
 
+# The length of the n-grams kept by Lexicon.enable_ngrams(), and the
+# character marking the start and end of a word in them.
+NGRAM = 3
+NGRAM_PAD = '\x00'
+
 @implementer(ILexicon)
 class Lexicon(Persistent):
 
+    # None unless enabled:  n-gram -> IITreeSet of the wids of the words
+    # containing it, where words are padded with NGRAM_PAD at each end
+    _ngrams = None
+
     def __init__(self, *pipeline):
         self._wids = OIBTree()  # word -> wid
         self._words = IOBTree() # wid -> word
@@ -88,6 +100,11 @@ class Lexicon(Persistent):
         for element in self._pipeline:
             process = getattr(element, "processGlob", element.process)
             last = process(last)
+        if self._ngrams is None:
+            # Without n-grams a pattern can't start with a glob character;
+            # search for the rest of it, as if it were punctuation.
+            last = [word for word in [word.lstrip("*?") for word in last]
+                    if word]
         return last
 
     def isGlob(self, word):
@@ -99,9 +116,9 @@ class Lexicon(Persistent):
     def get_wid(self, word):
         return self._wids.get(word, 0)
 
-    def globToWordIds(self, pattern):
+    def globToWordIds(self, pattern, limit=None):
         # Implement * and ? just as in the shell, except the pattern
-        # must not start with either of these
+        # must not start with either of these unless n-grams are enabled
         prefix = ""
         while pattern and pattern[0] not in "*?":
             prefix += pattern[0]
@@ -113,36 +130,101 @@ class Lexicon(Persistent):
                 return [wid]
             else:
                 return []
-        if not prefix:
+        if prefix:
+            items = self._wids.items(prefix) # Items starting at prefix
+        elif self._ngrams is not None:
+            items = self._ngram_items(pattern)
+        else:
             # The pattern starts with a globbing character.
-            # This is too efficient, so we raise an exception.
+            # This is too inefficient, so we raise an exception.
             raise QueryError(
                 "pattern %r shouldn't start with glob character" % pattern)
-        pat = prefix
-        for c in pattern:
-            if c == "*":
-                pat += ".*"
-            elif c == "?":
-                pat += "."
-            else:
-                pat += re.escape(c)
-        pat += "$"
-        prog = re.compile(pat)
-        keys = self._wids.keys(prefix) # Keys starting at prefix
+        if pattern.strip("*"):
+            pat = re.escape(prefix)
+            for c in pattern:
+                if c == "*":
+                    pat += ".*"
+                elif c == "?":
+                    pat += "."
+                else:
+                    pat += re.escape(c)
+            pat += "$"
+            match = re.compile(pat).match
+        else:
+            # Every word starting with prefix matches
+            match = None
         wids = []
-        for key in keys:
-            if not key.startswith(prefix):
+        for word, wid in items:
+            if not word.startswith(prefix):
                 break
-            if prog.match(key):
-                wids.append(self._wids[key])
+            if match is None or match(word):
+                wids.append(wid)
+                if len(wids) == limit:
+                    break
         return wids
 
+    def enable_ngrams(self):
+        """ Keep an index of the n-grams (``NGRAM`` characters long) of the
+        words, with which ``globToWordIds`` expands patterns starting with a
+        glob character (e.g. ``*ing`` or ``*graph*``).  Returns ``True`` if
+        it made the index, or ``False`` if it was already enabled. """
+        if self._ngrams is not None:
+            return False
+        self._ngrams = OOBTree()
+        for word, wid in self._wids.items():
+            self._add_ngrams(word, wid)
+        return True
+
+    def disable_ngrams(self):
+        """ Drop the n-grams made by ``enable_ngrams``, if any. """
+        if self._ngrams is not None:
+            del self._ngrams
+
+    def _add_ngrams(self, word, wid):
+        ngrams = self._ngrams
+        for ngram in _ngrams_of(NGRAM_PAD + word + NGRAM_PAD):
+            wids = ngrams.get(ngram)
+            if wids is None:
+                wids = ngrams[ngram] = IITreeSet()
+            wids.insert(wid)
+
+    def _ngram_items(self, pattern):
+        # (word, wid) pairs including at least those of the words matching
+        # pattern, which starts with a glob character:  the words holding
+        # every n-gram of its literal parts, the last of which must end a
+        # word.  Patterns without n-grams scan the whole lexicon.
+        parts = re.split("[*?]", pattern)
+        parts[-1] += NGRAM_PAD
+        needed = set()
+        for part in parts:
+            needed.update(_ngrams_of(part))
+        if not needed:
+            return self._wids.items()
+        ngrams = self._ngrams
+        sets = sorted([ngrams.get(ngram, ()) for ngram in needed], key=len)
+        wids = sets[0]
+        for other in sets[1:]:
+            if not wids:
+                break
+            wids = intersection(wids, other)
+        words = self._words
+        return [(words[wid], wid) for wid in wids]
+
+    def merge(self, other):
+        if not isinstance(self.word_count, Length):
+            # Make sure word_count is overridden with a BTrees.Length.Length
+            self.word_count = Length(self.word_count())
+        return dict((wid, self._getWordIdCreate(word))
+                    for word, wid in other.items())
+
     def _getWordIdCreate(self, word):
         wid = self._wids.get(word)
         if wid is None:
             wid = self._new_wid()
             self._wids[word] = wid
             self._words[wid] = word
+            if self._ngrams is not None:
+                self._add_ngrams(word, wid)
         return wid
 
     def _new_wid(self):
@@ -153,6 +235,9 @@ class Lexicon(Persistent):
             count.change(1)
         return count()
 
+def _ngrams_of(text):
+    return set([text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)])
+
 def _text2list(text):
     # Helper: splitter input may be a string or a list of strings
     try:
@@ -168,7 +253,7 @@ def _text2list(text):
 class Splitter(object):
 
     rx = re.compile(r"(?u)\w+")
-    rxGlob = re.compile(r"(?u)\w+[\w*?]*") # See globToWordIds() above
+    rxGlob = re.compile(r"(?u)[*?]*\w+[\w*?]*") # See globToWordIds() above
 
     def process(self, lst):
         result = []
@@ -189,20 +189,44 @@ to always be 1, and then that quotient is
 regardless of k3's value.  So, in a trivial sense, we are incorporating
 this measure (and optimizing it by not bothering to multiply by 1 <wink>).
 """
+import heapq
+import math
 import os
+from BTrees.IOBTree import IOBTree
 from BTrees.Length import Length
 
 from .baseindex import BaseIndex
 from .baseindex import inverse_doc_frequency
+from .setops import mass_weightedUnion
 
-score = None
+score_norms = None
 
 if not os.environ.get('PURE_PYTHON'):
     try:
-        from .okascore import score
+        from .okascore import score_norms
     except ImportError: #pragma NO COVERAGE
         pass
 
+class LengthNorms(dict):
+    """ An ``OkapiIndex``'s length norms, ``K1 * ((1-B) + B*len(D)/E(len(D)))``
+    for each docid D, computed on first use from the index's ``_docweight``
+    for the mean document length ``meandoclen``.
+
+    ``doclen`` is the total document length the norms are current for.
+    """
+
+    def __init__(self, docid2len, meandoclen, doclen, K1, B):
+        dict.__init__(self)
+        self.docid2len = docid2len
+        self.meandoclen = meandoclen
+        self.doclen = doclen
+        self._base = K1 * (1.0 - B)
+        self._scale = K1 * B / meandoclen
+
+    def __missing__(self, docid):
+        norm = self[docid] = self._base + self._scale * self.docid2len[docid]
+        return norm
+
 class OkapiIndex(BaseIndex):
 
     # BM25 free parameters.
@@ -211,7 +235,19 @@ class OkapiIndex(BaseIndex):
     assert K1 >= 0.0
     assert 0.0 <= B <= 1.0
 
-    def __init__(self, lexicon, family=None):
+    # wid -> {block key -> {docid -> frequency}}, the postings of each word
+    # grouped into blocks of similar impact; None unless impact order is
+    # enabled.  See ``enable_impact_order``.
+    _impacts = None
+
+    # A posting's block key combines its document's length per occurrence
+    # of the word, len(D) / f(D, t), in steps of 1/IMPACT_STEPS of an
+    # octave, with its frequency, up to IMPACT_FREQUENCIES.  Both bound
+    # TF(D, t) from above, whatever the mean document length.
+    IMPACT_STEPS = 4
+    IMPACT_FREQUENCIES = 4
+
+    def __init__(self, lexicon, family=None, impact_order=False):
         BaseIndex.__init__(self, lexicon, family=family)
 
         # ._wordinfo for Okapi is
@@ -228,117 +264,401 @@ class OkapiIndex(BaseIndex):
         # used often enough that speed should matter.
         self._totaldoclen = Length(0)
 
+        if impact_order:
+            self.enable_impact_order()
+
+    # Length norms are cached until the mean document length drifts from the
+    # one they were computed for by more than this fraction of it.
+    NORM_TOLERANCE = 0.01
+
+    def reset(self):
+        BaseIndex.reset(self)
+        self._totaldoclen = Length(0)
+        self._v_norms = None
+        if self._impacts is not None:
+            self._impacts = IOBTree()
+
+    def enable_impact_order(self):
+        """ Group each word's postings into blocks by their impact, the
+        most a posting can add to a document's score, from the current
+        contents of the index, and keep the blocks up to date from now on.
+        ``search_top`` then visits the blocks of all the query's words in
+        order of impact, and stops as soon as the blocks left can't lift a
+        new document into the results, at the cost of a second copy of
+        every posting. """
+        blocks = {}
+        docid2len = self._docweight
+        for wid, d2f in self._wordinfo.items():
+            wordblocks = blocks[wid] = {}
+            for docid, f in d2f.items():
+                key = self._impact_key(docid2len[docid], f)
+                block = wordblocks.get(key)
+                if block is None:
+                    block = wordblocks[key] = {}
+                block[docid] = f
+        self._impacts = impacts = IOBTree()
+        for wid, wordblocks in blocks.items():
+            impacts[wid] = self._make_blocks(wordblocks)
+
+    def disable_impact_order(self):
+        """ Discard the impact-ordered blocks. """
+        self._impacts = None
+
+    def _make_blocks(self, wordblocks):
+        family = self.family
+        blocks = family.IO.BTree()
+        for key, block in wordblocks.items():
+            blocks[key] = family.IF.BTree(block)
+        return blocks
+
+    def _impact_key(self, length, f):
+        level = int(math.log(float(length) / f, 2) * self.IMPACT_STEPS)
+        frequencies = self.IMPACT_FREQUENCIES
+        return level * frequencies + frequencies - min(int(f), frequencies)
+
+    def _impact_bound(self, key, meandoclen):
+        # The highest TF(D, t) of a posting in the block with this key.
+        # The length per occurrence is taken a hair short, to stay clear
+        # of rounding in _impact_key.
+        frequencies = self.IMPACT_FREQUENCIES
+        level, f = divmod(key, frequencies)
+        f = frequencies - f
+        K1 = self.K1
+        per_occurrence = 2.0 ** ((level - 0.01) / self.IMPACT_STEPS)
+        norm = K1 * self.B * per_occurrence / meandoclen
+        if f < frequencies:
+            norm += K1 * (1.0 - self.B) / f
+        return (K1 + 1.0) / (1.0 + norm)
+
+    def _add_impacts(self, docids):
+        # Add the postings of newly indexed documents to their blocks
+        impacts = self._impacts
+        if impacts is None:
+            return
+        family = self.family
+        docid2len = self._docweight
+        for docid in docids:
+            length = docid2len[docid]
+            wid2f = self._get_frequencies(self.get_words(docid))[0]
+            for wid, f in wid2f.items():
+                blocks = impacts.get(wid)
+                if blocks is None:
+                    blocks = impacts[wid] = family.IO.BTree()
+                key = self._impact_key(length, f)
+                block = blocks.get(key)
+                if block is None:
+                    block = blocks[key] = family.IF.BTree()
+                block[docid] = f
+
+    def _remove_impacts(self, docid):
+        # Remove the postings of a document about to be unindexed or
+        # reindexed from their blocks
+        impacts = self._impacts
+        if impacts is None:
+            return
+        length = self._docweight[docid]
+        wid2f = self._get_frequencies(self.get_words(docid))[0]
+        for wid, f in wid2f.items():
+            blocks = impacts[wid]
+            key = self._impact_key(length, f)
+            block = blocks[key]
+            del block[docid]
+            if not block:
+                del blocks[key]
+                if not blocks:
+                    del impacts[wid]
+
     def index_doc(self, docid, text):
+        new = docid not in self._docwords
         count = BaseIndex.index_doc(self, docid, text)
         self._change_doc_len(count)
+        if new:
+            self._add_impacts((docid,))
+        return count
+
+    def _add_docs(self, docid2wids):
+        count = BaseIndex._add_docs(self, docid2wids)
+        self._change_doc_len(count)
+        self._add_impacts(docid2wids)
         return count
 
+    def merge(self, other):
+        BaseIndex.merge(self, other)
+        self._change_doc_len(other._totaldoclen())
+        self._add_impacts(other._docwords.keys())
+
     def reindex_doc(self, docid, text):
-        self._change_doc_len(-self._docweight[docid])
-        return BaseIndex.reindex_doc(self, docid, text)
+        self._change_doc_len(-self._docweight[docid], docid)
+        self._remove_impacts(docid)
+        count = BaseIndex.reindex_doc(self, docid, text)
+        self._add_impacts((docid,))
+        return count
 
     def unindex_doc(self, docid):
         if docid not in self._docwords:
             return
-        self._change_doc_len(-self._docweight[docid])
+        self._change_doc_len(-self._docweight[docid], docid)
+        self._remove_impacts(docid)
         BaseIndex.unindex_doc(self, docid)
 
-    def _change_doc_len(self, delta):
-        # Change total doc length used for scoring
+    def _change_doc_len(self, delta, docid=None):
+        # Change total doc length used for scoring, keeping the cached
+        # length norms current if they were; docid is a document whose
+        # length is changing
         delta = int(delta)
+        norms = getattr(self, '_v_norms', None)
+        if norms is not None:
+            if norms.doclen == self._doclen():
+                norms.doclen += delta
+                norms.pop(docid, None)
+            else:
+                self._v_norms = None
         try:
             self._totaldoclen.change(delta)
         except AttributeError:
             # Opportunistically upgrade _totaldoclen attribute to Length object
             self._totaldoclen = Length(int(self._totaldoclen + delta))
 
+    def _doclen(self):
+        try:
+            return self._totaldoclen()
+        except TypeError:
+            # _totaldoclen has not yet been upgraded
+            return self._totaldoclen
+
+    def _norms(self):
+        # Return the LengthNorms for the current document lengths, making
+        # new ones if there are none yet, if documents were changed through
+        # another copy of the index, or if the mean document length has
+        # drifted too far from the one they were made for
+        doclen = self._doclen()
+        meandoclen = doclen / float(self.indexed_count())
+        norms = getattr(self, '_v_norms', None)
+        if (norms is None or norms.doclen != doclen or
+                abs(norms.meandoclen - meandoclen) >
+                meandoclen * self.NORM_TOLERANCE):
+            norms = self._v_norms = LengthNorms(
+                self._docweight, meandoclen, doclen, self.K1, self.B)
+        return norms
+
     # The workhorse.  Return a list of (IFBucket, weight) pairs, one pair
     # for each wid t in wids.  The IFBucket, times the weight, maps D to
     # TF(D,t) * IDF(t) for every docid D containing t.
     # As currently written, the weights are always 1, and the IFBucket maps
     # D to TF(D,t)*IDF(t) directly, where the product is computed as a float.
+    def _search_wids(self, wids):
+        if not wids:
+            return []
+        N = float(self.indexed_count())  # total # of docs
+
+        #                           f(D, t) * (k1 + 1)
+        #   TF(D, t) =  -------------------------------------------
+        #               f(D, t) + k1 * ((1-b) + b*len(D)/E(len(D)))
+        #
+        # where the denominator's second term is the length norm of D.
+
+        norms = self._norms()
+        L = []
+        for t in wids:
+            d2f = self._wordinfo[t] # map {docid -> f(docid, t)}
+            idf = inverse_doc_frequency(len(d2f), N)  # an unscaled float
+            result = self.family.IF.Bucket()
+            self._score(result, d2f, norms, idf)
+            L.append((result, 1))
+        return L
+
+        # Note about the above: the result is tf * idf.  tf is
+        # small -- it can't be larger than k1+1 = 2.2.  idf is
+        # formally unbounded, but is less than 14 for a term that
+        # appears in only 1 of a million documents.  So the
+        # product is probably less than 32, or 5 bits before the
+        # radix point.  If we did the scaled-int business on both
+        # of them, we'd be up to 25 bits.  Add 64 of those and
+        # we'd be in overflow territory.  That's pretty unlikely,
+        # so we *could* just store scaled_int(tf) in
+        # result[docid], and use scaled_int(idf) as an invariant
+        # weight across the whole result.  But besides skating
+        # near the edge, it's not a speed cure, since the
+        # computation of tf would still be done at Python speed,
+        # and it's a lot more work than just multiplying by idf.
+
+    # The inner scoring loop of _search_wids: set result[D] to
+    # TF(D, t) * idf for each docid D and frequency f(D, t) in d2f.
     # NOTE:  This may be overridden below, by a function that computes the
-    # same thing but with the inner scoring loop in C.
-    if score is None: #pragma NO COVERAGE
-        def _search_wids(self, wids):
-            if not wids:
-                return []
-            N = float(self.indexed_count())  # total # of docs
-            try:
-                doclen = self._totaldoclen()
-            except TypeError:
-                # _totaldoclen has not yet been upgraded
-                doclen = self._totaldoclen
-            meandoclen = doclen / N
-            K1 = self.K1
-            B = self.B
-            K1_plus1 = K1 + 1.0
-            B_from1 = 1.0 - B
-
-            #                           f(D, t) * (k1 + 1)
-            #   TF(D, t) =  -------------------------------------------
-            #               f(D, t) + k1 * ((1-b) + b*len(D)/E(len(D)))
-
-            L = []
-            docid2len = self._docweight
-            for t in wids:
-                d2f = self._wordinfo[t] # map {docid -> f(docid, t)}
-                idf = inverse_doc_frequency(len(d2f), N)  # an unscaled float
-                result = self.family.IF.Bucket()
-                for docid, f in d2f.items():
-                    lenweight = B_from1 + B * docid2len[docid] / meandoclen
-                    tf = f * K1_plus1 / (f + K1 * lenweight)
-                    result[docid] = tf * idf
-                L.append((result, 1))
-            return L
-
-            # Note about the above: the result is tf * idf.  tf is
-            # small -- it can't be larger than k1+1 = 2.2.  idf is
-            # formally unbounded, but is less than 14 for a term that
-            # appears in only 1 of a million documents.  So the
-            # product is probably less than 32, or 5 bits before the
-            # radix point.  If we did the scaled-int business on both
-            # of them, we'd be up to 25 bits.  Add 64 of those and
-            # we'd be in overflow territory.  That's pretty unlikely,
-            # so we *could* just store scaled_int(tf) in
-            # result[docid], and use scaled_int(idf) as an invariant
-            # weight across the whole result.  But besides skating
-            # near the edge, it's not a speed cure, since the
-            # computation of tf would still be done at Python speed,
-            # and it's a lot more work than just multiplying by idf.
+    # same thing in C.
+    if score_norms is None: #pragma NO COVERAGE
+        def _score(self, result, d2f, norms, idf):
+            K1_plus1 = self.K1 + 1.0
+            for docid, f in d2f.items():
+                result[docid] = f * K1_plus1 / (f + norms[docid]) * idf
     else:
-        # The same function as _search_wids above, but with the inner scoring
-        # loop written in C (module okascore, function score()).
-        # Cautions:  okascore hardcodes the values of K, B1, and the scaled_int
-        # function.
-        def _search_wids(self, wids):
-            if not wids:
-                return []
-            N = float(self.indexed_count())  # total # of docs
-            try:
-                doclen = self._totaldoclen()
-            except TypeError:
-                # _totaldoclen has not yet been upgraded
-                doclen = self._totaldoclen
-            meandoclen = doclen / N
-            #K1 = self.K1
-            #B = self.B
-            #K1_plus1 = K1 + 1.0
-            #B_from1 = 1.0 - B
-
-            #                           f(D, t) * (k1 + 1)
-            #   TF(D, t) =  -------------------------------------------
-            #               f(D, t) + k1 * ((1-b) + b*len(D)/E(len(D)))
-
-            L = []
-            docid2len = self._docweight
-            for t in wids:
-                d2f = self._wordinfo[t] # map {docid -> f(docid, t)}
-                idf = inverse_doc_frequency(len(d2f), N)  # an unscaled float
-                result = self.family.IF.Bucket()
-                score(result, list(d2f.items()), docid2len, idf, meandoclen)
-                L.append((result, 1))
-            return L
+        # Cautions:  okascore hardcodes the value of K1.
+        def _score(self, result, d2f, norms, idf):
+            score_norms(result, d2f.items(), norms, idf)
+
+    # Probing a candidate docid's frequency for a word in Python costs about
+    # as much as scoring this many of the word's docids in _search_wids.
+    PROBE_COST = 8
+
+    def search_top(self, wids, limit):
+        """Return the ``limit`` best ``(score, docid)`` pairs, best first,
+        of the documents containing any of ``wids``, scored as the
+        ``mass_weightedUnion`` of ``_search_wids(wids)`` would score them.
+
+        Words are visited in order of their highest possible score,
+        ``idf * (1 + K1)``, keeping running totals.  Once the remaining
+        words can't lift a document with no score yet past the
+        ``limit``'th best score so far, their postings are no longer
+        scored in full: documents which can't make the cut any more are
+        dropped, and the rest have their frequencies looked up.
+
+        With impact order enabled, queries in which one word outweighs
+        the rest visit blocks of postings instead of words; see
+        ``enable_impact_order``.
+        """
+        IF = self.family.IF
+        counts = {}
+        for wid in self._remove_oov_wids(wids):
+            counts[wid] = counts.get(wid, 0) + 1
+        if not counts or limit < 1:
+            return []
+        N = float(self.indexed_count())
+        K1_plus1 = self.K1 + 1.0
+
+        words = []
+        for wid, count in counts.items():
+            weight = count * inverse_doc_frequency(len(self._wordinfo[wid]), N)
+            words.append((weight * K1_plus1, wid, count, weight))
+        words.sort(reverse=True)
+        total = remaining = sum([word[0] for word in words])
+        if self._impacts is not None and words[0][0] * 4 >= total * 3:
+            # One word far outweighs the rest, so the best documents are
+            # likely found among its highest impact postings.
+            return self._search_top_impacts(counts, limit)
+        norms = self._norms()
+        scores = IF.Bucket()
+        pending = [] # (IF.Bucket, weight) pairs not yet added to scores
+        threshold = None
+        recheck = total
+        for bound, wid, count, weight in words:
+            d2f = self._wordinfo[wid]
+            pruning = threshold is not None and remaining < threshold
+            if remaining < total - remaining and (
+                    pruning or remaining < recheck):
+                # No score so far can exceed the bounds of the words seen,
+                # so only now can the threshold matter.  Finding it takes a
+                # pass over the scores, so until pruning starts it is only
+                # found again once the remaining bounds have shrunk.
+                recheck = remaining * 0.75
+                if pending:
+                    scores = mass_weightedUnion([(scores, 1)] + pending,
+                                                self.family)
+                    pending = []
+                if len(scores) >= limit:
+                    threshold = heapq.nlargest(limit, scores.values())[-1]
+            if threshold is not None and remaining < threshold:
+                # Only documents already scored can still make the cut.
+                scores = IF.Bucket([(docid, score)
+                                    for docid, score in scores.items()
+                                    if score + remaining >= threshold])
+                if len(scores) * self.PROBE_COST < len(d2f):
+                    for docid, score in scores.items():
+                        f = d2f.get(docid)
+                        if f:
+                            tf = f * K1_plus1 / (f + norms[docid])
+                            scores[docid] = score + weight * tf
+                else:
+                    wordscores = self._search_wids([wid])[0][0]
+                    wordscores = IF.weightedIntersection(
+                        wordscores, scores, count, 0)[1]
+                    scores = IF.weightedUnion(scores, wordscores)[1]
+            else:
+                pending.append((self._search_wids([wid])[0][0], count))
+            remaining -= bound
+        if pending:
+            scores = mass_weightedUnion([(scores, 1)] + pending, self.family)
+        return heapq.nlargest(
+            limit, [(score, docid) for docid, score in scores.items()])
+
+    def _search_top_impacts(self, counts, limit):
+        # search_top over impact-ordered blocks: every word's blocks are
+        # visited together, best bound first, until no document outside the
+        # scores so far can make the cut, and few enough inside might that
+        # looking up their frequencies beats visiting the blocks left.  A
+        # document's score is missing at most the next (best unvisited)
+        # block of each word, so those few are then scored in full.
+        N = float(self.indexed_count())
+        K1_plus1 = self.K1 + 1.0
+        norms = self._norms()
+        meandoclen = norms.meandoclen
+        words = []
+        blocks = []
+        left = {} # wid -> bounds of the word's unvisited blocks, ascending
+        for wid, count in counts.items():
+            d2f = self._wordinfo[wid]
+            weight = count * inverse_doc_frequency(len(d2f), N)
+            words.append((d2f, weight))
+            for key, block in self._impacts[wid].items():
+                bound = weight * self._impact_bound(key, meandoclen)
+                blocks.append((bound, wid, weight / count, count, block))
+                left.setdefault(wid, []).append(bound)
+        for bounds in left.values():
+            bounds.sort()
+        blocks.sort(key=lambda block: block[0], reverse=True)
+        postings = sum([len(block[-1]) for block in blocks])
+
+        def remaining():
+            return sum([bounds[-1] for bounds in left.values() if bounds])
+
+        IF = self.family.IF
+        scores = IF.Bucket()
+        pending = [] # (IF.Bucket, weight) pairs not yet added to scores
+        scored = 0 # postings scored since the threshold was last found
+        pruning = False
+        for bound, wid, idf, count, block in blocks:
+            if scored >= len(scores):
+                # Finding the threshold takes a pass over the scores, so it
+                # is only found again once as many postings were scored.
+                scored = 0
+                scores = mass_weightedUnion([(scores, 1)] + pending,
+                                            self.family)
+                pending = []
+                if len(scores) >= limit:
+                    least = (heapq.nlargest(limit, scores.values())[-1] -
+                             remaining())
+                    if least > 0:
+                        # Only documents already scored can still make the
+                        # cut, and only if they are scored this well.
+                        pruning = True
+                        scores = IF.Bucket([(docid, score)
+                                            for docid, score in scores.items()
+                                            if score >= least])
+                        if (len(scores) * len(words) * self.PROBE_COST <
+                                postings):
+                            break
+            result = IF.Bucket()
+            self._score(result, block, norms, idf)
+            scored += len(result)
+            postings -= len(result)
+            if pruning:
+                result = IF.weightedIntersection(result, scores, count, 0)[1]
+                count = 1
+            pending.append((result, count))
+            left[wid].pop()
+        else:
+            scores = mass_weightedUnion([(scores, 1)] + pending, self.family)
+            return heapq.nlargest(
+                limit, [(score, docid) for docid, score in scores.items()])
+        best = []
+        for docid in scores.keys():
+            norm = norms[docid]
+            score = 0.0
+            for d2f, weight in words:
+                f = d2f.get(docid)
+                if f:
+                    score += weight * (f * K1_plus1 / (f + norm))
+            best.append((score, docid))
+        return heapq.nlargest(limit, best)
 
     def query_weight(self, terms):
         # Get the wids.
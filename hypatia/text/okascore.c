@@ -15,6 +15,8 @@
 /*	okascore.c
  *
  *	The inner scoring loop of OkapiIndex._search_wids() coded in C.
+ *	score() finds each document's length norm from its length;
+ *	score_norms() is given the norms, precomputed by the index.
  *
  * Example from an indexed Python-Dev archive, where "python" shows up in all
  * but 2 of the 19,058 messages.  With the Python scoring loop,
@@ -131,8 +133,94 @@ static char score__doc__[] =
 "\n"
 "Do the inner scoring loop for an Okapi index.\n";
 
+static PyObject *
+score_norms(PyObject *self, PyObject *args)
+{
+	const double K1_PLUS1 = K1 + 1.0;
+
+	/* Inputs */
+	PyObject *result;	/* IIBucket result, maps d to score */
+	PyObject *d2fitems;	/* ._wordinfo[t].items(), maps d to f(d, t) */
+	PyObject *norms;	/* maps d to k1 * ((1-b) + b*len(d)/E(len(d))) */
+	double idf;		/* inverse doc frequency of t */
+
+	PyObject *iter;
+	PyObject *d_and_f;	/* a (d, f) pair */
+
+	if (!PyArg_ParseTuple(args, "OOOd:score_norms", &result, &d2fitems,
+						   &norms, &idf))
+		return NULL;
+
+	iter = PyObject_GetIter(d2fitems);
+	if (iter == NULL)
+		return NULL;
+	while ((d_and_f = PyIter_Next(iter)) != NULL) {
+		PyObject *d;
+		double f;
+		PyObject *norm;		/* norms[d] */
+		double tf;
+		PyObject *doc_score;
+		int status;
+
+		if (!(PyTuple_CheckExact(d_and_f) &&
+		      PyTuple_GET_SIZE(d_and_f) == 2)) {
+			PyErr_SetString(PyExc_TypeError,
+				"d2fitems must produce 2-item tuples");
+			Py_DECREF(d_and_f);
+			Py_DECREF(iter);
+			return NULL;
+		}
+		d = PyTuple_GET_ITEM(d_and_f, 0);
+		f = PyFloat_AsDouble(PyTuple_GET_ITEM(d_and_f, 1));
+		if (f == -1.0 && PyErr_Occurred()) {
+			Py_DECREF(d_and_f);
+			Py_DECREF(iter);
+			return NULL;
+		}
+
+		norm = PyObject_GetItem(norms, d);
+		if (norm == NULL) {
+			Py_DECREF(d_and_f);
+			Py_DECREF(iter);
+			return NULL;
+		}
+		tf = PyFloat_AsDouble(norm);
+		Py_DECREF(norm);
+		if (tf == -1.0 && PyErr_Occurred()) {
+			Py_DECREF(d_and_f);
+			Py_DECREF(iter);
+			return NULL;
+		}
+
+		tf = f * K1_PLUS1 / (f + tf);
+		doc_score = PyFloat_FromDouble(tf * idf);
+		if (doc_score == NULL)
+			status = -1;
+		else
+			status = PyObject_SetItem(result, d, doc_score);
+		Py_DECREF(d_and_f);
+		Py_XDECREF(doc_score);
+		if (status < 0) {
+			Py_DECREF(iter);
+			return NULL;
+		}
+	}
+	Py_DECREF(iter);
+	if (PyErr_Occurred())
+		return NULL;
+	Py_INCREF(Py_None);
+	return Py_None;
+}
+
+static char score_norms__doc__[] =
+"score_norms(result, d2fitems, norms, idf)\n"
+"\n"
+"Do the inner scoring loop for an Okapi index, given each document's\n"
+"precomputed length norm rather than its length.\n";
+
 static PyMethodDef okascore_functions[] = {
 	{"score",	   score,	  METH_VARARGS, score__doc__},
+	{"score_norms",	   score_norms,	  METH_VARARGS, score_norms__doc__},
 	{NULL}
 };
 
@@ -51,6 +51,9 @@ class ParseTreeNode(object):
     def executeQuery(self, index):
         raise NotImplementedError
 
+    def estimateQuery(self, index):
+        raise NotImplementedError
+
 class NotNode(ParseTreeNode):
 
     _nodeType = "NOT"
@@ -61,6 +64,9 @@ class NotNode(ParseTreeNode):
     def executeQuery(self, index):
         raise QueryError("NOT parse tree node cannot be executed directly")
 
+    def estimateQuery(self, index):
+        raise QueryError("NOT parse tree node cannot be estimated directly")
+
 class AndNode(ParseTreeNode):
 
     _nodeType = "AND"
@@ -89,6 +95,19 @@ class AndNode(ParseTreeNode):
             set = index.family.IF.difference(set, notset)
         return set
 
+    def estimateQuery(self, index):
+        # NOT subnodes can only shrink the result, so they're ignored.
+        L = []
+        for subnode in self.getValue():
+            if subnode.nodeType() != "NOT":
+                r = subnode.estimateQuery(index)
+                if r is not None:
+                    L.append(r)
+        if not L:
+            # unconstrained, like a query made only of stop words
+            return None
+        return min(L)
+
 class OrNode(ParseTreeNode):
 
     _nodeType = "OR"
@@ -105,6 +124,13 @@ class OrNode(ParseTreeNode):
                 weighted.append((r, 1))
         return mass_weightedUnion(weighted, index.family)
 
+    def estimateQuery(self, index):
+        L = [node.estimateQuery(index) for node in self.getValue()]
+        L = [r for r in L if r is not None]
+        if not L:
+            return None
+        return sum(L)
+
 class AtomNode(ParseTreeNode):
 
     _nodeType = "ATOM"
@@ -115,6 +141,9 @@ class AtomNode(ParseTreeNode):
     def executeQuery(self, index):
         return index.search(self.getValue())
 
+    def estimateQuery(self, index):
+        return index.estimate(self.getValue())
+
 class PhraseNode(AtomNode):
 
     _nodeType = "PHRASE"
@@ -122,9 +151,54 @@ class PhraseNode(AtomNode):
     def executeQuery(self, index):
         return index.search_phrase(self.getValue())
 
+    def estimateQuery(self, index):
+        return index.estimate_phrase(self.getValue())
+
+class NearNode(AtomNode):
+    """ Words which all occur with at most ``distance`` other words between
+    them, in any order. """
+
+    _nodeType = "NEAR"
+    _ordered = False
+
+    def __init__(self, words, distance):
+        AtomNode.__init__(self, words)
+        self._distance = distance
+
+    def getDistance(self):
+        return self._distance
+
+    def __repr__(self):
+        return "%s(%r, %r)" % (self.__class__.__name__, self.getValue(),
+                               self.getDistance())
+
+    def terms(self):
+        return list(self.getValue())
+
+    def executeQuery(self, index):
+        return index.search_near(self.getValue(), self.getDistance(),
+                                 self._ordered)
+
+    def estimateQuery(self, index):
+        # A document must contain every word, as for a phrase.
+        return index.estimate_phrase(self.getValue())
+
+class SloppyPhraseNode(NearNode):
+    """ A phrase whose words may have up to ``distance`` other words
+    between them, but must occur in order. """
+
+    _nodeType = "SLOPPY_PHRASE"
+    _ordered = True
+
+    def terms(self):
+        return [self.getValue()]
+
 class GlobNode(AtomNode):
 
     _nodeType = "GLOB"
 
     def executeQuery(self, index):
         return index.search_glob(self.getValue())
+
+    def estimateQuery(self, index):
+        return index.estimate_glob(self.getValue())
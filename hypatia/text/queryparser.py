@@ -19,9 +19,16 @@ Start = OrExpr
 OrExpr = AndExpr ('OR' AndExpr)*
 AndExpr = Term ('AND' NotExpr | 'NOT' AndExpr)*
 NotExpr = ['NOT'] Term
-Term = '(' OrExpr ')' | ATOM+
+Term = '(' OrExpr ')' | NearExpr+
+NearExpr = ATOM ('NEAR/' N ATOM)*
 
-The key words (AND, OR, NOT) are recognized in any mixture of case.
+The key words (AND, OR, NOT, NEAR/N for a number N) are recognized in
+any mixture of case.
+
+The ATOMs of a NearExpr with more than one ATOM must each be a single
+word, not a phrase or a pattern, and every NEAR/N in it must have the
+same N: the words must all occur with at most N other words between
+them, in any order.
 
 An ATOM is either:
 
@@ -31,7 +38,9 @@ An ATOM is either:
 
 + A non-empty string enclosed in double quotes.  The interior of the
   string can contain whitespace, parentheses and key words, but not
-  quotes.
+  quotes.  It may be followed by a tilde and a number N, making it a
+  sloppy phrase: its words must occur in order, but with at most N
+  other words between them.
 
 + A hyphen followed by one of the two forms above, meaning that it
   must not be present.
@@ -52,6 +61,9 @@ Summarizing the default operator rules:
 - a leading hyphen implies NOT, e.g. ``foo -bar''
 - these can be combined, e.g. ``foo -"foo bar"'' or ``foo -foo-bar''
 - * and ? are used for globbing (i.e. prefix search), e.g. ``foo*''
+- NEAR/N implies proximity search, e.g. ``foo NEAR/5 bar''
+- a tilde after double-quoted text implies a sloppy phrase search, e.g.
+  ``"foo bar"~3''
 """
 
 import re
@@ -68,6 +80,7 @@ _OR     = sys.intern("OR")
 _NOT    = sys.intern("NOT")
 _LPAREN = sys.intern("(")
 _RPAREN = sys.intern(")")
+_NEAR   = sys.intern("NEAR")
 _ATOM   = sys.intern("ATOM")
 _EOF    = sys.intern("EOF")
 
@@ -80,6 +93,12 @@ _keywords = {
     _RPAREN:    _RPAREN,
 }
 
+# Regular expression to recognize a NEAR/N key word.
+_near_regex = re.compile(r"NEAR/(\d+)$", re.IGNORECASE)
+
+# Regular expression to recognize a sloppy phrase's slop.
+_slop_regex = re.compile(r'"~(\d+)$')
+
 # Regular expression to tokenize.
 _tokenizer_regex = re.compile(r"""
     # a paren
@@ -88,13 +107,20 @@ _tokenizer_regex = re.compile(r"""
 |   -?
     # followed by
     (?:
-        # a string inside double quotes (and not containing these)
-        " [^"]* "
+        # a string inside double quotes (and not containing these),
+        # optionally followed by a tilde and a number
+        " [^"]* " (?: ~\d+ )?
         # or a non-empty stretch w/o whitespace, parens or double quotes
     |    [^()\s"]+
     )
 """, re.VERBOSE)
 
+def _token_type(token):
+    tokentype = _keywords.get(token.upper())
+    if tokentype is None:
+        tokentype = _NEAR if _near_regex.match(token) else _ATOM
+    return tokentype
+
 @implementer(IQueryParser)
 class QueryParser(object):
 
@@ -112,8 +138,7 @@ class QueryParser(object):
         tokens = _tokenizer_regex.findall(query)
         self._tokens = tokens
         # classify tokens
-        self._tokentypes = [_keywords.get(token.upper(), _ATOM)
-                            for token in tokens]
+        self._tokentypes = [_token_type(token) for token in tokens]
         # add _EOF
         self._tokens.append(_EOF)
         self._tokentypes.append(_EOF)
@@ -217,9 +242,9 @@ class QueryParser(object):
             self._require(_RPAREN)
         else:
             nodes = []
-            nodes = [self._parseAtom()]
+            nodes = [self._parseNearExpr()]
             while self._peek(_ATOM):
-                nodes.append(self._parseAtom())
+                nodes.append(self._parseNearExpr())
             nodes = [x for x in  nodes if x]
             if not nodes:
                 return None # Only stopwords
@@ -235,13 +260,47 @@ class QueryParser(object):
             tree = parsetree.AndNode(nodes)
         return tree
 
+    def _parseNearExpr(self):
+        if (not self._peek(_ATOM) or
+                self._tokentypes[self._index + 1] is not _NEAR):
+            return self._parseAtom()
+        terms = [self._get(_ATOM)]
+        distances = set()
+        while self._peek(_NEAR):
+            near = self._get(_NEAR)
+            distances.add(int(_near_regex.match(near).group(1)))
+            terms.append(self._get(_ATOM))
+        if len(distances) > 1:
+            raise parsetree.ParseError(
+                "NEAR/N operators in a row must have the same N")
+        words = []
+        for term in terms:
+            termwords = self._lexicon.parseTerms(term)
+            if (term[0] in '-"' or len(termwords) > 1 or
+                    termwords and self._lexicon.isGlob(termwords[0])):
+                raise parsetree.ParseError(
+                    "NEAR/N operands must be single words: %r" % term)
+            if not termwords:
+                self._ignored.append(term)
+            words.extend(termwords)
+        if not words:
+            return None # Only stopwords
+        if len(words) == 1:
+            return parsetree.AtomNode(words[0])
+        return parsetree.NearNode(words, distances.pop())
+
     def _parseAtom(self):
         term = self._get(_ATOM)
+        slop = _slop_regex.search(term)
+        if slop is not None:
+            term = term[:slop.start() + 1]
         words = self._lexicon.parseTerms(term)
         if not words:
             self._ignored.append(term)
             return None
-        if len(words) > 1:
+        if len(words) > 1 and slop is not None and int(slop.group(1)):
+            tree = parsetree.SloppyPhraseNode(words, int(slop.group(1)))
+        elif len(words) > 1:
             tree = parsetree.PhraseNode(words)
         elif self._lexicon.isGlob(words[0]):
             tree = parsetree.GlobNode(words[0])
@@ -411,6 +411,271 @@ class BaseIndexTestBase:
         index.index_doc(1, 'hit the nail on the head')
         self.assertEqual(dict(index.search_phrase('hit the nail')), {1: 1.0})
 
+    def _makeOneWithFrequencies(self):
+        index = self._makeOne()
+        def _faux_get_frequencies(wids):
+            return dict([(y, x) for x, y in enumerate(wids)]), 1
+        index._get_frequencies = _faux_get_frequencies
+        return index
+
+    def _assertSameState(self, index, other):
+        def wordinfo(index):
+            return [(wid, type(doc2score), sorted(doc2score.items()))
+                    for wid, doc2score in index._wordinfo.items()]
+        self.assertEqual(wordinfo(index), wordinfo(other))
+        self.assertEqual(list(index._docweight.items()),
+                         list(other._docweight.items()))
+        self.assertEqual(list(index._docwords.items()),
+                         list(other._docwords.items()))
+        self.assertEqual(index.word_count(), other.word_count())
+        self.assertEqual(index.indexed_count(), other.indexed_count())
+
+    def test_index_docs(self):
+        pairs = [(docid, 'common word%d' % (docid % 3))
+                 for docid in range(1, 15)]
+        pairs.extend([(3, 'common other'), (20, 'word1')])
+        index = self._makeOneWithFrequencies()
+        expected = self._makeOneWithFrequencies()
+        for each in (index, expected):
+            each.index_doc(1, 'common word5')
+            each.index_doc(50, 'word1')
+        index.index_docs(pairs)
+        for docid, text in pairs:
+            expected.index_doc(docid, text)
+        self._assertSameState(index, expected)
+        common = index._lexicon._wids['common']
+        self.assertEqual(len(index._wordinfo[common]), 14)
+
+    def test_index_docs_empty(self):
+        index = self._makeOneWithFrequencies()
+        self.assertEqual(index._add_docs({}), 0)
+        index.index_docs([])
+        self.assertEqual(index.indexed_count(), 0)
+
+    def test_index_docs_upgrades_word_count_indexed_count(self):
+        index = self._makeOneWithFrequencies()
+
+        # Simulate old instances which didn't have these as attributes
+        del index.word_count
+        del index.indexed_count
+
+        index.index_docs([(1, 'one two three'), (2, 'three four')])
+        self.assertEqual(index.word_count(), 4)
+        self.assertEqual(index.indexed_count(), 2)
+
+    def test_merge(self):
+        pairs = [(docid, 'common word%d' % (docid % 3))
+                 for docid in range(1, 15)]
+        index = self._makeOneWithFrequencies()
+        other = self._makeOneWithFrequencies()
+        expected = self._makeOneWithFrequencies()
+        # the other index's lexicon assigns different wids
+        other.index_doc(100, 'word2 word1')
+        expected.index_docs(pairs[:5])
+        expected.index_doc(100, 'word2 word1')
+        expected.index_docs(pairs[5:])
+        index.index_docs(pairs[:5])
+        other.index_docs(pairs[5:])
+        index.merge(other)
+        self._assertSameState(index, expected)
+
+    def test_merge_upgrades_word_count_indexed_count(self):
+        index = self._makeOneWithFrequencies()
+        other = self._makeOneWithFrequencies()
+        other.index_doc(1, 'one two three')
+
+        # Simulate old instances which didn't have these as attributes
+        del index.word_count
+        del index.indexed_count
+
+        index.merge(other)
+        self.assertEqual(index.word_count(), 3)
+        self.assertEqual(index.indexed_count(), 1)
+
+    def _positionsOf(self, index):
+        return dict([(wid, dict(doc2positions))
+                     for wid, doc2positions in index._positions.items()])
+
+    def test_enable_positions(self):
+        index = self._makeOneWithFrequencies()
+        index.index_doc(1, 'one two one three one')
+        index.index_doc(2, 'three two')
+        wids = index._lexicon.termToWordIds('one two three four')
+        one, two, three, four = wids
+        expected = {one: [0, 2, 4], two: [1], three: [3]}
+        self.assertEqual(index.get_positions(1, wids), expected)
+        index.enable_positions()
+        self.assertEqual(sorted(self._positionsOf(index)), [one, two, three])
+        self.assertEqual(index.get_positions(1, wids), expected)
+        self.assertEqual(index.get_positions(2, wids), {two: [1], three: [0]})
+        self.assertEqual(index.get_positions(3, wids), {})
+        index.disable_positions()
+        self.assertEqual(index._positions, None)
+
+    def test_positions_kept_up_to_date(self):
+        index = self._makeOneWithFrequencies()
+        index.enable_positions()
+        index.index_doc(1, 'one two two three')
+        index.index_docs([(2, 'two three four'), (3, 'four four')])
+        index.index_doc(1, 'three two one five')
+        index.unindex_doc(3)
+        other = self._makeOneWithFrequencies()
+        other.index_doc(4, 'seven two four')
+        index.merge(other)
+        positions = self._positionsOf(index)
+        index.enable_positions()
+        self.assertEqual(positions, self._positionsOf(index))
+        self.assertEqual(
+            sorted(positions),
+            sorted(index._lexicon.termToWordIds('one two three four five '
+                                                'seven')))
+        index.reset()
+        self.assertEqual(self._positionsOf(index), {})
+
+    def test_search_phrase_w_positions(self):
+        index = self._makeOneWithFrequencies()
+        def _faux_search_wids(wids):
+            result = index.family.IF.Bucket()
+            for docid in (1, 2, 3):
+                result[docid] = 1.0
+            return [(result, 1)] * len(wids)
+        index._search_wids = _faux_search_wids
+        index.index_doc(1, 'hit the nail on the head')
+        index.index_doc(2, 'the nail hit the head')
+        index.index_doc(3, 'la la la hit')
+        for positions in (False, True):
+            if positions:
+                index.enable_positions()
+            self.assertEqual(sorted(index.search_phrase('the nail')), [1, 2])
+            self.assertEqual(sorted(index.search_phrase('hit the nail')), [1])
+            self.assertEqual(sorted(index.search_phrase('la la')), [3])
+            self.assertEqual(sorted(index.search_phrase('nail the')), [])
+
+    def test_search_phrase_last_word_code_is_prefix(self):
+        index = self._makeOneWithFrequencies()
+        def _faux_search_wids(wids):
+            result = index.family.IF.Bucket()
+            result[2] = 1.0
+            return [(result, 1)] * len(wids)
+        index._search_wids = _faux_search_wids
+        index.index_doc(1, ' '.join(['w%d' % i for i in range(130)]))
+        # w0's code is a prefix of w128's
+        self.assertEqual(index._lexicon.termToWordIds('w0 w128'), [1, 129])
+        index.index_doc(2, 'w5 w128 w5')
+        for positions in (False, True):
+            if positions:
+                index.enable_positions()
+            self.assertEqual(sorted(index.search_phrase('w5 w0')), [])
+            self.assertEqual(sorted(index.search_phrase('w5 w128')), [2])
+            self.assertEqual(sorted(index.search_phrase('w128 w5')), [2])
+
+    def test_search_near_w_oov_term(self):
+        index = self._makeOneWithFrequencies()
+        index.index_doc(1, 'hit the nail')
+        self.assertEqual(dict(index.search_near(['hit', 'nonesuch'], 3)), {})
+
+    def test_search_near_miss(self):
+        index = self._makeOneWithFrequencies()
+        def _faux_search_wids(wids):
+            return [(index.family.IF.Bucket(), 1)] * len(wids)
+        index._search_wids = _faux_search_wids
+        index.index_doc(1, 'hit the nail')
+        self.assertEqual(dict(index.search_near(['hit', 'nail'], 3)), {})
+
+    def test_search_near_hit(self):
+        index = self._makeOneWithFrequencies()
+        def _faux_search_wids(wids):
+            result = index.family.IF.Bucket()
+            for docid in (1, 2, 3):
+                result[docid] = 1.0
+            return [(result, 1)] * len(wids)
+        index._search_wids = _faux_search_wids
+        index.index_doc(1, 'hit the nail on the head')
+        index.index_doc(2, 'the head of the nail was hit')
+        index.index_doc(3, 'nail nail nail')
+        for positions in (False, True):
+            if positions:
+                index.enable_positions()
+            def near(words, distance, ordered=False):
+                return sorted(index.search_near(words, distance, ordered))
+            self.assertEqual(near(['hit', 'nail'], 0), [])
+            self.assertEqual(near(['hit', 'nail'], 1), [1, 2])
+            self.assertEqual(near(['nail', 'hit'], 1), [1, 2])
+            self.assertEqual(near(['hit', 'nail'], 1, True), [1])
+            self.assertEqual(near(['nail', 'hit'], 1, True), [2])
+            self.assertEqual(near(['hit', 'nail', 'head'], 2), [])
+            self.assertEqual(near(['hit', 'nail', 'head'], 3), [1, 2])
+            self.assertEqual(near(['head', 'nail', 'hit'], 3, True), [2])
+            self.assertEqual(near(['nail', 'nail'], 0), [1, 2, 3])
+            self.assertEqual(near(['nail', 'nail'], 0, True), [3])
+            self.assertEqual(near(['head', 'hit'], 0, True), [])
+
+    def test__span(self):
+        from ..baseindex import _span
+        self.assertEqual(_span([[1, 10], [5, 12]]), 2)
+        self.assertEqual(_span([[3], [3]]), 0)
+        self.assertEqual(_span([[0, 20], [10], [30]]), 20)
+        self.assertEqual(_span([[1], []]), None)
+
+    def test__ordered_span(self):
+        from ..baseindex import _ordered_span
+        self.assertEqual(_ordered_span([[1, 10], [5, 12]]), 2)
+        self.assertEqual(_ordered_span([[5], [1]]), None)
+        self.assertEqual(_ordered_span([[0, 20], [10, 25], [30]]), 10)
+        self.assertEqual(_ordered_span([[3], [3]]), None)
+        self.assertEqual(_ordered_span([[], [3]]), None)
+
+    def test_estimate_w_empty_term(self):
+        index = self._makeOne()
+        self.assertEqual(index.estimate(''), None)
+
+    def test_estimate_w_oov_term(self):
+        index = self._makeOneWithFrequencies()
+        index.index_doc(1, 'hit')
+        self.assertEqual(index.estimate('nonesuch'), 0)
+
+    def test_estimate_hit(self):
+        index = self._makeOneWithFrequencies()
+        index.index_doc(1, 'hit')
+        index.index_doc(2, 'hit the nail')
+        index.index_doc(3, 'the nail')
+        self.assertEqual(index.estimate('hit'), 2)
+        self.assertEqual(index.estimate('nail'), 2)
+
+    def test_estimate_capped_at_document_count(self):
+        index = self._makeOneWithFrequencies()
+        index.index_doc(1, 'hit the nail')
+        index.index_doc(2, 'hit the nail')
+        self.assertEqual(index.estimate('hit nail'), 2)
+
+    def test_estimate_glob_w_oov_term(self):
+        index = self._makeOneWithFrequencies()
+        index.index_doc(1, 'hit')
+        self.assertEqual(index.estimate_glob('nonesuch*'), 0)
+
+    def test_estimate_glob_hit(self):
+        index = self._makeOneWithFrequencies()
+        index.index_doc(1, 'hitter')
+        index.index_doc(2, 'hits')
+        index.index_doc(3, 'nail')
+        self.assertEqual(index.estimate_glob('hit*'), 2)
+
+    def test_estimate_phrase_w_empty_term(self):
+        index = self._makeOne()
+        self.assertEqual(index.estimate_phrase(''), 0)
+
+    def test_estimate_phrase_w_oov_term(self):
+        index = self._makeOneWithFrequencies()
+        index.index_doc(1, 'hit the nail')
+        self.assertEqual(index.estimate_phrase('hit nonesuch'), 0)
+
+    def test_estimate_phrase_hit(self):
+        index = self._makeOneWithFrequencies()
+        index.index_doc(1, 'hit the nail')
+        index.index_doc(2, 'hit the wall')
+        index.index_doc(3, 'the wall')
+        self.assertEqual(index.estimate_phrase('hit the nail'), 1)
+
     def test__search_wids_raises_NotImplementedError(self):
         index = self._makeOne()
         self.assertRaises(NotImplementedError, index._search_wids, ())
@@ -98,3 +98,8 @@ class HTMLWordSplitterTests(unittest.TestCase):
         self.assertEqual(splitter.processGlob(['abc?def hij*klm nop* qrs?']),
                          ['abc?def', 'hij*klm', 'nop*', 'qrs?'])
 
+    def test_processGlob_no_markup_w_leading_glob(self):
+        splitter = self._makeOne()
+        self.assertEqual(splitter.processGlob(['*abc ?d*f * ?']),
+                         ['*abc', '?d*f'])
+
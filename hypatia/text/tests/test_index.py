@@ -163,6 +163,17 @@ class IndexTestBase:
         results = index.search_phrase("quick brown fox")
         self.assertEqual(list(results.keys()), [1])
 
+    def test_search_near(self):
+        index = self._makeOne()
+        index.index_doc(1, "the quick brown fox jumps over the lazy dog")
+        index.index_doc(2, "the quick fox jumps lazy over the brown dog")
+        results = index.search_near(["fox", "quick"], 1)
+        self.assertEqual(list(results.keys()), [1, 2])
+        results = index.search_near(["fox", "quick"], 1, ordered=True)
+        self.assertEqual(list(results.keys()), [])
+        results = index.search_near(["brown", "dog"], 0, ordered=True)
+        self.assertEqual(list(results.keys()), [2])
+
     def test_search_glob(self):
         index = self._makeOne()
         index.index_doc(1, "how now brown cow")
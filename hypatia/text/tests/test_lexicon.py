@@ -81,6 +81,25 @@ class LexiconTests(unittest.TestCase):
         self.assertEqual(lexicon.word_count(), 3)
         self.assertTrue(isinstance(lexicon.word_count, Length))
 
+    def test_merge(self):
+        lexicon = self._makeOne()
+        lexicon.sourceToWordIds('cats and dogs')
+        other = self._makeOne()
+        other.sourceToWordIds('dogs and mice')
+        self.assertEqual(lexicon.merge(other), {1: 3, 2: 2, 3: 4})
+        self.assertEqual(lexicon.get_word(4), 'mice')
+        self.assertEqual(lexicon.word_count(), 4)
+
+    def test_merge_promotes_word_count_attr(self):
+        from BTrees.Length import Length
+        lexicon = self._makeOne()
+        # Simulate old instance, which didn't have Length attr
+        del lexicon.word_count
+        other = self._makeOne()
+        other.sourceToWordIds('cats')
+        self.assertEqual(lexicon.merge(other), {1: 1})
+        self.assertTrue(isinstance(lexicon.word_count, Length))
+
     def test_termToWordIds_hit(self):
         lexicon = self._makeOne()
         lexicon.sourceToWordIds('cats and dogs')
@@ -148,6 +167,15 @@ class LexiconTests(unittest.TestCase):
         lexicon = self._makeOne()
         self.assertEqual(lexicon.parseTerms(''), [])
 
+    def test_parseTerms_leading_glob_wo_ngrams(self):
+        lexicon = self._makeOne()
+        self.assertEqual(lexicon.parseTerms('*bc ?d*f'), ['bc', 'd*f'])
+
+    def test_parseTerms_leading_glob_w_ngrams(self):
+        lexicon = self._makeOne()
+        lexicon.enable_ngrams()
+        self.assertEqual(lexicon.parseTerms('*bc ?d*f'), ['*bc', '?d*f'])
+
     def test_isGlob_empty(self):
         lexicon = self._makeOne()
         self.assertFalse(lexicon.isGlob(''))
@@ -185,6 +213,67 @@ class LexiconTests(unittest.TestCase):
         lexicon.sourceToWordIds('cats and dogs are enemies')
         self.assertEqual(lexicon.globToWordIds('are'), [4])
 
+    def test_globToWordIds_only_stars(self):
+        lexicon = self._makeOne()
+        lexicon.sourceToWordIds('cats and dogs are enemies')
+        self.assertEqual(lexicon.globToWordIds('a**'), [2, 4])
+
+    def test_globToWordIds_w_limit(self):
+        lexicon = self._makeOne()
+        lexicon.sourceToWordIds('cats and dogs are enemies')
+        self.assertEqual(lexicon.globToWordIds('a*', limit=1), [2])
+
+    def test_globToWordIds_escapes_prefix(self):
+        lexicon = self._makeOne()
+        lexicon._getWordIdCreate('a.c')
+        lexicon._getWordIdCreate('a.b')
+        lexicon._getWordIdCreate('abc')
+        self.assertEqual(lexicon.globToWordIds('a.?'), [2, 1])
+
+    def _makeOneWithNgrams(self):
+        lexicon = self._makeOne()
+        lexicon.sourceToWordIds('cats and dogs are enemies')
+        self.assertEqual(lexicon.enable_ngrams(), True)
+        lexicon.sourceToWordIds('a cart of snakes')
+        return lexicon
+
+    def test_enable_ngrams(self):
+        lexicon = self._makeOneWithNgrams()
+        self.assertEqual(lexicon.enable_ngrams(), False)
+        ngrams = dict([(ngram, list(wids))
+                       for ngram, wids in lexicon._ngrams.items()])
+        self.assertEqual(ngrams['\x00ca'], [1, 7])
+        self.assertEqual(ngrams['es\x00'], [5, 9])
+        self.assertEqual(ngrams['\x00a\x00'], [6])
+        self.assertEqual(len(ngrams['nem']), 1)
+        lexicon.disable_ngrams()
+        self.assertEqual(lexicon._ngrams, None)
+        lexicon.disable_ngrams()
+        self.assertEqual(lexicon._ngrams, None)
+
+    def test_globToWordIds_w_ngrams_suffix(self):
+        lexicon = self._makeOneWithNgrams()
+        self.assertEqual(lexicon.globToWordIds('*es'), [5, 9])
+        self.assertEqual(lexicon.globToWordIds('*s'), [1, 3, 5, 9])
+        self.assertEqual(lexicon.globToWordIds('*s', limit=2), [1, 3])
+        self.assertEqual(lexicon.globToWordIds('*emies'), [5])
+        self.assertEqual(lexicon.globToWordIds('*nemx'), [])
+        self.assertEqual(lexicon.globToWordIds('*xyz'), [])
+
+    def test_globToWordIds_w_ngrams_infix(self):
+        lexicon = self._makeOneWithNgrams()
+        self.assertEqual(lexicon.globToWordIds('*nem*'), [5])
+        self.assertEqual(lexicon.globToWordIds('*ar*'), [4, 7])
+        self.assertEqual(lexicon.globToWordIds('*a?e*'), [4, 9])
+        self.assertEqual(lexicon.globToWordIds('?a*s'), [1])
+        # too short for n-grams:  every word is checked, in order
+        self.assertEqual(lexicon.globToWordIds('*a*'), [6, 2, 4, 7, 1, 9])
+        self.assertEqual(lexicon.globToWordIds('*nem*z'), [])
+
+    def test_globToWordIds_w_ngrams_prefix(self):
+        lexicon = self._makeOneWithNgrams()
+        self.assertEqual(lexicon.globToWordIds('ca*'), [7, 1])
+
     def test_getWordIdCreate_new(self):
         lexicon = self._makeOne()
         wid = lexicon._getWordIdCreate('nonesuch')
@@ -277,6 +366,11 @@ class SplitterTests(unittest.TestCase):
         self.assertEqual(splitter.processGlob(['abc?def hij*klm nop* qrs?']),
                          ['abc?def', 'hij*klm', 'nop*', 'qrs?'])
 
+    def test_processGlob_w_leading_glob(self):
+        splitter = self._makeOne()
+        self.assertEqual(splitter.processGlob(['*abc ?d*f * ?']),
+                         ['*abc', '?d*f'])
+
 class CaseNormalizerTests(unittest.TestCase):
 
     def _getTargetClass(self):
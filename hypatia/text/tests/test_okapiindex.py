@@ -23,11 +23,12 @@ class OkapiIndexTestBase:
         from ..okapiindex import OkapiIndex
         return OkapiIndex
 
-    def _makeOne(self):
+    def _makeOne(self, **kw):
         from ..lexicon import Lexicon
         from ..lexicon import Splitter
         lexicon = Lexicon(Splitter())
-        return self._getTargetClass()(lexicon, family=self._getBTreesFamily())
+        return self._getTargetClass()(lexicon, family=self._getBTreesFamily(),
+                                      **kw)
 
     def test_class_conforms_to_IIndexInjection(self):
         from zope.interface.verify import verifyClass
@@ -85,6 +86,30 @@ class OkapiIndexTestBase:
         index.index_doc(1, 'two three four')
         self.assertEqual(index._totaldoclen(), 3)
 
+    def test_index_docs_updates_totaldoclen(self):
+        index = self._makeOne()
+        index.index_docs([(1, 'one two three'), (2, 'two three four'),
+                          (1, 'one')])
+        self.assertEqual(index._totaldoclen(), 4)
+        self.assertEqual(dict(index.search('two')),
+                         dict(self._makeIndexed().search('two')))
+
+    def test_merge_updates_totaldoclen(self):
+        index = self._makeOne()
+        other = self._makeOne()
+        index.index_doc(1, 'one')
+        other.index_doc(2, 'two three four')
+        index.merge(other)
+        self.assertEqual(index._totaldoclen(), 4)
+        self.assertEqual(dict(index.search('two')),
+                         dict(self._makeIndexed().search('two')))
+
+    def _makeIndexed(self):
+        index = self._makeOne()
+        index.index_doc(1, 'one')
+        index.index_doc(2, 'two three four')
+        return index
+
     def test_index_doc_upgrades_totaldoclen(self):
         index = self._makeOne()
 
@@ -144,6 +169,233 @@ class OkapiIndexTestBase:
 
         self.assertTrue(isinstance(index._totaldoclen, int))
 
+    def _expectedScore(self, index, docid, word):
+        from ..baseindex import inverse_doc_frequency
+        d2f = index._wordinfo[index._lexicon._wids[word]]
+        meandoclen = index._totaldoclen() / float(len(index._docweight))
+        lenweight = ((1.0 - index.B) +
+                     index.B * index._docweight[docid] / meandoclen)
+        f = d2f[docid]
+        tf = f * (index.K1 + 1.0) / (f + index.K1 * lenweight)
+        return tf * inverse_doc_frequency(len(d2f), len(index._docweight))
+
+    def _searchWord(self, index, word):
+        return dict(index._search_wids([index._lexicon._wids[word]])[0][0])
+
+    def test__search_wids_scores(self):
+        index = self._makeOne()
+        index.index_doc(1, 'one two three')
+        index.index_doc(2, 'one two')
+        index.index_doc(3, 'three four five six seven')
+        scores = self._searchWord(index, 'one')
+        for docid in (1, 2):
+            self.assertAlmostEqual(scores[docid],
+                                   self._expectedScore(index, docid, 'one'),
+                                   places=5)
+
+    def test__search_wids_reuses_norms(self):
+        index = self._makeOne()
+        for docid in range(100):
+            index.index_doc(docid, 'one two three')
+        self._searchWord(index, 'one')
+        norms = index._v_norms
+        self.assertEqual(len(norms), 100)
+        index.index_doc(100, 'one two three four')
+        index.index_doc(5, 'one two')
+        index.unindex_doc(6)
+        self.assertTrue(index._v_norms is norms)
+        self.assertEqual(norms.doclen, index._totaldoclen())
+        self.assertFalse(5 in norms)
+        self.assertFalse(6 in norms)
+        scores = self._searchWord(index, 'one')
+        self.assertTrue(index._v_norms is norms)
+        self.assertEqual(len(scores), 100)
+        for docid in (5, 100):
+            self.assertAlmostEqual(scores[docid],
+                                   self._expectedScore(index, docid, 'one'),
+                                   places=2)
+
+    def test__search_wids_remakes_norms_after_drift(self):
+        index = self._makeOne()
+        for docid in range(10):
+            index.index_doc(docid, 'one two three')
+        self._searchWord(index, 'one')
+        norms = index._v_norms
+        index.index_doc(10, 'one two three four five six seven')
+        self.assertTrue(index._v_norms is norms)
+        scores = self._searchWord(index, 'one')
+        self.assertFalse(index._v_norms is norms)
+        self.assertAlmostEqual(scores[10],
+                               self._expectedScore(index, 10, 'one'),
+                               places=5)
+
+    def test__search_wids_remakes_norms_changed_elsewhere(self):
+        index = self._makeOne()
+        index.index_doc(1, 'one two three')
+        self._searchWord(index, 'one')
+        norms = index._v_norms
+        # as if another copy of the index had changed the lengths
+        index._totaldoclen.change(1)
+        index._docweight[1] = 4
+        index.index_doc(2, 'one two')
+        self.assertEqual(index._v_norms, None)
+        self.assertAlmostEqual(self._searchWord(index, 'one')[1],
+                               self._expectedScore(index, 1, 'one'),
+                               places=5)
+        self.assertFalse(index._v_norms is norms)
+
+    def test_reset_drops_norms(self):
+        index = self._makeOne()
+        index.index_doc(1, 'one two three')
+        self._searchWord(index, 'one')
+        index.reset()
+        self.assertEqual(index._v_norms, None)
+
+    def test_reset_clears_totaldoclen(self):
+        index = self._makeOne()
+        index.index_doc(1, 'one two three')
+        index.reset()
+        self.assertEqual(index._totaldoclen(), 0)
+        index.index_doc(2, 'two three')
+        fresh = self._makeOne()
+        fresh.index_doc(2, 'two three')
+        self.assertEqual(dict(index.search('two')),
+                         dict(fresh.search('two')))
+
+    def _makeTopIndex(self):
+        index = self._makeOne()
+        for docid in range(100):
+            words = ['common'] * (docid % 4 + 1) + ['filler'] * (docid % 7)
+            if docid % 33 == 1:
+                words.append('rare')
+            if docid % 5 == 0:
+                words.extend(['some', 'some'])
+            index.index_doc(docid, ' '.join(words))
+        return index
+
+    def _bestByUnion(self, index, wids, limit):
+        import heapq
+        from ..setops import mass_weightedUnion
+        scores = mass_weightedUnion(index._search_wids(wids), index.family)
+        return heapq.nlargest(
+            limit, [(score, docid) for docid, score in scores.items()])
+
+    def _assertSameBest(self, index, wids, limit):
+        result = index.search_top(wids, limit)
+        expected = self._bestByUnion(index, wids, limit)
+        self.assertEqual([docid for score, docid in result],
+                         [docid for score, docid in expected])
+        for (score, docid), (expected_score, docid) in zip(result, expected):
+            self.assertAlmostEqual(score, expected_score, places=5)
+        return result
+
+    def test_search_top(self):
+        index = self._makeTopIndex()
+        wids = index._lexicon.termToWordIds('rare some common')
+        for limit in (1, 2, 3, 10, 200):
+            self._assertSameBest(index, wids, limit)
+        self.assertEqual(len(self._assertSameBest(index, wids, 200)), 100)
+
+    def test_search_top_single_word(self):
+        index = self._makeTopIndex()
+        wids = index._lexicon.termToWordIds('common')
+        self._assertSameBest(index, wids, 5)
+
+    def test_search_top_repeated_word(self):
+        index = self._makeTopIndex()
+        wids = index._lexicon.termToWordIds('some rare some')
+        self._assertSameBest(index, wids, 4)
+
+    def test_search_top_scores_probed_candidates_in_bulk(self):
+        index = self._makeTopIndex()
+        index.PROBE_COST = 1000
+        wids = index._lexicon.termToWordIds('rare some common')
+        for limit in (1, 2, 3, 10):
+            self._assertSameBest(index, wids, limit)
+
+    def test_search_top_no_words(self):
+        index = self._makeTopIndex()
+        self.assertEqual(index.search_top([], 10), [])
+        self.assertEqual(index.search_top([0, 12345], 10), [])
+        wids = index._lexicon.termToWordIds('common')
+        self.assertEqual(index.search_top(wids, 0), [])
+
+    def test_search_top_old_totaldoclen(self):
+        index = self._makeTopIndex()
+        index._totaldoclen = index._totaldoclen()
+        wids = index._lexicon.termToWordIds('rare common')
+        self._assertSameBest(index, wids, 2)
+
+    def _impactsOf(self, index):
+        return dict([(wid, dict([(key, dict(block))
+                                 for key, block in blocks.items()]))
+                     for wid, blocks in index._impacts.items()])
+
+    def test_enable_impact_order(self):
+        index = self._makeTopIndex()
+        index.enable_impact_order()
+        impacts = self._impactsOf(index)
+        self.assertEqual(sorted(impacts), list(index._wordinfo.keys()))
+        norms = index._norms()
+        K1_plus1 = index.K1 + 1.0
+        for wid, blocks in impacts.items():
+            postings = {}
+            for key, block in blocks.items():
+                bound = index._impact_bound(key, norms.meandoclen)
+                for docid, f in block.items():
+                    self.assertTrue(f * K1_plus1 / (f + norms[docid]) <= bound)
+                postings.update(block)
+            self.assertEqual(postings, dict(index._wordinfo[wid]))
+        index.disable_impact_order()
+        self.assertEqual(index._impacts, None)
+
+    def test_impact_order_kept_up_to_date(self):
+        index = self._makeOne(impact_order=True)
+        self.assertEqual(self._impactsOf(index), {})
+        index.index_doc(1, 'one two two three')
+        index.index_docs([(2, 'two three four'), (3, 'four four')])
+        index.index_doc(1, 'one two two three three three five six')
+        index.index_doc(2, 'four')
+        index.unindex_doc(3)
+        other = self._makeOne()
+        other.index_doc(4, 'two four seven')
+        index.merge(other)
+        impacts = self._impactsOf(index)
+        index.enable_impact_order()
+        self.assertEqual(impacts, self._impactsOf(index))
+        self.assertEqual(sorted(impacts),
+                         sorted(index._lexicon.termToWordIds(
+                             'one two three four five six seven')))
+        index.reset()
+        self.assertEqual(self._impactsOf(index), {})
+
+    def test_search_top_impact_order(self):
+        index = self._makeTopIndex()
+        index.enable_impact_order()
+        for text in ('common', 'some', 'rare common', 'rare some filler'):
+            wids = index._lexicon.termToWordIds(text)
+            for limit in (1, 2, 3, 10, 200):
+                self._assertSameBest(index, wids, limit)
+
+    def test_search_top_impact_order_scores_candidates(self):
+        index = self._makeTopIndex()
+        index.enable_impact_order()
+        index.PROBE_COST = 0
+        with mock.patch.object(index, '_score',
+                               side_effect=index._score) as _score:
+            self._assertSameBest(
+                index, index._lexicon.termToWordIds('common'), 3)
+        blocks = list(index._impacts[index._lexicon._wids['common']].keys())
+        self.assertTrue(_score.call_count < len(blocks))
+
+    def test_search_top_impact_order_balanced_words(self):
+        index = self._makeTopIndex()
+        index.enable_impact_order()
+        with mock.patch.object(index, '_search_top_impacts') as impacts:
+            self._assertSameBest(
+                index, index._lexicon.termToWordIds('some common'), 3)
+        self.assertFalse(impacts.called)
+
     def test_query_weight_empty_wids(self):
         index = self._makeOne()
         index.index_doc(1, 'one two three')
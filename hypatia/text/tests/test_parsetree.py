@@ -50,6 +50,10 @@ class ParseTreeNodeTests(unittest.TestCase, ConformsToIQueryParseTree):
         node = self._makeOne()
         self.assertRaises(NotImplementedError, node.executeQuery, FauxIndex())
 
+    def test_estimateQuery_raises(self):
+        node = self._makeOne()
+        self.assertRaises(NotImplementedError, node.estimateQuery, FauxIndex())
+
 class NotNodeTests(unittest.TestCase, ConformsToIQueryParseTree):
 
     def _getTargetClass(self):
@@ -74,6 +78,11 @@ class NotNodeTests(unittest.TestCase, ConformsToIQueryParseTree):
         node = self._makeOne()
         self.assertRaises(QueryError, node.executeQuery, FauxIndex())
 
+    def test_estimateQuery_raises(self):
+        from ..parsetree import QueryError
+        node = self._makeOne()
+        self.assertRaises(QueryError, node.estimateQuery, FauxIndex())
+
 class BucketMaker:
 
     def _makeBucket(self, index, count, start=0):
@@ -120,6 +129,23 @@ class AndNodeTests(unittest.TestCase, ConformsToIQueryParseTree, BucketMaker):
         result = node.executeQuery(index)
         self.assertEqual(sorted(result.keys()), [5])
 
+    def test_estimateQuery_no_estimates(self):
+        node = self._makeOne([FauxSubnode('FOO', None)])
+        self.assertEqual(node.estimateQuery(FauxIndex()), None)
+
+    def test_estimateQuery_w_positive_estimates(self):
+        node = self._makeOne([FauxSubnode('FOO', None, 5),
+                              FauxSubnode('FOO', None, 3),
+                              FauxSubnode('FOO', None, None),
+                             ])
+        self.assertEqual(node.estimateQuery(FauxIndex()), 3)
+
+    def test_estimateQuery_ignores_negative_estimates(self):
+        node = self._makeOne([FauxSubnode('NOT', None, 1),
+                              FauxSubnode('FOO', None, 6),
+                             ])
+        self.assertEqual(node.estimateQuery(FauxIndex()), 6)
+
 class OrNodeTests(unittest.TestCase, ConformsToIQueryParseTree, BucketMaker):
 
     def _getTargetClass(self):
@@ -149,6 +175,19 @@ class OrNodeTests(unittest.TestCase, ConformsToIQueryParseTree, BucketMaker):
         result = node.executeQuery(index)
         self.assertEqual(sorted(result.keys()), [0, 1, 2, 3, 4, 5])
 
+    def test_estimateQuery(self):
+        node = self._makeOne([FauxSubnode('FOO', None, 5),
+                              FauxSubnode('FOO', None, None),
+                              FauxSubnode('FOO', None, 6),
+                             ])
+        self.assertEqual(node.estimateQuery(FauxIndex()), 11)
+
+    def test_estimateQuery_no_estimates(self):
+        node = self._makeOne([FauxSubnode('FOO', None, None),
+                              FauxSubnode('FOO', None, None),
+                             ])
+        self.assertEqual(node.estimateQuery(FauxIndex()), None)
+
 class AtomNodeTests(unittest.TestCase, ConformsToIQueryParseTree, BucketMaker):
 
     def _getTargetClass(self):
@@ -175,6 +214,12 @@ class AtomNodeTests(unittest.TestCase, ConformsToIQueryParseTree, BucketMaker):
         result = node.executeQuery(index)
         self.assertEqual(sorted(result.keys()), [0, 1, 2, 3, 4])
 
+    def test_estimateQuery(self):
+        node = self._makeOne()
+        index = FauxIndex()
+        index.estimate = lambda term: 5
+        self.assertEqual(node.estimateQuery(index), 5)
+
 class PhraseNodeTests(unittest.TestCase, ConformsToIQueryParseTree):
 
     def _getTargetClass(self):
@@ -201,6 +246,95 @@ class PhraseNodeTests(unittest.TestCase, ConformsToIQueryParseTree):
         self.assertEqual(node.executeQuery(index), [])
         self.assertEqual(_called_with[0], (('XXX YYY',), {}))
 
+    def test_estimateQuery(self):
+        _called_with = []
+        def _estimate(*args, **kw):
+            _called_with.append((args, kw))
+            return 3
+        index = FauxIndex()
+        index.estimate_phrase = _estimate
+        node = self._makeOne()
+        self.assertEqual(node.estimateQuery(index), 3)
+        self.assertEqual(_called_with[0], (('XXX YYY',), {}))
+
+class NearNodeTests(unittest.TestCase, ConformsToIQueryParseTree):
+
+    def _getTargetClass(self):
+        from ..parsetree import NearNode
+        return NearNode
+
+    def _makeOne(self, value=None, distance=3):
+        if value is None:
+            value = ['XXX', 'YYY']
+        return self._getTargetClass()(value, distance)
+
+    def test_nodeType(self):
+        node = self._makeOne()
+        self.assertEqual(node.nodeType(), 'NEAR')
+
+    def test_getDistance(self):
+        node = self._makeOne()
+        self.assertEqual(node.getDistance(), 3)
+
+    def test___repr__(self):
+        node = self._makeOne()
+        self.assertEqual(repr(node), "NearNode(['XXX', 'YYY'], 3)")
+
+    def test_terms(self):
+        node = self._makeOne()
+        self.assertEqual(node.terms(), ['XXX', 'YYY'])
+
+    def test_executeQuery(self):
+        _called_with = []
+        def _search(*args, **kw):
+            _called_with.append((args, kw))
+            return []
+        index = FauxIndex()
+        index.search_near = _search
+        node = self._makeOne()
+        self.assertEqual(node.executeQuery(index), [])
+        self.assertEqual(_called_with[0], ((['XXX', 'YYY'], 3, False), {}))
+
+    def test_estimateQuery(self):
+        _called_with = []
+        def _estimate(*args, **kw):
+            _called_with.append((args, kw))
+            return 3
+        index = FauxIndex()
+        index.estimate_phrase = _estimate
+        node = self._makeOne()
+        self.assertEqual(node.estimateQuery(index), 3)
+        self.assertEqual(_called_with[0], ((['XXX', 'YYY'],), {}))
+
+class SloppyPhraseNodeTests(NearNodeTests):
+
+    def _getTargetClass(self):
+        from ..parsetree import SloppyPhraseNode
+        return SloppyPhraseNode
+
+    def test_nodeType(self):
+        node = self._makeOne()
+        self.assertEqual(node.nodeType(), 'SLOPPY_PHRASE')
+
+    def test___repr__(self):
+        node = self._makeOne()
+        self.assertEqual(repr(node), "SloppyPhraseNode(['XXX', 'YYY'], 3)")
+
+    def test_terms(self):
+        node = self._makeOne()
+        self.assertEqual(node.terms(), [['XXX', 'YYY']])
+
+    def test_executeQuery(self):
+        _called_with = []
+        def _search(*args, **kw):
+            _called_with.append((args, kw))
+            return []
+        index = FauxIndex()
+        index.search_near = _search
+        node = self._makeOne()
+        self.assertEqual(node.executeQuery(index), [])
+        self.assertEqual(_called_with[0], ((['XXX', 'YYY'], 3, True), {}))
+
 class GlobNodeTests(unittest.TestCase, ConformsToIQueryParseTree):
 
     def _getTargetClass(self):
@@ -227,6 +361,17 @@ class GlobNodeTests(unittest.TestCase, ConformsToIQueryParseTree):
         self.assertEqual(node.executeQuery(index), [])
         self.assertEqual(_called_with[0], (('XXX*',), {}))
 
+    def test_estimateQuery(self):
+        _called_with = []
+        def _estimate(*args, **kw):
+            _called_with.append((args, kw))
+            return 3
+        index = FauxIndex()
+        index.estimate_glob = _estimate
+        node = self._makeOne()
+        self.assertEqual(node.estimateQuery(index), 3)
+        self.assertEqual(_called_with[0], (('XXX*',), {}))
+
 class FauxIndex(object):
 
     def _get_family(self):
@@ -245,13 +390,16 @@ class FauxValue:
 
 
 class FauxSubnode:
-    def __init__(self, node_type, query_results):
+    def __init__(self, node_type, query_results, estimate=None):
         self._nodeType = node_type
         self._query_results = query_results
+        self._estimate = estimate
     def nodeType(self):
         return self._nodeType
     def executeQuery(self, index):
         return self._query_results
+    def estimateQuery(self, index):
+        return self._estimate
     def getValue(self):
         return self
 
@@ -54,6 +54,7 @@ class TestQueryParserBase(unittest.TestCase):
         from ..parsetree import AndNode
         from ..parsetree import AtomNode
         from ..parsetree import GlobNode
+        from ..parsetree import NearNode
         from ..parsetree import NotNode
         from ..parsetree import OrNode
         from ..parsetree import ParseTreeNode
@@ -62,7 +63,11 @@ class TestQueryParserBase(unittest.TestCase):
             msg = repr(got)
         self.assertEqual(isinstance(got, ParseTreeNode), 1)
         self.assertEqual(got.__class__, expected.__class__, msg)
-        if isinstance(got, PhraseNode):
+        if isinstance(got, NearNode):
+            self.assertEqual(got.nodeType(), expected.nodeType(), msg)
+            self.assertEqual(got.getValue(), expected.getValue(), msg)
+            self.assertEqual(got.getDistance(), expected.getDistance(), msg)
+        elif isinstance(got, PhraseNode):
             self.assertEqual(got.nodeType(), "PHRASE", msg)
             self.assertEqual(got.getValue(), expected.getValue(), msg)
         elif isinstance(got, GlobNode):
@@ -254,6 +259,54 @@ class TestQueryParser(TestQueryParserBase):
         self._expect(parser, "foo* bar",
                      AndNode([GlobNode("foo*"), AtomNode("bar")]))
 
+    def test024(self):
+        from ..parsetree import NearNode
+        parser = self._makeOne()
+        self._expect(parser, "foo NEAR/5 bar", NearNode(["foo", "bar"], 5))
+
+    def test025(self):
+        from ..parsetree import AndNode
+        from ..parsetree import AtomNode
+        from ..parsetree import NearNode
+        parser = self._makeOne()
+        self._expect(parser, "foo near/2 bar Near/2 baz blech",
+                     AndNode([NearNode(["foo", "bar", "baz"], 2),
+                              AtomNode("blech")]))
+
+    def test026(self):
+        from ..parsetree import AtomNode
+        from ..parsetree import NearNode
+        from ..parsetree import OrNode
+        parser = self._makeOne()
+        self._expect(parser, "foo NEAR/0 bar OR near",
+                     OrNode([NearNode(["foo", "bar"], 0), AtomNode("near")]))
+
+    def test027(self):
+        from ..parsetree import SloppyPhraseNode
+        parser = self._makeOne()
+        self._expect(parser, '"foo bar"~3',
+                     SloppyPhraseNode(["foo", "bar"], 3))
+
+    def test028(self):
+        from ..parsetree import AndNode
+        from ..parsetree import AtomNode
+        from ..parsetree import NotNode
+        from ..parsetree import SloppyPhraseNode
+        parser = self._makeOne()
+        self._expect(parser, 'blech -"foo bar"~2',
+                     AndNode([AtomNode("blech"),
+                              NotNode(SloppyPhraseNode(["foo", "bar"], 2))]))
+
+    def test029(self):
+        from ..parsetree import PhraseNode
+        parser = self._makeOne()
+        self._expect(parser, '"foo bar"~0', PhraseNode(["foo", "bar"]))
+
+    def test030(self):
+        from ..parsetree import AtomNode
+        parser = self._makeOne()
+        self._expect(parser, '"foo"~4', AtomNode("foo"))
+
     def test101(self):
         parser = self._makeOne()
         self._failure(parser, "")
@@ -342,6 +395,30 @@ class TestQueryParser(TestQueryParserBase):
         parser = self._makeOne()
         self._failure(parser, "foo AND -bar")
 
+    def test123(self):
+        parser = self._makeOne()
+        self._failure(parser, "NEAR/3 foo")
+
+    def test124(self):
+        parser = self._makeOne()
+        self._failure(parser, "foo NEAR/3")
+
+    def test125(self):
+        parser = self._makeOne()
+        self._failure(parser, "foo NEAR/1 bar NEAR/2 baz")
+
+    def test126(self):
+        parser = self._makeOne()
+        self._failure(parser, 'foo NEAR/3 "bar baz"')
+
+    def test127(self):
+        parser = self._makeOne()
+        self._failure(parser, "foo NEAR/3 bar*")
+
+    def test128(self):
+        parser = self._makeOne()
+        self._failure(parser, "foo NEAR/3 -bar")
+
 
 class StopWordTestQueryParser(TestQueryParserBase):
 
@@ -386,6 +463,17 @@ class StopWordTestQueryParser(TestQueryParserBase):
         self._expect(parser, 'foo AND bar NOT stop',
                      AndNode([AtomNode("foo"), AtomNode("bar")]), ["stop"])
 
+    def test208(self):
+        from ..parsetree import NearNode
+        parser = self._makeOne()
+        self._expect(parser, 'foo NEAR/2 stop NEAR/2 bar',
+                     NearNode(["foo", "bar"], 2), ["stop"])
+
+    def test209(self):
+        from ..parsetree import AtomNode
+        parser = self._makeOne()
+        self._expect(parser, 'foo NEAR/2 stop', AtomNode("foo"), ["stop"])
+
     def test301(self):
         parser = self._makeOne()
         self._failure(parser, 'stop')
@@ -410,6 +498,10 @@ class StopWordTestQueryParser(TestQueryParserBase):
         parser = self._makeOne()
         self._failure(parser, 'stop AND NOT foo')
 
+    def test307(self):
+        parser = self._makeOne()
+        self._failure(parser, 'stop NEAR/2 stop')
+
 
 class FakeStopWordRemover(object):
 
@@ -58,11 +58,65 @@ class TextIndexTests(unittest.TestCase):
         from hypatia.interfaces import IIndexStatistics
         verifyObject(IIndexStatistics, self._makeOne())
 
+    def test_class_conforms_to_IIndexEstimate(self):
+        from zope.interface.verify import verifyClass
+        from hypatia.interfaces import IIndexEstimate
+        verifyClass(IIndexEstimate, self._getTargetClass())
+
     def test_class_conforms_to_IIndex(self):
         from zope.interface.verify import verifyClass
         from hypatia.interfaces import IIndex
         verifyClass(IIndex, self._getTargetClass())
 
+    def test_class_conforms_to_IIndexGeneration(self):
+        from zope.interface.verify import verifyClass
+        from hypatia.interfaces import IIndexGeneration
+        verifyClass(IIndexGeneration, self._getTargetClass())
+
+    def test_index_docs(self):
+        pairs = [(1, 'one two'), (2, _marker), (3, 'two three'),
+                 (2, 'two'), (4, _marker), (1, 'one')]
+        index = self._makeOne()
+        index.index_docs(iter(pairs))
+        expected = self._makeOne()
+        for docid, text in pairs:
+            expected.index_doc(docid, text)
+        for term in ('one', 'two', 'three'):
+            self.assertEqual(dict(index.apply(term)),
+                             dict(expected.apply(term)))
+        self.assertEqual(list(index.not_indexed()), [4])
+        self.assertEqual(index.indexed_count(), 3)
+        self.assertTrue(index.generation() > 1)
+
+    def test_class_conforms_to_IIndexMerge(self):
+        from zope.interface.verify import verifyClass
+        from hypatia.interfaces import IIndexMerge
+        verifyClass(IIndexMerge, self._getTargetClass())
+
+    def test_merge(self):
+        index = self._makeOne()
+        other = self._makeOne()
+        index.index_doc(1, 'one two')
+        other.index_doc(2, 'two three')
+        other.index_doc(3, _marker)
+        index.merge(other)
+        self.assertEqual(sorted(index.apply('two')), [1, 2])
+        self.assertEqual(sorted(index.apply('three')), [2])
+        self.assertEqual(list(index.not_indexed()), [3])
+        self.assertEqual(index.generation(), 3)
+
+    def test_generation(self):
+        index = self._makeOne()
+        self.assertEqual(index.generation(), 1)
+        index.index_doc(1, 'one')
+        self.assertEqual(index.generation(), 2)
+        index.index_doc(1, _marker)
+        self.assertEqual(index.generation(), 4)
+        index.unindex_doc(1)
+        self.assertEqual(index.generation(), 5)
+        index.reset()
+        self.assertEqual(index.generation(), 6)
+
     def test_instance_conforms_to_IIndex(self):
         from zope.interface.verify import verifyObject
         from hypatia.interfaces import IIndex
@@ -220,6 +274,39 @@ class TextIndexTests(unittest.TestCase):
         index = self._makeOne(lexicon=lexicon, index=okapi)
         self.assertEqual(index.word_count(), 45)
 
+    def test_estimate_unconstrained(self):
+        lexicon = DummyLexicon()
+        okapi = DummyOkapi(lexicon, {})
+        okapi._estimate = None
+        index = self._makeOne(lexicon=lexicon, index=okapi)
+        self.assertEqual(index.estimate('anything'), 4)
+        self.assertEqual(okapi._estimated, ['anything'])
+
+    def test_estimate_w_results(self):
+        lexicon = DummyLexicon()
+        okapi = DummyOkapi(lexicon)
+        index = self._makeOne(lexicon=lexicon, index=okapi)
+        self.assertEqual(index.estimate('anything'), 3)
+        self.assertEqual(okapi._estimated, ['anything'])
+
+    def test_estimate_capped_at_indexed_count(self):
+        lexicon = DummyLexicon()
+        okapi = DummyOkapi(lexicon)
+        okapi._estimate = 10
+        index = self._makeOne(lexicon=lexicon, index=okapi)
+        self.assertEqual(index.estimate('anything'), 4)
+
+    def test_estimate_w_real_index(self):
+        index = self._makeOne()
+        index.index_doc(1, 'hello world')
+        index.index_doc(2, 'hello there')
+        index.index_doc(3, 'goodbye world')
+        self.assertEqual(index.estimate('hello'), 2)
+        self.assertEqual(index.estimate('hello AND world'), 2)
+        self.assertEqual(index.estimate('hello OR goodbye'), 3)
+        self.assertEqual(index.estimate('"goodbye world"'), 1)
+        self.assertEqual(index.estimate('hel*'), 2)
+
     def test_apply_no_results(self):
         lexicon = DummyLexicon()
         okapi = DummyOkapi(lexicon, {})
@@ -266,6 +353,45 @@ class TextIndexTests(unittest.TestCase):
         self.assertEqual(okapi._query_weighted[0], ['anything'])
         self.assertEqual(okapi._searched, ['anything'])
 
+    def test_apply_w_leading_glob(self):
+        index = self._makeOne()
+        index.index_doc(1, 'singing')
+        index.index_doc(2, 'sing')
+        index.index_doc(3, 'ringing')
+        # searches for 'sing'
+        self.assertEqual(sorted(index.apply('*sing')), [2])
+        index.lexicon.enable_ngrams()
+        self.assertEqual(sorted(index.apply('*ing')), [1, 2, 3])
+        self.assertEqual(sorted(index.apply('*ingi*')), [1, 3])
+
+    def test_apply_top(self):
+        index = self._makeOne()
+        for docid in range(60):
+            words = ['alpha'] * (docid % 3 + 1) + ['beta'] * (docid % 4)
+            if docid % 9 == 0:
+                words.append('gamma')
+            index.index_doc(docid, ' '.join(words))
+        for query in ('alpha', 'gamma OR beta', 'gam* OR alpha OR gamma',
+                      'alpha AND gamma', '"alpha beta"', 'beta NOT gamma',
+                      '"alpha beta" OR gamma'):
+            expected = index.apply(query)
+            result = index.apply_top(query, 5)
+            self.assertEqual(index.sort(result),
+                             index.sort(expected, limit=5))
+            for docid, score in result.items():
+                self.assertAlmostEqual(score, expected[docid], places=5)
+        self.assertEqual(len(index.apply_top('nonesuch', 5)), 0)
+        self.assertEqual(len(index.apply_top('nonesuch AND alpha', 5)), 0)
+
+    def test_apply_top_without_search_top(self):
+        lexicon = DummyLexicon()
+        okapi = DummyOkapi(lexicon)
+        index = self._makeOne(lexicon=lexicon, index=okapi)
+        results = index.apply_top('anything', 2)
+        self.assertEqual(list(results.keys()), [1, 2])
+        self.assertAlmostEqual(results[1], 14.0 / 42.0, places=6)
+        self.assertAlmostEqual(results[2], 7.4 / 42.0, places=6)
+
     def test_applyNotContains(self):
         index = self._makeOne()
         index.index_doc(1, 'now is the time')
@@ -321,6 +447,12 @@ class TextIndexTests(unittest.TestCase):
         expect = [-2, 0]
         self.assertEqual(index.sort(results, limit=2), expect)
 
+    def test_sort_limited_reverse(self):
+        index = self._makeOne()
+        results = {-2: 5.0, 3: 3.0, 0: 4.5}
+        expect = [3, 0]
+        self.assertEqual(index.sort(results, reverse=True, limit=2), expect)
+
     def test_sort_with_extra_kwargs(self):
         index = self._makeOne()
         results = {-2: 5.0, 3: 3.0, 0: 4.5}
@@ -348,6 +480,23 @@ class TextIndexTests(unittest.TestCase):
         index.index_doc(2, _marker)
         self.assertEqual(set([1, 2]), set(index.docids()))
 
+    def test_docids_maintained(self):
+        index = self._makeOne()
+        other = self._makeOne()
+        index.index_doc(1, 'one')
+        index.index_doc(2, _marker)
+        index.index_docs([(3, 'three'), (2, 'two'), (4, _marker)])
+        index.unindex_doc(1)
+        other.index_doc(5, 'five')
+        index.merge(other)
+        docids = index.docids()
+        self.assertTrue(docids is index._all_docids)
+        self.assertEqual(list(docids), [2, 3, 4, 5])
+        self.assertEqual(
+            list(docids),
+            sorted(set(index.indexed()) | set(index.not_indexed())))
+        self.assertEqual(list(index.applyNotContains('three')), [2, 4, 5])
+
     def test_contains(self):
         from .. import query
         index = self._makeOne()
@@ -376,6 +525,41 @@ class TextIndexTests(unittest.TestCase):
         self.assertEqual(result.__class__, query.NotContains)
         self.assertEqual(result._value, 1)
 
+    def test_parse_query_cached(self):
+        index = self._makeOne()
+        tree = index.parse_query('abc OR def')
+        self.assertEqual(tree.nodeType(), 'OR')
+        self.assertTrue(index.parse_query('abc OR def') is tree)
+        self.assertFalse(index.parse_query('abc def') is tree)
+
+    def test_parse_query_cache_disabled(self):
+        index = self._makeOne()
+        index.parse_cache_size = 0
+        tree = index.parse_query('abc')
+        self.assertFalse(index.parse_query('abc') is tree)
+        self.assertFalse(hasattr(index, '_v_parse_cache'))
+
+    def test_parse_query_cache_resized(self):
+        index = self._makeOne()
+        tree = index.parse_query('abc')
+        index.parse_cache_size = 5
+        self.assertFalse(index.parse_query('abc') is tree)
+        self.assertEqual(index._v_parse_cache.maxsize, 5)
+
+    def test_parse_query_cache_w_ngrams(self):
+        index = self._makeOne()
+        self.assertEqual(index.parse_query('*abc').nodeType(), 'ATOM')
+        index.lexicon.enable_ngrams()
+        self.assertEqual(index.parse_query('*abc').nodeType(), 'GLOB')
+
+    def test_parse_query_cache_w_other_lexicon(self):
+        from ..lexicon import Lexicon
+        from ..lexicon import Splitter
+        index = self._makeOne()
+        tree = index.parse_query('abc')
+        index.lexicon = Lexicon(Splitter())
+        self.assertFalse(index.parse_query('abc') is tree)
+
     def test_check_query(self):
         index = self._makeOne()
         self.assertTrue(index.check_query('abc'))
@@ -387,6 +571,7 @@ class DummyOkapi:
     _document_count = 4
     _word_count = 45
     _query_weight = 42.0
+    _estimate = 3
 
     def __init__(self, lexicon, search_results=None):
         self.lexicon = lexicon
@@ -394,6 +579,7 @@ class DummyOkapi:
         self._unindexed = []
         self._searched = []
         self._query_weighted = []
+        self._estimated = []
         if search_results is None:
             search_results = {1: 14.0, 2: 7.4, 3: 3.2}
         self._search_results = search_results
@@ -423,6 +609,12 @@ class DummyOkapi:
 
     search_phrase = search_glob = search
 
+    def estimate(self, term):
+        self._estimated.append(term)
+        return self._estimate
+
+    estimate_phrase = estimate_glob = estimate
+
 class DummyLexicon:
     def parseTerms(self, term):
         return term
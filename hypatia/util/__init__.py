@@ -1,6 +1,12 @@
 import itertools
+import math
+import operator
+
+from collections import OrderedDict
+
 import BTrees
 
+from BTrees.Length import Length
 from persistent import Persistent
 from ZODB.broken import Broken
 from zope.interface import implementer
@@ -10,7 +16,9 @@ _marker = object()
 from .. import exc
 from ..interfaces import (
     IResultSet,
+    NBEST,
     STABLE,
+    TIMSORT,
     )
 
 @implementer(IResultSet)
@@ -107,11 +115,160 @@ class ResultSet(object):
         filtered_ids = [ x for x in self.ids if x in docids ]
         return self.__class__(filtered_ids, len(filtered_ids), self.resolver)
 
+@implementer(IResultSet)
+class LazyResultSet(ResultSet):
+    """ A result set which holds on to its query rather than its results.
+
+    Docids are streamed from the query as they are consumed, so ``first``,
+    ``one``, ``all`` and iteration touch only as much of the indexes as
+    they need to.  Counting is deferred: ``len()`` evaluates the whole query
+    (once), while ``estimate()`` asks the query for a cheap approximation.
+    A limited ``sort`` by an index which supports scanning in sort order
+    (e.g. a field index) stops as soon as ``limit`` matches have been found,
+    when the index predicts that to be cheaper than a conventional sort.
+
+    ``ids`` is recomputed from the query each time it is accessed.
+    """
+
+    def __init__(self, query, names=None, resolver=None, sort_type=None):
+        self.query = query
+        self.names = names
+        self.resolver = resolver
+        self.sort_type = sort_type
+        self._numids = None
+
+    @property
+    def ids(self):
+        return self.query._stream(self.names)
+
+    @property
+    def numids(self):
+        if self._numids is None:
+            self._numids = len(self.query._apply(self.names))
+        return self._numids
+
+    def estimate(self):
+        """ Return an approximation of ``len(self)``, or ``None`` if the query
+        can't provide one cheaply. """
+        if self._numids is not None:
+            return self._numids
+        return self.query._estimate(self.names)
+
+    def first(self, resolve=True):
+        resolver = self.resolver
+        for id_ in self.ids:
+            if resolver is None or not resolve:
+                return id_
+            return resolver(id_)
+
+    def one(self, resolve=True):
+        ids = list(itertools.islice(self.ids, 2))
+        if len(ids) > 1:
+            raise exc.MultipleResults(self)
+        if not ids:
+            raise exc.NoResults(self)
+        if self.resolver is None or not resolve:
+            return ids[0]
+        return self.resolver(ids[0])
+
+    def sort(self, index, reverse=False, limit=None, sort_type=None,
+             raise_unsortable=True):
+        if sort_type is None:
+            sort_type = self.sort_type
+        if (limit and sort_type not in (NBEST, TIMSORT) and
+                getattr(index, 'scan', None) is not None):
+            estimate = self.estimate()
+            if estimate is not None and index.scan_wins(limit, estimate):
+                return self._scan(index, reverse, limit, raise_unsortable)
+        docids = self.query._apply(self.names)
+        resultset = ResultSet(docids, len(docids), self.resolver, sort_type)
+        return resultset.sort(index, reverse=reverse, limit=limit,
+                              sort_type=sort_type,
+                              raise_unsortable=raise_unsortable)
+
+    def _scan(self, index, reverse, limit, raise_unsortable):
+        narrow = self.query._narrower(self.names)
+        ids = list(index.scan(narrow, reverse=reverse, limit=limit))
+        numids = len(ids)
+        if raise_unsortable and numids < limit:
+            # the scan ran out of sortable docids; were there others?
+            IF = self.family.IF
+            missing = IF.difference(self.query._apply(self.names),
+                                    IF.Set(ids))
+            if missing:
+                ids = _raise_unsortable(ids, list(missing))
+        return ResultSet(ids, numids, self.resolver, sort_type=STABLE)
+
+    def intersect(self, docids):
+        if isinstance(docids, ResultSet):
+            docids = docids.ids
+        filtered_ids = [ x for x in self.ids if x in docids ]
+        return ResultSet(filtered_ids, len(filtered_ids), self.resolver)
+
+def _raise_unsortable(ids, missing):
+    for id_ in ids:
+        yield id_
+    raise exc.Unsortable(missing)
+
+# Constants of the cost model used by filter_wins, fitted by the
+# intersection benchmark of earlier releases; ``python -m benchmark run
+# --suite boolean`` times the queries which rely on it.
+FILTER_FUDGE = 17.0     # object key comparisons cost more than integer ones
+OO_BUCKET_SIZE = 125    # average OOBTree bucket size (forward indexes)
+IO_BUCKET_SIZE = 250    # average IOBTree bucket size (reverse indexes)
+
+def filter_wins(numdocids, numdocs, estimate):
+    """ Return true if narrowing a result of ``numdocids`` docids by
+    probing the reverse index of an index holding ``numdocs`` documents
+    is predicted to be cheaper than looking up the ``estimate`` docids
+    matched by a query in its forward index and intersecting the two."""
+    # The number of keys in the forward index isn't cheaply available, so
+    # the number of documents stands in for it as an upper bound.
+    numdocs = max(numdocs, 2)
+    forward = (FILTER_FUDGE * math.log(numdocs, OO_BUCKET_SIZE) +
+               max(numdocids, estimate))
+    reverse = numdocids * math.log(numdocs, IO_BUCKET_SIZE)
+    return reverse < forward
+
+class LRUCache(object):
+    """ A mapping of at most ``maxsize`` items which discards the least
+    recently used item when it grows too large """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        data = self._data
+        if key not in data:
+            return default
+        data.move_to_end(key)
+        return data[key]
+
+    def __setitem__(self, key, value):
+        data = self._data
+        data[key] = value
+        data.move_to_end(key)
+        while len(data) > self.maxsize:
+            data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
 class BaseIndexMixin(object):
     """ Mixin class for indexes that implements common behavior """
 
     family = BTrees.family64
 
+    # every document reported to the index (see docids())
+    _all_docids = None
+
     def discriminate(self, obj, default):
         """ See interface IIndexInjection """
         if callable(self.discriminator):
@@ -137,6 +294,54 @@ class BaseIndexMixin(object):
         self.unindex_doc(docid)
         self.index_doc(docid, obj)
 
+    def index_docs(self, pairs):
+        """ See interface IIndexInjection """
+        for docid, obj in pairs:
+            self.index_doc(docid, obj)
+
+    def _group_docids(self, pairs):
+        # Helper for index_docs() implementations: given (key, docid) pairs,
+        # yield (key, docids) once per distinct key, in key order, with the
+        # docids sorted so they can be bulk-inserted into a BTree set.
+        getkey = operator.itemgetter(0)
+        for key, group in itertools.groupby(sorted(pairs), key=getkey):
+            yield key, [docid for _, docid in group]
+
+    def generation(self):
+        """ See interface IIndexGeneration """
+        generation = getattr(self, '_generation', None)
+        if generation is None:
+            # an index pickled before generations were introduced
+            return None
+        if getattr(self, '_p_changed', False) or generation._p_changed:
+            # uncommitted changes may yet be aborted
+            return None
+        return generation()
+
+    def _universe(self):
+        # The persistent set behind docids(), kept up to date by the
+        # operations which add or remove documents; built on first use for
+        # an index pickled before it was introduced.
+        if self._all_docids is None:
+            self._all_docids = self.family.IF.TreeSet(self._compute_docids())
+        return self._all_docids
+
+    def _add_docids(self, docids):
+        self._universe().update(docids)
+
+    def _discard_docid(self, docid):
+        universe = self._universe()
+        if docid in universe:
+            universe.remove(docid)
+
+    def _bump_generation(self):
+        # called by every operation which changes the result of a query
+        generation = getattr(self, '_generation', None)
+        if generation is None:
+            self._generation = Length(1)
+        else:
+            generation.change(1)
+
     def indexed_count(self):
         """ See IIndexedDocuments """
         return len(self.indexed())
@@ -147,6 +352,12 @@ class BaseIndexMixin(object):
 
     def docids(self):
         """ See IIndexedDocuments """
+        # not a copy: callers must not change it (see IIndexEnumeration)
+        if self._all_docids is not None:
+            return self._all_docids
+        return self._compute_docids()
+
+    def _compute_docids(self):
         not_indexed = self.not_indexed()
         indexed = self.indexed()
         if len(not_indexed) == 0:
@@ -162,16 +373,44 @@ class BaseIndexMixin(object):
 
     def apply_intersect(self, query, docids):
         """ Default apply_intersect implementation """
+        if docids is not None and self._filter_wins(len(docids), query):
+            result = self.filter(docids, query)
+            if hasattr(result, 'items'):
+                # weights as intersecting with our unweighted result gives
+                result = self.family.IF.weightedIntersection(
+                    result, self.family.IF.Set(result.keys()))[1]
+            return result
         result = self.apply(query)
         if docids is None:
             return result
         return self.family.IF.weightedIntersection(result, docids)[1]
 
+    def _filter_wins(self, numdocids, query):
+        # Indexes which provide both estimate() and filter() may narrow an
+        # existing result through their reverse index instead of computing
+        # and intersecting the full result of the query.
+        estimate = getattr(self, 'estimate', None)
+        if estimate is None or getattr(self, 'filter', None) is None:
+            return False
+        return filter_wins(numdocids, self.indexed_count(), estimate(query))
+
+    def _filter_docids(self, docids, predicate):
+        # Helper for filter() implementations: keep the members of docids
+        # for which predicate(docid) is true, preserving weights if docids
+        # is a weighted result.
+        if hasattr(docids, 'items'):
+            return self.family.IF.Bucket(
+                [(docid, weight) for docid, weight in docids.items()
+                 if predicate(docid)])
+        return self.family.IF.Set(
+            [docid for docid in docids if predicate(docid)])
+
     def _negate(self, apply_func, *args, **kw):
         positive = apply_func(*args, **kw)
         all = self.docids()
         if len(positive) == 0:
-            return all
+            # a copy, as docids() may be the index's own set
+            return self.family.IF.Set(all)
         return self.family.IF.difference(all, positive)
 
     def qname(self):
@@ -184,12 +423,15 @@ class BaseIndexMixin(object):
             str(self),
             )
         
-    def resultset_from_query(self, query, names=None, resolver=None):
+    def resultset_from_query(self, query, names=None, resolver=None,
+                             lazy=False):
         # default resultset factory; meant to be overridden by systems that
         # have a default resolver.  NB: although the default implementation
         # below does not access "self", so it would appear that this could be
         # turned into a classmeth or staticmethod, subclasses that override may
         # expect self, so this is a plain method.
+        if lazy:
+            return LazyResultSet(query, names, resolver)
         docids = query._apply(names)
         numdocs = len(docids)
         return ResultSet(docids, numdocs, resolver)
@@ -225,6 +225,168 @@ class TestResultSet(unittest.TestCase):
         self.assertEqual(result.__class__, inst.__class__)
         self.assertEqual(result.ids, [3, 2])
         
+class TestLazyResultSet(unittest.TestCase):
+    def _getTargetClass(self):
+        from . import LazyResultSet
+        return LazyResultSet
+
+    def _makeOne(self, ids, resolver=None, estimate=None):
+        cls = self._getTargetClass()
+        self.query = DummyQuery(ids, estimate)
+        return cls(self.query, 'names', resolver)
+
+    def test_class_implements_IResultSet(self):
+        from zope.interface.verify import verifyClass
+        from hypatia.interfaces import IResultSet
+        verifyClass(IResultSet, self._getTargetClass())
+
+    def test_instance_implements_IResultSet(self):
+        from zope.interface.verify import verifyObject
+        from hypatia.interfaces import IResultSet
+        verifyObject(IResultSet, self._makeOne([1]))
+
+    def test_ids_streams_from_query(self):
+        inst = self._makeOne([1, 2])
+        self.assertEqual(list(inst.ids), [1, 2])
+        self.assertEqual(self.query.streamed, 'names')
+        self.assertEqual(self.query.applied, 0)
+
+    def test___len___deferred_and_cached(self):
+        inst = self._makeOne([1, 2])
+        self.assertEqual(self.query.applied, 0)
+        self.assertEqual(len(inst), 2)
+        self.assertEqual(inst.numids, 2)
+        self.assertEqual(self.query.applied, 1)
+
+    def test_estimate(self):
+        inst = self._makeOne([1, 2], estimate=5)
+        self.assertEqual(inst.estimate(), 5)
+        len(inst)
+        self.assertEqual(inst.estimate(), 2)
+
+    def test_first(self):
+        inst = self._makeOne([1, 2])
+        self.assertEqual(inst.first(), 1)
+        self.assertEqual(inst.first(), 1)
+        self.assertEqual(self.query.applied, 0)
+
+    def test_first_empty(self):
+        inst = self._makeOne([])
+        self.assertEqual(inst.first(), None)
+
+    def test_first_resolve(self):
+        inst = self._makeOne([1, 2], resolver=lambda x: 'a%s' % x)
+        self.assertEqual(inst.first(), 'a1')
+        self.assertEqual(inst.first(resolve=False), 1)
+
+    def test_one(self):
+        inst = self._makeOne([1], resolver=lambda x: 'a%s' % x)
+        self.assertEqual(inst.one(), 'a1')
+        self.assertEqual(inst.one(resolve=False), 1)
+        self.assertEqual(self.query.applied, 0)
+
+    def test_one_multiple_results(self):
+        from ..exc import MultipleResults
+        inst = self._makeOne([1, 2])
+        self.assertRaises(MultipleResults, inst.one)
+
+    def test_one_no_results(self):
+        from ..exc import NoResults
+        inst = self._makeOne([])
+        self.assertRaises(NoResults, inst.one)
+
+    def test_all(self):
+        inst = self._makeOne([1, 2], resolver=lambda x: 'a%s' % x)
+        self.assertEqual(list(inst.all()), ['a1', 'a2'])
+        self.assertEqual(list(inst), ['a1', 'a2'])
+        self.assertEqual(list(inst.all(resolve=False)), [1, 2])
+
+    def test_sort_index_without_scan(self):
+        from . import ResultSet
+        inst = self._makeOne([2, 1], estimate=2)
+        index = DummyIndex()
+        result = inst.sort(index, limit=1, reverse=True)
+        self.assertEqual(result.__class__, ResultSet)
+        self.assertEqual(result.ids, [1, 2])
+        self.assertEqual(result.numids, 1)
+        self.assertEqual(index.ids, [2, 1])
+        self.assertEqual(index.reverse, True)
+
+    def test_sort_scan_wins(self):
+        from ..interfaces import STABLE
+        inst = self._makeOne([1, 2, 3], estimate=3)
+        index = DummyScanIndex([3, 2, 1], True)
+        result = inst.sort(index, limit=2, reverse=True)
+        self.assertEqual(list(result.ids), [3, 2])
+        self.assertEqual(result.numids, 2)
+        self.assertEqual(result.sort_type, STABLE)
+        self.assertEqual(index.scanned, (True, 2))
+        self.assertEqual(index.scan_wins_args, (2, 3))
+        self.assertEqual(self.query.applied, 0)
+
+    def test_sort_scan_exhausted(self):
+        from BTrees import family64
+        inst = self._makeOne(family64.IF.Set([1, 2, 3]), estimate=3)
+        index = DummyScanIndex([3, 2, 1], True)
+        result = inst.sort(index, limit=5)
+        self.assertEqual(list(result.ids), [3, 2, 1])
+        self.assertEqual(result.numids, 3)
+
+    def test_sort_scan_unsortable(self):
+        from ..exc import Unsortable
+        from BTrees import family64
+        inst = self._makeOne(family64.IF.Set([1, 2, 3]), estimate=3)
+        index = DummyScanIndex([3, 1], True)
+        result = inst.sort(index, limit=5)
+        self.assertEqual(result.numids, 2)
+        ids = iter(result.ids)
+        self.assertEqual(next(ids), 3)
+        self.assertEqual(next(ids), 1)
+        try:
+            next(ids)
+        except Unsortable as e:
+            self.assertEqual(e.docids, [2])
+        else: # pragma: no cover
+            self.fail('Unsortable not raised')
+
+    def test_sort_scan_unsortable_not_raised(self):
+        inst = self._makeOne([1, 2, 3], estimate=3)
+        index = DummyScanIndex([3, 1], True)
+        result = inst.sort(index, limit=5, raise_unsortable=False)
+        self.assertEqual(list(result.ids), [3, 1])
+        self.assertEqual(self.query.applied, 0)
+
+    def test_sort_scan_loses(self):
+        inst = self._makeOne([2, 1], estimate=2)
+        index = DummyScanIndex([2, 1], False)
+        result = inst.sort(index, limit=1)
+        self.assertEqual(result.ids, [1, 2])
+        self.assertFalse(hasattr(index, 'scanned'))
+
+    def test_sort_scan_no_estimate(self):
+        inst = self._makeOne([2, 1])
+        index = DummyScanIndex([2, 1], True)
+        result = inst.sort(index, limit=1)
+        self.assertEqual(result.ids, [1, 2])
+        self.assertFalse(hasattr(index, 'scanned'))
+
+    def test_sort_explicit_sort_type(self):
+        from ..interfaces import TIMSORT
+        inst = self._makeOne([2, 1], estimate=2)
+        index = DummyScanIndex([2, 1], True)
+        result = inst.sort(index, limit=1, sort_type=TIMSORT)
+        self.assertEqual(result.ids, [1, 2])
+        self.assertEqual(index.sort_type, TIMSORT)
+        self.assertFalse(hasattr(index, 'scanned'))
+
+    def test_intersect(self):
+        from . import ResultSet
+        inst = self._makeOne([3, 2, 1])
+        result = inst.intersect(ResultSet([1, 3], 2, None))
+        self.assertEqual(result.__class__, ResultSet)
+        self.assertEqual(result.ids, [3, 1])
+        self.assertEqual(result.numids, 2)
+
 class TestBaseIndexMixin(unittest.TestCase):
     def _getTargetClass(self):
         from . import BaseIndexMixin
@@ -368,6 +530,183 @@ class TestBaseIndexMixin(unittest.TestCase):
         index = self._makeIndex('abc')
         self.assertEqual(index.flush(), None)
 
+    def test_resultset_from_query(self):
+        from . import ResultSet
+        index = self._makeIndex('abc')
+        query = DummyQuery([1, 2])
+        result = index.resultset_from_query(query, names='names')
+        self.assertEqual(result.__class__, ResultSet)
+        self.assertEqual(result.ids, [1, 2])
+        self.assertEqual(result.numids, 2)
+
+    def test_resultset_from_query_lazy(self):
+        from . import LazyResultSet
+        index = self._makeIndex('abc')
+        query = DummyQuery([1, 2])
+        result = index.resultset_from_query(query, names='names', lazy=True)
+        self.assertEqual(result.__class__, LazyResultSet)
+        self.assertEqual(result.query, query)
+        self.assertEqual(result.names, 'names')
+        self.assertEqual(query.applied, 0)
+
+    def test_apply_intersect_wo_docids(self):
+        index = self._makeIndex('abc')
+        index.apply = lambda query: index.family.IF.Set([1, 2])
+        self.assertEqual(list(index.apply_intersect('q', None)), [1, 2])
+
+    def test_apply_intersect_wo_filter(self):
+        index = self._makeIndex('abc')
+        index.apply = lambda query: index.family.IF.Set([1, 2])
+        docids = index.family.IF.Set([2, 3])
+        self.assertEqual(list(index.apply_intersect('q', docids)), [2])
+
+    def _makeFilteringIndex(self, estimate):
+        index = self._makeIndex('abc')
+        index.apply = lambda query: index.family.IF.Set([1, 2])
+        index.estimate = lambda query: estimate
+        index.indexed_count = lambda: 100000
+        def _filter(docids, query):
+            index.filtered = (list(docids), query)
+            return index.family.IF.Set([2])
+        index.filter = _filter
+        return index
+
+    def test_apply_intersect_filter_wins(self):
+        index = self._makeFilteringIndex(50000)
+        docids = index.family.IF.Set([2, 3])
+        self.assertEqual(list(index.apply_intersect('q', docids)), [2])
+        self.assertEqual(index.filtered, ([2, 3], 'q'))
+
+    def test_apply_intersect_filter_wins_weighted(self):
+        index = self._makeFilteringIndex(50000)
+        index.filter = lambda docids, query: index.family.IF.Bucket(
+            [(docid, weight) for docid, weight in docids.items()
+             if docid == 2])
+        docids = index.family.IF.Bucket([(2, 0.5), (3, 0.25)])
+        expected = index.family.IF.weightedIntersection(
+            index.apply('q'), docids)[1]
+        result = index.apply_intersect('q', docids)
+        self.assertEqual(list(result.items()), list(expected.items()))
+        self.assertEqual(list(result.items()), [(2, 1.5)])
+
+    def test_apply_intersect_filter_loses(self):
+        index = self._makeFilteringIndex(2)
+        docids = index.family.IF.Set(range(2, 1000))
+        self.assertEqual(list(index.apply_intersect('q', docids)), [2])
+        self.assertFalse(hasattr(index, 'filtered'))
+
+    def test__filter_docids_set(self):
+        index = self._makeIndex('abc')
+        docids = index.family.IF.Set([1, 2, 3, 4])
+        result = index._filter_docids(docids, lambda docid: docid % 2)
+        self.assertEqual(list(result), [1, 3])
+        self.assertFalse(hasattr(result, 'items'))
+
+    def test__filter_docids_weighted(self):
+        index = self._makeIndex('abc')
+        docids = index.family.IF.Bucket({1: 1.5, 2: 2.5, 3: 3.5})
+        result = index._filter_docids(docids, lambda docid: docid % 2)
+        self.assertEqual(list(result.items()), [(1, 1.5), (3, 3.5)])
+
+    def test_index_docs(self):
+        index = self._makeIndex('abc')
+        class Dummy:
+            abc = 'abc'
+        index.index_docs([(1, Dummy()), (2, object())])
+        self.assertEqual(set(index.docids()), set([1, 2]))
+        self.assertEqual(index.value, 'abc')
+
+    def test__group_docids(self):
+        index = self._makeIndex('abc')
+        pairs = [('b', 3), ('a', 2), ('b', 1), ('a', 4)]
+        self.assertEqual(list(index._group_docids(pairs)),
+                         [('a', [2, 4]), ('b', [1, 3])])
+
+    def test_generation_no_counter(self):
+        index = self._makeIndex('abc')
+        self.assertEqual(index.generation(), None)
+
+    def test_generation_bumped(self):
+        index = self._makeIndex('abc')
+        index._bump_generation()
+        self.assertEqual(index.generation(), 1)
+        index._bump_generation()
+        self.assertEqual(index.generation(), 2)
+
+    def test_generation_index_changed(self):
+        index = self._makeIndex('abc')
+        index._bump_generation()
+        index._p_changed = True
+        self.assertEqual(index.generation(), None)
+
+    def test_generation_counter_changed(self):
+        index = self._makeIndex('abc')
+        class DirtyLength(object):
+            _p_changed = True
+        index._generation = DirtyLength()
+        self.assertEqual(index.generation(), None)
+
+class TestLRUCache(unittest.TestCase):
+    def _makeOne(self, maxsize):
+        from . import LRUCache
+        return LRUCache(maxsize)
+
+    def test_get_missing(self):
+        cache = self._makeOne(2)
+        self.assertEqual(cache.get('a'), None)
+        self.assertEqual(cache.get('a', 1), 1)
+
+    def test_set_and_get(self):
+        cache = self._makeOne(2)
+        cache['a'] = 1
+        self.assertEqual(cache.get('a'), 1)
+        self.assertTrue('a' in cache)
+        self.assertEqual(len(cache), 1)
+
+    def test_discards_least_recently_used(self):
+        cache = self._makeOne(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache.get('a')
+        cache['c'] = 3
+        self.assertEqual(len(cache), 2)
+        self.assertFalse('b' in cache)
+        self.assertTrue('a' in cache)
+        self.assertTrue('c' in cache)
+
+    def test_replace(self):
+        cache = self._makeOne(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache['a'] = 3
+        cache['c'] = 4
+        self.assertFalse('b' in cache)
+        self.assertEqual(cache.get('a'), 3)
+
+    def test_clear(self):
+        cache = self._makeOne(2)
+        cache['a'] = 1
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+class Test_filter_wins(unittest.TestCase):
+
+    def _callFUT(self, numdocids, numdocs, estimate):
+        from . import filter_wins
+        return filter_wins(numdocids, numdocs, estimate)
+
+    def test_small_candidates_large_result(self):
+        self.assertTrue(self._callFUT(10, 1000000, 100000))
+
+    def test_similar_sizes(self):
+        self.assertFalse(self._callFUT(1000, 1000000, 1000))
+
+    def test_large_candidates_small_result(self):
+        self.assertFalse(self._callFUT(100000, 1000000, 10))
+
+    def test_tiny_index(self):
+        self.assertTrue(self._callFUT(1, 0, 0))
+
 class RichComparisonMixinTest(unittest.TestCase):
 
     def setUp(self):
@@ -499,3 +838,49 @@ class DummyIndex(object):
         self.raise_unsortable = raise_unsortable
         return sorted(ids)
     
+
+
+class DummyScanIndex(DummyIndex):
+
+    def __init__(self, order, wins):
+        self.order = order
+        self.wins = wins
+
+    def scan_wins(self, limit, rlen):
+        self.scan_wins_args = (limit, rlen)
+        return self.wins
+
+    def scan(self, narrow, reverse=False, limit=None):
+        self.scanned = (reverse, limit)
+        matched = narrow(self.order)
+        n = 0
+        for docid in self.order:
+            if docid in matched:
+                n += 1
+                yield docid
+                if n == limit:
+                    return
+
+
+class DummyQuery(object):
+
+    applied = 0
+    streamed = None
+
+    def __init__(self, results, estimate=None):
+        self.results = results
+        self.estimate = estimate
+
+    def _apply(self, names):
+        self.applied += 1
+        return self.results
+
+    def _stream(self, names):
+        self.streamed = names
+        return iter(self.results)
+
+    def _estimate(self, names):
+        return self.estimate
+
+    def _narrower(self, names):
+        return lambda docids: [x for x in docids if x in self.results]
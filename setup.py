@@ -76,7 +76,9 @@ install_requires = [
     'zope.interface',
     ]
 
-testing_extras = ['pytest', 'coverage']
+numpy_extras = ['numpy']
+
+testing_extras = ['pytest', 'coverage'] + numpy_extras
 
 docs_extras = [
     'Sphinx >= 3.0.0',  # Force RTD to use >= 3.0.0
@@ -113,7 +115,7 @@ setup(name='hypatia',
       tests_require = install_requires,
       install_requires = install_requires,
       extras_require = {
-        'benchmark': ['PyChart'],
+        'numpy': numpy_extras,
         'testing': testing_extras,
         'docs': docs_extras,
         },
@@ -122,10 +124,5 @@ setup(name='hypatia',
               [os.path.join('hypatia', 'text', 'okascore.c')]),
       ],
       cmdclass = {'build_ext':optional_build_ext},
-      ## entry_points = """\
-      ## [console_scripts]
-      ## catalog_benchmark = hypatia.benchmark.benchmark:run
-      ## sortbench = hypatia.benchmark.sortbench:main
-      ## """,
       )
 